@@ -98,6 +98,8 @@ class MicrocontrollerDef:
     MSG_LENGTH = 24
     CMD_LENGTH = 8
     N_BYTES_POS = 4
+    # The number of status packets (each with the stage position, and the time it was received) to keep
+    POSITION_HISTORY_LENGTH = 4096
 
 
 USE_SEPARATE_MCU_FOR_DAC = False
@@ -376,6 +378,11 @@ HOMING_ENABLED_X = True
 HOMING_ENABLED_Y = True
 HOMING_ENABLED_Z = False
 
+# At startup, the devices are connected to, homed and configured concurrently where they can be (see
+# control/device_initialization.py).  Startup fails if connecting to a device, or homing it, takes longer than this.
+DEVICE_INITIALIZATION_TIMEOUT_S = 30
+DEVICE_HOMING_TIMEOUT_S = 180
+
 SLEEP_TIME_S = 0.005
 
 LED_MATRIX_R_FACTOR = 0
@@ -413,6 +420,14 @@ CAMERA_PIXEL_SIZE_UM = {
 
 TUBE_LENS_MM = 50
 CAMERA_SENSOR = "IMX226"
+
+# The main camera's images are the centred Acquisition.CROP_WIDTH x CROP_HEIGHT field of view, binned by
+# CAMERA_BINNING.  By default the camera is left at the resolution, ROI and binning it's configured with, and the crop
+# and any further binning are done in software.  With CAMERA_USE_HARDWARE_ROI_AND_BINNING, the camera is set up to do
+# as much of it as it can (hardware ROI and binning, see control/camera_geometry.py), and the field of view is in
+# unbinned sensor pixels.
+CAMERA_BINNING = 1
+CAMERA_USE_HARDWARE_ROI_AND_BINNING = False
 TRACKERS = ["csrt", "kcf", "mil", "tld", "medianflow", "mosse", "daSiamRPN"]
 DEFAULT_TRACKER = "csrt"
 
@@ -475,6 +490,21 @@ class SOFTWARE_POS_LIMIT:
 SHOW_AUTOLEVEL_BTN = False
 AUTOLEVEL_DEFAULT_SETTING = False
 
+# The napari live view's histogram (and autolevel) is computed from at most LIVE_STATISTICS_MAX_SAMPLES pixels of a
+# frame, on a separate thread, at most LIVE_STATISTICS_RATE_HZ times a second.
+LIVE_STATISTICS_RATE_HZ = 5
+LIVE_STATISTICS_MAX_SAMPLES = 65536
+LIVE_STATISTICS_BINS = 256
+# Autolevel sets the contrast limits to these percentiles of the frame
+LIVE_AUTOLEVEL_LOW_PERCENTILE = 0.5
+LIVE_AUTOLEVEL_HIGH_PERCENTILE = 99.5
+
+# The napari live, multichannel and mosaic views only draw the latest frame waiting for them (per channel, or per
+# tile for the mosaic), DISPLAY_REFRESH_RATE_HZ times a second.  Capture to display latency is tracked over the last
+# DISPLAY_LATENCY_WINDOW frames drawn.
+DISPLAY_REFRESH_RATE_HZ = 30
+DISPLAY_LATENCY_WINDOW = 300
+
 MULTIPOINT_AUTOFOCUS_CHANNEL = "BF LED matrix full"
 # MULTIPOINT_AUTOFOCUS_CHANNEL = 'BF LED matrix left half'
 MULTIPOINT_AUTOFOCUS_ENABLE_BY_DEFAULT = False
@@ -489,13 +519,60 @@ ENABLE_FLEXIBLE_MULTIPOINT = True
 USE_OVERLAP_FOR_FLEXIBLE = True
 ENABLE_WELLPLATE_MULTIPOINT = True
 ENABLE_RECORDING = False
+# The frames (and spectra) waiting to be saved by a recording are buffered in up to RECORDING_BUFFER_MB of memory.
+# When it's full, RECORDING_OVERFLOW_POLICY decides what happens (see squid/recording_sink.py): "block" (whoever is
+# handing over frames waits), "drop_oldest", "drop_newest", or "spill" to a scratch file of up to
+# RECORDING_SPILL_MAX_MB in RECORDING_SPILL_DIR (the system temp dir if None), which should be on a fast local disk.
+RECORDING_BUFFER_MB = 256
+RECORDING_OVERFLOW_POLICY = "drop_newest"
+RECORDING_SPILL_DIR = None
+RECORDING_SPILL_MAX_MB = 4096
+# How recordings are saved (see control/recording_formats.py): "files" (an image file per frame), or one container per
+# recording, which is much cheaper at high frame rates: "bigtiff" (BigTIFF files of up to RECORDING_BIGTIFF_FILE_MB),
+# "raw" (a raw stack of frames with an index), or "zarr" (chunks of RECORDING_ZARR_FRAMES_PER_CHUNK frames).  The
+# containers also save every frame's id and timestamp.
+RECORDING_FORMAT = "files"
+RECORDING_BIGTIFF_FILE_MB = 1024
+RECORDING_ZARR_FRAMES_PER_CHUNK = 16
+# Spectra are recorded to a binary file (see control/spectrum_recording.py), in batches of up to
+# SPECTRUM_RECORDING_BATCH_SIZE spectra, written at least every SPECTRUM_RECORDING_FLUSH_INTERVAL_S
+SPECTRUM_RECORDING_BATCH_SIZE = 256
+SPECTRUM_RECORDING_FLUSH_INTERVAL_S = 1
 
 CAMERA_SN = {"ch 1": "SN1", "ch 2": "SN2"}  # for multiple cameras, to be overwritten in the configuration file
 
 ENABLE_STROBE_OUTPUT = False
 
 ACQUISITION_PATTERN = "S-Pattern"  # 'S-Pattern', 'Unidirectional'
-FOV_PATTERN = "Unidirectional"  # 'S-Pattern', 'Unidirectional'
+FOV_PATTERN = "Unidirectional"  # 'S-Pattern', 'Unidirectional', 'Continuous'
+
+# With FOV_PATTERN = 'Continuous', each row of FOVs is imaged while the stage sweeps through it at a constant speed
+# instead of stopping at every FOV.  The speed is the fastest that keeps the motion blur during the illumination pulse
+# under CONTINUOUS_SCAN_MAX_BLUR_PX, and leaves the camera a frame period between FOVs.
+# With a hardware trigger, the illumination pulse is as long as the exposure, but cut short if that would blur more
+# than CONTINUOUS_SCAN_MAX_BLUR_PX at the fastest speed the frame rate allows.  It's never cut below
+# CONTINUOUS_SCAN_MIN_ILLUMINATION_ON_TIME_US, the sweep slows down instead.
+CONTINUOUS_SCAN_MIN_ILLUMINATION_ON_TIME_US = 100
+CONTINUOUS_SCAN_MAX_BLUR_PX = 0.5
+CONTINUOUS_SCAN_MAX_SPEED_MM = 10
+# Added to the exposure time to get the camera frame period, for cameras that can't tell us theirs
+CONTINUOUS_SCAN_READOUT_MARGIN_MS = 20
+# A FOV the stage is already this far past when it's time to trigger is imaged with a stop instead
+CONTINUOUS_SCAN_MAX_TRIGGER_ERROR_UM = 100
+CONTINUOUS_SCAN_POLL_INTERVAL_MS = 0.5
+
+# Every frame of a multipoint acquisition is recorded in each timepoint's acquisition_index.bin (see
+# control/acquisition_index.py), which is synced to disk at least this often so a crash loses at most this much.
+ACQUISITION_INDEX_FSYNC_INTERVAL_S = 1
+# How many records the index has room for before it needs to grow
+ACQUISITION_INDEX_INITIAL_CAPACITY = 4096
+
+# Record how long each step of an acquisition takes (see squid.logging.span), save it with each acquisition as
+# trace.json (for chrome://tracing or https://ui.perfetto.dev), and show FOV/s and the time per step in a "Timing" tab.
+# The tab is always there, this only decides whether recording starts out on.
+ENABLE_ACQUISITION_TELEMETRY = False
+# The Timing tab summarizes the FOVs of the last this many seconds
+ACQUISITION_TELEMETRY_WINDOW_S = 60
 
 Z_STACKING_CONFIG = "FROM BOTTOM"  # 'FROM BOTTOM', 'FROM TOP'
 Z_STACKING_CONFIG_MAP = {0: "FROM BOTTOM", 1: "FROM CENTER", 2: "FROM TOP"}
@@ -557,6 +634,35 @@ DISP_TH_DURING_MULTIPOINT = 0.95
 SORT_DURING_MULTIPOINT = False
 
 DO_FLUORESCENCE_RTP = False
+# Real time processing runs on RTP_NUM_WORKERS workers (processes if RTP_USE_PROCESSES, otherwise threads).  At most
+# RTP_MAX_QUEUE_SIZE FOVs wait for processing (0 is unbounded), and once the queue is full RTP_DROP_POLICY decides
+# whether acquisition waits ("block") or FOVs are skipped ("drop newest" or "drop oldest").  The malaria classifier
+# updates the acquisition's state, so its FOVs are classified one at a time whatever the number of workers.
+RTP_NUM_WORKERS = 1
+RTP_USE_PROCESSES = False
+RTP_MAX_QUEUE_SIZE = 16
+RTP_DROP_POLICY = "block"
+RTP_BATCH_SIZE = 1
+
+# Pseudo color, merge and write the channel images of a multipoint acquisition on a background thread
+MULTIPOINT_COMPOSITE_IN_BACKGROUND = False
+
+# The simulated camera images a synthetic specimen at the stage position.  The specimen is a procedurally generated
+# SIMULATED_SPECIMEN_SIZE x SIMULATED_SPECIMEN_SIZE tile (repeated across the stage) unless SIMULATED_SPECIMEN_IMAGE
+# is the path of an image to use instead.  It is in focus at SIMULATED_SPECIMEN_FOCUS_Z_MM, and blurs by
+# SIMULATED_SPECIMEN_BLUR_UM_PER_UM um (gaussian sigma) per um of defocus.
+SIMULATED_SPECIMEN_IMAGE = None
+SIMULATED_SPECIMEN_SIZE = 4096
+SIMULATED_SPECIMEN_PIXEL_SIZE_UM = 0.5
+SIMULATED_SPECIMEN_FOCUS_Z_MM = DEFAULT_Z_POS_MM
+SIMULATED_SPECIMEN_BLUR_UM_PER_UM = 0.5
+# The brightest parts of the specimen reach full scale at this exposure time and 0 gain
+SIMULATED_CAMERA_FULL_SCALE_EXPOSURE_MS = 50
+SIMULATED_CAMERA_FULL_WELL_E = 10000
+SIMULATED_CAMERA_READ_NOISE_E = 2
+# If True, simulated frames arrive trigger latency + exposure + readout after send_trigger, like real ones
+SIMULATED_CAMERA_SIMULATE_TIMING = False
+SIMULATED_CAMERA_TRIGGER_LATENCY_MS = 0.65
 
 INVERTED_OBJECTIVE = False
 
@@ -571,6 +677,13 @@ USE_LDI_SERIAL_CONTROL = False
 LDI_INTENSITY_MODE = "PC"
 LDI_SHUTTER_MODE = "PC"
 USE_CELESTA_ETHENET_CONTROL = False
+# The CELESTA is sent commands over HTTP at CELESTA_IP, on one connection kept open between them.  A command that isn't
+# answered in CELESTA_HTTP_TIMEOUT_S fails.
+CELESTA_IP = "192.168.201.200"
+CELESTA_HTTP_TIMEOUT_S = 2
+# With CELESTA_BLOCKING False, the CELESTA's intensity and shutter commands are sent from a worker thread (in order) and
+# the GUI doesn't wait on each HTTP round trip.  The camera can then be triggered before the new intensity is set.
+CELESTA_BLOCKING = True
 
 XLIGHT_EMISSION_FILTER_MAPPING = {405: 1, 470: 2, 555: 3, 640: 4, 730: 5}
 XLIGHT_SERIAL_NUMBER = "B00031BE"
@@ -596,10 +709,27 @@ USE_NAPARI_FOR_MULTIPOINT = True
 USE_NAPARI_FOR_MOSAIC_DISPLAY = True
 USE_NAPARI_ACQUISITION_VIEWER = True
 SINGLE_WINDOW_ACQUISITION_VIEWER = True
+# The acquisition viewer keeps up to ACQUISITION_VIEWER_CACHE_MB of decoded OME-Zarr chunks (from the wells and
+# timepoints shown, and their neighbours, which are prefetched), and the last ACQUISITION_VIEWER_MAX_OPEN_DATASETS
+# datasets open.
+ACQUISITION_VIEWER_CACHE_MB = 1024
+ACQUISITION_VIEWER_MAX_OPEN_DATASETS = 16
 USE_NAPARI_WELL_SELECTION = False
 USE_NAPARI_FOR_LIVE_CONTROL = False
 LIVE_ONLY_MODE = False
 PRVIEW_DOWNSAMPLE_FACTOR = 5
+# The mosaic view stores its data as MOSAIC_TILE_SIZE square tiles, with MOSAIC_PYRAMID_LEVELS 2x downsampled levels
+# for display, and refreshes at most once every MOSAIC_DISPLAY_REFRESH_INTERVAL_MS
+MOSAIC_TILE_SIZE = 512
+MOSAIC_PYRAMID_LEVELS = 4
+MOSAIC_DISPLAY_REFRESH_INTERVAL_MS = 200
+
+# The multichannel view keeps each channel's z stack as MULTICHANNEL_CANVAS_DISPLAY_LEVELS 2x downsampled levels (none
+# of them smaller than MULTICHANNEL_CANVAS_MIN_LEVEL_SIZE pixels), starting from full resolution if all the channels
+# fit in MULTICHANNEL_CANVAS_MEMORY_BUDGET_MB, or from a coarser level if they don't.
+MULTICHANNEL_CANVAS_MEMORY_BUDGET_MB = 2048
+MULTICHANNEL_CANVAS_DISPLAY_LEVELS = 3
+MULTICHANNEL_CANVAS_MIN_LEVEL_SIZE = 256
 
 # Controller SN (needed when using multiple teensy-based connections)
 CONTROLLER_SN = None
@@ -614,6 +744,11 @@ SCIMICROSCOPY_LED_ARRAY_TURN_ON_DELAY = 0.03  # time to wait before trigger the
 
 # Navigation Settings
 ENABLE_CLICK_TO_MOVE_BY_DEFAULT = True
+# Overlay changes in the navigation viewer are coalesced and uploaded at most this many times per second
+NAVIGATION_VIEWER_MAX_UPDATE_HZ = 60
+# Draw the scan FOV overlay as a single vector path instead of rasterizing into an RGBA overlay.  This is
+# cheaper for scans with many thousands of FOVs.
+NAVIGATION_VIEWER_USE_VECTOR_OVERLAY = False
 
 # Stitcher
 ENABLE_STITCHER = False
@@ -0,0 +1,231 @@
+"""
+A binary, append-only record of every frame of a multipoint acquisition: where (region, fov, z level, channel), where
+the stage was (x, y, z and piezo), when, and the camera's frame id.
+
+The file is a 64 byte header followed by fixed width RECORD_DTYPE records, preallocated and memory-mapped so that
+appending a record is a copy into memory instead of a pd.concat.  The header's count is only bumped after a record is
+written, so a reader (or a crash) never sees half a record, and the file is synced to disk periodically so a crash
+loses at most the last few records instead of the whole timepoint.
+
+Loading the index is a memory map too, so it takes microseconds no matter how big the acquisition was.  For tools
+that want the old coordinates.csv, see write_coordinates_csv.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+import squid.logging
+from control._def import *
+
+INDEX_FILE_NAME = "acquisition_index.bin"
+
+MAGIC = b"SQIDXIDX"
+VERSION = 1
+
+HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("record_size", "<u4"),
+        ("count", "<u8"),
+        ("reserved", "V40"),
+    ]
+)
+HEADER_SIZE = HEADER_DTYPE.itemsize
+
+RECORD_DTYPE = np.dtype(
+    [
+        # utf-8, truncated to fit
+        ("region", "S32"),
+        # -1 if the frame isn't one of a region's FOVs
+        ("fov", "<i4"),
+        ("z_level", "<i4"),
+        # The channel (configuration) name, utf-8, truncated to fit
+        ("channel", "S64"),
+        ("x_mm", "<f8"),
+        ("y_mm", "<f8"),
+        ("z_um", "<f8"),
+        # Relative to the piezo's home position, NaN without a piezo
+        ("z_piezo_um", "<f8"),
+        # time.time() of the exposure
+        ("timestamp", "<f8"),
+        # The camera's frame id, -1 if unknown
+        ("frame_id", "<i8"),
+    ]
+)
+
+
+class AcquisitionIndexWriter:
+    """
+    Appends records to a new index file at path (overwriting any existing one).  Safe to append from multiple threads.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        capacity: int = ACQUISITION_INDEX_INITIAL_CAPACITY,
+        fsync_interval_s: float = ACQUISITION_INDEX_FSYNC_INTERVAL_S,
+    ):
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self.path = path
+        self.fsync_interval_s = fsync_interval_s
+
+        self._lock = threading.Lock()
+        self._count = 0
+        self._last_sync = time.monotonic()
+        self._header = None
+        self._records = None
+
+        self._file = open(path, "w+b")
+        self._allocate(max(int(capacity), 1))
+        self._header["magic"] = MAGIC
+        self._header["version"] = VERSION
+        self._header["record_size"] = RECORD_DTYPE.itemsize
+        self._header["count"] = 0
+        self._sync()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def append(
+        self,
+        region,
+        fov: Optional[int],
+        z_level: int,
+        channel: str,
+        x_mm: float,
+        y_mm: float,
+        z_um: float,
+        z_piezo_um: float = np.nan,
+        timestamp: Optional[float] = None,
+        frame_id: int = -1,
+    ):
+        record = (
+            str(region).encode(),
+            -1 if fov is None else fov,
+            z_level,
+            str(channel).encode(),
+            x_mm,
+            y_mm,
+            z_um,
+            z_piezo_um,
+            time.time() if timestamp is None else timestamp,
+            frame_id,
+        )
+        with self._lock:
+            if self._records is None:
+                raise ValueError(f"Can't append to {self.path}, it's closed")
+            if self._count == len(self._records):
+                self._allocate(2 * len(self._records))
+            self._records[self._count] = record
+            self._count += 1
+            self._header["count"] = self._count
+            if time.monotonic() - self._last_sync >= self.fsync_interval_s:
+                self._sync()
+
+    def flush(self):
+        """Sync everything appended so far to disk."""
+        with self._lock:
+            if self._records is not None:
+                self._sync()
+
+    def close(self):
+        """Sync, and trim the file to the records actually appended."""
+        with self._lock:
+            if self._records is None:
+                return
+            self._sync()
+            # The maps have to be gone before the file can shrink under them.
+            self._records = None
+            self._header = None
+            self._file.truncate(HEADER_SIZE + self._count * RECORD_DTYPE.itemsize)
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    def _allocate(self, capacity: int):
+        # Like in close, none of the file can be mapped while it's resized (Windows refuses to), so both maps are
+        # written out and dropped, and made again for the new size.
+        if self._records is not None:
+            self._records.flush()
+            self._header.flush()
+            self._log.debug(f"Growing {self.path} from {len(self._records)} to {capacity} records")
+            self._records = None
+            self._header = None
+        self._file.truncate(HEADER_SIZE + capacity * RECORD_DTYPE.itemsize)
+        self._header = np.memmap(self._file, dtype=HEADER_DTYPE, mode="r+", shape=(1,))
+        self._records = np.memmap(self._file, dtype=RECORD_DTYPE, mode="r+", offset=HEADER_SIZE, shape=(capacity,))
+
+    def _sync(self):
+        self._records.flush()
+        self._header.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+
+
+def load(path: str) -> np.ndarray:
+    """
+    The records in the index at path, as a read-only RECORD_DTYPE array mapped from the file.  Can be called while
+    the index is still being written, to get the records so far.
+    """
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) != 1 or header[0]["magic"] != MAGIC:
+        raise ValueError(f"{path} is not an acquisition index")
+    if header[0]["version"] != VERSION or header[0]["record_size"] != RECORD_DTYPE.itemsize:
+        raise ValueError(
+            f"{path} is version {header[0]['version']} with {header[0]['record_size']} byte records, but only version "
+            f"{VERSION} with {RECORD_DTYPE.itemsize} byte records is supported"
+        )
+    count = int(header[0]["count"])
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+
+def to_dataframe(records: np.ndarray) -> pd.DataFrame:
+    """All the records, one row per frame, with the strings decoded."""
+    df = pd.DataFrame({name: records[name] for name in RECORD_DTYPE.names})
+    for name in ("region", "channel"):
+        df[name] = [value.decode(errors="replace") for value in records[name]]
+    return df
+
+
+def to_coordinates_dataframe(records: np.ndarray) -> pd.DataFrame:
+    """
+    What used to be coordinates.csv: one row per region, fov and z level, at the position of its first frame.
+    """
+    df = to_dataframe(records).drop_duplicates(["region", "fov", "z_level"], keep="first")
+    coordinates = pd.DataFrame(
+        {
+            "region": df["region"],
+            "fov": df["fov"],
+            "z_level": df["z_level"],
+            "x (mm)": df["x_mm"],
+            "y (mm)": df["y_mm"],
+            "z (um)": df["z_um"],
+            "time": [datetime.fromtimestamp(t).strftime("%Y-%m-%d_%H-%M-%S.%f") for t in df["timestamp"]],
+        }
+    )
+    if df["z_piezo_um"].notna().any():
+        coordinates["z_piezo (um)"] = df["z_piezo_um"]
+    return coordinates.reset_index(drop=True)
+
+
+def write_coordinates_csv(index_path: str, csv_path: str):
+    to_coordinates_dataframe(load(index_path)).to_csv(csv_path, index=False, header=True)
+
+
+def write_parquet(index_path: str, parquet_path: str):
+    """Every record, in a parquet file.  Needs pyarrow or fastparquet."""
+    to_dataframe(load(index_path)).to_parquet(parquet_path, index=False)
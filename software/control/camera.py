@@ -1,6 +1,9 @@
 import argparse
+import concurrent.futures
 import cv2
 import time
+from typing import Any, Callable, Dict, List, Optional
+
 import numpy as np
 
 try:
@@ -9,6 +12,9 @@ except:
     print("gxipy import error")
 
 from control._def import *
+from control.simulated_specimen import SensorNoise, SyntheticSpecimen, expose, get_default_specimen
+from squid.abc import AbstractCamera
+from squid.frame_queue import CameraFrame
 
 
 def get_sn_by_model(model_name):
@@ -24,9 +30,10 @@ def get_sn_by_model(model_name):
     return None  # return None if no device with the specified model_name is connected
 
 
-class Camera(object):
+class Camera(AbstractCamera):
 
     def __init__(self, sn=None, is_global_shutter=False, rotate_image_angle=None, flip_image=None):
+        super().__init__(rotate_image_angle=rotate_image_angle, flip_image=flip_image)
 
         # many to be purged
         self.sn = sn
@@ -40,22 +47,6 @@ class Camera(object):
         self.contrast_lut = None
         self.color_correction_param = None
 
-        self.rotate_image_angle = rotate_image_angle
-        self.flip_image = flip_image
-
-        self.exposure_time = 1  # unit: ms
-        self.analog_gain = 0
-        self.frame_ID = -1
-        self.frame_ID_software = -1
-        self.frame_ID_offset_hardware_trigger = 0
-        self.timestamp = 0
-
-        self.image_locked = False
-        self.current_frame = None
-
-        self.callback_is_enabled = False
-        self.is_streaming = False
-
         self.GAIN_MAX = 24
         self.GAIN_MIN = 0
         self.GAIN_STEP = 1
@@ -74,11 +65,6 @@ class Camera(object):
             self.row_numbers - 1
         )
 
-        self.pixel_format = None  # use the default pixel format
-
-        self.is_live = False  # this determines whether a new frame received will be handled in the streamHandler
-        # mainly for discarding the last frame received after stop_live() is called, where illumination is being turned off during exposure
-
     def open(self, index=0):
         (device_num, self.device_info_list) = self.device_manager.update_device_list()
         if device_num == 0:
@@ -112,9 +98,11 @@ class Camera(object):
         self.HeightMax = self.camera.HeightMax.get()
         self.OffsetX = self.camera.OffsetX.get()
         self.OffsetY = self.camera.OffsetY.get()
-
-    def set_callback(self, function):
-        self.new_image_callback_external = function
+        # The ROI is set in steps of the sensor's increments (they're powers of 2, so the largest is a multiple of all)
+        self.ROI_ALIGNMENT = max(
+            feature.get_range()["inc"]
+            for feature in (self.camera.Width, self.camera.Height, self.camera.OffsetX, self.camera.OffsetY)
+        )
 
     def enable_callback(self):
         if self.callback_is_enabled == False:
@@ -326,23 +314,31 @@ class Camera(object):
 
     def send_trigger(self):
         if self.is_streaming:
+            self._mark_trigger()
             self.camera.TriggerSoftware.send_command()
         else:
             print("trigger not sent - camera is not streaming")
 
-    def read_frame(self):
-        raw_image = self.camera.data_stream[self.device_index].get_image()
+    def _get_packed_bit_depth(self):
+        # MONO12 and BAYER_RG12 come as 12 bit values in uint16, everything else uses the full range of its dtype
+        if self.pixel_format in ("MONO12", "BAYER_RG12"):
+            return 12
+        return None
+
+    def _get_numpy_image(self, raw_image):
         if self.is_color:
-            rgb_image = raw_image.convert("RGB")
-            numpy_image = rgb_image.get_numpy_array()
-            if self.pixel_format == "BAYER_RG12":
-                numpy_image = numpy_image << 4
-        else:
-            numpy_image = raw_image.get_numpy_array()
-            if self.pixel_format == "MONO12":
-                numpy_image = numpy_image << 4
-        # self.current_frame = numpy_image
-        return numpy_image
+            return raw_image.convert("RGB").get_numpy_array()
+        return raw_image.get_numpy_array()
+
+    def read_camera_frame(self, reset_image_ready_flag=True, timeout_s=None):
+        # read_frame gets frames from the SDK's own (blocking) queue rather than the frame queue
+        raw_image = self.camera.data_stream[self.device_index].get_image()
+        if raw_image is None:
+            self._log.error("read frame timed out")
+            return None
+        return CameraFrame(
+            self._get_numpy_image(raw_image), self.frame_ID_software, time.time(), self._get_packed_bit_depth()
+        )
 
     def _on_frame_callback(self, user_param, raw_image):
         if raw_image is None:
@@ -350,33 +346,21 @@ class Camera(object):
             return
         if raw_image.get_status() != 0:
             print("Got an incomplete frame")
+            self.frame_queue.record_dropped()
             return
         if self.image_locked:
             print("last image is still being processed, a frame is dropped")
+            self.frame_queue.record_dropped()
             return
-        if self.is_color:
-            rgb_image = raw_image.convert("RGB")
-            numpy_image = rgb_image.get_numpy_array()
-            if self.pixel_format == "BAYER_RG12":
-                numpy_image = numpy_image << 4
-        else:
-            numpy_image = raw_image.get_numpy_array()
-            if self.pixel_format == "MONO12":
-                numpy_image = numpy_image << 4
+        numpy_image = self._get_numpy_image(raw_image)
         if numpy_image is None:
             return
-        self.current_frame = numpy_image
-        self.frame_ID_software = self.frame_ID_software + 1
-        self.frame_ID = raw_image.get_frame_id()
-        if self.trigger_mode == TriggerMode.HARDWARE:
-            if self.frame_ID_offset_hardware_trigger == None:
-                self.frame_ID_offset_hardware_trigger = self.frame_ID
-            self.frame_ID = self.frame_ID - self.frame_ID_offset_hardware_trigger
-        self.timestamp = time.time()
-        self.new_image_callback_external(self)
-
-        # self.frameID = self.frameID + 1
-        # print(self.frameID)
+        self._deliver_frame(
+            numpy_image,
+            self._get_packed_bit_depth(),
+            frame_id=raw_image.get_frame_id(),
+            hardware_triggered=self.trigger_mode == TriggerMode.HARDWARE,
+        )
 
     def set_ROI(self, offset_x=None, offset_y=None, width=None, height=None):
 
@@ -447,35 +431,39 @@ class Camera(object):
         self.camera.LineSource.set(gx.GxLineSourceEntry.EXPOSURE_ACTIVE)
 
 
-class Camera_Simulation(object):
-
-    def __init__(self, sn=None, is_global_shutter=False, rotate_image_angle=None, flip_image=None):
+class Camera_Simulation(AbstractCamera):
+    """
+    A camera that images a SyntheticSpecimen at the current stage position (see set_position_source), with exposure
+    and gain dependent noise and defocus blur.  Frames are rendered at the current ROI, binning and pixel format.
+
+    For benchmarks, simulate_timing makes frames arrive when a real camera's would (trigger latency + exposure +
+    readout after the trigger), and prepare_frame_pool renders frames ahead of time so that the camera is never the
+    bottleneck.
+    """
+
+    def __init__(
+        self,
+        sn=None,
+        is_global_shutter=False,
+        rotate_image_angle=None,
+        flip_image=None,
+        specimen: Optional[SyntheticSpecimen] = None,
+        position_source: Optional[Callable[[], Any]] = None,
+        simulate_timing=SIMULATED_CAMERA_SIMULATE_TIMING,
+    ):
+        super().__init__(rotate_image_angle=rotate_image_angle, flip_image=flip_image)
         # many to be purged
         self.sn = sn
         self.is_global_shutter = is_global_shutter
         self.device_info_list = None
         self.device_index = 0
         self.camera = None
-        self.is_color = None
         self.gamma_lut = None
         self.contrast_lut = None
         self.color_correction_param = None
 
-        self.rotate_image_angle = rotate_image_angle
-        self.flip_image = flip_image
-
-        self.exposure_time = 0
-        self.analog_gain = 0
+        self.exposure_time = 10
         self.frame_ID = 0
-        self.frame_ID_software = -1
-        self.frame_ID_offset_hardware_trigger = 0
-        self.timestamp = 0
-
-        self.image_locked = False
-        self.current_frame = None
-
-        self.callback_is_enabled = False
-        self.is_streaming = False
 
         self.GAIN_MAX = 24
         self.GAIN_MIN = 0
@@ -483,7 +471,6 @@ class Camera_Simulation(object):
         self.EXPOSURE_TIME_MS_MIN = 0.01
         self.EXPOSURE_TIME_MS_MAX = 4000
 
-        self.trigger_mode = None
         self.pixel_size_byte = 1
 
         # below are values for IMX226 (MER2-1220-32U3M) - to make configurable
@@ -497,45 +484,51 @@ class Camera_Simulation(object):
 
         self.pixel_format = "MONO8"
 
-        self.is_live = False
-
         self.Width = Acquisition.CROP_WIDTH
         self.Height = Acquisition.CROP_HEIGHT
         # self.resolution=(self.Width,self.Height)
         # self.res_list = [(1000,1000), (2000,2000), (3000,3000), (4000,3000)]
         self.WidthMax = 4000
         self.HeightMax = 3000
-        self.OffsetX = 0
-        self.OffsetY = 0
-
-        self.new_image_callback_external = None
+        # The ROI, in binned pixels.  The centre of the sensor images the stage position.
+        self.OffsetX = (self.WidthMax - self.Width) // 2
+        self.OffsetY = (self.HeightMax - self.Height) // 2
+        self.binning = 1
+
+        self._specimen = specimen
+        self._position_source = position_source
+        self._noise = SensorNoise()
+        # The noise free render of the specimen, and the (position, size, binning) it was rendered for
+        self._render_key = None
+        self._render: Optional[np.ndarray] = None
+        self._render_scratch: Dict[str, np.ndarray] = {}
+        self._frame_pool: List[np.ndarray] = []
+        self._frame_pool_index = 0
+
+        self.simulate_timing = simulate_timing
+        # Frames are rendered and delivered in order on this thread when simulating timing
+        self._timing_executor = None
+        self._sensor_free_at = 0.0
 
     def open(self, index=0):
         pass
 
-    def set_callback(self, function):
-        self.new_image_callback_external = function
-
-    def enable_callback(self):
-        self.callback_is_enabled = True
-
-    def disable_callback(self):
-        self.callback_is_enabled = False
-
     def open_by_sn(self, sn):
         pass
 
     def close(self):
-        pass
+        if self._timing_executor is not None:
+            self._timing_executor.shutdown(wait=True)
+            self._timing_executor = None
 
     def set_exposure_time(self, exposure_time):
-        pass
+        self.exposure_time = exposure_time
 
     def update_camera_exposure_time(self):
         pass
 
     def set_analog_gain(self, analog_gain):
-        pass
+        self.analog_gain = analog_gain
 
     def get_awb_ratios(self):
         pass
@@ -549,19 +542,17 @@ class Camera_Simulation(object):
     def get_balance_white_auto(self):
         return 0
 
-    def get_is_color(self):
-        return False
-
     def start_streaming(self):
-        self.frame_ID_software = 0
+        self.is_streaming = True
 
     def stop_streaming(self):
-        pass
+        self.is_streaming = False
 
     def set_pixel_format(self, pixel_format):
         self.pixel_format = pixel_format
         print(pixel_format)
         self.frame_ID = 0
+        self.clear_frame_pool()
 
     def set_continuous_acquisition(self):
         pass
@@ -572,41 +563,134 @@ class Camera_Simulation(object):
     def set_hardware_triggered_acquisition(self):
         pass
 
-    def send_trigger(self):
-        self.frame_ID = self.frame_ID + 1
-        self.timestamp = time.time()
-        if self.frame_ID == 1:
-            if self.pixel_format == "MONO8":
-                self.current_frame = np.random.randint(255, size=(self.Height, self.Width), dtype=np.uint8)
-                self.current_frame[
-                    self.Height // 2 - 99 : self.Height // 2 + 100, self.Width // 2 - 99 : self.Width // 2 + 100
-                ] = 200
-            elif self.pixel_format == "MONO12":
-                self.current_frame = np.random.randint(4095, size=(self.Height, self.Width), dtype=np.uint16)
-                self.current_frame[
-                    self.Height // 2 - 99 : self.Height // 2 + 100, self.Width // 2 - 99 : self.Width // 2 + 100
-                ] = (200 * 16)
-                self.current_frame = self.current_frame << 4
-            elif self.pixel_format == "MONO16":
-                self.current_frame = np.random.randint(65535, size=(self.Height, self.Width), dtype=np.uint16)
-                self.current_frame[
-                    self.Height // 2 - 99 : self.Height // 2 + 100, self.Width // 2 - 99 : self.Width // 2 + 100
-                ] = (200 * 256)
-        else:
-            self.current_frame = np.roll(self.current_frame, 10, axis=0)
-            pass
-            # self.current_frame = np.random.randint(255,size=(768,1024),dtype=np.uint8)
-        if self.new_image_callback_external is not None and self.callback_is_enabled:
-            self.new_image_callback_external(self)
+    def set_specimen(self, specimen: Optional[SyntheticSpecimen]):
+        """None means the default specimen from the SIMULATED_SPECIMEN_* settings."""
+        self._specimen = specimen
+        self._render_key = None
 
-    def read_frame(self):
-        return self.current_frame
+    def set_position_source(self, position_source: Optional[Callable[[], Any]]):
+        """
+        position_source returns the stage position to image (anything with x_mm, y_mm and z_mm, ex: a squid.abc.Pos
+        from AbstractStage.get_pos).  None means always image (0, 0) in focus.
+        """
+        self._position_source = position_source
+
+    def get_binning_options(self):
+        return (1, 2, 4)
+
+    def set_binning(self, binning):
+        self.binning = max(1, int(binning))
+        self.clear_frame_pool()
+
+    def get_frame_period_s(self):
+        """How long after the trigger a frame arrives when simulating timing."""
+        readout_ms = self.row_period_us * self.Height * self.binning / 1000
+        return (SIMULATED_CAMERA_TRIGGER_LATENCY_MS + self.exposure_time + readout_ms) / 1000
+
+    def _get_position(self):
+        if self._position_source is None:
+            return 0.0, 0.0, self._get_specimen().focus_z_mm
+        pos = self._position_source()
+        return pos.x_mm, pos.y_mm, pos.z_mm
+
+    def _get_specimen(self) -> SyntheticSpecimen:
+        if self._specimen is None:
+            self._specimen = get_default_specimen()
+        return self._specimen
+
+    def _get_scratch(self, name, shape):
+        scratch = self._render_scratch.get(name)
+        if scratch is None or scratch.shape != shape:
+            scratch = np.empty(shape, dtype=np.float32)
+            self._render_scratch[name] = scratch
+        return scratch
+
+    def _render_frame(self, position) -> np.ndarray:
+        """A new frame of the specimen at position, with the current settings."""
+        shape = (self.Height, self.Width)
+        # Moving the ROI moves the field of view across the specimen.
+        x_mm, y_mm, z_mm = position
+        pixel_size_mm = self._get_specimen().pixel_size_um * self.binning / 1000
+        roi_center_x = self.OffsetX + self.Width / 2 - self.WidthMax / self.binning / 2
+        roi_center_y = self.OffsetY + self.Height / 2 - self.HeightMax / self.binning / 2
+        position = (x_mm + roi_center_x * pixel_size_mm, y_mm + roi_center_y * pixel_size_mm, z_mm)
+        key = (position, shape, self.binning, id(self._get_specimen()))
+        # Rendering (and especially blurring) is most of the cost of a frame, and the specimen doesn't change when
+        # the stage doesn't move, so only render when it does.  The noise is different every frame regardless.
+        if key != self._render_key:
+            self._render = self._get_specimen().render(
+                self._get_scratch("render", shape),
+                *position,
+                binning=self.binning,
+                scratch=self._get_scratch("binning", (shape[0] * self.binning, shape[1] * self.binning)),
+            )
+            self._render_key = key
+
+        bit_depth = self.get_bit_depth() or 8
+        frame = np.empty(shape, dtype=np.uint8 if bit_depth <= 8 else np.uint16)
+        return expose(
+            self._render,
+            frame,
+            self.exposure_time,
+            self.analog_gain,
+            2**bit_depth - 1,
+            self._noise,
+            (self._get_scratch("electrons", shape), self._get_scratch("sigma", shape)),
+        )
 
-    def _on_frame_callback(self, user_param, raw_image):
-        pass
+    def prepare_frame_pool(self, count):
+        """
+        Render count frames at the current position and settings, and then cycle through them on every trigger
+        instead of rendering, until clear_frame_pool (or a settings change).  The pooled frames are read only.
+        """
+        position = self._get_position()
+        self._frame_pool = [self._render_frame(position) for _ in range(count)]
+        for frame in self._frame_pool:
+            frame.flags.writeable = False
+        self._frame_pool_index = 0
+
+    def clear_frame_pool(self):
+        self._frame_pool = []
+
+    def _next_frame(self, position) -> np.ndarray:
+        if self._frame_pool:
+            frame = self._frame_pool[self._frame_pool_index % len(self._frame_pool)]
+            self._frame_pool_index += 1
+            return frame
+        return self._render_frame(position)
+
+    def _deliver_at(self, deliver_at, position):
+        frame = self._next_frame(position)
+        delay = deliver_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._deliver_frame(frame, bit_depth=self.get_bit_depth())
+
+    def send_trigger(self):
+        self._mark_trigger()
+        # The frame shows where the stage was when it was triggered, not when it is delivered
+        position = self._get_position()
+        if not self.simulate_timing:
+            self._deliver_frame(self._next_frame(position), bit_depth=self.get_bit_depth())
+            return
+
+        if self._timing_executor is None:
+            self._timing_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        # The sensor can't start a new exposure until the last frame is read out.
+        start = max(time.monotonic(), self._sensor_free_at)
+        self._sensor_free_at = start + self.get_frame_period_s()
+        self._timing_executor.submit(self._deliver_at, self._sensor_free_at, position)
 
     def set_ROI(self, offset_x=None, offset_y=None, width=None, height=None):
-        pass
+        if width is not None:
+            self.Width = min(int(width), self.WidthMax // self.binning)
+        if height is not None:
+            self.Height = min(int(height), self.HeightMax // self.binning)
+        if offset_x is not None:
+            self.OffsetX = int(offset_x)
+        if offset_y is not None:
+            self.OffsetY = int(offset_y)
+        self.clear_frame_pool()
 
     def reset_camera_acquisition_counter(self):
         pass
@@ -0,0 +1,280 @@
+"""
+Negotiating the geometry of the images the main camera delivers: a field of view centred on the sensor, and a
+binning.
+
+Cameras can crop and bin themselves, which is cheaper than reading out and transferring the whole sensor to crop and
+bin it in software, but they expose it in different ways: set_ROI, set_binning (the simulated camera) and
+set_resolution with a list of binned resolutions (Toupcam and Tucsen).  negotiate_geometry picks the cheapest way to
+get a requested OutputGeometry from what a camera can do:
+
+1. bin in the camera, by the largest factor it supports that divides the requested binning,
+2. read out a ROI around the field of view, aligned to what the camera accepts,
+3. and crop and bin whatever is left in software, with SoftwareGeometry.
+
+Without hardware ROI and binning (use_hardware=False), the camera is left as it was configured, and the field of view
+is cropped (and binned further) in software out of the frames it delivers at its current resolution and binning.
+"""
+
+import dataclasses
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+import squid.logging
+from control._def import *
+import control.utils as utils
+
+log = squid.logging.get_logger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class OutputGeometry:
+    # The field of view, in (unbinned) sensor pixels, centred on the sensor
+    width: int
+    height: int
+    binning: int = 1
+
+
+@dataclasses.dataclass(frozen=True)
+class CameraGeometryCapabilities:
+    # The full sensor, unbinned
+    sensor_width: int
+    sensor_height: int
+    hardware_binnings: Tuple[int, ...] = (1,)
+    # For cameras that bin by switching resolution: {binning: (width, height)} to pass to set_resolution
+    binning_resolutions: Dict[int, Tuple[int, int]] = dataclasses.field(default_factory=dict)
+    supports_roi: bool = True
+    # Hardware ROI offsets and sizes are multiples of this
+    roi_alignment: int = 1
+
+
+@dataclasses.dataclass(frozen=True)
+class GeometryPlan:
+    requested: OutputGeometry
+    hardware_binning: int
+    # The (offset_x, offset_y, width, height) to set the camera's ROI to, in hardware binned pixels
+    hardware_roi: Optional[Tuple[int, int, int, int]]
+    # The size of the frames the camera delivers, in hardware binned pixels
+    frame_width: int
+    frame_height: int
+    # The crop of the frame that is binned in software, in hardware binned pixels.  It's the field of view, so it's
+    # centred on the sensor, which isn't quite the centre of the frame if the ROI had to be rounded.
+    crop_x: int
+    crop_y: int
+    crop_width: int
+    crop_height: int
+    software_binning: int
+
+    @property
+    def binning(self) -> int:
+        """How many sensor pixels (along each axis) an output pixel covers."""
+        return self.hardware_binning * self.software_binning
+
+    @property
+    def output_width(self) -> int:
+        return self.crop_width // self.software_binning
+
+    @property
+    def output_height(self) -> int:
+        return self.crop_height // self.software_binning
+
+    @property
+    def needs_software(self) -> bool:
+        return self.software_binning > 1 or (self.crop_width, self.crop_height) != (
+            self.frame_width,
+            self.frame_height,
+        )
+
+    def describe(self) -> str:
+        steps = []
+        if self.hardware_binning > 1:
+            steps.append(f"{self.hardware_binning}x camera binning")
+        if self.hardware_roi is not None:
+            steps.append(f"{self.frame_width}x{self.frame_height} camera ROI")
+        if (self.crop_width, self.crop_height) != (self.frame_width, self.frame_height):
+            steps.append(f"{self.crop_width}x{self.crop_height} software crop")
+        if self.software_binning > 1:
+            steps.append(f"{self.software_binning}x software binning")
+        return f"{self.output_width}x{self.output_height} at {self.binning}x binning: " + (
+            ", ".join(steps) or "full frame"
+        )
+
+
+def get_camera_capabilities(camera) -> CameraGeometryCapabilities:
+    """What a camera driver can do, worked out from the methods and attributes it has."""
+    binning_resolutions = {}
+    if hasattr(camera, "get_binning_options"):
+        # The simulated camera
+        sensor = (camera.WidthMax, camera.HeightMax)
+        hardware_binnings = tuple(camera.get_binning_options())
+    else:
+        # Toupcam has a res_list, and Tucsen a {resolution: binning mode} dict, of the binned resolutions
+        resolutions = list(getattr(camera, "res_list", None) or getattr(camera, "binning_options", None) or [])
+        if resolutions:
+            sensor = max(resolutions, key=lambda resolution: resolution[0] * resolution[1])
+            for width, height in resolutions:
+                binning = round(sensor[0] / width)
+                if binning == round(sensor[1] / height):
+                    binning_resolutions.setdefault(binning, (width, height))
+        else:
+            sensor = (camera.WidthMax, camera.HeightMax)
+        hardware_binnings = tuple(sorted(binning_resolutions)) or (1,)
+    return CameraGeometryCapabilities(
+        int(sensor[0]),
+        int(sensor[1]),
+        hardware_binnings,
+        binning_resolutions,
+        supports_roi=hasattr(camera, "set_ROI"),
+        roi_alignment=getattr(camera, "ROI_ALIGNMENT", 1),
+    )
+
+
+def get_current_binning(camera) -> int:
+    """The binning the camera is set to, from its binning (the simulated camera) or its binned resolution."""
+    if hasattr(camera, "get_binning_options"):
+        return max(1, int(camera.binning))
+    resolutions = list(getattr(camera, "res_list", None) or getattr(camera, "binning_options", None) or [])
+    resolution = getattr(camera, "resolution", None)
+    if resolutions and resolution:
+        sensor = max(resolutions, key=lambda resolution: resolution[0] * resolution[1])
+        return max(1, round(sensor[0] / resolution[0]))
+    return 1
+
+
+def negotiate_geometry(
+    capabilities: CameraGeometryCapabilities, requested: OutputGeometry, use_hardware: bool = True
+) -> GeometryPlan:
+    binning = max(1, int(requested.binning))
+    hardware_binning = 1
+    if use_hardware:
+        hardware_binning = max(b for b in capabilities.hardware_binnings + (1,) if binning % b == 0)
+    software_binning = binning // hardware_binning
+
+    # The output is a whole number of software bins, of the field of view (or as much of it as there is sensor for)
+    output_width = max(1, min(requested.width, capabilities.sensor_width) // binning)
+    output_height = max(1, min(requested.height, capabilities.sensor_height) // binning)
+    crop_width = output_width * software_binning
+    crop_height = output_height * software_binning
+
+    binned_sensor_width = capabilities.sensor_width // hardware_binning
+    binned_sensor_height = capabilities.sensor_height // hardware_binning
+    # Where the field of view is on the (hardware binned) sensor
+    fov_x = (binned_sensor_width - crop_width) // 2
+    fov_y = (binned_sensor_height - crop_height) // 2
+    if use_hardware and capabilities.supports_roi:
+        # The smallest aligned ROI around the field of view.  At the edges of the sensor, the ROI ends with the sensor.
+        alignment = max(1, capabilities.roi_alignment)
+        offset_x = fov_x // alignment * alignment
+        offset_y = fov_y // alignment * alignment
+        frame_width = min(binned_sensor_width, -(-(fov_x + crop_width) // alignment) * alignment) - offset_x
+        frame_height = min(binned_sensor_height, -(-(fov_y + crop_height) // alignment) * alignment) - offset_y
+        hardware_roi = (offset_x, offset_y, frame_width, frame_height)
+    else:
+        offset_x = offset_y = 0
+        frame_width, frame_height = binned_sensor_width, binned_sensor_height
+        hardware_roi = None
+
+    return GeometryPlan(
+        requested,
+        hardware_binning,
+        hardware_roi,
+        frame_width,
+        frame_height,
+        fov_x - offset_x,
+        fov_y - offset_y,
+        crop_width,
+        crop_height,
+        software_binning,
+    )
+
+
+def apply_geometry_plan(camera, capabilities: CameraGeometryCapabilities, plan: GeometryPlan):
+    """Set the camera's binning and ROI for plan.  The camera should not be streaming."""
+    if len(capabilities.hardware_binnings) > 1:
+        if capabilities.binning_resolutions:
+            camera.set_resolution(*capabilities.binning_resolutions[plan.hardware_binning])
+        else:
+            camera.set_binning(plan.hardware_binning)
+    if plan.hardware_roi is not None:
+        camera.set_ROI(*plan.hardware_roi)
+    elif capabilities.supports_roi:
+        camera.set_ROI(0, 0, plan.frame_width, plan.frame_height)
+
+
+def plan_software_geometry(camera, requested: OutputGeometry) -> GeometryPlan:
+    """
+    The plan for cropping and binning the frames the camera delivers as it is, without changing its resolution, ROI or
+    binning.  Like the crop to CROP_WIDTH x CROP_HEIGHT it replaces, requested's width and height are in the pixels of
+    those frames, and its binning is the total binning, which is at least the camera's.
+    """
+    current_binning = get_current_binning(camera)
+    # The frames are the whole "sensor", binned by the camera's binning
+    capabilities = CameraGeometryCapabilities(
+        int(camera.Width) * current_binning,
+        int(camera.Height) * current_binning,
+        hardware_binnings=(current_binning,),
+        supports_roi=False,
+    )
+    binning = current_binning * max(1, round(requested.binning / current_binning))
+    return negotiate_geometry(
+        capabilities,
+        OutputGeometry(requested.width * current_binning, requested.height * current_binning, binning),
+    )
+
+
+def configure_camera_geometry(camera, requested: OutputGeometry, use_hardware: bool = True) -> GeometryPlan:
+    """
+    Negotiate requested with what camera can do, set the camera up for it, and return the plan.  Without use_hardware,
+    the camera isn't changed, see plan_software_geometry.
+    """
+    if use_hardware:
+        capabilities = get_camera_capabilities(camera)
+        plan = negotiate_geometry(capabilities, requested)
+        apply_geometry_plan(camera, capabilities, plan)
+    else:
+        plan = plan_software_geometry(camera, requested)
+    log.info(f"Camera geometry: {plan.describe()}")
+    return plan
+
+
+class SoftwareGeometry:
+    """
+    The software part of a GeometryPlan: the crop of the field of view out of the frames the camera delivers, binned
+    by the plan's software_binning.  Frames that aren't the size the plan expects (ex: the camera didn't take the ROI)
+    are cropped around their centre.
+
+    The crop is a view of the frame, and binning sums the blocks of that view in one vectorized pass (into an
+    accumulator that's reused from frame to frame), so the only copy made is the binned output.  Binned pixels are the
+    rounded mean of their block, so the output has the same dtype and range as the frame.
+    """
+
+    def __init__(self, plan: GeometryPlan):
+        self.plan = plan
+        self._accumulator: Optional[np.ndarray] = None
+
+    def apply(self, frame: np.ndarray) -> np.ndarray:
+        plan = self.plan
+        if frame.shape[:2] == (plan.frame_height, plan.frame_width):
+            cropped = frame[plan.crop_y : plan.crop_y + plan.crop_height, plan.crop_x : plan.crop_x + plan.crop_width]
+        else:
+            cropped = utils.crop_image(frame, plan.crop_width, plan.crop_height)
+        binning = plan.software_binning
+        if binning == 1:
+            return cropped
+
+        height = cropped.shape[0] // binning
+        width = cropped.shape[1] // binning
+        blocks = cropped[: height * binning, : width * binning].reshape(
+            (height, binning, width, binning) + cropped.shape[2:]
+        )
+        if not np.issubdtype(frame.dtype, np.unsignedinteger):
+            return blocks.mean(axis=(1, 3)).astype(frame.dtype)
+
+        shape = (height, width) + cropped.shape[2:]
+        accumulator_dtype = np.uint32 if frame.dtype.itemsize <= 2 else np.uint64
+        if self._accumulator is None or self._accumulator.shape != shape:
+            self._accumulator = np.empty(shape, dtype=accumulator_dtype)
+        np.sum(blocks, axis=(1, 3), dtype=accumulator_dtype, out=self._accumulator)
+        self._accumulator += binning * binning // 2
+        self._accumulator //= binning * binning
+        return self._accumulator.astype(frame.dtype)
@@ -2,6 +2,7 @@ import time
 import numpy as np
 
 import squid.logging
+from squid.abc import AbstractCamera
 from control._def import *
 
 import threading
@@ -23,7 +24,9 @@ def get_sn_by_model(model_name):
     return None  # return None if no device with the specified model_name is connected
 
 
-class Camera(object):
+class Camera(AbstractCamera):
+    # put_Roi takes even offsets and sizes
+    ROI_ALIGNMENT = 2
 
     @staticmethod
     def _event_callback(nEvent, camera):
@@ -37,6 +40,7 @@ class Camera(object):
         # check if the last image is still locked
         if self.image_locked:
             self.log.warning("last image is still being processed, a frame is dropped")
+            self.frame_queue.record_dropped()
             return
 
         # get the image from the camera
@@ -48,34 +52,23 @@ class Camera(object):
             # TODO(imo): Propagate error in some way and handle
             self.log.error("pull image failed, hr=0x{:x}".format(ex.hr))
 
-        # increament frame ID
-        self.frame_ID_software += 1
-        self.frame_ID += 1
-        self.timestamp = time.time()
-
         # right now support the raw format only
         if self.data_format == "RGB":
             if self.pixel_format == "RGB24":
                 # TODO(imo): Propagate error in some way and handle
                 self.log.error("convert buffer to image not yet implemented for the RGB format")
             return
-        else:
-            if self.pixel_size_byte == 1:
-                raw_image = np.frombuffer(self.buf, dtype="uint8")
-            elif self.pixel_size_byte == 2:
-                raw_image = np.frombuffer(self.buf, dtype="uint16")
-            self.current_frame = raw_image.reshape(self.Height, self.Width)
-
-        # frame ID for hardware triggered acquisition
-        if self.trigger_mode == TriggerMode.HARDWARE:
-            if self.frame_ID_offset_hardware_trigger == None:
-                self.frame_ID_offset_hardware_trigger = self.frame_ID
-            self.frame_ID = self.frame_ID - self.frame_ID_offset_hardware_trigger
-
-        self.image_is_ready = True
-
-        if self.callback_is_enabled == True:
-            self.new_image_callback_external(self)
+        if self.pixel_size_byte == 1:
+            raw_image = np.frombuffer(self.buf, dtype="uint8")
+        elif self.pixel_size_byte == 2:
+            raw_image = np.frombuffer(self.buf, dtype="uint16")
+
+        # self.buf is pulled into again for the next frame, and frames can be kept around after that (in the frame
+        # queue, the display and the recording), so every frame gets its own copy.
+        self._deliver_frame(
+            raw_image.reshape(self.Height, self.Width).copy(),
+            hardware_triggered=self.trigger_mode == TriggerMode.HARDWARE,
+        )
 
     def _TDIBWIDTHBYTES(w):
         return (w * 24 + 31) // 32 * 4
@@ -83,6 +76,7 @@ class Camera(object):
     def __init__(
         self, sn=None, resolution=(3104, 2084), is_global_shutter=False, rotate_image_angle=None, flip_image=None
     ):
+        super().__init__(rotate_image_angle=rotate_image_angle, flip_image=flip_image)
         self.log = squid.logging.get_logger(self.__class__.__name__)
 
         # many to be purged
@@ -96,22 +90,6 @@ class Camera(object):
         self.contrast_lut = None
         self.color_correction_param = None
 
-        self.rotate_image_angle = rotate_image_angle
-        self.flip_image = flip_image
-
-        self.exposure_time = 1  # unit: ms
-        self.analog_gain = 0
-        self.frame_ID = -1
-        self.frame_ID_software = -1
-        self.frame_ID_offset_hardware_trigger = 0
-        self.timestamp = 0
-
-        self.image_locked = False
-        self.current_frame = None
-
-        self.callback_is_enabled = False
-        self.is_streaming = False
-
         self.GAIN_MAX = 40
         self.GAIN_MIN = 0
         self.GAIN_STEP = 1
@@ -143,7 +121,6 @@ class Camera(object):
         # toupcam
         self.data_format = "RAW"
         self.devices = toupcam.Toupcam.EnumV2()
-        self.image_is_ready = False
         self._toupcam_pullmode_started = False
         self._software_trigger_sent = False
         self._last_software_trigger_timestamp = None
@@ -266,18 +243,9 @@ class Camera(object):
 
         self.thread_read_temperature.start()
 
-    def set_callback(self, function):
-        self.new_image_callback_external = function
-
     def set_temperature_reading_callback(self, func):
         self.temperature_reading_callback = func
 
-    def enable_callback(self):
-        self.callback_is_enabled = True
-
-    def disable_callback(self):
-        self.callback_is_enabled = False
-
     def open_by_sn(self, sn):
         pass
 
@@ -564,6 +532,7 @@ class Camera(object):
                 self.log.warning("last software trigger timed out")
                 self._software_trigger_sent = False
         if self.is_streaming and (self._software_trigger_sent == False):
+            self._mark_trigger()
             self.camera.Trigger(1)
             self._software_trigger_sent = True
             self._last_software_trigger_timestamp = time.time()
@@ -582,19 +551,6 @@ class Camera(object):
         else:
             pass
 
-    def read_frame(self, reset_image_ready_flag=True):
-        # set reset_image_ready_flag to True when read_frame() is called immediately after triggering the acquisition
-        if reset_image_ready_flag:
-            self.image_is_ready = False
-        timestamp_t0 = time.time()
-        while (time.time() - timestamp_t0) <= (self.exposure_time / 1000) * 1.02 + 4:
-            time.sleep(0.005)
-            if self.image_is_ready:
-                self.image_is_ready = False
-                return self.current_frame
-        self.log.error("read frame timed out")
-        return None
-
     def set_ROI(self, offset_x=None, offset_y=None, width=None, height=None):
         if offset_x is not None:
             ROI_offset_x = 2 * (offset_x // 2)
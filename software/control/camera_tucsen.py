@@ -38,6 +38,9 @@ def get_sn_by_model(model_name):
 
 
 class Camera(object):
+    # TUCAM ROIs are placed and sized in steps of 8 pixels
+    ROI_ALIGNMENT = 8
+
     def __init__(
         self, sn=None, resolution=(6240, 4168), is_global_shutter=False, rotate_image_angle=None, flip_image=None
     ):
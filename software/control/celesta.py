@@ -3,56 +3,181 @@ Generic Lumencor laser control via HTTP (ethernet connection).
 Bogdan 3/19
 
 revised HL 2/2024
+
+Commands go over one keep-alive HTTP connection (CelestaSession) instead of a new connection per command, and the
+CELESTA keeps the last intensity and shutter state it set for each laser so that setting them again to the same value
+doesn't send anything.  CelestaSimulationServer is a local stand in for the light engine's HTTP interface.
 """
 
+import concurrent.futures
+import functools
+import http.client
+import http.server
+import json
+import socketserver
+import threading
+import time
+import urllib.parse
 import urllib.request
-import traceback
+from typing import Dict, List, Optional
+
+import squid.logging
 from squid.abc import LightSource
+from squid.exceptions import SquidError
+from control._def import *
 from control.microscope import LightSourceType, IntensityControlMode, ShutterControlMode
 
 
-def lumencor_httpcommand(command="GET IP", ip="192.168.201.200"):
+class CelestaError(SquidError):
+    pass
+
+
+def parse_response(body: bytes) -> dict:
+    """
+    The light engine answers with a JSON object whose "message" is the reply to the command ("A ..." if the command
+    was accepted, "E ..." if not).
+    """
+    try:
+        message = json.loads(body)
+    except ValueError as e:
+        raise CelestaError(f"Lumencor response isn't JSON: {body[:100]!r}") from e
+    if not isinstance(message, dict) or not isinstance(message.get("message"), str):
+        raise CelestaError(f"Lumencor response has no message: {body[:100]!r}")
+    return message
+
+
+def is_accepted(message: dict) -> bool:
+    return message["message"].startswith("A")
+
+
+def command_path(command: str) -> str:
+    return "/service/?command=" + urllib.parse.quote(command)
+
+
+def lumencor_httpcommand(command="GET IP", ip=CELESTA_IP):
     """
     Sends commands to the lumencor system via http.
     Plese find commands here:
     http://lumencor.com/wp-content/uploads/sites/11/2019/01/57-10018.pdf
     """
-    command_full = r"http://" + ip + "/service/?command=" + command.replace(" ", "%20")
-    with urllib.request.urlopen(command_full) as response:
-        message = eval(response.read())  # the default is conveniently JSON so eval creates dictionary
-    return message
+    command_full = r"http://" + ip + command_path(command)
+    with urllib.request.urlopen(command_full, timeout=CELESTA_HTTP_TIMEOUT_S) as response:
+        return parse_response(response.read())
+
+
+class CelestaSession:
+    """
+    A keep-alive HTTP connection to a Lumencor light engine.  command() sends a command and waits for the reply,
+    submit() queues it to be sent from a worker thread and returns a Future of the reply.  Commands are sent in the
+    order they're given: command() first waits for the ones submitted before it.
+
+    If the connection was closed (ex: the light engine timed out the idle connection), it's reopened and the command
+    sent again once.  Every command is safe to send twice.
+    """
+
+    def __init__(self, ip: str, port: int = 80, timeout_s: float = CELESTA_HTTP_TIMEOUT_S):
+        self.ip = ip
+        self.port = port
+        self.timeout_s = timeout_s
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self._connection: Optional[http.client.HTTPConnection] = None
+        # The connection is held for a whole round trip, so submit() only takes the executor's lock and doesn't wait
+        # on a command in flight.
+        self._connection_lock = threading.Lock()
+        self._executor_lock = threading.Lock()
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._last_future: Optional[concurrent.futures.Future] = None
+
+    def command(self, command: str) -> dict:
+        self.wait()
+        return self._send(command)
+
+    def submit(self, command: str) -> concurrent.futures.Future:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            self._last_future = self._executor.submit(self._send, command)
+            return self._last_future
+
+    def wait(self, timeout: Optional[float] = None):
+        """Wait until the submitted commands were sent and answered (successfully or not)."""
+        future = self._last_future
+        if future is not None:
+            concurrent.futures.wait([future], timeout)
+
+    def close(self):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self._connection_lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _send(self, command: str) -> dict:
+        with self._connection_lock:
+            for attempt in range(2):
+                if self._connection is None:
+                    self._connection = http.client.HTTPConnection(self.ip, self.port, timeout=self.timeout_s)
+                try:
+                    self._connection.request("GET", command_path(command))
+                    response = self._connection.getresponse()
+                    body = response.read()
+                    break
+                except (http.client.HTTPException, OSError) as e:
+                    self._connection.close()
+                    self._connection = None
+                    # A keep-alive connection that was closed on the other end fails on the next request, so it's
+                    # worth one more try on a new connection.  A timeout means the light engine isn't answering.
+                    if attempt or isinstance(e, TimeoutError):
+                        raise CelestaError(f"Lumencor command '{command}' to {self.ip} failed: {e}") from e
+                    self._log.debug(f"Reconnecting to {self.ip} after: {e}")
+            if response.status != 200:
+                raise CelestaError(f"Lumencor command '{command}' to {self.ip} failed: HTTP {response.status}")
+            return parse_response(body)
 
 
 class CELESTA(LightSource):
     """
     This controls a lumencor object (default: Celesta) using HTTP.
     Please connect the provided cat5e, RJ45 ethernet cable between the PC and Lumencor system.
+
+    With blocking=False, set_intensity and set_shutter_state (and the batched set_intensities and set_shutter_states)
+    return as soon as the command is queued, and a command that fails is logged.  wait() waits for the queued commands.
     """
 
     def __init__(self, **kwds):
         """
         Connect to the Lumencor system via HTTP and check if you get the right response.
         """
+        self.log = squid.logging.get_logger(self.__class__.__name__)
         self.on = False
-        self.ip = kwds.get("ip", "192.168.201.200")
+        self.ip = kwds.get("ip", CELESTA_IP)
+        self.blocking = kwds.get("blocking", True)
+        self.session = CelestaSession(self.ip, kwds.get("port", 80), kwds.get("timeout_s", CELESTA_HTTP_TIMEOUT_S))
         [self.pmin, self.pmax] = 0, 1000
+        self.n_lasers = 0
+        # The intensity and shutter state each laser was last set to.  A laser that isn't in them is sent the next
+        # value it's set to whatever it is.
+        self._intensities: Dict[int, int] = {}
+        self._shutter_states: Dict[int, bool] = {}
+        self._cache_lock = threading.Lock()
         try:
             # See if the system returns back the right IP.
             self.message = self.get_IP()
-            assert self.message["message"] == "A IP " + self.ip
+            if self.message["message"] != "A IP " + self.ip:
+                raise CelestaError(f"Unexpected answer to GET IP: {self.message['message']}")
             self.n_lasers = self.get_number_lasers()
             self.live = True
-        except:
-            print(traceback.format_exc())
+        except Exception:
+            self.log.exception(f"Failed to connect to Lumencor Laser at ip: {self.ip}")
             self.live = False
-            print("Failed to connect to Lumencor Laser at ip:", ip)
 
         if self.live:
             [self.pmin, self.pmax] = self.get_intensity_range()
             self.set_shutter_control_mode(True)
-            for i in range(self.n_lasers):
-                if not self.get_shutter_state(i):
-                    self.set_shutter_state(i, False)
+            self.refresh()
 
         self.channel_mappings = {
             405: 0,
@@ -78,30 +203,47 @@ class CELESTA(LightSource):
     def get_intensity_control_mode(self):
         pass
 
+    def command(self, command):
+        self.message = self.session.command(command)
+        return self.message
+
+    def refresh(self):
+        """Read the intensity and shutter state of every laser, to start the cache from what the lasers are at."""
+        for i in range(self.n_lasers):
+            self.get_intensity(i)
+            self.get_shutter_state(i)
+
+    def invalidate_cache(self):
+        """Forget the intensities and shutter states set, ex: after they were changed from the light engine's panel."""
+        with self._cache_lock:
+            self._intensities.clear()
+            self._shutter_states.clear()
+
+    def wait(self, timeout=None):
+        self.session.wait(timeout)
+
     def get_number_lasers(self):
         """Return the number of lasers the current lumencor system can control"""
-        self.message = lumencor_httpcommand(command="GET CHMAP", ip=self.ip)
-        if self.message["message"][0] == "A":
+        self.command("GET CHMAP")
+        if is_accepted(self.message):
             return len(self.message["message"].split(" ")) - 2
         return 0
 
     def get_color(self, laser_id):
         """Returns the color of the current laser"""
-        self.message = lumencor_httpcommand(command="GET CHMAP", ip=self.ip)
+        self.command("GET CHMAP")
         colors = self.message["message"].split(" ")[2:]
-        print(colors)
+        self.log.debug(f"Laser colors: {colors}")
         return colors[int(laser_id)]
 
     def get_IP(self):
-        self.message = lumencor_httpcommand(command="GET IP", ip=self.ip)
-        return self.message
+        return self.command("GET IP")
 
     def get_shutter_control_mode(self):
         """
         Return True/False the lasers can be controlled with TTL.
         """
-        self.message = lumencor_httpcommand(command="GET TTLENABLE", ip=self.ip)
-        response = self.message["message"]
+        response = self.command("GET TTLENABLE")["message"]
         if response[-1] == "1":
             return ShutterControlMode.TTL
         else:
@@ -115,15 +257,16 @@ class CELESTA(LightSource):
             ttl_enable = "1"
         else:
             ttl_enable = "0"
-        self.message = lumencor_httpcommand(command="SET TTLENABLE " + ttl_enable, ip=self.ip)
+        self.command("SET TTLENABLE " + ttl_enable)
 
     def get_shutter_state(self, laser_id):
         """
         Return True/False the laser is on/off.
         """
-        self.message = lumencor_httpcommand(command="GET CH " + str(laser_id), ip=self.ip)
-        response = self.message["message"]
+        response = self.command("GET CH " + str(laser_id))["message"]
         self.on = response[-1] == "1"
+        with self._cache_lock:
+            self._shutter_states[laser_id] = self.on
         return self.on
 
     def get_intensity_range(self):
@@ -131,8 +274,8 @@ class CELESTA(LightSource):
         Return [minimum power, maximum power].
         """
         max_int = 1000  # default
-        self.message = lumencor_httpcommand(command="GET MAXINT", ip=self.ip)
-        if self.message["message"][0] == "A":
+        self.command("GET MAXINT")
+        if is_accepted(self.message):
             max_int = float(self.message["message"].split(" ")[-1])
         return [0, max_int]
 
@@ -140,46 +283,101 @@ class CELESTA(LightSource):
         """
         Return the current laser power.
         """
-        self.message = lumencor_httpcommand(command="GET CHINT " + str(laser_id), ip=self.ip)
-        # print(command = 'GET CHINT '+str(laser_id), ip=self.ip)
-        response = self.message["message"]
+        response = self.command("GET CHINT " + str(laser_id))["message"]
         power = float(response.split(" ")[-1])
+        with self._cache_lock:
+            self._intensities[laser_id] = int(power)
         return power
 
     def set_shutter_state(self, laser_id, on):
         """
         Turn the laser on/off.
         """
-        if on:
-            self.message = lumencor_httpcommand(command="SET CH " + str(laser_id) + " 1", ip=self.ip)
-            self.on = True
-        else:
-            self.message = lumencor_httpcommand(command="SET CH " + str(laser_id) + " 0", ip=self.ip)
-            self.on = False
-        print("Turning On/Off", self.on, self.message)
+        self.on = bool(on)
+        self.set_shutter_states({laser_id: self.on})
 
     def set_intensity(self, laser_id, power_in_mw):
         """
         power_in_mw - The desired laser power in mW.
         """
-        print("Setting Power", power_in_mw, self.message)
-        if power_in_mw > self.pmax:
-            power_in_mw = self.pmax
-        self.message = lumencor_httpcommand(
-            command="SET CHINT " + str(laser_id) + " " + str(int(power_in_mw)), ip=self.ip
-        )
-        if self.message["message"][0] == "A":
-            return True
-        return False
+        return self.set_intensities({laser_id: power_in_mw})
+
+    def set_shutter_states(self, states: Dict[int, bool]):
+        """
+        Turn several lasers on/off, with one SET MULCH command if more than one changes.
+        """
+        states = {laser_id: bool(on) for laser_id, on in states.items()}
+        self.log.debug(f"Turning On/Off {states}")
+        return self._set(self._shutter_states, states, "SET CH {} {}", "SET MULCH", lambda on: "1" if on else "0")
+
+    def set_intensities(self, powers_in_mw: Dict[int, float]):
+        """
+        Set the power in mW of several lasers, with one SET MULCHINT command if more than one changes.
+        """
+        intensities = {laser_id: int(min(power, self.pmax)) for laser_id, power in powers_in_mw.items()}
+        self.log.debug(f"Setting Power {intensities}")
+        return self._set(self._intensities, intensities, "SET CHINT {} {}", "SET MULCHINT", str)
+
+    def _set(self, cache: Dict[int, object], values: Dict[int, object], single_command, multi_command, to_str):
+        with self._cache_lock:
+            changed = {laser_id: value for laser_id, value in values.items() if cache.get(laser_id) != value}
+            if not changed:
+                return True
+            # The multi laser commands set every laser, so they need the values of the lasers that aren't changing.
+            lasers = range(self.n_lasers)
+            if (
+                len(changed) > 1
+                and all(i in lasers for i in changed)
+                and all(i in cache or i in changed for i in lasers)
+            ):
+                all_values = [changed.get(i, cache.get(i)) for i in range(self.n_lasers)]
+                commands = [" ".join([multi_command] + [to_str(value) for value in all_values])]
+            else:
+                commands = [single_command.format(laser_id, to_str(value)) for laser_id, value in changed.items()]
+            cache.update(changed)
+
+        def on_reply(command: str, message: dict):
+            if not is_accepted(message):
+                self._forget(cache, changed)
+                self.log.error(f"Lumencor refused '{command}': {message['message']}")
+            self.message = message
+            return is_accepted(message)
+
+        def on_done(command: str, future: concurrent.futures.Future):
+            if future.exception() is not None:
+                self._forget(cache, changed)
+                self.log.error(f"Lumencor command '{command}' failed: {future.exception()}")
+            else:
+                on_reply(command, future.result())
+
+        accepted = True
+        for command in commands:
+            if self.blocking:
+                try:
+                    accepted = on_reply(command, self.session.command(command)) and accepted
+                except Exception:
+                    self._forget(cache, changed)
+                    raise
+            else:
+                future = self.session.submit(command)
+                future.add_done_callback(functools.partial(on_done, command))
+        return accepted
+
+    def _forget(self, cache: Dict[int, object], values: Dict[int, object]):
+        # Whatever the lasers are at now is unknown, so the next value is sent even if it's the same.
+        with self._cache_lock:
+            for laser_id in values:
+                cache.pop(laser_id, None)
 
     def shut_down(self):
         """
         Turn the laser off.
         """
         if self.live:
-            for i in range(self.n_lasers):
-                self.set_intensity(i, 0)
-                self.set_shutter_state(i, False)
+            self.set_intensities({i: 0 for i in range(self.n_lasers)})
+            self.set_shutter_states({i: False for i in range(self.n_lasers)})
+            self.wait()
+        self.session.close()
 
     def get_status(self):
         """
@@ -188,6 +386,129 @@ class CELESTA(LightSource):
         return self.live
 
 
+class CelestaSimulationServer:
+    """
+    A stand in for a CELESTA's HTTP interface, served on ip (localhost) at port (a free one if 0), that answers the
+    commands CELESTA sends like the light engine does.  commands lists every command it got, and connections the
+    number of connections they came on.  Each answer is held back response_delay_s, like a slow light engine.
+    """
+
+    LASER_COLORS = ["VIOLET", "BLUE", "CYAN", "TEAL", "GREEN", "RED", "NIR"]
+
+    def __init__(self, ip: str = "127.0.0.1", port: int = 0, max_intensity: int = 1000):
+        self.ip = ip
+        self.max_intensity = max_intensity
+        self.n_lasers = len(self.LASER_COLORS)
+        self.ttl_enable = False
+        self.shutter_states: List[bool] = [False] * self.n_lasers
+        self.intensities: List[int] = [0] * self.n_lasers
+        self.commands: List[str] = []
+        self.connections = 0
+        self.response_delay_s = 0.0
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # The headers and body are written separately, which stalls each response on a delayed ACK otherwise.
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def do_GET(self):
+                url = urllib.parse.urlparse(self.path)
+                command = urllib.parse.parse_qs(url.query).get("command", [""])[0]
+                body = json.dumps({"message": server.handle_command(command)}).encode()
+                time.sleep(server.response_delay_s)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        # Not http.server.ThreadingHTTPServer, which looks up the host's name when it starts
+        self._server = socketserver.ThreadingTCPServer((ip, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def handle_command(self, command: str) -> str:
+        with self._lock:
+            self.commands.append(command)
+            try:
+                return "A " + self._handle(command.split(" "))
+            except (ValueError, IndexError):
+                return "E " + command
+
+    def _handle(self, words: List[str]) -> str:
+        verb, name, args = words[0], words[1], words[2:]
+        if verb == "GET" and name == "IP":
+            return "IP " + self.ip
+        if verb == "GET" and name == "CHMAP":
+            return "CHMAP " + " ".join(self.LASER_COLORS)
+        if verb == "GET" and name == "MAXINT":
+            return f"MAXINT {self.max_intensity}"
+        if name == "TTLENABLE":
+            if verb == "SET":
+                self.ttl_enable = args[0] == "1"
+            return f"TTLENABLE {int(self.ttl_enable)}"
+        if name in ("CH", "CHINT"):
+            laser_id = int(args[0])
+            if not 0 <= laser_id < self.n_lasers:
+                raise ValueError(laser_id)
+            if verb == "SET" and name == "CH":
+                self.shutter_states[laser_id] = args[1] == "1"
+            elif verb == "SET":
+                self.intensities[laser_id] = self._intensity(args[1])
+            value = int(self.shutter_states[laser_id]) if name == "CH" else self.intensities[laser_id]
+            return f"{name} {laser_id} {value}"
+        if name in ("MULCH", "MULCHINT"):
+            if verb == "SET":
+                if len(args) != self.n_lasers:
+                    raise ValueError(args)
+                if name == "MULCH":
+                    self.shutter_states = [arg == "1" for arg in args]
+                else:
+                    self.intensities = [self._intensity(arg) for arg in args]
+            values = self.shutter_states if name == "MULCH" else self.intensities
+            return name + " " + " ".join(str(int(value)) for value in values)
+        raise ValueError(words)
+
+    def _intensity(self, arg: str) -> int:
+        intensity = int(arg)
+        if not 0 <= intensity <= self.max_intensity:
+            raise ValueError(intensity)
+        return intensity
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+
+class CELESTA_Simulation(CELESTA):
+    """A CELESTA connected to its own CelestaSimulationServer, which stops when it's shut down."""
+
+    def __init__(self, **kwds):
+        self.server = CelestaSimulationServer()
+        super().__init__(ip=self.server.ip, port=self.server.port, **kwds)
+
+    def shut_down(self):
+        super().shut_down()
+        self.server.close()
+
+
 #
 # The MIT License
 #
@@ -0,0 +1,110 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from control._def import *
+
+# The LED array illumination pattern for each configuration name substring.  When more than one matches, the last one
+# wins.
+_LED_ARRAY_PATTERNS = (
+    ("BF LED matrix left half", "dpc.l"),
+    ("BF LED matrix right half", "dpc.r"),
+    ("BF LED matrix top half", "dpc.t"),
+    ("BF LED matrix bottom half", "dpc.b"),
+    ("BF LED matrix full", "bf"),
+    ("DF LED matrix", "df"),
+)
+
+_LED_MATRIX_COLORS = (
+    ("BF LED matrix full_R", (1, 0, 0)),
+    ("BF LED matrix full_G", (0, 1, 0)),
+    ("BF LED matrix full_B", (0, 0, 1)),
+)
+
+
+def parse_wavelength(name: str) -> Optional[int]:
+    """The excitation wavelength [nm] in a configuration name like 'Fluorescence 488 nm Ex', or None."""
+    parts = name.split()
+    if "Fluorescence" in parts:
+        index = parts.index("Fluorescence") + 1
+        if index < len(parts) and parts[index].isdigit():
+            return int(parts[index])
+    return None
+
+
+@dataclass(frozen=True)
+class ChannelProgram:
+    """
+    Everything needed to switch the microscope to a channel, worked out once from a Configuration so that switching
+    channels doesn't need to parse names or look anything up.
+
+    operations is the state the devices need to be in for this channel, as {device operation: value}.  The
+    LiveController compares the slow ones (illumination and emission filter) to what it last sent, and only sends
+    those whose value changed.
+    """
+
+    name: str
+    exposure_time: float
+    analog_gain: float
+    illumination_source: int
+    illumination_intensity: float
+    emission_filter_position: Optional[int]
+    wavelength: Optional[int]
+    is_fluorescence: bool
+    uses_led_matrix: bool
+    # The (r, g, b) intensity multipliers for the microcontroller driven LED matrix
+    led_matrix_color: Tuple[float, float, float]
+    # The color and pattern for the SciMicroscopy LED array
+    led_array_color: Tuple[float, float, float]
+    led_array_pattern: Optional[str]
+
+    @property
+    def operations(self) -> Dict[str, Any]:
+        return {
+            "exposure_time": self.exposure_time,
+            "analog_gain": self.analog_gain,
+            "illumination": (self.illumination_source, self.illumination_intensity, self.led_matrix_color),
+            "emission_filter": (self.illumination_source, self.emission_filter_position),
+        }
+
+    def matches(self, configuration) -> bool:
+        """True if configuration hasn't changed since this program was compiled from it."""
+        return (
+            self.name == configuration.name
+            and self.exposure_time == configuration.exposure_time
+            and self.analog_gain == configuration.analog_gain
+            and self.illumination_source == configuration.illumination_source
+            and self.illumination_intensity == configuration.illumination_intensity
+            and self.emission_filter_position == configuration.emission_filter_position
+        )
+
+
+def compile_channel_program(configuration) -> ChannelProgram:
+    name = configuration.name
+
+    led_matrix_color = (LED_MATRIX_R_FACTOR, LED_MATRIX_G_FACTOR, LED_MATRIX_B_FACTOR)
+    led_array_color = tuple(SCIMICROSCOPY_LED_ARRAY_DEFAULT_COLOR)
+    for substring, color in _LED_MATRIX_COLORS:
+        if substring in name:
+            led_matrix_color = color
+            led_array_color = color
+            break
+
+    led_array_pattern = None
+    for substring, pattern in _LED_ARRAY_PATTERNS:
+        if substring in name:
+            led_array_pattern = pattern
+
+    return ChannelProgram(
+        name=name,
+        exposure_time=configuration.exposure_time,
+        analog_gain=configuration.analog_gain,
+        illumination_source=configuration.illumination_source,
+        illumination_intensity=configuration.illumination_intensity,
+        emission_filter_position=configuration.emission_filter_position,
+        wavelength=parse_wavelength(name),
+        is_fluorescence="Fluorescence" in name,
+        uses_led_matrix="LED matrix" in name,
+        led_matrix_color=led_matrix_color,
+        led_array_color=led_array_color,
+        led_array_pattern=led_array_pattern,
+    )
@@ -0,0 +1,155 @@
+from typing import Dict, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+
+def hex_to_rgb_ratios(hex_color: int) -> np.ndarray:
+    """0xRRGGBB -> float32 [r, g, b] in [0, 1]"""
+    return np.array([(hex_color >> 16) & 0xFF, (hex_color >> 8) & 0xFF, hex_color & 0xFF], dtype=np.float32) / 255
+
+
+def generate_dpc(
+    im_left: np.ndarray,
+    im_right: np.ndarray,
+    out: Optional[np.ndarray] = None,
+    scratch: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> np.ndarray:
+    """
+    Differential phase contrast of a left/right half illumination pair, as a uint8 image where 127 is no phase
+    gradient.  Pixels that are 0 in both images are 0.
+
+    This matches utils.generate_dpc (to within 1 count of float rounding), but works in float32, and doesn't allocate
+    if out and scratch are given.  scratch is a pair of float32 arrays with the same shape as the input images.
+    """
+    if scratch is None:
+        difference = im_left.astype(np.float32)
+        denominator = im_right.astype(np.float32)
+    else:
+        difference, denominator = scratch
+        np.copyto(difference, im_left, casting="unsafe")
+        np.copyto(denominator, im_right, casting="unsafe")
+    if out is None:
+        out = np.empty(im_left.shape, dtype=np.uint8)
+
+    # denominator <- left + right, then difference <- 2 * left - (left + right) = left - right
+    np.add(difference, denominator, out=denominator)
+    np.multiply(difference, 2, out=difference)
+    np.subtract(difference, denominator, out=difference)
+
+    # 255 * clip(0.5 + difference / denominator, 0, 1), where 0 / 0 -> 0
+    np.divide(difference, denominator, out=difference, where=denominator > 0)
+    np.multiply(difference, 255, out=difference)
+    np.add(difference, 127.5, out=difference)
+    np.clip(difference, 0, 255, out=difference)
+    np.copyto(difference, 0, where=denominator <= 0)
+    np.copyto(out, difference, casting="unsafe")
+    return out
+
+
+def pseudo_color(image: np.ndarray, hex_color: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Tint a mono image with hex_color (0xRRGGBB).  Returns an (..., 3) rgb image with the same dtype as image.
+
+    Each output channel is written directly from image * ratio in float32, so unlike stacking the image 3 times and
+    multiplying there is no 3x float64 temporary.
+    """
+    if out is None:
+        out = np.empty(image.shape + (3,), dtype=image.dtype)
+    for channel, ratio in enumerate(hex_to_rgb_ratios(hex_color)):
+        np.multiply(image, ratio, out=out[..., channel], casting="unsafe")
+    return out
+
+
+def merge_rgb(red: np.ndarray, green: np.ndarray, blue: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Interleave three mono images into one (..., 3) rgb image."""
+    if out is None:
+        out = np.empty(red.shape + (3,), dtype=red.dtype)
+    out[..., 0] = red
+    out[..., 1] = green
+    out[..., 2] = blue
+    return out
+
+
+def saturating_add(accumulator: np.ndarray, image: np.ndarray) -> np.ndarray:
+    """
+    accumulator += image in place, clipping at the max of the accumulator's dtype instead of wrapping around.
+    """
+    if accumulator.dtype in (np.uint8, np.uint16) and image.dtype == accumulator.dtype:
+        # opencv saturates uint8 and uint16 adds natively.
+        cv2.add(accumulator, np.ascontiguousarray(image), dst=accumulator)
+    elif np.issubdtype(accumulator.dtype, np.integer):
+        info = np.iinfo(accumulator.dtype)
+        wide = accumulator.astype(np.int64)
+        np.add(wide, image, out=wide, casting="unsafe")
+        np.clip(wide, info.min, info.max, out=wide)
+        np.copyto(accumulator, wide, casting="unsafe")
+    else:
+        np.add(accumulator, image, out=accumulator, casting="unsafe")
+    return accumulator
+
+
+class Compositor:
+    """
+    Makes the composite images (dpc, pseudo color, rgb and merged channels) for an acquisition, reusing one set of
+    buffers for every FOV instead of allocating new images each time.
+
+    The arrays returned by the methods below are those buffers, and are overwritten by the next call of the same
+    kind.  Copy them if they need to outlive that (ex: if they're emitted to the GUI).  A Compositor is not thread
+    safe; use one per thread.
+    """
+
+    def __init__(self):
+        self._buffers: Dict[str, np.ndarray] = {}
+        self._merged_count = 0
+
+    def _get_buffer(self, name: str, shape: Sequence[int], dtype) -> np.ndarray:
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buffer
+        return buffer
+
+    def dpc(self, im_left: np.ndarray, im_right: np.ndarray) -> np.ndarray:
+        scratch = (
+            self._get_buffer("dpc_difference", im_left.shape, np.float32),
+            self._get_buffer("dpc_denominator", im_left.shape, np.float32),
+        )
+        return generate_dpc(im_left, im_right, self._get_buffer("dpc", im_left.shape, np.uint8), scratch)
+
+    def pseudo_color(self, image: np.ndarray, hex_color: int) -> np.ndarray:
+        return pseudo_color(image, hex_color, self._get_buffer("pseudo_color", image.shape + (3,), image.dtype))
+
+    def merge_rgb(self, red: np.ndarray, green: np.ndarray, blue: np.ndarray) -> np.ndarray:
+        return merge_rgb(red, green, blue, self._get_buffer("rgb", red.shape + (3,), red.dtype))
+
+    @property
+    def merged_count(self) -> int:
+        """The number of images added to the merged image since the last reset_merged."""
+        return self._merged_count
+
+    def add_to_merged(self, image: np.ndarray) -> np.ndarray:
+        """
+        Saturating add image into the merged image, and return the merged image so far.  Every image of a merge must
+        have the shape and dtype of the first one; raises ValueError otherwise, and the merge so far is kept.
+        """
+        if self._merged_count == 0:
+            merged = self._get_buffer("merged", image.shape, image.dtype)
+            np.copyto(merged, image)
+        else:
+            merged = self._buffers["merged"]
+            if merged.shape != image.shape or merged.dtype != image.dtype:
+                raise ValueError(
+                    f"Can't merge a {image.shape} {image.dtype} image into a {merged.shape} {merged.dtype} one"
+                )
+            saturating_add(merged, image)
+        self._merged_count += 1
+        return merged
+
+    def reset_merged(self):
+        self._merged_count = 0
+
+    def clear(self):
+        """Free all the buffers."""
+        self._buffers.clear()
+        self._merged_count = 0
@@ -0,0 +1,171 @@
+import dataclasses
+import time
+from typing import Callable, List, Optional, Sequence
+
+import squid.logging
+from squid.abc import AbstractStage, Pos
+from control._def import *
+
+
+def plan_sweep_speed(
+    pixel_size_um: float,
+    illumination_on_time_us: float,
+    fov_pitch_mm: float,
+    frame_period_s: float,
+    max_speed_mm: float = CONTINUOUS_SCAN_MAX_SPEED_MM,
+    max_blur_px: float = CONTINUOUS_SCAN_MAX_BLUR_PX,
+) -> float:
+    """
+    The speed (mm/s) to sweep through FOVs that are fov_pitch_mm apart: the fastest that moves the image at most
+    max_blur_px pixels while the illumination is on, and that still leaves the camera frame_period_s per FOV.
+    """
+    # um/us is m/s, so * 1000 for mm/s
+    speed = max_blur_px * pixel_size_um / illumination_on_time_us * 1000
+    if frame_period_s > 0:
+        speed = min(speed, fov_pitch_mm / frame_period_s)
+    return min(speed, max_speed_mm)
+
+
+def plan_illumination_on_time_us(
+    exposure_time_ms: float,
+    pixel_size_um: float,
+    fov_pitch_mm: float,
+    frame_period_s: float,
+    max_speed_mm: float = CONTINUOUS_SCAN_MAX_SPEED_MM,
+    max_blur_px: float = CONTINUOUS_SCAN_MAX_BLUR_PX,
+    min_on_time_us: float = CONTINUOUS_SCAN_MIN_ILLUMINATION_ON_TIME_US,
+) -> float:
+    """
+    How long (us) to pulse the light for each FOV of a hardware triggered sweep: the whole exposure, unless that
+    would blur more than max_blur_px at the fastest speed the frame rate (and stage) allow.  Then the pulse is cut
+    to what keeps the blur under max_blur_px at that speed, but not below min_on_time_us.
+    """
+    speed = max_speed_mm
+    if frame_period_s > 0:
+        speed = min(speed, fov_pitch_mm / frame_period_s)
+    # mm/s is um/ms, so / 1000 for um/us
+    max_on_time_us = max_blur_px * pixel_size_um / speed * 1000
+    return min(exposure_time_ms * 1000, max(max_on_time_us, min_on_time_us))
+
+
+@dataclasses.dataclass
+class SweepTrigger:
+    # Which FOV (an index into the x_mm given to RowSweep.run)
+    index: int
+    # time.time() right before the trigger was sent
+    trigger_time: float
+    # Where the stage was while the FOV was lit
+    pos: Optional[Pos] = None
+
+
+class RowSweep:
+    """
+    Images a row of FOVs (at x_mm positions along one y_mm) while the stage moves through them at a constant speed,
+    instead of stopping at each one.
+
+    The firmware can't fire triggers at stage positions, so the sweep watches the position the microcontroller
+    reports and calls trigger() as the stage reaches each FOV, and then on_trigger(index, trigger_time) (ex: to read
+    the frame).  The light should only be on for a short pulse (see plan_sweep_speed), so the exact trigger position
+    doesn't matter much: each FOV is tagged with where the stage was halfway through the pulse (tag_delay_s after
+    the trigger), from the stage's position history.
+
+    If the stage is already more than max_trigger_error_mm past a FOV when it gets there (ex: because on_trigger took
+    longer than the travel between FOVs), that FOV is skipped and left for the caller to image some other way.
+
+    The stage needs to be a SpeedLimitedStage, to move at the sweep's speed.
+    """
+
+    def __init__(
+        self,
+        stage: AbstractStage,
+        trigger: Callable[[], None],
+        speed_mm_s: float,
+        on_trigger: Optional[Callable[[int, float], None]] = None,
+        tag_delay_s: float = 0.0,
+        poll_interval_s: float = CONTINUOUS_SCAN_POLL_INTERVAL_MS / 1000,
+        max_trigger_error_mm: float = CONTINUOUS_SCAN_MAX_TRIGGER_ERROR_UM / 1000,
+    ):
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self.stage = stage
+        self.trigger = trigger
+        self.speed_mm_s = speed_mm_s
+        self.on_trigger = on_trigger
+        self.tag_delay_s = tag_delay_s
+        self.poll_interval_s = poll_interval_s
+        self.max_trigger_error_mm = max_trigger_error_mm
+
+    def get_run_up_mm(self) -> float:
+        """How far before the first FOV (and after the last) the sweep starts (and ends), to be at speed in between."""
+        # Twice the distance needed at constant acceleration, since the firmware's ramp is gentler than that.
+        return self.speed_mm_s**2 / self.stage.get_config().X_AXIS.MAX_ACCELERATION
+
+    def run(
+        self, x_mm: Sequence[float], y_mm: float, abort: Optional[Callable[[], bool]] = None
+    ) -> List[Optional[SweepTrigger]]:
+        """
+        Sweep through x_mm in the given order (which must be sorted, in either direction).  Returns a SweepTrigger
+        for each FOV, or None for the FOVs that were skipped (or not reached because of abort).
+        """
+        triggers: List[Optional[SweepTrigger]] = [None] * len(x_mm)
+        if not len(x_mm):
+            return triggers
+
+        direction = 1 if x_mm[-1] >= x_mm[0] else -1
+        start_mm = x_mm[0] - direction * self.get_run_up_mm()
+        end_mm = x_mm[-1] + direction * self.get_run_up_mm()
+
+        # Positions are only as good as the stage's resolution, so a FOV counts as reached when it's that close.
+        resolution_mm = self._get_resolution_mm()
+
+        self.stage.move_y_to(y_mm)
+        self.stage.move_x_to(start_mm)
+        self.stage.set_x_max_speed(self.speed_mm_s)
+        try:
+            self.stage.move_x_to(end_mm, blocking=False)
+            deadline = time.time() + 3 * abs(end_mm - start_mm) / self.speed_mm_s + 3
+            next_index = 0
+            while next_index < len(x_mm):
+                if abort is not None and abort():
+                    break
+                if time.time() > deadline:
+                    self._log.error(f"Timed out waiting for the stage to reach x={x_mm[next_index]} [mm]")
+                    break
+
+                # How far past the next FOV the stage is (negative before it gets there)
+                past_mm = (self.stage.get_pos().x_mm - x_mm[next_index]) * direction
+                if past_mm < -resolution_mm:
+                    time.sleep(self.poll_interval_s)
+                    continue
+                if past_mm > self.max_trigger_error_mm:
+                    self._log.warning(f"Missed x={x_mm[next_index]} [mm] by {past_mm * 1000:.1f} [um], skipping it")
+                    next_index += 1
+                    continue
+
+                trigger_time = time.time()
+                self.trigger()
+                triggers[next_index] = SweepTrigger(next_index, trigger_time)
+                if self.on_trigger is not None:
+                    self.on_trigger(next_index, trigger_time)
+                next_index += 1
+
+            self._wait_for_x(end_mm, resolution_mm, deadline)
+        finally:
+            self.stage.set_x_max_speed(None)
+
+        # Tag after the sweep, so that the position history has packets from both sides of every trigger.
+        for trigger in triggers:
+            if trigger is not None:
+                trigger.pos = self.stage.get_pos_at(trigger.trigger_time + self.tag_delay_s)
+        return triggers
+
+    def _get_resolution_mm(self) -> float:
+        return max(abs(self.stage.get_config().X_AXIS.convert_to_real_units(2)), 0.001)
+
+    def _wait_for_x(self, x_mm: float, tolerance_mm: float, deadline: float):
+        # The stage isn't "busy" with the move once another command (ex: a trigger) has been sent, so wait for the
+        # position instead.
+        while abs(self.stage.get_pos().x_mm - x_mm) > tolerance_mm:
+            if time.time() > deadline:
+                self._log.error(f"Timed out waiting for the stage to stop at x={x_mm} [mm]")
+                return
+            time.sleep(self.poll_interval_s)
@@ -17,15 +17,22 @@ from qtpy.QtGui import *
 # control
 from control._def import *
 
-if DO_FLUORESCENCE_RTP:
+if DO_FLUORESCENCE_RTP or MULTIPOINT_COMPOSITE_IN_BACKGROUND:
     from control.processing_handler import ProcessingHandler
+if DO_FLUORESCENCE_RTP:
     from control.processing_pipeline import *
     from control.multipoint_built_in_functionalities import malaria_rtp
 
 import control.utils as utils
+import control.acquisition_index as acquisition_index
+from control.camera_geometry import GeometryPlan, SoftwareGeometry
+import control.compositing as compositing
+from control.continuous_scan import RowSweep, plan_illumination_on_time_us, plan_sweep_speed
+from control.channel_program import ChannelProgram, compile_channel_program
 import control.utils_config as utils_config
-import control.tracking as tracking
 import control.serial_peripherals as serial_peripherals
+from control.recording_formats import RecordingWriter, make_recording_writer
+from squid.recording_sink import RecordingSink, RecordingSinkStats
 
 try:
     from control.multipoint_custom_script_entry_v2 import *
@@ -34,9 +41,10 @@ try:
 except:
     pass
 
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from queue import Queue
-from threading import Thread, Lock
+from threading import Thread, Lock, RLock
+import concurrent.futures
 from pathlib import Path
 from datetime import datetime
 import time
@@ -49,7 +57,6 @@ import math
 import random
 import numpy as np
 import pandas as pd
-import scipy.signal
 import cv2
 import imageio as iio
 import squid.abc
@@ -64,10 +71,23 @@ class ObjectiveStore:
         self.sensor_pixel_size_um = CAMERA_PIXEL_SIZE_UM[CAMERA_SENSOR]
         self.pixel_binning = self.get_pixel_binning()
         self.pixel_size_um = self.calculate_pixel_size(self.current_objective)
+        # The size of the main camera's images, in (binned) pixels
+        self.image_width = Acquisition.CROP_WIDTH
+        self.image_height = Acquisition.CROP_HEIGHT
 
     def get_pixel_size(self):
         return self.pixel_size_um
 
+    def set_camera_geometry(self, plan: GeometryPlan):
+        self.pixel_binning = plan.binning
+        self.image_width = plan.output_width
+        self.image_height = plan.output_height
+        self.pixel_size_um = self.calculate_pixel_size(self.current_objective)
+
+    def get_fov_size_mm(self):
+        """The width of the main camera's field of view with the current objective."""
+        return self.image_width * self.pixel_size_um / 1000
+
     def calculate_pixel_size(self, objective_name):
         objective = self.objectives_dict[objective_name]
         magnification = objective["magnification"]
@@ -111,11 +131,16 @@ class StreamHandler(QObject):
         self.fps_save = 1
         self.fps_track = 1
         self.timestamp_last_display = 0
+        # When (roughly) the photons of the last frame sent to display hit the sensor: the time.time() the camera
+        # delivered it, less its exposure.  Valid while image_to_display's (direct) receivers run.
+        self.display_capture_timestamp = 0
         self.timestamp_last_save = 0
         self.timestamp_last_track = 0
 
         self.crop_width = crop_width
         self.crop_height = crop_height
+        # If set, how frames are cropped and binned instead of cropping them to crop_width x crop_height
+        self.software_geometry: Optional[SoftwareGeometry] = None
         self.display_resolution_scaling = display_resolution_scaling
 
         self.save_image_flag = False
@@ -148,6 +173,17 @@ class StreamHandler(QObject):
     def set_crop(self, crop_width, crop_height):
         self.crop_width = crop_width
         self.crop_height = crop_height
+        self.software_geometry = None
+
+    def set_camera_geometry(self, plan: GeometryPlan):
+        self.crop_width = plan.output_width
+        self.crop_height = plan.output_height
+        self.software_geometry = SoftwareGeometry(plan)
+
+    def crop_frame(self, image):
+        if self.software_geometry is not None:
+            return self.software_geometry.apply(image)
+        return utils.crop_image(image, self.crop_width, self.crop_height)
 
     def set_display_resolution_scaling(self, display_resolution_scaling):
         self.display_resolution_scaling = display_resolution_scaling / 100
@@ -177,7 +213,7 @@ class StreamHandler(QObject):
             # camera.current_frame = utils.rotate_and_flip_image(camera.current_frame,rotate_image_angle=camera.rotate_image_angle,flip_image=camera.flip_image)
 
             # crop image
-            image_cropped = utils.crop_image(camera.current_frame, self.crop_width, self.crop_height)
+            image_cropped = self.crop_frame(camera.current_frame)
             image_cropped = np.squeeze(image_cropped)
 
             # # rotate and flip - moved up (1/10/2022)
@@ -191,6 +227,7 @@ class StreamHandler(QObject):
             # send image to display
             time_now = time.time()
             if time_now - self.timestamp_last_display >= 1 / self.fps_display:
+                self.display_capture_timestamp = camera.timestamp - camera.exposure_time / 1000
                 # self.image_to_display.emit(cv2.resize(image_cropped,(round(self.crop_width*self.display_resolution_scaling), round(self.crop_height*self.display_resolution_scaling)),cv2.INTER_LINEAR))
                 self.image_to_display.emit(
                     utils.crop_image(
@@ -247,71 +284,87 @@ class StreamHandler(QObject):
     """
 
 
+def make_recording_sink(write, name, key=None, on_error=None, on_idle=None, idle_interval_s=1.0) -> RecordingSink:
+    """A RecordingSink for write, with the buffer size and overflow policy of the RECORDING_ settings."""
+    return RecordingSink(
+        write,
+        max_bytes=int(RECORDING_BUFFER_MB * 1024**2),
+        policy=RECORDING_OVERFLOW_POLICY,
+        spill_dir=RECORDING_SPILL_DIR,
+        max_spill_bytes=int(RECORDING_SPILL_MAX_MB * 1024**2),
+        key=key,
+        on_error=on_error,
+        name=name,
+        on_idle=on_idle,
+        idle_interval_s=idle_interval_s,
+    )
+
+
 class ImageSaver(QObject):
 
     stop_recording = Signal()
+    # The first error saving a frame of a recording (which also stops the recording)
+    recording_error = Signal(str)
 
-    def __init__(self, image_format=Acquisition.IMAGE_FORMAT):
+    def __init__(self, image_format=Acquisition.IMAGE_FORMAT, recording_format=RECORDING_FORMAT):
         QObject.__init__(self)
+        self._log = squid.logging.get_logger(self.__class__.__name__)
         self.base_path = "./"
         self.experiment_ID = ""
         self.image_format = image_format
-        self.max_num_image_per_folder = 1000
-        self.queue = Queue(10)  # max 10 items in the queue
+        self.recording_format = recording_format
+        # The writer of the current recording, made in recording_path when its first frame is saved.  These are only
+        # changed by the sink's worker, once the frames of the last recording are written.
+        self.writer: Optional[RecordingWriter] = None
+        self.recording_path = None
+        self._writing_finished = False
+        # Whether finish_recording was called since the last start_new_experiment
+        self._recording_finished = True
+        # Frames are (image, frame_ID, timestamp), and lost frames are recorded by their frame_ID.  enqueue should be
+        # called from the thread frames arrive on (ex: with a DirectConnection), so that RECORDING_OVERFLOW_POLICY =
+        # "block" slows that down rather than the GUI.
+        self.sink = make_recording_sink(
+            self.save_image, self.__class__.__name__, key=lambda item: item[1], on_error=self._on_save_error
+        )
+        self._warned_about_dropping = False
         self.image_lock = Lock()
-        self.stop_signal_received = False
-        self.thread = Thread(target=self.process_queue)
-        self.thread.start()
-        self.counter = 0
         self.recording_start_time = 0
         self.recording_time_limit = -1
 
-    def process_queue(self):
-        while True:
-            # stop the thread if stop signal is received
-            if self.stop_signal_received:
-                return
-            # process the queue
-            try:
-                [image, frame_ID, timestamp] = self.queue.get(timeout=0.1)
-                self.image_lock.acquire(True)
-                folder_ID = int(self.counter / self.max_num_image_per_folder)
-                file_ID = int(self.counter % self.max_num_image_per_folder)
-                # create a new folder
-                if file_ID == 0:
-                    os.mkdir(os.path.join(self.base_path, self.experiment_ID, str(folder_ID)))
-
-                if image.dtype == np.uint16:
-                    # need to use tiff when saving 16 bit images
-                    saving_path = os.path.join(
-                        self.base_path, self.experiment_ID, str(folder_ID), str(file_ID) + "_" + str(frame_ID) + ".tiff"
-                    )
-                    iio.imwrite(saving_path, image)
-                else:
-                    saving_path = os.path.join(
-                        self.base_path,
-                        self.experiment_ID,
-                        str(folder_ID),
-                        str(file_ID) + "_" + str(frame_ID) + "." + self.image_format,
-                    )
-                    cv2.imwrite(saving_path, image)
+    def save_image(self, image, frame_ID, timestamp):
+        with self.image_lock:
+            if self.writer is None:
+                if self._writing_finished:
+                    # The frame was on its way when the recording stopped.  A new writer would overwrite the recording.
+                    self._log.debug(f"Not saving frame {frame_ID}, it arrived after its recording was finished")
+                    return
+                if self.recording_path is None:
+                    self.recording_path = os.path.join(self.base_path, self.experiment_ID)
+                self.writer = make_recording_writer(self.recording_format, self.recording_path, self.image_format)
+            self.writer.write(image, frame_ID, timestamp)
 
-                self.counter = self.counter + 1
-                self.queue.task_done()
-                self.image_lock.release()
-            except:
-                pass
+    def _close_writer(self):
+        with self.image_lock:
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+
+    def _on_save_error(self, error):
+        self.recording_error.emit(f"Saving the recording to {self.experiment_ID} failed: {error}")
+        self.stop_recording.emit()
 
     def enqueue(self, image, frame_ID, timestamp):
-        try:
-            self.queue.put_nowait([image, frame_ID, timestamp])
-            if (self.recording_time_limit > 0) and (
-                time.time() - self.recording_start_time >= self.recording_time_limit
-            ):
-                self.stop_recording.emit()
-            # when using self.queue.put(str_), program can be slowed down despite multithreading because of the block and the GIL
-        except:
-            print("imageSaver queue is full, image discarded")
+        if not self.sink.put(image, frame_ID, timestamp) and not self._warned_about_dropping:
+            self._log.warning(
+                f"The recording buffer is full ({RECORDING_OVERFLOW_POLICY}), frame {frame_ID} was dropped.  Lost "
+                "frames are counted in the recording stats."
+            )
+            self._warned_about_dropping = True
+        if (self.recording_time_limit > 0) and (time.time() - self.recording_start_time >= self.recording_time_limit):
+            self.stop_recording.emit()
+
+    def get_stats(self) -> RecordingSinkStats:
+        return self.sink.get_stats()
 
     def set_base_path(self, path):
         self.base_path = path
@@ -320,6 +373,7 @@ class ImageSaver(QObject):
         self.recording_time_limit = time_limit
 
     def start_new_experiment(self, experiment_ID, add_timestamp=True):
+        self.finish_recording()
         if add_timestamp:
             # generate unique experiment ID
             self.experiment_ID = experiment_ID + "_" + datetime.now().strftime("%Y-%m-%d_%H-%M-%S.%f")
@@ -327,75 +381,96 @@ class ImageSaver(QObject):
             self.experiment_ID = experiment_ID
         self.recording_start_time = time.time()
         # create a new folder
-        try:
-            os.mkdir(os.path.join(self.base_path, self.experiment_ID))
-            # to do: save configuration
-        except:
-            pass
-        # reset the counter
-        self.counter = 0
+        recording_path = os.path.join(self.base_path, self.experiment_ID)
+        os.makedirs(recording_path, exist_ok=True)
+        # The sink's worker switches to the new recording once the last one's frames are written, so this doesn't
+        # wait for them.
+        self.sink.call_when_written(lambda stats: self._start_writing(recording_path))
+        self.sink.reset_stats()
+        self._recording_finished = False
+        self._warned_about_dropping = False
+
+    def finish_recording(self):
+        """
+        Close the recording's writer, which completes its container (ex: cuts a BIGTIFF file's unused pages off and
+        writes a ZARR's last chunk), once its frames are written.  Doesn't wait for that.  Call it when the recording
+        stops, calling it again before the next start_new_experiment does nothing.
+        """
+        if self._recording_finished:
+            return
+        self._recording_finished = True
+        experiment_ID = self.experiment_ID
+        self.sink.call_when_written(lambda stats: self._finish_writing(experiment_ID, stats))
+
+    def _finish_writing(self, experiment_ID, stats: RecordingSinkStats):
+        self._close_writer()
+        self._writing_finished = True
+        self._log_recording_summary(experiment_ID, stats)
+
+    def _start_writing(self, recording_path):
+        self.recording_path = recording_path
+        self._writing_finished = False
+
+    def _log_recording_summary(self, experiment_ID, stats: RecordingSinkStats):
+        if not stats.accepted:
+            return
+        message = f"Recording {experiment_ID}: {stats.describe()}"
+        if stats.lost:
+            self._log.warning(f"{message}.  Lost frames: {stats.lost_keys}")
+        else:
+            self._log.info(message)
 
     def close(self):
-        self.queue.join()
-        self.stop_signal_received = True
-        self.thread.join()
+        self.finish_recording()
+        self.sink.close()
+        self._close_writer()
 
 
 class ImageSaver_Tracking(QObject):
     def __init__(self, base_path, image_format="bmp"):
         QObject.__init__(self)
+        self._log = squid.logging.get_logger(self.__class__.__name__)
         self.base_path = base_path
         self.image_format = image_format
         self.max_num_image_per_folder = 1000
-        self.queue = Queue(100)  # max 100 items in the queue
+        # Frames are (image, frame_counter, postfix), and lost frames are recorded by their frame_counter
+        self.sink = make_recording_sink(self.save_image, self.__class__.__name__, key=lambda item: item[1])
         self.image_lock = Lock()
-        self.stop_signal_received = False
-        self.thread = Thread(target=self.process_queue)
-        self.thread.start()
 
-    def process_queue(self):
-        while True:
-            # stop the thread if stop signal is received
-            if self.stop_signal_received:
-                return
-            # process the queue
-            try:
-                [image, frame_counter, postfix] = self.queue.get(timeout=0.1)
-                self.image_lock.acquire(True)
-                folder_ID = int(frame_counter / self.max_num_image_per_folder)
-                file_ID = int(frame_counter % self.max_num_image_per_folder)
-                # create a new folder
-                if file_ID == 0:
-                    os.mkdir(os.path.join(self.base_path, str(folder_ID)))
-                if image.dtype == np.uint16:
-                    saving_path = os.path.join(
-                        self.base_path,
-                        str(folder_ID),
-                        str(file_ID) + "_" + str(frame_counter) + "_" + postfix + ".tiff",
-                    )
-                    iio.imwrite(saving_path, image)
-                else:
-                    saving_path = os.path.join(
-                        self.base_path,
-                        str(folder_ID),
-                        str(file_ID) + "_" + str(frame_counter) + "_" + postfix + "." + self.image_format,
-                    )
-                    cv2.imwrite(saving_path, image)
-                self.queue.task_done()
-                self.image_lock.release()
-            except:
-                pass
+    def save_image(self, image, frame_counter, postfix):
+        with self.image_lock:
+            folder_ID = int(frame_counter / self.max_num_image_per_folder)
+            file_ID = int(frame_counter % self.max_num_image_per_folder)
+            # create a new folder
+            if file_ID == 0:
+                os.makedirs(os.path.join(self.base_path, str(folder_ID)), exist_ok=True)
+            if image.dtype == np.uint16:
+                saving_path = os.path.join(
+                    self.base_path,
+                    str(folder_ID),
+                    str(file_ID) + "_" + str(frame_counter) + "_" + postfix + ".tiff",
+                )
+                iio.imwrite(saving_path, image)
+            else:
+                saving_path = os.path.join(
+                    self.base_path,
+                    str(folder_ID),
+                    str(file_ID) + "_" + str(frame_counter) + "_" + postfix + "." + self.image_format,
+                )
+                if not cv2.imwrite(saving_path, image):
+                    raise IOError(f"Couldn't write {saving_path}")
 
     def enqueue(self, image, frame_counter, postfix):
-        try:
-            self.queue.put_nowait([image, frame_counter, postfix])
-        except:
-            print("imageSaver queue is full, image discarded")
+        self.sink.put(image, frame_counter, postfix)
+
+    def get_stats(self) -> RecordingSinkStats:
+        return self.sink.get_stats()
 
     def close(self):
-        self.queue.join()
-        self.stop_signal_received = True
-        self.thread.join()
+        self.sink.close()
+        stats = self.sink.get_stats()
+        if stats.lost:
+            self._log.warning(f"Tracking images: {stats.describe()}.  Lost frames: {stats.lost_keys}")
 
 
 class ImageDisplay(QObject):
@@ -477,6 +552,12 @@ class Configuration:
         self.emission_filter_position = emission_filter_position
 
 
+_UNSET = object()
+# The camera settings are cheap to send, and the camera widgets also change them directly, so run_channel_program
+# always sends them instead of trusting what it last sent.
+_ALWAYS_SENT_OPERATIONS = ("exposure_time", "analog_gain")
+
+
 class LiveController(QObject):
     def __init__(
         self,
@@ -490,6 +571,7 @@ class LiveController(QObject):
         for_displacement_measurement=False,
     ):
         QObject.__init__(self)
+        self._log = squid.logging.get_logger(self.__class__.__name__)
         self.microscope = parent
         self.camera = camera
         self.microcontroller = microcontroller
@@ -522,6 +604,13 @@ class LiveController(QObject):
 
         self.enable_channel_auto_filter_switching = True
 
+        # {configuration id: ChannelProgram}
+        self._channel_programs = {}
+        # The value of each (slow) channel program operation as last sent to the hardware
+        self._hardware_state = {}
+        self._hardware_lock = RLock()
+        self._filter_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
         if USE_LDI_SERIAL_CONTROL:
             self.ldi = self.microscope.ldi
 
@@ -534,76 +623,53 @@ class LiveController(QObject):
 
     # illumination control
     def turn_on_illumination(self):
-        if self.illuminationController is not None and not "LED matrix" in self.currentConfiguration.name:
-            self.illuminationController.turn_on_illumination(
-                int(self.configurationManager.extract_wavelength(self.currentConfiguration.name))
-            )
-        elif SUPPORT_SCIMICROSCOPY_LED_ARRAY and "LED matrix" in self.currentConfiguration.name:
+        program = self.get_channel_program(self.currentConfiguration)
+        if self.illuminationController is not None and not program.uses_led_matrix:
+            self.illuminationController.turn_on_illumination(program.wavelength)
+        elif SUPPORT_SCIMICROSCOPY_LED_ARRAY and program.uses_led_matrix:
             self.led_array.turn_on_illumination()
         else:
             self.microcontroller.turn_on_illumination()
         self.illumination_on = True
 
     def turn_off_illumination(self):
-        if self.illuminationController is not None and not "LED matrix" in self.currentConfiguration.name:
-            self.illuminationController.turn_off_illumination(
-                int(self.configurationManager.extract_wavelength(self.currentConfiguration.name))
-            )
-        elif SUPPORT_SCIMICROSCOPY_LED_ARRAY and "LED matrix" in self.currentConfiguration.name:
+        program = self.get_channel_program(self.currentConfiguration)
+        if self.illuminationController is not None and not program.uses_led_matrix:
+            self.illuminationController.turn_off_illumination(program.wavelength)
+        elif SUPPORT_SCIMICROSCOPY_LED_ARRAY and program.uses_led_matrix:
             self.led_array.turn_off_illumination()
         else:
             self.microcontroller.turn_off_illumination()
         self.illumination_on = False
 
     def set_illumination(self, illumination_source, intensity, update_channel_settings=True):
+        program = self.get_channel_program(self.currentConfiguration)
+        with self._hardware_lock:
+            filter_future = self._filter_executor.submit(self._set_emission_filter, program)
+            self._set_illumination(program, illumination_source, intensity, update_channel_settings)
+            filter_future.result()
+            # These weren't necessarily set from a program, so the next program needs to send them again.
+            self._hardware_state.pop("illumination", None)
+            self._hardware_state.pop("emission_filter", None)
+
+    def _set_illumination(self, program, illumination_source, intensity, update_channel_settings=True):
         if illumination_source < 10:  # LED matrix
             if SUPPORT_SCIMICROSCOPY_LED_ARRAY:
-                # set color
-                if "BF LED matrix full_R" in self.currentConfiguration.name:
-                    self.led_array.set_color((1, 0, 0))
-                elif "BF LED matrix full_G" in self.currentConfiguration.name:
-                    self.led_array.set_color((0, 1, 0))
-                elif "BF LED matrix full_B" in self.currentConfiguration.name:
-                    self.led_array.set_color((0, 0, 1))
-                else:
-                    self.led_array.set_color(SCIMICROSCOPY_LED_ARRAY_DEFAULT_COLOR)
-                # set intensity
+                self.led_array.set_color(program.led_array_color)
                 self.led_array.set_brightness(intensity)
-                # set mode
-                if "BF LED matrix left half" in self.currentConfiguration.name:
-                    self.led_array.set_illumination("dpc.l")
-                if "BF LED matrix right half" in self.currentConfiguration.name:
-                    self.led_array.set_illumination("dpc.r")
-                if "BF LED matrix top half" in self.currentConfiguration.name:
-                    self.led_array.set_illumination("dpc.t")
-                if "BF LED matrix bottom half" in self.currentConfiguration.name:
-                    self.led_array.set_illumination("dpc.b")
-                if "BF LED matrix full" in self.currentConfiguration.name:
-                    self.led_array.set_illumination("bf")
-                if "DF LED matrix" in self.currentConfiguration.name:
-                    self.led_array.set_illumination("df")
+                if program.led_array_pattern is not None:
+                    self.led_array.set_illumination(program.led_array_pattern)
             else:
-                if "BF LED matrix full_R" in self.currentConfiguration.name:
-                    self.microcontroller.set_illumination_led_matrix(illumination_source, r=(intensity / 100), g=0, b=0)
-                elif "BF LED matrix full_G" in self.currentConfiguration.name:
-                    self.microcontroller.set_illumination_led_matrix(illumination_source, r=0, g=(intensity / 100), b=0)
-                elif "BF LED matrix full_B" in self.currentConfiguration.name:
-                    self.microcontroller.set_illumination_led_matrix(illumination_source, r=0, g=0, b=(intensity / 100))
-                else:
-                    self.microcontroller.set_illumination_led_matrix(
-                        illumination_source,
-                        r=(intensity / 100) * LED_MATRIX_R_FACTOR,
-                        g=(intensity / 100) * LED_MATRIX_G_FACTOR,
-                        b=(intensity / 100) * LED_MATRIX_B_FACTOR,
-                    )
+                r, g, b = program.led_matrix_color
+                self.microcontroller.set_illumination_led_matrix(
+                    illumination_source, r=(intensity / 100) * r, g=(intensity / 100) * g, b=(intensity / 100) * b
+                )
         else:
             # update illumination
             if self.illuminationController is not None:
-                self.illuminationController.set_intensity(
-                    int(self.configurationManager.extract_wavelength(self.currentConfiguration.name)), intensity
-                )
-            elif ENABLE_NL5 and NL5_USE_DOUT and "Fluorescence" in self.currentConfiguration.name:
-                wavelength = int(self.currentConfiguration.name[13:16])
+                self.illuminationController.set_intensity(program.wavelength, intensity)
+            elif ENABLE_NL5 and NL5_USE_DOUT and program.is_fluorescence:
+                wavelength = program.wavelength
                 self.microscope.nl5.set_active_channel(NL5_WAVENLENGTH_MAP[wavelength])
                 if NL5_USE_AOUT and update_channel_settings:
                     self.microscope.nl5.set_laser_power(NL5_WAVENLENGTH_MAP[wavelength], int(intensity))
@@ -612,11 +678,16 @@ class LiveController(QObject):
             else:
                 self.microcontroller.set_illumination(illumination_source, intensity)
 
+    def _set_emission_filter(self, program):
+        """
+        Move the emission filter(s) for program, including any settling delay.  This runs on the filter executor so
+        that it overlaps with setting up the camera and illumination.
+        """
         # set emission filter position
         if ENABLE_SPINNING_DISK_CONFOCAL:
             try:
                 self.microscope.xlight.set_emission_filter(
-                    XLIGHT_EMISSION_FILTER_MAPPING[illumination_source],
+                    XLIGHT_EMISSION_FILTER_MAPPING[program.illumination_source],
                     extraction=False,
                     validate=XLIGHT_VALIDATE_WHEEL_POS,
                 )
@@ -625,17 +696,14 @@ class LiveController(QObject):
 
         if USE_ZABER_EMISSION_FILTER_WHEEL and self.enable_channel_auto_filter_switching:
             try:
-                if (
-                    self.currentConfiguration.emission_filter_position
-                    != self.microscope.emission_filter_wheel.current_index
-                ):
+                if program.emission_filter_position != self.microscope.emission_filter_wheel.current_index:
                     if ZABER_EMISSION_FILTER_WHEEL_BLOCKING_CALL:
                         self.microscope.emission_filter_wheel.set_emission_filter(
-                            self.currentConfiguration.emission_filter_position, blocking=True
+                            program.emission_filter_position, blocking=True
                         )
                     else:
                         self.microscope.emission_filter_wheel.set_emission_filter(
-                            self.currentConfiguration.emission_filter_position, blocking=False
+                            program.emission_filter_position, blocking=False
                         )
                         if self.trigger_mode == TriggerMode.SOFTWARE:
                             time.sleep(ZABER_EMISSION_FILTER_WHEEL_DELAY_MS / 1000)
@@ -652,13 +720,8 @@ class LiveController(QObject):
             and OPTOSPIN_EMISSION_FILTER_WHEEL_TTL_TRIGGER == False
         ):
             try:
-                if (
-                    self.currentConfiguration.emission_filter_position
-                    != self.microscope.emission_filter_wheel.current_index
-                ):
-                    self.microscope.emission_filter_wheel.set_emission_filter(
-                        self.currentConfiguration.emission_filter_position
-                    )
+                if program.emission_filter_position != self.microscope.emission_filter_wheel.current_index:
+                    self.microscope.emission_filter_wheel.set_emission_filter(program.emission_filter_position)
                     if self.trigger_mode == TriggerMode.SOFTWARE:
                         time.sleep(OPTOSPIN_EMISSION_FILTER_WHEEL_DELAY_MS / 1000)
                     elif self.trigger_mode == TriggerMode.HARDWARE:
@@ -670,10 +733,69 @@ class LiveController(QObject):
 
         if USE_SQUID_FILTERWHEEL and self.enable_channel_auto_filter_switching:
             try:
-                self.microscope.squid_filter_wheel.set_emission(self.currentConfiguration.emission_filter_position)
+                self.microscope.squid_filter_wheel.set_emission(program.emission_filter_position)
             except Exception as e:
                 print("not setting emission filter position due to " + str(e))
 
+    # channel programs
+    def get_channel_program(self, configuration) -> ChannelProgram:
+        program = self._channel_programs.get(configuration.id)
+        if program is None or not program.matches(configuration):
+            program = compile_channel_program(configuration)
+            self._channel_programs[configuration.id] = program
+        return program
+
+    def compile_channel_programs(self, configurations):
+        """
+        Compile the programs for configurations ahead of time (ex: at the start of an acquisition), and forget what
+        was sent to the hardware so that the first channel is set up completely.
+        """
+        for configuration in configurations:
+            self.get_channel_program(configuration)
+        self.invalidate_hardware_state()
+
+    def invalidate_hardware_state(self):
+        """Call this if the camera, illumination, or filters might have been changed behind our back."""
+        with self._hardware_lock:
+            self._hardware_state.clear()
+
+    def run_channel_program(self, program: ChannelProgram):
+        """
+        Put the hardware in the state program needs.  The exposure and gain are always sent, and the illumination and
+        emission filter only if they differ from what was last sent.  The emission filter moves while the camera and
+        illumination are being set up.
+        """
+        with self._hardware_lock:
+            changed = {
+                operation: value
+                for (operation, value) in program.operations.items()
+                if operation in _ALWAYS_SENT_OPERATIONS or self._hardware_state.get(operation, _UNSET) != value
+            }
+            if not self.control_illumination:
+                changed.pop("illumination", None)
+                changed.pop("emission_filter", None)
+
+            filter_future = None
+            if "emission_filter" in changed:
+                filter_future = self._filter_executor.submit(self._set_emission_filter, program)
+            try:
+                if "exposure_time" in changed:
+                    self.camera.set_exposure_time(program.exposure_time)
+                if "analog_gain" in changed:
+                    self.camera.set_analog_gain(program.analog_gain)
+                if "illumination" in changed:
+                    self._set_illumination(program, program.illumination_source, program.illumination_intensity)
+            finally:
+                if filter_future is not None:
+                    filter_future.result()
+            self._hardware_state.update(
+                {operation: value for (operation, value) in changed.items() if operation not in _ALWAYS_SENT_OPERATIONS}
+            )
+        self._log.debug(f"channel program {program.name} sent {list(changed.keys())}")
+
+    def close(self):
+        self._filter_executor.shutdown(wait=True)
+
     def start_live(self):
         self.is_live = True
         self.camera.is_live = True
@@ -746,6 +868,8 @@ class LiveController(QObject):
 
     # trigger mode and settings
     def set_trigger_mode(self, mode):
+        # The exposure depends on the trigger mode, so it needs to be sent again
+        self.invalidate_hardware_state()
         if mode == TriggerMode.SOFTWARE:
             if self.is_live and (
                 self.trigger_mode == TriggerMode.HARDWARE and self.use_internal_timer_for_hardware_trigger
@@ -781,7 +905,7 @@ class LiveController(QObject):
     # set microscope mode
     # @@@ to do: change softwareTriggerGenerator to TriggerGeneratror
     def set_microscope_mode(self, configuration):
-
+        program = self.get_channel_program(configuration)
         self.currentConfiguration = configuration
         print("setting microscope mode to " + self.currentConfiguration.name)
 
@@ -791,15 +915,8 @@ class LiveController(QObject):
             if self.control_illumination:
                 self.turn_off_illumination()
 
-        # set camera exposure time and analog gain
-        self.camera.set_exposure_time(self.currentConfiguration.exposure_time)
-        self.camera.set_analog_gain(self.currentConfiguration.analog_gain)
-
-        # set illumination
-        if self.control_illumination:
-            self.set_illumination(
-                self.currentConfiguration.illumination_source, self.currentConfiguration.illumination_intensity
-            )
+        # set camera exposure time, analog gain, illumination, and emission filter
+        self.run_channel_program(program)
 
         # restart live
         if self.is_live is True:
@@ -1130,10 +1247,8 @@ class AutofocusWorker(QObject):
             # image_to_display = utils.crop_image(image,round(self.crop_width* self.liveController.display_resolution_scaling), round(self.crop_height* self.liveController.display_resolution_scaling))
 
             QApplication.processEvents()
-            timestamp_0 = time.time()
-            focus_measure = utils.calculate_focus_measure(image, FOCUS_MEASURE_OPERATOR)
-            timestamp_1 = time.time()
-            print("             calculating focus measure took " + str(timestamp_1 - timestamp_0) + " second")
+            with squid.logging.span("focus measure"):
+                focus_measure = utils.calculate_focus_measure(image, FOCUS_MEASURE_OPERATOR)
             focus_measure_vs_z[i] = focus_measure
             print(i, focus_measure)
             focus_measure_max = max(focus_measure, focus_measure_max)
@@ -1369,7 +1484,7 @@ class MultiPointWorker(QObject):
     signal_detection_stats = Signal(object)
     signal_update_stats = Signal(object)
     signal_z_piezo_um = Signal(float)
-    napari_layers_init = Signal(int, int, object)
+    napari_layers_init = Signal(int, int, object, object)
     napari_layers_update = Signal(np.ndarray, float, float, int, str)  # image, x_mm, y_mm, k, channel
     napari_rtp_layers_update = Signal(np.ndarray, str)
     signal_acquisition_progress = Signal(int, int, int)
@@ -1383,6 +1498,7 @@ class MultiPointWorker(QObject):
         self.start_time = 0
         if DO_FLUORESCENCE_RTP:
             self.processingHandler = multiPointController.processingHandler
+            self._rtp_lock = Lock()
         self.camera = self.multiPointController.camera
         self.microcontroller = self.multiPointController.microcontroller
         self.usb_spectrometer = self.multiPointController.usb_spectrometer
@@ -1402,6 +1518,9 @@ class MultiPointWorker(QObject):
         self.do_reflection_af = self.multiPointController.do_reflection_af
         self.crop_width = self.multiPointController.crop_width
         self.crop_height = self.multiPointController.crop_height
+        self.software_geometry = None
+        if self.multiPointController.camera_geometry is not None:
+            self.software_geometry = SoftwareGeometry(self.multiPointController.camera_geometry)
         self.display_resolution_scaling = self.multiPointController.display_resolution_scaling
         self.counter = self.multiPointController.counter
         self.experiment_ID = self.multiPointController.experiment_ID
@@ -1420,6 +1539,8 @@ class MultiPointWorker(QObject):
         self.scan_region_names = self.multiPointController.scan_region_names
         self.z_stacking_config = self.multiPointController.z_stacking_config  # default 'from bottom'
         self.z_range = self.multiPointController.z_range
+        self.scanCoordinates = self.multiPointController.scanCoordinates
+        self.fov_pattern = self.scanCoordinates.fov_pattern if self.scanCoordinates is not None else FOV_PATTERN
 
         self.microscope = self.multiPointController.parent
         self.performance_mode = self.microscope.performance_mode
@@ -1438,9 +1559,19 @@ class MultiPointWorker(QObject):
             self.init_napari_layers = False
 
         self.count = 0
-
-        self.merged_image = None
-        self.image_count = 0
+        # Every frame of the current timepoint, see run_single_time_point
+        self.acquisition_index = None
+
+        self.compositor = compositing.Compositor()
+        # The FOV whose channels couldn't be merged, whose other channels are then left out of the merge too
+        self._merge_failed_file_ID = None
+        # The merged image needs the channels in order, so compositing gets a single worker of its own.  One FOV's
+        # worth of queued channels is enough to keep acquisition from waiting on it.
+        self.compositingHandler = None
+        if MULTIPOINT_COMPOSITE_IN_BACKGROUND:
+            self.compositingHandler = ProcessingHandler(
+                num_workers=1, max_queue_size=2 * max(1, len(self.multiPointController.selected_configurations))
+            )
 
     def update_stats(self, new_stats):
         self.count += 1
@@ -1465,6 +1596,9 @@ class MultiPointWorker(QObject):
         self.start_time = time.perf_counter_ns()
         if not self.camera.is_streaming:
             self.camera.start_streaming()
+        if self.compositingHandler is not None:
+            self.compositingHandler.start_processing()
+            self.compositingHandler.start_uploading()
 
         while self.time_point < self.Nt:
             # check if abort acquisition has been requested
@@ -1500,13 +1634,29 @@ class MultiPointWorker(QObject):
 
         # End processing using the updated method
         if DO_FLUORESCENCE_RTP:
-            self.processingHandler.processing_queue.join()
-            self.processingHandler.upload_queue.join()
             self.processingHandler.end_processing()
+        if self.compositingHandler is not None:
+            self.compositingHandler.end_processing()
+        self.compositor.clear()
 
         self._log.info(f"Time taken for acquisition/processing: {(time.perf_counter_ns() - self.start_time) / 1e9} [s]")
+        if squid.logging.is_tracing_enabled():
+            self.save_trace()
         self.finished.emit()
 
+    def save_trace(self):
+        """Save this acquisition's spans as a Chrome trace, and log where the time per FOV went."""
+        spans = squid.logging.get_spans(since_ns=self.start_time)
+        summary = squid.logging.summarize_spans(spans)
+        breakdown = ", ".join(f"{name} {seconds * 1000:.1f}" for name, seconds in summary["breakdown_s"].items())
+        self._log.info(f"{summary['rate_per_s']:.2f} FOV/s, per FOV [ms]: {breakdown}")
+        try:
+            squid.logging.export_chrome_trace(
+                os.path.join(self.base_path, self.experiment_ID, "trace.json"), since_ns=self.start_time
+            )
+        except OSError as e:
+            self._log.error(f"Couldn't save the acquisition trace: {e}")
+
     def wait_till_operation_is_completed(self):
         while self.microcontroller.is_busy():
             time.sleep(SLEEP_TIME_S)
@@ -1523,16 +1673,19 @@ class MultiPointWorker(QObject):
 
         slide_path = os.path.join(self.base_path, self.experiment_ID)
 
-        # create a dataframe to save coordinates
-        self.initialize_coordinates_dataframe()
-
-        # init z parameters, z range
-        self.initialize_z_stack()
+        # record every frame's position as it's taken, so a crash doesn't lose them
+        index_path = os.path.join(current_path, acquisition_index.INDEX_FILE_NAME)
+        self.acquisition_index = acquisition_index.AcquisitionIndexWriter(index_path)
+        try:
+            # init z parameters, z range
+            self.initialize_z_stack()
 
-        self.run_coordinate_acquisition(current_path)
+            self.run_coordinate_acquisition(current_path)
+        finally:
+            self.acquisition_index.close()
 
-        # finished region scan
-        self.coordinates_pd.to_csv(os.path.join(current_path, "coordinates.csv"), index=False, header=True)
+        # finished region scan, also write the positions as a csv for the tools that read that
+        acquisition_index.write_coordinates_csv(index_path, os.path.join(current_path, "coordinates.csv"))
         utils.create_done_file(current_path)
         # TODO(imo): If anything throws above, we don't re-enable the joystick
         self.microcontroller.enable_joystick(True)
@@ -1562,35 +1715,26 @@ class MultiPointWorker(QObject):
             if MULTIPOINT_PIEZO_UPDATE_DISPLAY:
                 self.signal_z_piezo_um.emit(self.z_piezo_um)
 
-    def initialize_coordinates_dataframe(self):
-        base_columns = ["z_level", "x (mm)", "y (mm)", "z (um)", "time"]
-        piezo_column = ["z_piezo (um)"] if self.use_piezo else []
-        self.coordinates_pd = pd.DataFrame(columns=["region", "fov"] + base_columns + piezo_column)
-
-    def update_coordinates_dataframe(self, region_id, z_level, fov=None):
-        pos = self.stage.get_pos()
-        base_data = {
-            "z_level": [z_level],
-            "x (mm)": [pos.x_mm],
-            "y (mm)": [pos.y_mm],
-            "z (um)": [pos.z_mm * 1000],
-            "time": [datetime.now().strftime("%Y-%m-%d_%H-%M-%S.%f")],
-        }
-        piezo_data = {"z_piezo (um)": [self.z_piezo_um - OBJECTIVE_PIEZO_HOME_UM]} if self.use_piezo else {}
-
-        new_row = pd.DataFrame({"region": [region_id], "fov": [fov], **base_data, **piezo_data})
-
-        self.coordinates_pd = pd.concat([self.coordinates_pd, new_row], ignore_index=True)
+    def record_frame(self, region_id, fov, z_level, channel, pos, timestamp=None, frame_id=-1):
+        """Add a frame, and where the stage was when it was taken, to the acquisition index."""
+        z_piezo_um = self.z_piezo_um - OBJECTIVE_PIEZO_HOME_UM if self.use_piezo else np.nan
+        self.acquisition_index.append(
+            region_id, fov, z_level, channel, pos.x_mm, pos.y_mm, pos.z_mm * 1000, z_piezo_um, timestamp, frame_id
+        )
 
     def move_to_coordinate(self, coordinate_mm):
         print("moving to coordinate", coordinate_mm)
         x_mm = coordinate_mm[0]
-        self.stage.move_x_to(x_mm)
-        time.sleep(SCAN_STABILIZATION_TIME_MS_X / 1000)
+        with squid.logging.span("move"):
+            self.stage.move_x_to(x_mm)
+        with squid.logging.span("settle"):
+            time.sleep(SCAN_STABILIZATION_TIME_MS_X / 1000)
 
         y_mm = coordinate_mm[1]
-        self.stage.move_y_to(y_mm)
-        time.sleep(SCAN_STABILIZATION_TIME_MS_Y / 1000)
+        with squid.logging.span("move"):
+            self.stage.move_y_to(y_mm)
+        with squid.logging.span("settle"):
+            time.sleep(SCAN_STABILIZATION_TIME_MS_Y / 1000)
 
         # check if z is included in the coordinate
         if len(coordinate_mm) == 3:
@@ -1615,6 +1759,7 @@ class MultiPointWorker(QObject):
 
     def run_coordinate_acquisition(self, current_path):
         n_regions = len(self.scan_region_coords_mm)
+        continuous = self.fov_pattern == "Continuous" and self.can_scan_continuously()
 
         for region_index, (region_id, coordinates) in enumerate(self.scan_region_fov_coords_mm.items()):
 
@@ -1623,15 +1768,199 @@ class MultiPointWorker(QObject):
             self.num_fovs = len(coordinates)
             self.total_scans = self.num_fovs * self.NZ * len(self.selected_configurations)
 
+            if continuous:
+                self.acquire_region_continuously(region_id, coordinates, current_path)
+                if self.multiPointController.abort_acqusition_requested:
+                    self.handle_acquisition_abort(current_path, region_id)
+                    return
+                continue
+
             for fov_count, coordinate_mm in enumerate(coordinates):
 
-                self.move_to_coordinate(coordinate_mm)
-                self.acquire_at_position(region_id, current_path, fov_count)
+                with squid.logging.span("fov"):
+                    self.move_to_coordinate(coordinate_mm)
+                    self.acquire_at_position(region_id, current_path, fov_count)
 
                 if self.multiPointController.abort_acqusition_requested:
                     self.handle_acquisition_abort(current_path, region_id)
                     return
 
+    def can_scan_continuously(self):
+        """
+        Continuous scanning images a row of FOVs in one channel per sweep, at one z, so acquisitions that need more
+        than that at every FOV are done stop and go instead.
+        """
+        reasons = []
+        if self.scanCoordinates is None:
+            reasons.append("no scan coordinates")
+        if self.NZ > 1:
+            reasons.append("z stacks")
+        if self.do_autofocus or self.do_reflection_af:
+            reasons.append("autofocus")
+        if self.multiPointController.do_fluorescence_rtp:
+            reasons.append("real time processing")
+        if RUN_CUSTOM_MULTIPOINT or LASER_AF_CHARACTERIZATION_MODE:
+            reasons.append("a custom multipoint script")
+        if self.liveController.trigger_mode == TriggerMode.CONTINUOUS:
+            reasons.append("continuous acquisition trigger mode")
+        if not isinstance(self.stage, squid.abc.SpeedLimitedStage):
+            reasons.append(f"a {self.stage.__class__.__name__} (it can't sweep at a set speed)")
+        if any("RGB" in config.name or "USB Spectrometer" in config.name for config in self.selected_configurations):
+            reasons.append("RGB or spectrometer channels")
+
+        if reasons:
+            self._log.warning(f"Can't scan continuously with {', '.join(reasons)}, stopping at every FOV instead")
+            return False
+        return True
+
+    @staticmethod
+    def group_into_rows(coordinates):
+        """The indices of coordinates, in runs of the same y, each sorted by x."""
+        rows = []
+        for index, coordinate_mm in enumerate(coordinates):
+            if rows and abs(coordinates[rows[-1][0]][1] - coordinate_mm[1]) < 1e-6:
+                rows[-1].append(index)
+            else:
+                rows.append([index])
+        for row in rows:
+            row.sort(key=lambda index: coordinates[index][0])
+        return rows
+
+    def acquire_region_continuously(self, region_id, coordinates, current_path):
+        """Image the FOVs of a region a row at a time, sweeping through each row once per channel."""
+        forward = True
+        images_done = 0
+        for row in self.group_into_rows(coordinates):
+            row_z_mm = {coordinates[fov][2] for fov in row if len(coordinates[fov]) == 3}
+            if len(row_z_mm) > 1:
+                # A focus map moves z between FOVs, which a sweep can't do.
+                for fov in row:
+                    self.move_to_coordinate(coordinates[fov])
+                    self.acquire_at_position(region_id, current_path, fov)
+                    if self.multiPointController.abort_acqusition_requested:
+                        return
+                images_done += len(row) * len(self.selected_configurations)
+                continue
+            if row_z_mm:
+                self.move_to_z_level(row_z_mm.pop())
+
+            # Where each FOV was imaged in the first channel, for the navigation viewer
+            fov_positions = {}
+            for config in self.selected_configurations:
+                # Sweep back and forth, to not waste a move back to the start of the row.
+                fovs = row if forward else row[::-1]
+                forward = not forward
+                triggers = self.sweep_row(config, region_id, fovs, coordinates, current_path, images_done)
+                if self.multiPointController.abort_acqusition_requested:
+                    return
+
+                for fov, trigger in zip(fovs, triggers):
+                    if trigger is None:
+                        # Missed on the fly, so stop there instead.
+                        with squid.logging.span("fov"):
+                            self.move_to_coordinate(coordinates[fov])
+                            frame = self.acquire_camera_image(config, f"{region_id}_{fov}_0", current_path, {}, 0)
+                        if frame is not None:
+                            self.record_frame(region_id, fov, 0, config.name, *frame)
+                            fov_positions.setdefault(fov, frame[0])
+                    else:
+                        fov_positions.setdefault(fov, trigger.pos)
+                images_done += len(fovs)
+                self.signal_region_progress.emit(images_done, self.total_scans)
+
+            for fov in row:
+                pos = fov_positions.get(fov) or self.stage.get_pos()
+                self.signal_register_current_fov.emit(pos.x_mm, pos.y_mm)
+                self.af_fov_count = self.af_fov_count + 1
+
+    def sweep_row(self, config, region_id, fovs, coordinates, current_path, images_done=0):
+        """
+        Image fovs (one row, in the order to sweep through them) in one channel without stopping, see RowSweep, and
+        record them in the acquisition index.  Returns RowSweep.run's SweepTrigger (or None, for FOVs that weren't
+        imaged) for each FOV.
+        """
+        self.signal_current_configuration.emit(config)
+        self.wait_till_operation_is_completed()
+
+        x_mm = [coordinates[fov][0] for fov in fovs]
+        fov_pitch_mm = float(np.min(np.abs(np.diff(x_mm)))) if len(x_mm) > 1 else np.inf
+        if hasattr(self.camera, "get_frame_period_s"):
+            frame_period_s = self.camera.get_frame_period_s()
+        else:
+            frame_period_s = (self.camera.exposure_time + CONTINUOUS_SCAN_READOUT_MARGIN_MS) / 1000
+        pixel_size_um = self.scanCoordinates.objectiveStore.get_pixel_size()
+        max_speed_mm = min(CONTINUOUS_SCAN_MAX_SPEED_MM, self.stage.get_config().X_AXIS.MAX_SPEED)
+
+        hardware_trigger = self.liveController.trigger_mode == TriggerMode.HARDWARE
+        if hardware_trigger:
+            # A pulse of light no longer than the blur allows freezes the motion, however long the exposure is.
+            illumination_on_time_us = plan_illumination_on_time_us(
+                self.camera.exposure_time, pixel_size_um, fov_pitch_mm, frame_period_s, max_speed_mm=max_speed_mm
+            )
+            if illumination_on_time_us < self.camera.exposure_time * 1000:
+                self._log.info(
+                    f"Cutting the illumination for {config.name} to {illumination_on_time_us:.0f} [us] of the"
+                    f" {self.camera.exposure_time} [ms] exposure, to keep the motion blur under"
+                    f" {CONTINUOUS_SCAN_MAX_BLUR_PX} [px]"
+                )
+
+            def trigger():
+                self.microcontroller.send_hardware_trigger(
+                    control_illumination=True, illumination_on_time_us=illumination_on_time_us
+                )
+
+        else:
+            # The light stays on for the whole sweep, so the exposure is what freezes the motion.
+            illumination_on_time_us = self.camera.exposure_time * 1000
+            trigger = self.camera.send_trigger
+
+        speed_mm_s = plan_sweep_speed(
+            pixel_size_um,
+            illumination_on_time_us,
+            fov_pitch_mm,
+            frame_period_s,
+            max_speed_mm=max_speed_mm,
+        )
+        self._log.debug(f"Sweeping {len(fovs)} FOVs in {config.name} at {speed_mm_s:.2f} [mm/s]")
+
+        failed = set()
+        frame_ids = {}
+
+        def on_trigger(index, trigger_time):
+            # The stage keeps moving, so a FOV here is just getting its image.
+            with squid.logging.span("fov"):
+                with squid.logging.span("exposure"):
+                    image = self.camera.read_frame()
+                if image is None:
+                    self._log.warning(f"No frame for FOV {fovs[index]} while sweeping")
+                    failed.add(index)
+                    return
+                frame_ids[index] = getattr(self.camera, "frame_ID", -1)
+                self.process_camera_image(image, config, f"{region_id}_{fovs[index]}_0", current_path, {}, 0)
+                self.signal_region_progress.emit(images_done + index + 1, self.total_scans)
+
+        sweep = RowSweep(
+            self.stage, trigger, speed_mm_s, on_trigger=on_trigger, tag_delay_s=illumination_on_time_us / 2e6
+        )
+        if not hardware_trigger:
+            self.liveController.turn_on_illumination()
+            self.wait_till_operation_is_completed()
+        try:
+            triggers = sweep.run(
+                x_mm, coordinates[fovs[0]][1], abort=lambda: self.multiPointController.abort_acqusition_requested
+            )
+        finally:
+            if not hardware_trigger:
+                self.liveController.turn_off_illumination()
+
+        triggers = [None if index in failed else trigger for index, trigger in enumerate(triggers)]
+        for fov, trigger in zip(fovs, triggers):
+            if trigger is not None:
+                self.record_frame(
+                    region_id, fov, 0, config.name, trigger.pos, trigger.trigger_time, frame_ids[trigger.index]
+                )
+        return triggers
+
     def acquire_at_position(self, region_id, current_path, fov):
 
         if RUN_CUSTOM_MULTIPOINT and "multipoint_custom_script_entry" in globals():
@@ -1672,11 +2001,15 @@ class MultiPointWorker(QObject):
 
                 # acquire image
                 if "USB Spectrometer" not in config.name and "RGB" not in config.name:
-                    self.acquire_camera_image(config, file_ID, current_path, current_round_images, z_level)
-                elif "RGB" in config.name:
-                    self.acquire_rgb_image(config, file_ID, current_path, current_round_images, z_level)
+                    frame = self.acquire_camera_image(config, file_ID, current_path, current_round_images, z_level)
+                    if frame is not None:
+                        self.record_frame(region_id, fov, z_level, config.name, *frame)
                 else:
-                    self.acquire_spectrometer_data(config, file_ID, current_path, z_level)
+                    if "RGB" in config.name:
+                        self.acquire_rgb_image(config, file_ID, current_path, current_round_images, z_level)
+                    else:
+                        self.acquire_spectrometer_data(config, file_ID, current_path, z_level)
+                    self.record_frame(region_id, fov, z_level, config.name, self.stage.get_pos())
 
                 self.handle_z_offset(config, False)
 
@@ -1692,9 +2025,8 @@ class MultiPointWorker(QObject):
             if self.multiPointController.do_fluorescence_rtp:
                 self.run_real_time_processing(current_round_images, z_level)
 
-            # updates coordinates df
-            self.update_coordinates_dataframe(region_id, z_level, fov)
-            self.signal_register_current_fov.emit(self.stage.get_pos().x_mm, self.stage.get_pos().y_mm)
+            pos = self.stage.get_pos()
+            self.signal_register_current_fov.emit(pos.x_mm, pos.y_mm)
 
             # check if the acquisition should be aborted
             if self.multiPointController.abort_acqusition_requested:
@@ -1733,20 +2065,30 @@ class MultiPointWorker(QObject):
                     I_left = cv2.cvtColor(I_left, cv2.COLOR_RGB2GRAY)
                 if len(I_right.shape) == 3:
                     I_right = cv2.cvtColor(I_right, cv2.COLOR_RGB2GRAY)
-                malaria_rtp(
-                    I_fluorescence,
-                    I_left,
-                    I_right,
-                    z_level,
-                    self,
-                    classification_test_mode=self.microscope.classification_test_mode,
-                    sort_during_multipoint=SORT_DURING_MULTIPOINT,
-                    disp_th_during_multipoint=DISP_TH_DURING_MULTIPOINT,
+                # Hand the FOV off to the processing workers so the classifier doesn't hold up acquisition.  This
+                # runs on a worker thread, not a process, because malaria_rtp needs this (unpicklable) worker.
+                self.processingHandler.submit(
+                    self._run_malaria_rtp,
+                    args=(I_fluorescence, I_left, I_right, z_level),
+                    kwargs={
+                        "classification_test_mode": self.microscope.classification_test_mode,
+                        "sort_during_multipoint": SORT_DURING_MULTIPOINT,
+                        "disp_th_during_multipoint": DISP_TH_DURING_MULTIPOINT,
+                    },
+                    in_process=False,
                 )
-                self.count_rtp += 1
             except AttributeError as e:
                 print(repr(e))
 
+    def _run_malaria_rtp(self, I_fluorescence, I_left, I_right, z_level, **kwargs):
+        # malaria_rtp updates this worker's state, so FOVs are classified one at a time even with several processing
+        # workers.  count_rtp only counts the FOVs that were classified, not the ones that were dropped or failed.
+        with self._rtp_lock:
+            upload_task = malaria_rtp(I_fluorescence, I_left, I_right, z_level, self, **kwargs)
+            self.count_rtp += 1
+        return upload_task
+
+    @squid.logging.traced("autofocus")
     def perform_autofocus(self, region_id, fov):
         if not self.do_reflection_af:
             # contrast-based AF; perform AF only if when not taking z stack or doing z stack from center
@@ -1809,6 +2151,7 @@ class MultiPointWorker(QObject):
                     return False
         return True
 
+    @squid.logging.traced("z stack move")
     def prepare_z_stack(self):
         # move to bottom of the z stack
         if self.z_stacking_config == "FROM CENTER":
@@ -1823,6 +2166,7 @@ class MultiPointWorker(QObject):
         self.stage.move_z(distance_to_clear_backlash)
         time.sleep(SCAN_STABILIZATION_TIME_MS_Z / 1000)
 
+    @squid.logging.traced("z offset")
     def handle_z_offset(self, config, not_offset):
         if config.z_offset is not None:  # perform z offset for config, assume z_offset is in um
             if config.z_offset != 0.0:
@@ -1833,60 +2177,93 @@ class MultiPointWorker(QObject):
                 time.sleep(SCAN_STABILIZATION_TIME_MS_Z / 1000)
 
     def acquire_camera_image(self, config, file_ID, current_path, current_round_images, k):
+        """
+        Returns (pos, timestamp, frame_id) for the frame, with where the stage was halfway through its exposure, or None
+        if there was no frame.
+        """
         # update the current configuration
-        self.signal_current_configuration.emit(config)
-        self.wait_till_operation_is_completed()
+        with squid.logging.span("config"):
+            self.signal_current_configuration.emit(config)
+            self.wait_till_operation_is_completed()
 
         # trigger acquisition (including turning on the illumination) and read frame
-        if self.liveController.trigger_mode == TriggerMode.SOFTWARE:
-            self.liveController.turn_on_illumination()
-            self.wait_till_operation_is_completed()
-            self.camera.send_trigger()
-            image = self.camera.read_frame()
-        elif self.liveController.trigger_mode == TriggerMode.HARDWARE:
-            if "Fluorescence" in config.name and ENABLE_NL5 and NL5_USE_DOUT:
-                self.camera.image_is_ready = False  # to remove
-                self.microscope.nl5.start_acquisition()
-                image = self.camera.read_frame(reset_image_ready_flag=False)
-            else:
-                self.microcontroller.send_hardware_trigger(
-                    control_illumination=True, illumination_on_time_us=self.camera.exposure_time * 1000
-                )
+        trigger_time = None
+        with squid.logging.span("exposure"):
+            if self.liveController.trigger_mode == TriggerMode.SOFTWARE:
+                self.liveController.turn_on_illumination()
+                self.wait_till_operation_is_completed()
+                trigger_time = time.time()
+                self.camera.send_trigger()
+                image = self.camera.read_frame()
+            elif self.liveController.trigger_mode == TriggerMode.HARDWARE:
+                if "Fluorescence" in config.name and ENABLE_NL5 and NL5_USE_DOUT:
+                    self.camera.image_is_ready = False  # to remove
+                    self.microscope.nl5.start_acquisition()
+                    image = self.camera.read_frame(reset_image_ready_flag=False)
+                else:
+                    trigger_time = time.time()
+                    self.microcontroller.send_hardware_trigger(
+                        control_illumination=True, illumination_on_time_us=self.camera.exposure_time * 1000
+                    )
+                    image = self.camera.read_frame()
+            else:  # continuous acquisition
                 image = self.camera.read_frame()
-        else:  # continuous acquisition
-            image = self.camera.read_frame()
 
         if image is None:
             self._log.warning("self.camera.read_frame() returned None")
-            return
+            return None
+        frame_id = getattr(self.camera, "frame_ID", -1)
+
+        # Tag the frame with where the stage was halfway through the exposure, rather than where it is now.  Without a
+        # trigger time, assume the frame was exposed right before it was read.
+        if trigger_time is None:
+            trigger_time = time.time() - self.camera.exposure_time / 1000
+        pos = self.stage.get_pos_at(trigger_time + self.camera.exposure_time / 2000)
 
         # turn off the illumination if using software trigger
         if self.liveController.trigger_mode == TriggerMode.SOFTWARE:
-            self.liveController.turn_off_illumination()
+            with squid.logging.span("illumination"):
+                self.liveController.turn_off_illumination()
+
+        self.process_camera_image(image, config, file_ID, current_path, current_round_images, k)
+        return pos, trigger_time, frame_id
+
+    def crop_frame(self, image):
+        if self.software_geometry is not None:
+            return self.software_geometry.apply(image)
+        return utils.crop_image(image, self.crop_width, self.crop_height)
 
+    def process_camera_image(self, image, config, file_ID, current_path, current_round_images, k):
         # process the image -  @@@ to move to camera
-        image = utils.crop_image(image, self.crop_width, self.crop_height)
-        image = utils.rotate_and_flip_image(
-            image, rotate_image_angle=self.camera.rotate_image_angle, flip_image=self.camera.flip_image
-        )
-        image_to_display = utils.crop_image(
-            image,
-            round(self.crop_width * self.display_resolution_scaling),
-            round(self.crop_height * self.display_resolution_scaling),
-        )
-        self.image_to_display.emit(image_to_display)
-        self.image_to_display_multi.emit(image_to_display, config.illumination_source)
+        with squid.logging.span("processing"):
+            image = self.crop_frame(image)
+            image = utils.rotate_and_flip_image(
+                image, rotate_image_angle=self.camera.rotate_image_angle, flip_image=self.camera.flip_image
+            )
+            image_to_display = utils.crop_image(
+                image,
+                round(self.crop_width * self.display_resolution_scaling),
+                round(self.crop_height * self.display_resolution_scaling),
+            )
+        with squid.logging.span("display"):
+            self.image_to_display.emit(image_to_display)
+            self.image_to_display_multi.emit(image_to_display, config.illumination_source)
 
-        self.save_image(image, file_ID, config, current_path)
-        self.update_napari(image, config.name, k)
+        with squid.logging.span("save"):
+            self.save_image(image, file_ID, config, current_path)
+        with squid.logging.span("display"):
+            self.update_napari(image, config.name, k)
 
-        current_round_images[config.name] = np.copy(image)
+        with squid.logging.span("processing"):
+            current_round_images[config.name] = np.copy(image)
 
-        self.handle_dpc_generation(current_round_images)
-        self.handle_rgb_generation(current_round_images, file_ID, current_path, k)
+            self.handle_dpc_generation(current_round_images)
+            self.handle_rgb_generation(current_round_images, file_ID, current_path, k)
 
-        QApplication.processEvents()
+        with squid.logging.span("display"):
+            QApplication.processEvents()
 
+    @squid.logging.traced("rgb")
     def acquire_rgb_image(self, config, file_ID, current_path, current_round_images, k):
         # go through the channels
         rgb_channels = ["BF LED matrix full_R", "BF LED matrix full_G", "BF LED matrix full_B"]
@@ -1922,7 +2299,7 @@ class MultiPointWorker(QObject):
                     self.liveController.turn_off_illumination()
 
                 # process the image  -  @@@ to move to camera
-                image = utils.crop_image(image, self.crop_width, self.crop_height)
+                image = self.crop_frame(image)
                 image = utils.rotate_and_flip_image(
                     image, rotate_image_angle=self.camera.rotate_image_angle, flip_image=self.camera.flip_image
                 )
@@ -1943,6 +2320,7 @@ class MultiPointWorker(QObject):
             print("constructing RGB image")
             self.construct_rgb_image(images, file_ID, current_path, config, k)
 
+    @squid.logging.traced("spectrometer")
     def acquire_spectrometer_data(self, config, file_ID, current_path):
         if self.usb_spectrometer != None:
             for l in range(N_SPECTRUM_PER_POINT):
@@ -1968,6 +2346,17 @@ class MultiPointWorker(QObject):
                 elif MULTIPOINT_BF_SAVING_OPTION == "Green Channel Only":
                     image = image[:, :, 1]
 
+        if self.compositingHandler is not None and (Acquisition.PSEUDO_COLOR or Acquisition.MERGE_CHANNELS):
+            # submit copies the image, so the camera is free to reuse its buffer.
+            self.compositingHandler.submit(
+                self._composite_and_save_image,
+                args=(image, saving_path, file_ID, config, current_path),
+                in_process=False,
+            )
+        else:
+            self._composite_and_save_image(image, saving_path, file_ID, config, current_path)
+
+    def _composite_and_save_image(self, image, saving_path, file_ID, config, current_path):
         if Acquisition.PSEUDO_COLOR:
             image = self.return_pseudo_colored_image(image, config)
 
@@ -1977,21 +2366,24 @@ class MultiPointWorker(QObject):
         iio.imwrite(saving_path, image)
 
     def _save_merged_image(self, image, file_ID, current_path):
-        self.image_count += 1
-        if self.image_count == 1:
-            self.merged_image = image
-        else:
-            self.merged_image += image
-
-            if self.image_count == len(self.selected_configurations):
-                if image.dtype == np.uint16:
-                    saving_path = os.path.join(current_path, file_ID + "_merged" + ".tiff")
-                else:
-                    saving_path = os.path.join(current_path, file_ID + "_merged" + "." + Acquisition.IMAGE_FORMAT)
+        # There's nothing to merge with a single channel
+        if len(self.selected_configurations) < 2 or file_ID == self._merge_failed_file_ID:
+            return
+        try:
+            merged_image = self.compositor.add_to_merged(image)
+        except ValueError as e:
+            self._log.error(f"Not saving the merged image of {file_ID}: {e}")
+            self.compositor.reset_merged()
+            self._merge_failed_file_ID = file_ID
+            return
+        if self.compositor.merged_count == len(self.selected_configurations):
+            if image.dtype == np.uint16:
+                saving_path = os.path.join(current_path, file_ID + "_merged" + ".tiff")
+            else:
+                saving_path = os.path.join(current_path, file_ID + "_merged" + "." + Acquisition.IMAGE_FORMAT)
 
-                iio.imwrite(saving_path, self.merged_image)
-                self.image_count = 0
-        return
+            iio.imwrite(saving_path, merged_image)
+            self.compositor.reset_merged()
 
     def return_pseudo_colored_image(self, image, config):
         if "405 nm" in config.name:
@@ -2008,9 +2400,8 @@ class MultiPointWorker(QObject):
         return image
 
     def grayscale_to_rgb(self, image, hex_color):
-        rgb_ratios = np.array([(hex_color >> 16) & 0xFF, (hex_color >> 8) & 0xFF, hex_color & 0xFF]) / 255
-        rgb = np.stack([image] * 3, axis=-1) * rgb_ratios
-        return rgb.astype(image.dtype)
+        # Returns the compositor's buffer, which is overwritten by the next call
+        return self.compositor.pseudo_color(image, hex_color)
 
     def update_napari(self, image, config_name, k):
         if not self.performance_mode and (USE_NAPARI_FOR_MOSAIC_DISPLAY or USE_NAPARI_FOR_MULTIPOINT):
@@ -2018,7 +2409,7 @@ class MultiPointWorker(QObject):
             if not self.init_napari_layers:
                 print("init napari layers")
                 self.init_napari_layers = True
-                self.napari_layers_init.emit(image.shape[0], image.shape[1], image.dtype)
+                self.napari_layers_init.emit(image.shape[0], image.shape[1], image.dtype, image.shape[2:])
             pos = self.stage.get_pos()
             self.napari_layers_update.emit(image, pos.x_mm, pos.y_mm, k, config_name)
 
@@ -2080,10 +2471,10 @@ class MultiPointWorker(QObject):
             iio.imwrite(os.path.join(current_path, file_name), images[channel])
 
     def construct_rgb_image(self, images, file_ID, current_path, config, k):
-        rgb_image = np.zeros((*images["BF LED matrix full_R"].shape, 3), dtype=images["BF LED matrix full_R"].dtype)
-        rgb_image[:, :, 0] = images["BF LED matrix full_R"]
-        rgb_image[:, :, 1] = images["BF LED matrix full_G"]
-        rgb_image[:, :, 2] = images["BF LED matrix full_B"]
+        # This image is emitted to the display, so it gets a buffer of its own rather than the compositor's.
+        rgb_image = compositing.merge_rgb(
+            images["BF LED matrix full_R"], images["BF LED matrix full_G"], images["BF LED matrix full_B"]
+        )
 
         # send image to display
         image_to_display = utils.crop_image(
@@ -2110,10 +2501,11 @@ class MultiPointWorker(QObject):
         region_center = self.scan_region_coords_mm[self.scan_region_names.index(region_id)]
         self.move_to_coordinate(region_center)
 
-        # Save coordinates.csv
-        self.coordinates_pd.to_csv(os.path.join(current_path, "coordinates.csv"), index=False, header=True)
+        # Everything acquired so far is already in the acquisition index, which becomes coordinates.csv at the end
+        # of the time point.
         self.microcontroller.enable_joystick(True)
 
+    @squid.logging.traced("z stack move")
     def move_z_for_stack(self):
         if self.use_piezo:
             self.z_piezo_um += self.deltaZ * 1000
@@ -2128,6 +2520,7 @@ class MultiPointWorker(QObject):
             self.stage.move_z(self.deltaZ)
             time.sleep(SCAN_STABILIZATION_TIME_MS_Z / 1000)
 
+    @squid.logging.traced("z stack move")
     def move_z_back_after_stack(self):
         if self.use_piezo:
             self.z_piezo_um = OBJECTIVE_PIEZO_HOME_UM
@@ -2163,7 +2556,7 @@ class MultiPointController(QObject):
     detection_stats = Signal(object)
     signal_stitcher = Signal(str)
     napari_rtp_layers_update = Signal(np.ndarray, str)
-    napari_layers_init = Signal(int, int, object)
+    napari_layers_init = Signal(int, int, object, object)
     napari_layers_update = Signal(np.ndarray, float, float, int, str)  # image, x_mm, y_mm, k, channel
     signal_z_piezo_um = Signal(float)
     signal_acquisition_progress = Signal(int, int, int)
@@ -2185,7 +2578,13 @@ class MultiPointController(QObject):
         self._log = squid.logging.get_logger(self.__class__.__name__)
         self.camera = camera
         if DO_FLUORESCENCE_RTP:
-            self.processingHandler = ProcessingHandler()
+            self.processingHandler = ProcessingHandler(
+                num_workers=RTP_NUM_WORKERS,
+                use_processes=RTP_USE_PROCESSES,
+                max_queue_size=RTP_MAX_QUEUE_SIZE,
+                drop_policy=RTP_DROP_POLICY,
+                batch_size=RTP_BATCH_SIZE,
+            )
         self.stage = stage
         self.microcontroller = microcontroller
         self.liveController = liveController
@@ -2209,6 +2608,8 @@ class MultiPointController(QObject):
         self.do_fluorescence_rtp = DO_FLUORESCENCE_RTP
         self.crop_width = Acquisition.CROP_WIDTH
         self.crop_height = Acquisition.CROP_HEIGHT
+        # If set, how the workers crop and bin frames instead of cropping them to crop_width x crop_height
+        self.camera_geometry: Optional[GeometryPlan] = None
         self.display_resolution_scaling = Acquisition.IMAGE_DISPLAY_SCALING_FACTOR
         self.counter = 0
         self.experiment_ID = None
@@ -2297,6 +2698,12 @@ class MultiPointController(QObject):
     def set_crop(self, crop_width, crop_height):
         self.crop_width = crop_width
         self.crop_height = crop_height
+        self.camera_geometry = None
+
+    def set_camera_geometry(self, plan: GeometryPlan):
+        self.crop_width = plan.output_width
+        self.crop_height = plan.output_height
+        self.camera_geometry = plan
 
     def set_base_path(self, path):
         self.base_path = path
@@ -2344,6 +2751,7 @@ class MultiPointController(QObject):
         # TODO: USE OBJECTIVE STORE DATA
         acquisition_parameters["sensor_pixel_size_um"] = CAMERA_PIXEL_SIZE_UM[CAMERA_SENSOR]
         acquisition_parameters["tube_lens_mm"] = TUBE_LENS_MM
+        acquisition_parameters["pixel_binning"] = 1 if self.camera_geometry is None else self.camera_geometry.binning
         f = open(os.path.join(self.base_path, self.experiment_ID) + "/acquisition parameters.json", "w")
         f.write(json.dumps(acquisition_parameters))
         f.close()
@@ -2372,6 +2780,7 @@ class MultiPointController(QObject):
         self.abort_acqusition_requested = False
 
         self.configuration_before_running_multipoint = self.liveController.currentConfiguration
+        self.liveController.compile_channel_programs(self.selected_configurations)
         # stop live
         if self.liveController.is_live:
             self.liveController_was_live_before_multipoint = True
@@ -2510,22 +2919,22 @@ class MultiPointController(QObject):
         self.thread.started.connect(self.multiPointWorker.run)
         self.multiPointWorker.signal_detection_stats.connect(self.slot_detection_stats)
         self.multiPointWorker.finished.connect(self._on_acquisition_completed)
-        if DO_FLUORESCENCE_RTP:
-            self.processingHandler.finished.connect(self.multiPointWorker.deleteLater)
-            self.processingHandler.finished.connect(self.thread.quit)
-        else:
-            self.multiPointWorker.finished.connect(self.multiPointWorker.deleteLater)
-            self.multiPointWorker.finished.connect(self.thread.quit)
+        # The worker waits for real time processing to finish before it emits finished.
+        self.multiPointWorker.finished.connect(self.multiPointWorker.deleteLater)
+        self.multiPointWorker.finished.connect(self.thread.quit)
         self.multiPointWorker.image_to_display.connect(self.slot_image_to_display)
         self.multiPointWorker.image_to_display_multi.connect(self.slot_image_to_display_multi)
         self.multiPointWorker.spectrum_to_display.connect(self.slot_spectrum_to_display)
+        # Direct, so that the channel is set up on the worker's thread rather than round tripping through the GUI
         self.multiPointWorker.signal_current_configuration.connect(
-            self.slot_current_configuration, type=Qt.BlockingQueuedConnection
+            self.slot_current_configuration, type=Qt.DirectConnection
         )
         self.multiPointWorker.signal_register_current_fov.connect(self.slot_register_current_fov)
-        self.multiPointWorker.napari_layers_init.connect(self.slot_napari_layers_init)
+        # Direct, so that the images can go from the worker's thread straight into the napari widgets' mailboxes
+        # instead of queueing up on the GUI thread.
+        self.multiPointWorker.napari_layers_init.connect(self.slot_napari_layers_init, type=Qt.DirectConnection)
         self.multiPointWorker.napari_rtp_layers_update.connect(self.slot_napari_rtp_layers_update)
-        self.multiPointWorker.napari_layers_update.connect(self.slot_napari_layers_update)
+        self.multiPointWorker.napari_layers_update.connect(self.slot_napari_layers_update, type=Qt.DirectConnection)
         self.multiPointWorker.signal_z_piezo_um.connect(self.slot_z_piezo_um)
         self.multiPointWorker.signal_acquisition_progress.connect(self.slot_acquisition_progress)
         self.multiPointWorker.signal_region_progress.connect(self.slot_region_progress)
@@ -2543,6 +2952,8 @@ class MultiPointController(QObject):
             for x, y, z in self.focus_map_storage:
                 self.autofocusController.focus_map_coords.append((x, y, z))
             self.autofocusController.use_focus_map = self.already_using_fmap
+        if self.configuration_before_running_multipoint is not None:
+            self.liveController.set_microscope_mode(self.configuration_before_running_multipoint)
         self.signal_current_configuration.emit(self.configuration_before_running_multipoint)
 
         # re-enable callback
@@ -2589,6 +3000,8 @@ class MultiPointController(QObject):
         self.image_to_display_multi.emit(image, illumination_source)
 
     def slot_current_configuration(self, configuration):
+        # This runs on the worker's thread.  The GUI is only told about the change so it can update its controls.
+        self.liveController.set_microscope_mode(configuration)
         self.signal_current_configuration.emit(configuration)
 
     def slot_register_current_fov(self, x_mm, y_mm):
@@ -2597,8 +3010,8 @@ class MultiPointController(QObject):
     def slot_napari_rtp_layers_update(self, image, channel):
         self.napari_rtp_layers_update.emit(image, channel)
 
-    def slot_napari_layers_init(self, image_height, image_width, dtype):
-        self.napari_layers_init.emit(image_height, image_width, dtype)
+    def slot_napari_layers_init(self, image_height, image_width, dtype, pixel_shape):
+        self.napari_layers_init.emit(image_height, image_width, dtype, pixel_shape)
 
     def slot_napari_layers_update(self, image, x_mm, y_mm, k, channel):
         self.napari_layers_update.emit(image, x_mm, y_mm, k, channel)
@@ -2638,6 +3051,9 @@ class TrackingController(QObject):
         self.liveController = liveController
         self.autofocusController = autofocusController
         self.imageDisplayWindow = imageDisplayWindow
+        # Imported here since tracking is optional and slow to import
+        import control.tracking as tracking
+
         self.tracker = tracking.Tracker_Image()
 
         self.tracking_time_interval_s = 0
@@ -3236,9 +3652,9 @@ class NavigationViewer(QFrame):
         self.location_update_threshold_mm = 0.2
         self.box_color = (255, 0, 0)
         self.box_line_thickness = 2
-        self.acquisition_size = Acquisition.CROP_HEIGHT
         self.x_mm = None
         self.y_mm = None
+        self.use_vector_overlay = NAVIGATION_VIEWER_USE_VECTOR_OVERLAY
         self.image_paths = {
             "glass slide": "images/slide carrier_828x662.png",
             "4 glass slide": "images/4 slide carrier_1509x1010.png",
@@ -3253,6 +3669,14 @@ class NavigationViewer(QFrame):
         print("navigation viewer:", sample)
         self.init_ui(invertX)
 
+        # Overlay edits only mark their layer dirty.  The dirty layers are uploaded together when this timer fires,
+        # so a burst of edits (ex: registering every FOV of a region) costs at most one texture upload per frame.
+        self._dirty_layers = set()
+        self._update_timer = QTimer(self)
+        self._update_timer.setSingleShot(True)
+        self._update_timer.setInterval(int(1000 / NAVIGATION_VIEWER_MAX_UPDATE_HZ))
+        self._update_timer.timeout.connect(self.flush_overlay_updates)
+
         self.load_background_image(self.image_paths.get(sample, "images/slide carrier_828x662.png"))
         self.create_layers()
         self.update_display_properties(sample)
@@ -3301,15 +3725,28 @@ class NavigationViewer(QFrame):
         self.fov_overlay_item = pg.ImageItem()
         self.focus_point_overlay_item = pg.ImageItem()
 
+        # Vector version of the scan overlay.  Maps (x0, y0, x1, y1) pixel rects to the number of times they were
+        # registered, so overlapping regions deregister correctly.
+        self.scan_fov_rects = {}
+        self.scan_path_item = QGraphicsPathItem()
+        scan_pen = QPen(QColor(252, 174, 30, 128))
+        scan_pen.setWidth(self.box_line_thickness)
+        scan_pen.setCosmetic(True)
+        self.scan_path_item.setPen(scan_pen)
+
         self.view.addItem(self.scan_overlay_item)
+        self.view.addItem(self.scan_path_item)
         self.view.addItem(self.fov_overlay_item)
         self.view.addItem(self.focus_point_overlay_item)
 
         self.background_item.setZValue(-1)  # Background layer at the bottom
         self.scan_overlay_item.setZValue(0)  # Scan overlay in the middle
+        self.scan_path_item.setZValue(0)
         self.fov_overlay_item.setZValue(1)  # FOV overlay next
         self.focus_point_overlay_item.setZValue(2)  # # Focus points on top
 
+        self.current_fov_rect = None
+
     def update_display_properties(self, sample):
         if sample == "glass slide":
             self.location_update_threshold_mm = 0.2
@@ -3329,8 +3766,8 @@ class NavigationViewer(QFrame):
         self.update_fov_size()
 
     def update_fov_size(self):
-        pixel_size_um = self.objectiveStore.get_pixel_size()
-        self.fov_size_mm = self.acquisition_size * pixel_size_um / 1000
+        # The box drawn for each field of view is as big as the images are tall
+        self.fov_size_mm = self.objectiveStore.image_height * self.objectiveStore.get_pixel_size() / 1000
 
     def on_objective_changed(self):
         self.clear_overlay()
@@ -3427,34 +3864,141 @@ class NavigationViewer(QFrame):
             )
         return current_FOV_top_left, current_FOV_bottom_right
 
-    def draw_current_fov(self, x_mm, y_mm):
-        self.fov_overlay.fill(0)
-        current_FOV_top_left, current_FOV_bottom_right = self.get_FOV_pixel_coordinates(x_mm, y_mm)
-        cv2.rectangle(
-            self.fov_overlay, current_FOV_top_left, current_FOV_bottom_right, (255, 0, 0, 255), self.box_line_thickness
+    def get_FOV_pixel_rects(self, coordinates):
+        """
+        Vectorized version of get_FOV_pixel_coordinates.  Takes an iterable of (x_mm, y_mm, ...) coordinates and
+        returns an (N, 4) int array of (x0, y0, x1, y1) pixel rects.
+        """
+        coordinates = np.array([(c[0], c[1]) for c in coordinates], dtype=float).reshape(-1, 2)
+        half_fov_pixel = self.fov_size_mm / 2 / self.mm_per_pixel
+        x_center = self.origin_x_pixel + coordinates[:, 0] / self.mm_per_pixel
+        y_center = self.origin_y_pixel + coordinates[:, 1] / self.mm_per_pixel
+        if self.sample == "glass slide":
+            y_center = self.image_height - y_center
+        return np.round(
+            np.stack(
+                (
+                    x_center - half_fov_pixel,
+                    y_center - half_fov_pixel,
+                    x_center + half_fov_pixel,
+                    y_center + half_fov_pixel,
+                ),
+                axis=1,
+            )
+        ).astype(np.int32)
+
+    def _draw_rects(self, overlay, rects, color):
+        """Draw all rects into overlay in a single pass, and return the bounding box of the touched pixels."""
+        if len(rects) == 0:
+            return None
+        # Each rect becomes a closed 4 point polygon, so a single polylines call draws all of them.
+        polygons = rects[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+        cv2.polylines(overlay, list(polygons), True, color, self.box_line_thickness)
+        margin = self.box_line_thickness
+        return (
+            int(rects[:, 0].min()) - margin,
+            int(rects[:, 1].min()) - margin,
+            int(rects[:, 2].max()) + margin,
+            int(rects[:, 3].max()) + margin,
         )
-        self.fov_overlay_item.setImage(self.fov_overlay)
+
+    def _mark_dirty(self, layer_item, dirty_rect):
+        """
+        Record that dirty_rect (x0, y0, x1, y1) of layer_item changed, and schedule an upload of the layer.  Edits
+        that drew nothing (dirty_rect None), or only outside of the image, don't need an upload at all.
+        """
+        if dirty_rect is None:
+            return
+        x0, y0, x1, y1 = dirty_rect
+        if x1 < 0 or y1 < 0 or x0 >= self.image_width or y0 >= self.image_height:
+            return
+        self._dirty_layers.add(layer_item)
+        if not self._update_timer.isActive():
+            self._update_timer.start()
+
+    def flush_overlay_updates(self):
+        """
+        Upload every layer that changed since the last flush.  ImageItem can only re-render its whole image, so each
+        dirty layer is uploaded in full, once.
+        """
+        self._update_timer.stop()
+        dirty_layers = self._dirty_layers
+        self._dirty_layers = set()
+        for layer_item in dirty_layers:
+            if layer_item is self.background_item:
+                self.background_item.setImage(self.background_image)
+            elif layer_item is self.scan_overlay_item:
+                self.scan_overlay_item.setImage(self.scan_overlay)
+            elif layer_item is self.fov_overlay_item:
+                self.fov_overlay_item.setImage(self.fov_overlay)
+            elif layer_item is self.focus_point_overlay_item:
+                self.focus_point_overlay_item.setImage(self.focus_point_overlay)
+            elif layer_item is self.scan_path_item:
+                self._rebuild_scan_path()
+
+    def _rebuild_scan_path(self):
+        path = QPainterPath()
+        for x0, y0, x1, y1 in self.scan_fov_rects:
+            path.addRect(QRectF(x0, y0, x1 - x0, y1 - y0))
+        self.scan_path_item.setPath(path)
+
+    def draw_current_fov(self, x_mm, y_mm):
+        if x_mm is None or y_mm is None:
+            return
+        rect = tuple(int(v) for v in self.get_FOV_pixel_rects([(x_mm, y_mm)])[0])
+        if rect == self.current_fov_rect:
+            return
+
+        # Only the previous box needs erasing, not the whole overlay.
+        if self.current_fov_rect is not None:
+            self._mark_dirty(
+                self.fov_overlay_item,
+                self._draw_rects(self.fov_overlay, np.array([self.current_fov_rect]), (0, 0, 0, 0)),
+            )
+        self.current_fov_rect = rect
+        self._mark_dirty(self.fov_overlay_item, self._draw_rects(self.fov_overlay, np.array([rect]), (255, 0, 0, 255)))
 
     def register_fov(self, x_mm, y_mm):
         color = (0, 0, 255, 255)  # Blue RGBA
-        current_FOV_top_left, current_FOV_bottom_right = self.get_FOV_pixel_coordinates(x_mm, y_mm)
-        cv2.rectangle(
-            self.background_image, current_FOV_top_left, current_FOV_bottom_right, color, self.box_line_thickness
+        self._mark_dirty(
+            self.background_item,
+            self._draw_rects(self.background_image, self.get_FOV_pixel_rects([(x_mm, y_mm)]), color),
         )
-        self.background_item.setImage(self.background_image)
 
     def register_fov_to_image(self, x_mm, y_mm):
-        color = (252, 174, 30, 128)  # Yellow RGBA
-        current_FOV_top_left, current_FOV_bottom_right = self.get_FOV_pixel_coordinates(x_mm, y_mm)
-        cv2.rectangle(self.scan_overlay, current_FOV_top_left, current_FOV_bottom_right, color, self.box_line_thickness)
-        self.scan_overlay_item.setImage(self.scan_overlay)
+        self.register_fovs_to_image([(x_mm, y_mm)])
 
     def deregister_fov_to_image(self, x_mm, y_mm):
-        current_FOV_top_left, current_FOV_bottom_right = self.get_FOV_pixel_coordinates(x_mm, y_mm)
-        cv2.rectangle(
-            self.scan_overlay, current_FOV_top_left, current_FOV_bottom_right, (0, 0, 0, 0), self.box_line_thickness
-        )
-        self.scan_overlay_item.setImage(self.scan_overlay)
+        self.deregister_fovs_to_image([(x_mm, y_mm)])
+
+    def register_fovs_to_image(self, coordinates):
+        """Draw the scan overlay boxes for every (x_mm, y_mm, ...) coordinate in one batch."""
+        if len(coordinates) == 0:
+            return
+        rects = self.get_FOV_pixel_rects(coordinates)
+        if self.use_vector_overlay:
+            for rect in map(tuple, rects.tolist()):
+                self.scan_fov_rects[rect] = self.scan_fov_rects.get(rect, 0) + 1
+            self._mark_dirty(self.scan_path_item, (0, 0, self.image_width, self.image_height))
+        else:
+            color = (252, 174, 30, 128)  # Yellow RGBA
+            self._mark_dirty(self.scan_overlay_item, self._draw_rects(self.scan_overlay, rects, color))
+
+    def deregister_fovs_to_image(self, coordinates):
+        """Erase the scan overlay boxes for every (x_mm, y_mm, ...) coordinate in one batch."""
+        if len(coordinates) == 0:
+            return
+        rects = self.get_FOV_pixel_rects(coordinates)
+        if self.use_vector_overlay:
+            for rect in map(tuple, rects.tolist()):
+                count = self.scan_fov_rects.get(rect, 0) - 1
+                if count > 0:
+                    self.scan_fov_rects[rect] = count
+                else:
+                    self.scan_fov_rects.pop(rect, None)
+            self._mark_dirty(self.scan_path_item, (0, 0, self.image_width, self.image_height))
+        else:
+            self._mark_dirty(self.scan_overlay_item, self._draw_rects(self.scan_overlay, rects, (0, 0, 0, 0)))
 
     def register_focus_point(self, x_mm, y_mm):
         """Draw focus point marker as filled circle centered on the FOV"""
@@ -3466,23 +4010,28 @@ class NavigationViewer(QFrame):
         # Draw a filled circle at the center
         radius = 5  # Radius of circle in pixels
         cv2.circle(self.focus_point_overlay, (center_x, center_y), radius, color, -1)  # -1 thickness means filled
-        self.focus_point_overlay_item.setImage(self.focus_point_overlay)
+        self._mark_dirty(
+            self.focus_point_overlay_item,
+            (center_x - radius, center_y - radius, center_x + radius, center_y + radius),
+        )
 
     def clear_focus_points(self):
         """Clear just the focus point overlay"""
-        self.focus_point_overlay = np.zeros((self.image_height, self.image_width, 4), dtype=np.uint8)
-        self.focus_point_overlay_item.setImage(self.focus_point_overlay)
+        self.focus_point_overlay.fill(0)
+        self._mark_dirty(self.focus_point_overlay_item, (0, 0, self.image_width, self.image_height))
 
     def clear_slide(self):
         self.background_image = self.background_image_copy.copy()
-        self.background_item.setImage(self.background_image)
+        self._mark_dirty(self.background_item, (0, 0, self.image_width, self.image_height))
         self.draw_current_fov(self.x_mm, self.y_mm)
 
     def clear_overlay(self):
         self.scan_overlay.fill(0)
-        self.scan_overlay_item.setImage(self.scan_overlay)
+        self._mark_dirty(self.scan_overlay_item, (0, 0, self.image_width, self.image_height))
+        self.scan_fov_rects.clear()
+        self._mark_dirty(self.scan_path_item, (0, 0, self.image_width, self.image_height))
         self.focus_point_overlay.fill(0)
-        self.focus_point_overlay_item.setImage(self.focus_point_overlay)
+        self._mark_dirty(self.focus_point_overlay_item, (0, 0, self.image_width, self.image_height))
 
     def handle_mouse_click(self, evt):
         if not evt.double():
@@ -3831,8 +4380,7 @@ class ScanCoordinates(QObject):
 
     def add_region(self, well_id, center_x, center_y, scan_size_mm, overlap_percent=10, shape="Square"):
         """add region based on user inputs"""
-        pixel_size_um = self.objectiveStore.get_pixel_size()
-        fov_size_mm = (pixel_size_um / 1000) * Acquisition.CROP_WIDTH
+        fov_size_mm = self.objectiveStore.get_fov_size_mm()
         step_size_mm = fov_size_mm * (1 - overlap_percent / 100)
 
         steps = math.floor(scan_size_mm / step_size_mm)
@@ -3870,7 +4418,6 @@ class ScanCoordinates(QObject):
                 ):
                     if self.validate_coordinates(x, y):
                         row.append((x, y))
-                        self.navigationViewer.register_fov_to_image(x, y)
 
             if self.fov_pattern == "S-Pattern" and i % 2 == 1:
                 row.reverse()
@@ -3879,7 +4426,8 @@ class ScanCoordinates(QObject):
         if not scan_coordinates and shape == "Circle":
             if self.validate_coordinates(center_x, center_y):
                 scan_coordinates.append((center_x, center_y))
-                self.navigationViewer.register_fov_to_image(center_x, center_y)
+
+        self.navigationViewer.register_fovs_to_image(scan_coordinates)
 
         self.region_shapes[well_id] = shape
         self.region_centers[well_id] = [float(center_x), float(center_y), float(self.stage.get_pos().z_mm)]
@@ -3896,8 +4444,7 @@ class ScanCoordinates(QObject):
 
             if well_id in self.region_fov_coordinates:
                 region_scan_coordinates = self.region_fov_coordinates.pop(well_id)
-                for coord in region_scan_coordinates:
-                    self.navigationViewer.deregister_fov_to_image(coord[0], coord[1])
+                self.navigationViewer.deregister_fovs_to_image(region_scan_coordinates)
 
             print(f"Removed Region: {well_id}")
             self.signal_scan_coordinates_updated.emit()
@@ -3912,7 +4459,7 @@ class ScanCoordinates(QObject):
 
     def add_flexible_region(self, region_id, center_x, center_y, center_z, Nx, Ny, overlap_percent=10):
         """Convert grid parameters NX, NY to FOV coordinates based on overlap"""
-        fov_size_mm = (self.objectiveStore.get_pixel_size() / 1000) * Acquisition.CROP_WIDTH
+        fov_size_mm = self.objectiveStore.get_fov_size_mm()
         step_size_mm = fov_size_mm * (1 - overlap_percent / 100)
 
         # Calculate total grid size
@@ -3927,11 +4474,11 @@ class ScanCoordinates(QObject):
                 x = center_x - grid_width_mm / 2 + j * step_size_mm
                 if self.validate_coordinates(x, y):
                     row.append((x, y))
-                    self.navigationViewer.register_fov_to_image(x, y)
 
             if self.fov_pattern == "S-Pattern" and i % 2 == 1:  # reverse even rows
                 row.reverse()
             scan_coordinates.extend(row)
+        self.navigationViewer.register_fovs_to_image(scan_coordinates)
 
         # Region coordinates are already centered since center_x, center_y is grid center
         if scan_coordinates:  # Only add region if there are valid coordinates
@@ -3958,8 +4505,8 @@ class ScanCoordinates(QObject):
             for x in x_range:
                 if self.validate_coordinates(x, y):
                     row.append((x, y))
-                    self.navigationViewer.register_fov_to_image(x, y)
             scan_coordinates.extend(row)
+        self.navigationViewer.register_fovs_to_image(scan_coordinates)
 
         if scan_coordinates:  # Only add region if there are valid coordinates
             print(f"Added Flexible Region: {region_id}")
@@ -3975,8 +4522,7 @@ class ScanCoordinates(QObject):
             print("Invalid manual ROI data")
             return []
 
-        pixel_size_um = self.objectiveStore.get_pixel_size()
-        fov_size_mm = (pixel_size_um / 1000) * Acquisition.CROP_WIDTH
+        fov_size_mm = self.objectiveStore.get_fov_size_mm()
         step_size_mm = fov_size_mm * (1 - overlap_percent / 100)
 
         # Ensure shape_coords is a numpy array
@@ -4027,8 +4573,7 @@ class ScanCoordinates(QObject):
                 sorted_points[mask] = sorted_points[mask][::-1]
 
         # Register FOVs
-        for x, y in sorted_points:
-            self.navigationViewer.register_fov_to_image(x, y)
+        self.navigationViewer.register_fovs_to_image(sorted_points)
 
         return sorted_points.tolist()
 
@@ -4194,9 +4739,6 @@ class ScanCoordinates(QObject):
         print(f"Updated z-level to {new_z} for region:{region_id}, fov:{fov}")
 
 
-from scipy.interpolate import SmoothBivariateSpline, RBFInterpolator
-
-
 class FocusMap:
     """Handles fitting and interpolation of slide surfaces through measured focus points"""
 
@@ -4294,6 +4836,8 @@ class FocusMap:
         z = self.points[:, 2]
 
         if self.method == "spline":
+            from scipy.interpolate import SmoothBivariateSpline
+
             try:
                 self.surface_fit = SmoothBivariateSpline(
                     x, y, z, kx=3, ky=3, s=self.smoothing_factor  # cubic spline in x  # cubic spline in y
@@ -4311,6 +4855,8 @@ class FocusMap:
 
     def _fit_rbf(self, x, y, z):
         """Fit using Radial Basis Function interpolation"""
+        from scipy.interpolate import RBFInterpolator
+
         xy = np.column_stack((x, y))
         self.surface_fit = RBFInterpolator(xy, z, kernel="thin_plate_spline", epsilon=self.smoothing_factor)
 
@@ -4603,6 +5149,9 @@ class LaserAutofocusController(QObject):
             # signal along x
             tmp = np.sum(I, axis=0)
             # find peaks
+            # scipy.signal is slow to import, and only needed for two interface laser AF
+            import scipy.signal
+
             peak_locations, _ = scipy.signal.find_peaks(tmp, distance=100)
             idx = np.argsort(tmp[peak_locations])
             peak_0_location = peak_locations[idx[-1]]
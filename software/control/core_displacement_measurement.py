@@ -11,6 +11,7 @@ from qtpy.QtGui import *
 
 import control.utils as utils
 from control._def import *
+from squid.ring_buffer import RingBuffer
 
 import time
 import numpy as np
@@ -22,7 +23,7 @@ class DisplacementMeasurementController(QObject):
     signal_readings = Signal(list)
     signal_plots = Signal(np.ndarray, np.ndarray)
 
-    def __init__(self, x_offset=0, y_offset=0, x_scaling=1, y_scaling=1, N_average=1, N=10000):
+    def __init__(self, x_offset=0, y_offset=0, x_scaling=1, y_scaling=1, N_average=1, N=10000, max_points_to_plot=2000):
 
         QObject.__init__(self)
         self.x_offset = x_offset
@@ -31,9 +32,9 @@ class DisplacementMeasurementController(QObject):
         self.y_scaling = y_scaling
         self.N_average = N_average
         self.N = N  # length of array to emit
-        self.t_array = np.array([])
-        self.x_array = np.array([])
-        self.y_array = np.array([])
+        self.max_points_to_plot = max_points_to_plot
+        # columns are (t, x, y)
+        self.measurements = RingBuffer(max(N, N_average), (3,))
 
     def update_measurement(self, image):
 
@@ -55,16 +56,19 @@ class DisplacementMeasurementController(QObject):
         x = x * self.x_scaling
         y = y * self.y_scaling
 
-        self.t_array = np.append(self.t_array, t)
-        self.x_array = np.append(self.x_array, x)
-        self.y_array = np.append(self.y_array, y)
+        self.measurements.append((t, x, y))
 
-        self.signal_plots.emit(self.t_array[-self.N :], np.vstack((self.x_array[-self.N :], self.y_array[-self.N :])))
-        self.signal_readings.emit([np.mean(self.x_array[-self.N_average :]), np.mean(self.y_array[-self.N_average :])])
+        # The plot can't show more than a couple thousand points anyway, so only send a decimated copy.
+        to_plot = self.measurements.get_decimated(self.N, self.max_points_to_plot).T.copy()
+        self.signal_plots.emit(to_plot[0], to_plot[1:])
+        averaged = self.measurements.get_window(self.N_average).mean(axis=0)
+        self.signal_readings.emit([averaged[1], averaged[2]])
 
     def update_settings(self, x_offset, y_offset, x_scaling, y_scaling, N_average, N):
         self.N = N
         self.N_average = N_average
+        if max(N, N_average) != self.measurements.capacity:
+            self.measurements.resize(max(N, N_average))
         self.x_offset = x_offset
         self.y_offset = y_offset
         self.x_scaling = x_scaling
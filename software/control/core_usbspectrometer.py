@@ -23,7 +23,13 @@ from datetime import datetime
 
 from lxml import etree as ET
 from pathlib import Path
+from typing import Optional
 import control.utils_config as utils_config
+from control.spectrum_recording import SpectrumRecordingWriter, open_spectrum_recording
+from control.core.core import make_recording_sink
+from squid.recording_sink import RecordingSinkStats
+from squid.ring_buffer import RingBuffer
+import squid.logging
 
 import math
 import json
@@ -33,11 +39,13 @@ import pandas as pd
 class SpectrumStreamHandler(QObject):
 
     spectrum_to_display = Signal(np.ndarray)
-    spectrum_to_write = Signal(np.ndarray)
+    # The spectrum, and when it was measured
+    spectrum_to_write = Signal(np.ndarray, float)
     signal_new_spectrum_received = Signal()
 
     def __init__(self):
         QObject.__init__(self)
+        self._log = squid.logging.get_logger(self.__class__.__name__)
         self.fps_display = 30
         self.fps_save = 1
         self.timestamp_last_display = 0
@@ -47,8 +55,8 @@ class SpectrumStreamHandler(QObject):
 
         # for fps measurement
         self.timestamp_last = 0
-        self.counter = 0
         self.fps_real = 0
+        self.measurement_timestamps = RingBuffer(4096)
 
     def start_recording(self):
         self.save_spectrum_flag = True
@@ -64,75 +72,123 @@ class SpectrumStreamHandler(QObject):
 
     def on_new_measurement(self, data):
         self.signal_new_spectrum_received.emit()
-        # measure real fps
-        timestamp_now = round(time.time())
-        if timestamp_now == self.timestamp_last:
-            self.counter = self.counter + 1
-        else:
-            self.timestamp_last = timestamp_now
-            self.fps_real = self.counter
-            self.counter = 0
-            print("real spectrometer fps is " + str(self.fps_real))
-        # send image to display
+        # measure real fps over the last second of measurements
         time_now = time.time()
+        self.measurement_timestamps.append(time_now)
+        if round(time_now) != self.timestamp_last:
+            self.timestamp_last = round(time_now)
+            timestamps = self.measurement_timestamps.get_window()
+            self.fps_real = len(timestamps) - np.searchsorted(timestamps, time_now - 1.0, side="right")
+            self._log.debug(f"real spectrometer fps is {self.fps_real}")
+        # send image to display
         if time_now - self.timestamp_last_display >= 1 / self.fps_display:
             self.spectrum_to_display.emit(data)
             self.timestamp_last_display = time_now
         # send image to write
         if self.save_spectrum_flag and time_now - self.timestamp_last_save >= 1 / self.fps_save:
-            self.spectrum_to_write.emit(data)
+            self.spectrum_to_write.emit(data, time_now)
             self.timestamp_last_save = time_now
 
 
 class SpectrumSaver(QObject):
 
     stop_recording = Signal()
+    # The first error saving a spectrum of a recording (which also stops the recording)
+    recording_error = Signal(str)
+    # The path of the CSV export_csv wrote, or the error it failed with
+    csv_exported = Signal(str)
+    csv_export_failed = Signal(str)
 
     def __init__(self):
         QObject.__init__(self)
+        self._log = squid.logging.get_logger(self.__class__.__name__)
         self.base_path = "./"
         self.experiment_ID = ""
-        self.max_num_file_per_folder = 1000
-        self.queue = Queue(10)  # max 10 items in the queue
-        self.stop_signal_received = False
-        self.thread = Thread(target=self.process_queue)
-        self.thread.start()
-        self.counter = 0
+        # Spectra are (data, spectrum_ID, timestamp), where spectrum_ID counts the spectra enqueued in the recording, so
+        # lost spectra are recorded by it.
+        # The batch of spectra the writer holds is flushed when the sink has waited flush_interval_s for the next one,
+        # so the spectra before a pause in the stream are on disk within about that.
+        self.flush_interval_s = SPECTRUM_RECORDING_FLUSH_INTERVAL_S
+        self.sink = make_recording_sink(
+            self.save_spectrum,
+            self.__class__.__name__,
+            key=lambda item: item[1],
+            on_error=self._on_save_error,
+            on_idle=self._flush_writer_if_due,
+            idle_interval_s=self.flush_interval_s,
+        )
+        # The writer of the current recording, made in recording_path when its first spectrum is saved.  These are only
+        # changed by the sink's worker, once the spectra of the last recording are written.
+        self.writer: Optional[SpectrumRecordingWriter] = None
+        self.recording_path = None
+        self._writing_finished = False
+        # Whether finish_recording was called since the last start_new_experiment
+        self._recording_finished = True
+        self.writer_lock = Lock()
+        self.spectrum_ID = 0
         self.recording_start_time = 0
         self.recording_time_limit = -1
 
-    def process_queue(self):
-        while True:
-            # stop the thread if stop signal is received
-            if self.stop_signal_received:
-                return
-            # process the queue
-            try:
-                data = self.queue.get(timeout=0.1)
-                folder_ID = int(self.counter / self.max_num_file_per_folder)
-                file_ID = int(self.counter % self.max_num_file_per_folder)
-                # create a new folder
-                if file_ID == 0:
-                    os.mkdir(os.path.join(self.base_path, self.experiment_ID, str(folder_ID)))
-
-                saving_path = os.path.join(self.base_path, self.experiment_ID, str(folder_ID), str(file_ID) + ".csv")
-                np.savetxt(saving_path, data, delimiter=",")
-
-                self.counter = self.counter + 1
-                self.queue.task_done()
-            except:
-                pass
-
-    def enqueue(self, data):
+    def save_spectrum(self, data, spectrum_ID, timestamp):
+        with self.writer_lock:
+            if self.writer is None:
+                if self._writing_finished:
+                    # The spectrum was on its way when the recording stopped, a new writer would overwrite the recording
+                    self._log.debug(f"Not saving spectrum {spectrum_ID}, it arrived after its recording was finished")
+                    return
+                if self.recording_path is None:
+                    self.recording_path = self.get_recording_path()
+                self.writer = SpectrumRecordingWriter(self.recording_path, flush_interval_s=self.flush_interval_s)
+            self.writer.write_spectrum(data, spectrum_ID, timestamp)
+
+    def _flush_writer_if_due(self):
+        with self.writer_lock:
+            if self.writer is not None:
+                self.writer.flush_if_due()
+
+    def _close_writer(self):
+        with self.writer_lock:
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+
+    def _on_save_error(self, error):
+        self.recording_error.emit(f"Saving the spectra to {self.experiment_ID} failed: {error}")
+        self.stop_recording.emit()
+
+    def enqueue(self, data, timestamp=None):
+        self.sink.put(data, self.spectrum_ID, time.time() if timestamp is None else timestamp)
+        self.spectrum_ID += 1
+        if (self.recording_time_limit > 0) and (time.time() - self.recording_start_time >= self.recording_time_limit):
+            self.stop_recording.emit()
+
+    def get_recording_path(self):
+        return os.path.join(self.base_path, self.experiment_ID)
+
+    def export_csv(self, csv_path=None):
+        """
+        Export the current (or last) recording as a CSV table (see SpectrumRecording.export_csv), with everything
+        enqueued so far.  It's done on the saving thread once that's saved, so this doesn't wait for it: csv_exported
+        is emitted with the path of the CSV, or csv_export_failed with the error.
+        """
+        recording_path = self.get_recording_path()
+        self.sink.call_when_written(lambda stats: self._export_csv(recording_path, csv_path))
+
+    def _export_csv(self, recording_path, csv_path):
         try:
-            self.queue.put_nowait(data)
-            if (self.recording_time_limit > 0) and (
-                time.time() - self.recording_start_time >= self.recording_time_limit
-            ):
-                self.stop_recording.emit()
-            # when using self.queue.put(str_), program can be slowed down despite multithreading because of the block and the GIL
-        except:
-            print("imageSaver queue is full, image discarded")
+            with self.writer_lock:
+                if self.writer is not None:
+                    self.writer.flush()
+            with open_spectrum_recording(recording_path) as recording:
+                csv_path = recording.export_csv(csv_path)
+        except Exception as e:
+            self._log.exception(f"Exporting {recording_path} to CSV failed")
+            self.csv_export_failed.emit(str(e))
+            return
+        self.csv_exported.emit(csv_path)
+
+    def get_stats(self) -> RecordingSinkStats:
+        return self.sink.get_stats()
 
     def set_base_path(self, path):
         self.base_path = path
@@ -141,6 +197,7 @@ class SpectrumSaver(QObject):
         self.recording_time_limit = time_limit
 
     def start_new_experiment(self, experiment_ID, add_timestamp=True):
+        self.finish_recording()
         if add_timestamp:
             # generate unique experiment ID
             self.experiment_ID = experiment_ID + "_spectrum_" + datetime.now().strftime("%Y-%m-%d_%H-%M-%S.%f")
@@ -148,15 +205,47 @@ class SpectrumSaver(QObject):
             self.experiment_ID = experiment_ID
         self.recording_start_time = time.time()
         # create a new folder
-        try:
-            os.mkdir(os.path.join(self.base_path, self.experiment_ID))
-            # to do: save configuration
-        except:
-            pass
-        # reset the counter
-        self.counter = 0
+        recording_path = self.get_recording_path()
+        os.makedirs(recording_path, exist_ok=True)
+        # to do: save configuration
+        # The sink's worker switches to the new recording once the last one's spectra are written, so this doesn't
+        # wait for them.
+        self.sink.call_when_written(lambda stats: self._start_writing(recording_path))
+        self.sink.reset_stats()
+        self._recording_finished = False
+        self.spectrum_ID = 0
+
+    def finish_recording(self):
+        """
+        Close the recording's writer, which writes out its last batch of spectra, once its spectra are saved.  Doesn't
+        wait for that.  Call it when the recording stops, calling it again before the next start_new_experiment does
+        nothing.
+        """
+        if self._recording_finished:
+            return
+        self._recording_finished = True
+        experiment_ID = self.experiment_ID
+        self.sink.call_when_written(lambda stats: self._finish_writing(experiment_ID, stats))
+
+    def _finish_writing(self, experiment_ID, stats: RecordingSinkStats):
+        self._close_writer()
+        self._writing_finished = True
+        self._log_recording_summary(experiment_ID, stats)
+
+    def _start_writing(self, recording_path):
+        self.recording_path = recording_path
+        self._writing_finished = False
+
+    def _log_recording_summary(self, experiment_ID, stats: RecordingSinkStats):
+        if not stats.accepted:
+            return
+        message = f"Spectrum recording {experiment_ID}: {stats.describe()}"
+        if stats.lost:
+            self._log.warning(f"{message}.  Lost spectra: {stats.lost_keys}")
+        else:
+            self._log.info(message)
 
     def close(self):
-        self.queue.join()
-        self.stop_signal_received = True
-        self.thread.join()
+        self.finish_recording()
+        self.sink.close()
+        self._close_writer()
@@ -0,0 +1,217 @@
+"""
+The startup device graph of the HCS gui: connecting to every device, and homing and configuring them.
+
+Everything that talks to the microcontroller (the stage, its homing, the DAC setup and the squid filter wheel) is one
+chain, because the microcontroller only tracks one command at a time.  The cameras, the light sources, the spinning
+disk and the emission filter wheels each have their own connection, so they come up concurrently with that chain.  The
+focus camera waits for the main one though: the vendor SDKs they're opened with aren't safe to use from two threads at
+once.
+"""
+
+import serial
+
+import control.camera
+import control.filterwheel as filterwheel
+import control.microcontroller as microcontroller
+import control.serial_peripherals as serial_peripherals
+import squid.abc
+import squid.config
+from control._def import *
+from control.microscope import IlluminationController, IntensityControlMode, LightSourceType, ShutterControlMode
+from squid.device_graph import DeviceGraph
+
+# The nodes of the graph that are steps of setting up a device, rather than devices
+SETUP_STEPS = ("stage_homing", "dac", "emission_filter_wheel_homing")
+
+
+def build_device_graph(
+    is_simulation: bool, camera_module=control.camera, focus_camera_module=control.camera
+) -> DeviceGraph:
+    """
+    The graph of the devices enabled in _def, with the real devices, or with their simulations if is_simulation.
+
+    The results of run() are the device objects, named after the gui attributes they're for (ex: "camera",
+    "camera_focus", "stage", "emission_filter_wheel"), and the results of the SETUP_STEPS, of which "stage_homing" is
+    True if x and y were homed.
+    """
+    graph = DeviceGraph(default_timeout_s=DEVICE_INITIALIZATION_TIMEOUT_S)
+
+    if is_simulation:
+        graph.add(
+            "microcontroller", lambda: microcontroller.Microcontroller(existing_serial=microcontroller.SimSerial())
+        )
+    else:
+        graph.add(
+            "microcontroller", lambda: microcontroller.Microcontroller(version=CONTROLLER_VERSION, sn=CONTROLLER_SN)
+        )
+
+    if USE_PRIOR_STAGE:
+        import squid.stage.prior
+
+        graph.add("stage", lambda: squid.stage.prior.PriorStage(sn=PRIOR_STAGE_SN))
+    else:
+        import squid.stage.cephla
+
+        graph.add(
+            "stage",
+            lambda mcu: squid.stage.cephla.CephlaStage(
+                microcontroller=mcu, stage_config=squid.config.get_stage_config()
+            ),
+            depends_on=["microcontroller"],
+        )
+    graph.add("stage_homing", _home_stage, depends_on=["stage"], timeout_s=DEVICE_HOMING_TIMEOUT_S)
+    graph.add("dac", _configure_dac, depends_on=["microcontroller", "stage_homing"])
+
+    if USE_SQUID_FILTERWHEEL:
+        # In simulation too, this is the real wrapper, driving the simulated microcontroller.
+        graph.add(
+            "squid_filter_wheel",
+            _initialize_squid_filter_wheel,
+            depends_on=["microcontroller", "dac"],
+            timeout_s=DEVICE_HOMING_TIMEOUT_S,
+        )
+
+    graph.add("camera", lambda: _initialize_camera(is_simulation, camera_module))
+    if SUPPORT_LASER_AUTOFOCUS:
+        graph.add(
+            "camera_focus",
+            lambda _: _initialize_focus_camera(is_simulation, focus_camera_module),
+            depends_on=["camera"],
+        )
+
+    if ENABLE_SPINNING_DISK_CONFOCAL:
+        if is_simulation:
+            graph.add("xlight", serial_peripherals.XLight_Simulation)
+        else:
+            graph.add("xlight", lambda: serial_peripherals.XLight(XLIGHT_SERIAL_NUMBER, XLIGHT_SLEEP_TIME_FOR_WHEEL))
+
+    if ENABLE_NL5:
+        graph.add("nl5", lambda: _initialize_nl5(is_simulation))
+
+    if ENABLE_CELLX:
+        graph.add("cellx", lambda: _initialize_cellx(is_simulation))
+
+    if USE_LDI_SERIAL_CONTROL:
+        graph.add("ldi", serial_peripherals.LDI_Simulation if is_simulation else serial_peripherals.LDI)
+    if USE_CELESTA_ETHENET_CONTROL:
+        graph.add("celesta", lambda: _initialize_celesta(is_simulation))
+        graph.add(
+            "illuminationController",
+            lambda mcu, celesta: IlluminationController(
+                mcu, IntensityControlMode.Software, ShutterControlMode.TTL, LightSourceType.CELESTA, celesta
+            ),
+            depends_on=["microcontroller", "celesta"],
+        )
+    elif USE_LDI_SERIAL_CONTROL:
+        graph.add(
+            "illuminationController",
+            lambda mcu, ldi: IlluminationController(
+                mcu, ldi.intensity_mode, ldi.shutter_mode, LightSourceType.LDI, ldi
+            ),
+            depends_on=["microcontroller", "ldi"],
+        )
+
+    if USE_ZABER_EMISSION_FILTER_WHEEL or USE_OPTOSPIN_EMISSION_FILTER_WHEEL:
+        graph.add("emission_filter_wheel", lambda: _initialize_emission_filter_wheel(is_simulation))
+        graph.add(
+            "emission_filter_wheel_homing",
+            _home_emission_filter_wheel,
+            depends_on=["emission_filter_wheel"],
+            timeout_s=DEVICE_HOMING_TIMEOUT_S,
+        )
+
+    return graph
+
+
+def _home_stage(stage: squid.abc.AbstractStage) -> bool:
+    if HOMING_ENABLED_Z:
+        stage.home(x=False, y=False, z=True, theta=False)
+    if not (HOMING_ENABLED_X and HOMING_ENABLED_Y):
+        return False
+    stage.home(x=False, y=True, z=False, theta=False)
+    stage.home(x=True, y=False, z=False, theta=False)
+    # TODO(imo): Why do we move to 20 after homing here?
+    stage.move_x(20)
+    stage.move_y(20)
+    return True
+
+
+def _configure_dac(mcu: microcontroller.Microcontroller, _):
+    if ENABLE_OBJECTIVE_PIEZO:
+        OUTPUT_GAINS.CHANNEL7_GAIN = OBJECTIVE_PIEZO_CONTROL_VOLTAGE_RANGE == 5
+    div = 1 if OUTPUT_GAINS.REFDIV else 0
+    gains = sum(getattr(OUTPUT_GAINS, f"CHANNEL{i}_GAIN") << i for i in range(8))
+    mcu.configure_dac80508_refdiv_and_gain(div, gains)
+    mcu.set_dac80508_scaling_factor_for_illumination(ILLUMINATION_INTENSITY_FACTOR)
+
+
+def _initialize_squid_filter_wheel(mcu: microcontroller.Microcontroller, _):
+    squid_filter_wheel = filterwheel.SquidFilterWheelWrapper(mcu)
+    if SQUID_FILTERWHEEL_HOMING_ENABLED:
+        squid_filter_wheel.homing()
+    return squid_filter_wheel
+
+
+def _initialize_camera(is_simulation, camera_module):
+    if is_simulation:
+        camera = camera_module.Camera_Simulation(rotate_image_angle=ROTATE_IMAGE_ANGLE, flip_image=FLIP_IMAGE)
+    else:
+        sn_camera_main = camera_module.get_sn_by_model(MAIN_CAMERA_MODEL)
+        camera = camera_module.Camera(sn=sn_camera_main, rotate_image_angle=ROTATE_IMAGE_ANGLE, flip_image=FLIP_IMAGE)
+        camera.open()
+    camera.set_pixel_format(DEFAULT_PIXEL_FORMAT)
+    return camera
+
+
+def _initialize_focus_camera(is_simulation, camera_module):
+    if is_simulation:
+        return camera_module.Camera_Simulation()
+    sn_camera_focus = camera_module.get_sn_by_model(FOCUS_CAMERA_MODEL)
+    camera_focus = camera_module.Camera(sn=sn_camera_focus)
+    camera_focus.open()
+    camera_focus.set_pixel_format("MONO8")
+    return camera_focus
+
+
+def _initialize_nl5(is_simulation):
+    import control.NL5 as NL5
+
+    return NL5.NL5_Simulation() if is_simulation else NL5.NL5()
+
+
+def _initialize_cellx(is_simulation):
+    if is_simulation:
+        return serial_peripherals.CellX_Simulation()
+    cellx = serial_peripherals.CellX(CELLX_SN)
+    for channel in [1, 2, 3, 4]:
+        cellx.set_modulation(channel, CELLX_MODULATION)
+        cellx.turn_on(channel)
+    return cellx
+
+
+def _initialize_celesta(is_simulation):
+    import control.celesta
+
+    if is_simulation:
+        return control.celesta.CELESTA_Simulation(blocking=CELESTA_BLOCKING)
+    return control.celesta.CELESTA(ip=CELESTA_IP, blocking=CELESTA_BLOCKING)
+
+
+def _initialize_emission_filter_wheel(is_simulation):
+    if USE_ZABER_EMISSION_FILTER_WHEEL:
+        if is_simulation:
+            return serial_peripherals.FilterController_Simulation(115200, 8, serial.PARITY_NONE, serial.STOPBITS_ONE)
+        return serial_peripherals.FilterController(
+            FILTER_CONTROLLER_SERIAL_NUMBER, 115200, 8, serial.PARITY_NONE, serial.STOPBITS_ONE
+        )
+    if is_simulation:
+        return serial_peripherals.Optospin_Simulation(SN=None)
+    return serial_peripherals.Optospin(SN=FILTER_CONTROLLER_SERIAL_NUMBER)
+
+
+def _home_emission_filter_wheel(emission_filter_wheel):
+    if USE_ZABER_EMISSION_FILTER_WHEEL:
+        emission_filter_wheel.start_homing()
+        emission_filter_wheel.wait_for_homing_complete()
+    else:
+        emission_filter_wheel.set_speed(OPTOSPIN_EMISSION_FILTER_WHEEL_SPEED_HZ)
@@ -0,0 +1,124 @@
+import dataclasses
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+from qtpy.QtCore import QObject, QTimer, Qt
+
+import squid.logging
+from squid.ring_buffer import RingBuffer
+from control._def import *
+
+
+@dataclasses.dataclass
+class DisplayStatistics:
+    # Since creation (or the last reset_statistics)
+    posted: int
+    presented: int
+    # Posted, but replaced by a newer one before they could be presented
+    dropped: int
+    # Over the latest latency_window presented frames, from when the frame was captured to when the display was
+    # updated with it.  NaN if nothing has been presented yet.
+    latency_mean_s: float
+    latency_p95_s: float
+    latency_max_s: float
+
+
+class DisplayMailbox(QObject):
+    """
+    A latest-frame-wins hand off from a producer (ex: the camera's thread) to a display on the GUI thread.
+
+    post() overwrites the frame waiting in a slot instead of queueing another one, and a timer on the GUI thread
+    presents whatever is waiting refresh_rate_hz times a second by calling present(*args).  So a display that can't
+    keep up drops frames instead of falling further and further behind the camera, and the GUI thread never spends
+    time drawing a frame that's already stale.
+
+    By default there's one slot.  Posting with a key gives each key its own slot (ex: one per channel), and all the
+    waiting slots are presented (in the order they were first posted) on each tick.
+
+    Must be created on the GUI thread.  post() can be called from any thread, but the posted args are read later, so
+    don't post a buffer that's about to be overwritten.
+    """
+
+    def __init__(
+        self,
+        present: Callable[..., None],
+        refresh_rate_hz: float = DISPLAY_REFRESH_RATE_HZ,
+        latency_window: int = DISPLAY_LATENCY_WINDOW,
+        parent: Optional[QObject] = None,
+    ):
+        QObject.__init__(self, parent)
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self.present = present
+
+        self._lock = threading.Lock()
+        # key -> (args, capture timestamp)
+        self._slots: Dict[Hashable, Tuple[tuple, float]] = {}
+        self._posted = 0
+        self._presented = 0
+        self._dropped = 0
+        self._latencies = RingBuffer(latency_window)
+
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.PreciseTimer)
+        self._timer.timeout.connect(self.present_waiting)
+        self.set_refresh_rate(refresh_rate_hz)
+        self._timer.start()
+
+    def set_refresh_rate(self, refresh_rate_hz: float):
+        self._timer.setInterval(max(1, round(1000 / refresh_rate_hz)))
+
+    def post(self, *args, key: Hashable = None, timestamp: Optional[float] = None):
+        """
+        Leave args for the next present(*args), replacing whatever is waiting for key.  timestamp is the time.time()
+        the frame was captured (the latency is measured from it), or now if None.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            if key in self._slots:
+                self._dropped += 1
+            self._slots[key] = (args, timestamp)
+            self._posted += 1
+
+    def present_waiting(self):
+        """Present everything that's waiting now, instead of on the next tick.  Only call this on the GUI thread."""
+        with self._lock:
+            if not self._slots:
+                return
+            slots, self._slots = self._slots, {}
+        for args, timestamp in slots.values():
+            try:
+                self.present(*args)
+            except Exception as e:
+                self._log.error(f"Couldn't present a frame: {e}")
+                continue
+            self._presented += 1
+            self._latencies.append(time.time() - timestamp)
+
+    def discard_waiting(self):
+        """Drop everything that's waiting (ex: because the display is being reset)."""
+        with self._lock:
+            self._dropped += len(self._slots)
+            self._slots = {}
+
+    def get_statistics(self) -> DisplayStatistics:
+        with self._lock:
+            posted, dropped = self._posted, self._dropped
+        latencies = self._latencies.get_window()
+        if len(latencies):
+            mean_s, p95_s, max_s = float(latencies.mean()), float(np.percentile(latencies, 95)), float(latencies.max())
+        else:
+            mean_s = p95_s = max_s = float("nan")
+        return DisplayStatistics(posted, self._presented, dropped, mean_s, p95_s, max_s)
+
+    def reset_statistics(self):
+        with self._lock:
+            self._posted = len(self._slots)
+            self._dropped = 0
+        self._presented = 0
+        self._latencies.clear()
+
+    def close(self):
+        self._timer.stop()
+        self.discard_waiting()
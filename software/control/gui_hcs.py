@@ -2,7 +2,6 @@
 import os
 
 os.environ["QT_API"] = "pyqt5"
-import serial
 import time
 from typing import Optional
 
@@ -21,17 +20,12 @@ import squid.logging
 import squid.config
 import squid.stage.utils
 import control.microscope
-from control.microscope import LightSourceType, IntensityControlMode, ShutterControlMode
+import control.camera_geometry
+import control.device_initialization
+from squid.device_graph import DeviceInitializationError, DeviceInitializationTimeout
 
 log = squid.logging.get_logger(__name__)
 
-import control.filterwheel as filterwheel
-
-if USE_PRIOR_STAGE:
-    import squid.stage.prior
-else:
-    import squid.stage.cephla
-
 if CAMERA_TYPE == "Toupcam":
     try:
         import control.camera_toupcam as camera
@@ -82,7 +76,6 @@ else:
 
 import control.core.core as core
 import control.microcontroller as microcontroller
-import control.serial_peripherals as serial_peripherals
 
 if ENABLE_STITCHER:
     from control.stitcher.stitcher_parameters import StitchingParameters
@@ -180,14 +173,7 @@ class HighContentScreeningGui(QMainWindow):
 
     def loadObjects(self, is_simulation):
         self.illuminationController = None
-        if is_simulation:
-            self.loadSimulationObjects()
-        else:
-            try:
-                self.loadHardwareObjects()
-            except Exception:
-                self.log.error("---- !! ERROR CONNECTING TO HARDWARE !! ----", stack_info=True, exc_info=True)
-                raise
+        self.initializeDevices(is_simulation)
 
         # Common object initialization
         self.objectiveStore = core.ObjectiveStore(parent=self)
@@ -198,13 +184,9 @@ class HighContentScreeningGui(QMainWindow):
             self.camera, self.microcontroller, self.configurationManager, self.illuminationController, parent=self
         )
 
-        if USE_PRIOR_STAGE:
-            self.stage: squid.abc.AbstractStage = squid.stage.prior.PriorStage(sn=PRIOR_STAGE_SN)
-
-        else:
-            self.stage: squid.abc.AbstractStage = squid.stage.cephla.CephlaStage(
-                microcontroller=self.microcontroller, stage_config=squid.config.get_stage_config()
-            )
+        if is_simulation and hasattr(self.camera, "set_position_source"):
+            # Image the simulated specimen wherever the simulated stage is
+            self.camera.set_position_source(self.stage.get_pos)
 
         self.slidePositionController = core.SlidePositionController(
             self.stage, self.liveController, is_for_wellplate=True
@@ -285,170 +267,41 @@ class HighContentScreeningGui(QMainWindow):
                 look_for_cache=False,
             )
 
-        if USE_SQUID_FILTERWHEEL:
-            self.squid_filter_wheel = filterwheel.SquidFilterWheelWrapper(self.microcontroller)
-
-    def loadSimulationObjects(self):
-        self.log.debug("Loading simulated hardware objects...")
-        self.microcontroller = microcontroller.Microcontroller(existing_serial=microcontroller.SimSerial())
-        # Initialize simulation objects
-        if ENABLE_SPINNING_DISK_CONFOCAL:
-            self.xlight = serial_peripherals.XLight_Simulation()
-        if ENABLE_NL5:
-            import control.NL5 as NL5
-
-            self.nl5 = NL5.NL5_Simulation()
-        if ENABLE_CELLX:
-            self.cellx = serial_peripherals.CellX_Simulation()
-        if SUPPORT_LASER_AUTOFOCUS:
-            self.camera_focus = camera_fc.Camera_Simulation()
-        if USE_LDI_SERIAL_CONTROL:
-            self.ldi = serial_peripherals.LDI_Simulation()
-            self.illuminationController = control.microscope.IlluminationController(
-                self.microcontroller, self.ldi.intensity_mode, self.ldi.shutter_mode, LightSourceType.LDI, self.ldi
-            )
-        self.camera = camera.Camera_Simulation(rotate_image_angle=ROTATE_IMAGE_ANGLE, flip_image=FLIP_IMAGE)
-        self.camera.set_pixel_format(DEFAULT_PIXEL_FORMAT)
-        if USE_ZABER_EMISSION_FILTER_WHEEL:
-            self.emission_filter_wheel = serial_peripherals.FilterController_Simulation(
-                115200, 8, serial.PARITY_NONE, serial.STOPBITS_ONE
-            )
-        if USE_OPTOSPIN_EMISSION_FILTER_WHEEL:
-            self.emission_filter_wheel = serial_peripherals.Optospin_Simulation(SN=None)
-        if USE_SQUID_FILTERWHEEL:
-            self.squid_filter_wheel = filterwheel.SquidFilterWheelWrapper_Simulation(None)
-
-    def loadHardwareObjects(self):
-        # Initialize hardware objects
+    def initializeDevices(self, is_simulation):
+        """Connect to, home and configure every device, concurrently where they don't depend on each other."""
+        self.log.debug(f"Initializing {'simulated ' if is_simulation else ''}hardware objects...")
+        self.deviceGraph = control.device_initialization.build_device_graph(is_simulation, camera, camera_fc)
         try:
-            self.microcontroller = microcontroller.Microcontroller(version=CONTROLLER_VERSION, sn=CONTROLLER_SN)
-        except Exception:
-            self.log.error(f"Error initializing Microcontroller")
+            devices = self.deviceGraph.run()
+        except DeviceInitializationError as e:
+            self.log.error("---- !! ERROR CONNECTING TO HARDWARE !! ----", stack_info=True, exc_info=True)
+            timed_out = isinstance(e, DeviceInitializationTimeout) or isinstance(e.__cause__, TimeoutError)
+            if timed_out and "microcontroller" in self.deviceGraph.results:
+                # If we can't recover from a timeout, at least do our best to make sure the system is left in a safe
+                # and restartable state.
+                self.log.error("Setup timed out, resetting microcontroller before failing gui setup")
+                self.deviceGraph.results["microcontroller"].reset()
             raise
 
-        if ENABLE_SPINNING_DISK_CONFOCAL:
-            try:
-                self.xlight = serial_peripherals.XLight(XLIGHT_SERIAL_NUMBER, XLIGHT_SLEEP_TIME_FOR_WHEEL)
-            except Exception:
-                self.log.error("Error initializing Spinning Disk Confocal")
-                raise
-
-        if ENABLE_NL5:
-            try:
-                import control.NL5 as NL5
-
-                self.nl5 = NL5.NL5()
-            except Exception:
-                self.log.error("Error initializing NL5")
-                raise
-
-        if ENABLE_CELLX:
-            try:
-                self.cellx = serial_peripherals.CellX(CELLX_SN)
-                for channel in [1, 2, 3, 4]:
-                    self.cellx.set_modulation(channel, CELLX_MODULATION)
-                    self.cellx.turn_on(channel)
-            except Exception:
-                self.log.error("Error initializing CellX")
-                raise
-
-        if USE_LDI_SERIAL_CONTROL:
-            try:
-                self.ldi = serial_peripherals.LDI()
-                self.illuminationController = control.microscope.IlluminationController(
-                    self.microcontroller, self.ldi.intensity_mode, self.ldi.shutter_mode, LightSourceType.LDI, self.ldi
-                )
-            except Exception:
-                self.log.error("Error initializing LDI")
-                raise
-
-        if USE_CELESTA_ETHENET_CONTROL:
-            try:
-                import control.celesta
-
-                self.celesta = control.celesta.CELESTA()
-                self.illuminationController = control.microscope.IlluminationController(
-                    self.microcontroller,
-                    IntensityControlMode.Software,
-                    ShutterControlMode.TTL,
-                    LightSourceType.CELESTA,
-                    self.celesta,
-                )
-            except Exception:
-                self.log.error("Error initializing CELESTA")
-                raise
-
-        if SUPPORT_LASER_AUTOFOCUS:
-            try:
-                sn_camera_focus = camera_fc.get_sn_by_model(FOCUS_CAMERA_MODEL)
-                self.camera_focus = camera_fc.Camera(sn=sn_camera_focus)
-                self.camera_focus.open()
-                self.camera_focus.set_pixel_format("MONO8")
-            except Exception:
-                self.log.error(f"Error initializing Laser Autofocus Camera")
-                raise
-
-        try:
-            sn_camera_main = camera.get_sn_by_model(MAIN_CAMERA_MODEL)
-            self.camera = camera.Camera(sn=sn_camera_main, rotate_image_angle=ROTATE_IMAGE_ANGLE, flip_image=FLIP_IMAGE)
-            self.camera.open()
-            self.camera.set_pixel_format(DEFAULT_PIXEL_FORMAT)
-        except Exception:
-            self.log.error("Error initializing Main Camera")
-            raise
-
-        if USE_ZABER_EMISSION_FILTER_WHEEL:
-            try:
-                self.emission_filter_wheel = serial_peripherals.FilterController(
-                    FILTER_CONTROLLER_SERIAL_NUMBER, 115200, 8, serial.PARITY_NONE, serial.STOPBITS_ONE
-                )
-            except Exception:
-                self.log.error("Error initializing Zaber Emission Filter Wheel")
-                raise
-
-        if USE_OPTOSPIN_EMISSION_FILTER_WHEEL:
-            try:
-                self.emission_filter_wheel = serial_peripherals.Optospin(SN=FILTER_CONTROLLER_SERIAL_NUMBER)
-            except Exception:
-                self.log.error("Error initializing Optospin Emission Filter Wheel")
-                raise
+        self.stage_homed = devices["stage_homing"]
+        for name, device in devices.items():
+            if name not in control.device_initialization.SETUP_STEPS:
+                setattr(self, name, device)
 
     def setupHardware(self):
-        # Setup hardware components
-        if USE_ZABER_EMISSION_FILTER_WHEEL:
-            self.emission_filter_wheel.start_homing()
-        if USE_OPTOSPIN_EMISSION_FILTER_WHEEL:
-            self.emission_filter_wheel.set_speed(OPTOSPIN_EMISSION_FILTER_WHEEL_SPEED_HZ)
+        if self.stage_homed:
+            self.slidePositionController.homing_done = True
 
-        if not self.microcontroller:
-            raise ValueError("Microcontroller must be none-None for hardware setup.")
+        self.cameraGeometry = control.camera_geometry.configure_camera_geometry(
+            self.camera,
+            control.camera_geometry.OutputGeometry(Acquisition.CROP_WIDTH, Acquisition.CROP_HEIGHT, CAMERA_BINNING),
+            use_hardware=CAMERA_USE_HARDWARE_ROI_AND_BINNING,
+        )
+        self.streamHandler.set_camera_geometry(self.cameraGeometry)
+        self.multipointController.set_camera_geometry(self.cameraGeometry)
+        self.objectiveStore.set_camera_geometry(self.cameraGeometry)
+        self.navigationViewer.update_fov_size()
 
-        try:
-            if HOMING_ENABLED_Z:
-                self.stage.home(x=False, y=False, z=True, theta=False)
-            if HOMING_ENABLED_X and HOMING_ENABLED_Y:
-                self.stage.home(x=False, y=True, z=False, theta=False)
-                self.stage.home(x=True, y=False, z=False, theta=False)
-                self.slidePositionController.homing_done = True
-            if USE_ZABER_EMISSION_FILTER_WHEEL:
-                self.emission_filter_wheel.wait_for_homing_complete()
-            # TODO(imo): Why do we move to 20 after homing here?
-            if HOMING_ENABLED_X and HOMING_ENABLED_Y:
-                self.stage.move_x(20)
-                self.stage.move_y(20)
-
-            if ENABLE_OBJECTIVE_PIEZO:
-                OUTPUT_GAINS.CHANNEL7_GAIN = OBJECTIVE_PIEZO_CONTROL_VOLTAGE_RANGE == 5
-            div = 1 if OUTPUT_GAINS.REFDIV else 0
-            gains = sum(getattr(OUTPUT_GAINS, f"CHANNEL{i}_GAIN") << i for i in range(8))
-            self.microcontroller.configure_dac80508_refdiv_and_gain(div, gains)
-            self.microcontroller.set_dac80508_scaling_factor_for_illumination(ILLUMINATION_INTENSITY_FACTOR)
-        except TimeoutError as e:
-            # If we can't recover from a timeout, at least do our best to make sure the system is left in a safe
-            # and restartable state.
-            self.log.error("Setup timed out, resetting microcontroller before failing gui setup")
-            self.microcontroller.reset()
-            raise e
         self.camera.set_software_triggered_acquisition()
         self.camera.set_callback(self.streamHandler.on_new_frame)
         self.camera.enable_callback()
@@ -462,10 +315,6 @@ class HighContentScreeningGui(QMainWindow):
             self.camera_focus.enable_callback()
             self.camera_focus.start_streaming()
 
-        if USE_SQUID_FILTERWHEEL:
-            if SQUID_FILTERWHEEL_HOMING_ENABLED:
-                self.squid_filter_wheel.homing()
-
     def waitForMicrocontroller(self, timeout=5.0, error_message=None):
         try:
             self.microcontroller.wait_till_operation_is_completed(timeout)
@@ -532,6 +381,9 @@ class HighContentScreeningGui(QMainWindow):
         self.focusMapWidget = widgets.FocusMapWidget(
             self.stage, self.navigationViewer, self.scanCoordinates, core.FocusMap()
         )
+        if ENABLE_ACQUISITION_TELEMETRY:
+            squid.logging.enable_tracing()
+        self.acquisitionTelemetryWidget = widgets.AcquisitionTelemetryWidget()
 
         if SUPPORT_LASER_AUTOFOCUS:
             if FOCUS_CAMERA_TYPE == "Toupcam":
@@ -739,6 +591,7 @@ class HighContentScreeningGui(QMainWindow):
         if SUPPORT_LASER_AUTOFOCUS:
             self.cameraTabWidget.addTab(self.laserAutofocusControlWidget, "Laser AF")
         self.cameraTabWidget.addTab(self.focusMapWidget, "Focus Map")
+        self.cameraTabWidget.addTab(self.acquisitionTelemetryWidget, "Timing")
         self.cameraTabWidget.currentChanged.connect(lambda: self.resizeCurrentTab(self.cameraTabWidget))
         self.resizeCurrentTab(self.cameraTabWidget)
 
@@ -834,7 +687,9 @@ class HighContentScreeningGui(QMainWindow):
 
     def makeConnections(self):
         self.streamHandler.signal_new_frame_received.connect(self.liveController.on_new_frame)
-        self.streamHandler.packet_image_to_write.connect(self.imageSaver.enqueue)
+        # Direct, so that saving never waits on the GUI's event loop (and the "block" overflow policy holds up the
+        # camera's thread rather than the GUI)
+        self.streamHandler.packet_image_to_write.connect(self.imageSaver.enqueue, type=Qt.DirectConnection)
 
         if ENABLE_STITCHER:
             self.multipointController.signal_stitcher.connect(self.startStitcher)
@@ -891,13 +746,18 @@ class HighContentScreeningGui(QMainWindow):
         if USE_NAPARI_FOR_LIVE_VIEW and not self.live_only_mode:
             self.multipointController.signal_current_configuration.connect(self.napariLiveWidget.set_microscope_mode)
             self.autofocusController.image_to_display.connect(
-                lambda image: self.napariLiveWidget.updateLiveLayer(image, from_autofocus=True)
+                lambda image: self.napariLiveWidget.postLiveFrame(image, from_autofocus=True)
             )
+            # Direct, so that frames go straight from the camera's thread to the display's mailbox instead of queueing
+            # up on the GUI thread.
             self.streamHandler.image_to_display.connect(
-                lambda image: self.napariLiveWidget.updateLiveLayer(image, from_autofocus=False)
+                lambda image: self.napariLiveWidget.postLiveFrame(
+                    image, from_autofocus=False, timestamp=self.streamHandler.display_capture_timestamp
+                ),
+                type=Qt.DirectConnection,
             )
             self.multipointController.image_to_display.connect(
-                lambda image: self.napariLiveWidget.updateLiveLayer(image, from_autofocus=False)
+                lambda image: self.napariLiveWidget.postLiveFrame(image, from_autofocus=False)
             )
             self.napariLiveWidget.signal_coordinates_clicked.connect(self.move_from_click_image)
             self.liveControlWidget.signal_live_configuration.connect(self.napariLiveWidget.set_live_configuration)
@@ -977,15 +837,17 @@ class HighContentScreeningGui(QMainWindow):
                 (self.multipointController.signal_current_configuration, self.napariLiveWidget.set_microscope_mode),
                 (
                     self.autofocusController.image_to_display,
-                    lambda image: self.napariLiveWidget.updateLiveLayer(image, from_autofocus=True),
+                    lambda image: self.napariLiveWidget.postLiveFrame(image, from_autofocus=True),
                 ),
                 (
                     self.streamHandler.image_to_display,
-                    lambda image: self.napariLiveWidget.updateLiveLayer(image, from_autofocus=False),
+                    lambda image: self.napariLiveWidget.postLiveFrame(
+                        image, from_autofocus=False, timestamp=self.streamHandler.display_capture_timestamp
+                    ),
                 ),
                 (
                     self.multipointController.image_to_display,
-                    lambda image: self.napariLiveWidget.updateLiveLayer(image, from_autofocus=False),
+                    lambda image: self.napariLiveWidget.postLiveFrame(image, from_autofocus=False),
                 ),
                 (self.napariLiveWidget.signal_coordinates_clicked, self.move_from_click_image),
                 (self.liveControlWidget.signal_live_configuration, self.napariLiveWidget.set_live_configuration),
@@ -1011,9 +873,19 @@ class HighContentScreeningGui(QMainWindow):
         if not self.live_only_mode:
             # Setup multichannel widget connections
             if USE_NAPARI_FOR_MULTIPOINT:
+                # The layers are posted to the widget's mailbox directly from the acquisition's thread (like live
+                # view), so only the latest image of each layer waits for the GUI.
                 self.napari_connections["napariMultiChannelWidget"] = [
-                    (self.multipointController.napari_layers_init, self.napariMultiChannelWidget.initLayers),
-                    (self.multipointController.napari_layers_update, self.napariMultiChannelWidget.updateLayers),
+                    (
+                        self.multipointController.napari_layers_init,
+                        self.napariMultiChannelWidget.postLayersInit,
+                        Qt.DirectConnection,
+                    ),
+                    (
+                        self.multipointController.napari_layers_update,
+                        self.napariMultiChannelWidget.postLayers,
+                        Qt.DirectConnection,
+                    ),
                 ]
 
                 if ENABLE_FLEXIBLE_MULTIPOINT:
@@ -1049,7 +921,11 @@ class HighContentScreeningGui(QMainWindow):
             # Setup mosaic display widget connections
             if USE_NAPARI_FOR_MOSAIC_DISPLAY:
                 self.napari_connections["napariMosaicDisplayWidget"] = [
-                    (self.multipointController.napari_layers_update, self.napariMosaicDisplayWidget.updateMosaic),
+                    (
+                        self.multipointController.napari_layers_update,
+                        self.napariMosaicDisplayWidget.postMosaic,
+                        Qt.DirectConnection,
+                    ),
                     (self.napariMosaicDisplayWidget.signal_coordinates_clicked, self.move_from_click_mm),
                     (self.napariMosaicDisplayWidget.signal_clear_viewer, self.navigationViewer.clear_slide),
                 ]
@@ -1099,7 +975,8 @@ class HighContentScreeningGui(QMainWindow):
             if widget_name != "napariLiveWidget":  # Always keep the live widget connected
                 widget = getattr(self, widget_name, None)
                 if widget:
-                    for signal, slot in connections:
+                    # An optional third item is the connection type
+                    for signal, slot, *connection_type in connections:
                         if self.performance_mode:
                             try:
                                 signal.disconnect(slot)
@@ -1108,7 +985,7 @@ class HighContentScreeningGui(QMainWindow):
                                 pass
                         else:
                             try:
-                                signal.connect(slot)
+                                signal.connect(slot, *connection_type)
                             except TypeError:
                                 # Connection might already exist, which is fine
                                 pass
@@ -1413,10 +1290,12 @@ class HighContentScreeningGui(QMainWindow):
             self.stitcherWidget.closeEvent(event)
         if SUPPORT_LASER_AUTOFOCUS:
             self.liveController_focus_camera.stop_live()
+            self.liveController_focus_camera.close()
             self.camera_focus.close()
             self.imageDisplayWindow_focus.close()
 
         self.liveController.stop_live()
+        self.liveController.close()
         self.camera.stop_streaming()
         self.camera.close()
 
@@ -1436,6 +1315,8 @@ class HighContentScreeningGui(QMainWindow):
 
         self.imageSaver.close()
         self.imageDisplay.close()
+        if USE_NAPARI_FOR_LIVE_VIEW:
+            self.napariLiveWidget.close()
         if not SINGLE_WINDOW:
             self.imageDisplayWindow.close()
             self.imageArrayDisplayWindow.close()
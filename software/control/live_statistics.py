@@ -0,0 +1,104 @@
+import dataclasses
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+from qtpy.QtCore import QObject, Signal
+
+import squid.logging
+from control._def import *
+
+
+@dataclasses.dataclass
+class LiveStatistics:
+    # The left edge of each bin, and how many (sampled) pixels are in it
+    bin_edges: np.ndarray
+    counts: np.ndarray
+    min: float
+    max: float
+    # The low and high percentiles, for autolevel
+    low: float
+    high: float
+
+
+def subsample(image: np.ndarray, max_samples: int) -> np.ndarray:
+    """A strided view of image with at most about max_samples pixels (per color channel), spread over the frame."""
+    height, width = image.shape[:2]
+    step = max(1, int(np.ceil(np.sqrt(height * width / max_samples))))
+    return image[::step, ::step]
+
+
+def compute_live_statistics(
+    image: np.ndarray,
+    max_samples: int = LIVE_STATISTICS_MAX_SAMPLES,
+    bins: int = LIVE_STATISTICS_BINS,
+    low_percentile: float = LIVE_AUTOLEVEL_LOW_PERCENTILE,
+    high_percentile: float = LIVE_AUTOLEVEL_HIGH_PERCENTILE,
+) -> LiveStatistics:
+    """
+    The histogram and autolevel range of an image, from a subsample of its pixels.  For an overview of a live frame
+    (where exact counts don't matter), a few tens of thousands of pixels give the same picture as all of them.
+    """
+    sample = subsample(image, max_samples).ravel()
+    lo, hi = float(sample.min()), float(sample.max())
+    counts, bin_edges = np.histogram(sample, bins=bins, range=(lo, hi if hi > lo else lo + 1))
+    low, high = np.percentile(sample, [low_percentile, high_percentile])
+    return LiveStatistics(bin_edges[:-1], counts, lo, hi, float(low), float(high))
+
+
+class LiveStatisticsWorker(QObject):
+    """
+    Computes LiveStatistics for the latest submitted frame on a thread of its own, at most rate_hz times a second, and
+    emits them with statistics_ready.  Frames that arrive while it's busy (or too soon) replace the waiting one, so a
+    fast camera never queues up work.
+
+    Submitted frames are only read, but they're read later, so don't submit a buffer that's about to be overwritten.
+    """
+
+    statistics_ready = Signal(object)
+
+    def __init__(self, rate_hz: float = LIVE_STATISTICS_RATE_HZ, max_samples: int = LIVE_STATISTICS_MAX_SAMPLES):
+        QObject.__init__(self)
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self.rate_hz = rate_hz
+        self.max_samples = max_samples
+
+        self._condition = threading.Condition()
+        self._latest: Optional[np.ndarray] = None
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, image: np.ndarray):
+        with self._condition:
+            self._latest = image
+            self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            self._stop = True
+            self._condition.notify()
+        self._thread.join()
+
+    def _run(self):
+        last_time = 0.0
+        while True:
+            with self._condition:
+                while self._latest is None and not self._stop:
+                    self._condition.wait()
+                if self._stop:
+                    return
+            # Leave the latest frame in place while waiting out the rate limit, so newer ones replace it.
+            wait_s = last_time + 1 / self.rate_hz - time.monotonic()
+            if wait_s > 0:
+                time.sleep(wait_s)
+            with self._condition:
+                image, self._latest = self._latest, None
+            if image is None:
+                continue
+            last_time = time.monotonic()
+            try:
+                self.statistics_ready.emit(compute_live_statistics(image, self.max_samples))
+            except Exception as e:
+                self._log.error(f"Couldn't compute live statistics: {e}")
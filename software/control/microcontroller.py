@@ -10,6 +10,7 @@ from crc import CrcCalculator, Crc8
 
 import squid.logging
 from control._def import *
+from squid.ring_buffer import RingBuffer
 
 
 # add user to the dialout group to avoid the need to use sudo
@@ -35,6 +36,9 @@ class CommandAborted(RuntimeError):
 
 
 class SimSerial:
+    # How often the simulated firmware sends a status packet while an axis is moving.
+    STATUS_INTERVAL_S = 0.005
+
     @staticmethod
     def response_bytes_for(command_id, execution_status, x, y, z, theta, joystick_button, switch):
         """
@@ -58,9 +62,14 @@ class SimSerial:
         response.append(crc_calculator.calculate_checksum(response))
         return response
 
-    def __init__(self):
-        self.in_waiting = 0
+    def __init__(self, simulate_motion=False):
+        """
+        By default moves finish as soon as they are sent.  With simulate_motion, the axes move at their max velocity
+        (MAX_VELOCITY_*_mm, or whatever SET_MAX_VELOCITY_ACCELERATION last set), and status packets with the
+        position are sent every STATUS_INTERVAL_S while moving, like the firmware does.  Acceleration isn't simulated.
+        """
         self.response_buffer = []
+        self._lock = threading.RLock()
 
         self.x = 0
         self.y = 0
@@ -71,63 +80,136 @@ class SimSerial:
 
         self.closed = False
 
+        self.simulate_motion = simulate_motion
+        self._usteps_per_mm = {
+            AXIS.X: FULLSTEPS_PER_REV_X * MICROSTEPPING_DEFAULT_X / SCREW_PITCH_X_MM,
+            AXIS.Y: FULLSTEPS_PER_REV_Y * MICROSTEPPING_DEFAULT_Y / SCREW_PITCH_Y_MM,
+            AXIS.Z: FULLSTEPS_PER_REV_Z * MICROSTEPPING_DEFAULT_Z / SCREW_PITCH_Z_MM,
+        }
+        self._max_velocity_mm = {AXIS.X: MAX_VELOCITY_X_mm, AXIS.Y: MAX_VELOCITY_Y_mm, AXIS.Z: MAX_VELOCITY_Z_mm}
+        # axis -> (start usteps, target usteps, start time, usteps per second) of the moves in progress
+        self._moves = {}
+        self._last_command_id = 0
+        # Whether the last command was a move that hasn't finished yet
+        self._last_command_moving = False
+        self._last_status_time = 0.0
+
+    @property
+    def in_waiting(self):
+        with self._lock:
+            if self._moves:
+                self._update_motion()
+            return len(self.response_buffer)
+
     @staticmethod
     def unpack_position(pos_bytes):
         return Microcontroller._payload_to_int(pos_bytes, len(pos_bytes))
 
+    _AXIS_ATTRIBUTES = {AXIS.X: "x", AXIS.Y: "y", AXIS.Z: "z", AXIS.THETA: "theta"}
+
+    def _start_move(self, axis, target_usteps):
+        if not self.simulate_motion or axis not in self._usteps_per_mm:
+            setattr(self, self._AXIS_ATTRIBUTES[axis], target_usteps)
+            return
+        start = getattr(self, self._AXIS_ATTRIBUTES[axis])
+        speed = self._max_velocity_mm[axis] * self._usteps_per_mm[axis]
+        self._moves[axis] = (start, target_usteps, time.monotonic(), speed)
+
+    def _move_target(self, axis):
+        """Where axis is going (or is, if it isn't moving), for relative moves."""
+        if axis in self._moves:
+            return self._moves[axis][1]
+        return getattr(self, self._AXIS_ATTRIBUTES[axis])
+
+    def _update_motion(self):
+        now = time.monotonic()
+        for axis, (start, target, start_time, speed) in list(self._moves.items()):
+            travelled = (now - start_time) * speed
+            if travelled >= abs(target - start):
+                position = target
+                del self._moves[axis]
+            else:
+                position = start + int(np.sign(target - start) * travelled)
+            setattr(self, self._AXIS_ATTRIBUTES[axis], position)
+
+        if not self._moves:
+            if self._last_command_moving:
+                self._last_command_moving = False
+                self._queue_status()
+        elif now - self._last_status_time >= self.STATUS_INTERVAL_S:
+            self._queue_status()
+
+    def _queue_status(self):
+        self._last_status_time = time.monotonic()
+        self.response_buffer.extend(
+            SimSerial.response_bytes_for(
+                self._last_command_id,
+                (
+                    CMD_EXECUTION_STATUS.IN_PROGRESS
+                    if self._last_command_moving
+                    else CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS
+                ),
+                self.x,
+                self.y,
+                self.z,
+                self.theta,
+                self.joystick_button,
+                self.switch,
+            )
+        )
+
     def respond_to(self, write_bytes):
         # NOTE: As we need more and more microcontroller simulator functionality, add
         # CMD_SET handlers here.  Prefer this over adding checks for simulated mode in
         # the Microcontroller!
+        if self._moves:
+            self._update_motion()
         command_byte = write_bytes[1]
         # If this is a position related command, these are our position bytes.
         position_bytes = write_bytes[2:6]
         if command_byte == CMD_SET.MOVE_X:
-            self.x += self.unpack_position(position_bytes)
+            self._start_move(AXIS.X, self._move_target(AXIS.X) + self.unpack_position(position_bytes))
         elif command_byte == CMD_SET.MOVE_Y:
-            self.y += self.unpack_position(position_bytes)
+            self._start_move(AXIS.Y, self._move_target(AXIS.Y) + self.unpack_position(position_bytes))
         elif command_byte == CMD_SET.MOVE_Z:
-            self.z += self.unpack_position(position_bytes)
+            self._start_move(AXIS.Z, self._move_target(AXIS.Z) + self.unpack_position(position_bytes))
         elif command_byte == CMD_SET.MOVE_THETA:
-            self.theta += self.unpack_position(position_bytes)
+            self._start_move(AXIS.THETA, self._move_target(AXIS.THETA) + self.unpack_position(position_bytes))
         elif command_byte == CMD_SET.MOVETO_X:
-            self.x = self.unpack_position(position_bytes)
+            self._start_move(AXIS.X, self.unpack_position(position_bytes))
         elif command_byte == CMD_SET.MOVETO_Y:
-            self.y = self.unpack_position(position_bytes)
+            self._start_move(AXIS.Y, self.unpack_position(position_bytes))
         elif command_byte == CMD_SET.MOVETO_Z:
-            self.z = self.unpack_position(position_bytes)
+            self._start_move(AXIS.Z, self.unpack_position(position_bytes))
+        elif command_byte == CMD_SET.SET_MAX_VELOCITY_ACCELERATION:
+            axis = write_bytes[2]
+            if axis in self._max_velocity_mm:
+                self._max_velocity_mm[axis] = ((write_bytes[3] << 8) + write_bytes[4]) / 100
         elif command_byte == CMD_SET.HOME_OR_ZERO:
             axis = write_bytes[2]
             # NOTE: write_bytes[3] might indicate that we only want to "ZERO", but
             # in the simulated case zeroing is the same as homing.  So don't check
             # that here.  If we want to simulate the homing motion in the future
             # we'd need to do that here.
-            if axis == AXIS.X:
-                self.x = 0
-            elif axis == AXIS.Y:
-                self.y = 0
-            elif axis == AXIS.Z:
-                self.z = 0
-            elif axis == AXIS.THETA:
-                self.theta = 0
-            elif axis == AXIS.XY:
-                self.x = 0
-                self.y = 0
-
-        self.response_buffer.extend(
-            SimSerial.response_bytes_for(
-                write_bytes[0],
-                CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS,
-                self.x,
-                self.y,
-                self.z,
-                self.theta,
-                self.joystick_button,
-                self.switch,
-            )
+            if axis == AXIS.XY:
+                axes = (AXIS.X, AXIS.Y)
+            else:
+                axes = (axis,) if axis in self._AXIS_ATTRIBUTES else ()
+            for homed_axis in axes:
+                self._moves.pop(homed_axis, None)
+                setattr(self, self._AXIS_ATTRIBUTES[homed_axis], 0)
+
+        self._last_command_id = write_bytes[0]
+        self._last_command_moving = bool(self._moves) and command_byte in (
+            CMD_SET.MOVE_X,
+            CMD_SET.MOVE_Y,
+            CMD_SET.MOVE_Z,
+            CMD_SET.MOVE_THETA,
+            CMD_SET.MOVETO_X,
+            CMD_SET.MOVETO_Y,
+            CMD_SET.MOVETO_Z,
         )
-
-        self.in_waiting = len(self.response_buffer)
+        self._queue_status()
 
     def close(self):
         self.closed = True
@@ -135,19 +217,16 @@ class SimSerial:
     def write(self, data):
         if self.closed:
             raise IOError("Closed")
-        self.respond_to(data)
+        with self._lock:
+            self.respond_to(data)
 
     def read(self, count=1):
         if self.closed:
             raise IOError("Closed")
 
-        response = bytearray()
-        for i in range(count):
-            if not len(self.response_buffer):
-                break
-            response.append(self.response_buffer.pop(0))
-
-        self.in_waiting = len(self.response_buffer)
+        with self._lock:
+            response = bytearray(self.response_buffer[:count])
+            del self.response_buffer[:count]
         return response
 
 
@@ -171,6 +250,10 @@ class Microcontroller:
         self.z_pos = 0  # unit: microstep or encoder resolution
         self.w_pos = 0  # unit: microstep or encoder resolution
         self.theta_pos = 0  # unit: microstep or encoder resolution
+        # Every received position as (receive time from time.time(), x, y, z, theta), oldest first
+        self._position_history = RingBuffer(MicrocontrollerDef.POSITION_HISTORY_LENGTH, (5,))
+        self._position_history_lock = threading.Lock()
+        self._position_row = np.zeros(5)
         self.button_and_switch_state = 0
         self.joystick_button_pressed = 0
         # This is used to keep track of whether or not we should emit joystick events to the joystick listeners,
@@ -770,6 +853,7 @@ class Microcontroller:
             msg = []
             for i in range(self.rx_buffer_length):
                 msg.append(ord(self.serial.read()))
+            receive_time = time.time()
 
             # parse the message
             """
@@ -828,6 +912,7 @@ class Microcontroller:
             self.theta_pos = self._payload_to_int(
                 msg[14:18], MicrocontrollerDef.N_BYTES_POS
             )  # unit: microstep or encoder resolution
+            self._record_position(receive_time)
 
             self.button_and_switch_state = msg[18]
             # joystick button
@@ -854,6 +939,44 @@ class Microcontroller:
     def get_pos(self):
         return self.x_pos, self.y_pos, self.z_pos, self.theta_pos
 
+    def _record_position(self, receive_time):
+        row = self._position_row
+        row[0] = receive_time
+        row[1] = self.x_pos
+        row[2] = self.y_pos
+        row[3] = self.z_pos
+        row[4] = self.theta_pos
+        with self._position_history_lock:
+            self._position_history.append(row)
+
+    def get_position_history(self, n=None):
+        """
+        A copy of the latest n (or all) received positions, as rows of (receive time, x, y, z, theta) with the
+        positions in usteps, oldest first.
+        """
+        with self._position_history_lock:
+            return self._position_history.get_window(n).copy()
+
+    def get_pos_at(self, timestamp):
+        """
+        The (x, y, z, theta) position in usteps at timestamp (from time.time()), linearly interpolated between the
+        received positions around it.  Before the first or after the last received position, that position is used.
+        """
+        with self._position_history_lock:
+            history = self._position_history.get_window()
+            if not len(history):
+                return self.get_pos()
+            index = int(np.searchsorted(history[:, 0], timestamp))
+            if index == 0:
+                pos = history[0, 1:]
+            elif index == len(history):
+                pos = history[-1, 1:]
+            else:
+                before, after = history[index - 1], history[index]
+                fraction = (timestamp - before[0]) / (after[0] - before[0]) if after[0] > before[0] else 1.0
+                pos = before[1:] + fraction * (after[1:] - before[1:])
+            return tuple(float(p) for p in pos)
+
     def get_button_and_switch_state(self):
         return self.button_and_switch_state
 
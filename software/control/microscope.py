@@ -161,6 +161,7 @@ class Microscope(QObject):
 
     def close(self):
         self.stop_live()
+        self.liveController.close()
         self.camera.close()
         self.microcontroller.close()
         if USE_ZABER_EMISSION_FILTER_WHEEL or USE_OPTOSPIN_EMISSION_FILTER_WHEEL:
@@ -296,10 +296,7 @@ def acquire_spectrometer_data(worker, config, file_ID, current_path, i, j, z_lev
 
 
 def update_coordinates_dataframe(worker, region_id, z_level, fov, i, j):
-    if i is None or j is None:
-        worker.update_coordinates_dataframe(region_id, z_level, fov)
-    else:
-        worker.update_coordinates_dataframe(region_id, z_level, i=i, j=j)
+    worker.record_frame(region_id, fov, z_level, "", worker.stage.get_pos())
     worker.signal_register_current_fov.emit(worker.navigationController.x_pos_mm, worker.navigationController.y_pos_mm)
 
 
@@ -0,0 +1,315 @@
+"""
+Lazy, cached reading of stitched OME-Zarr acquisitions for the acquisition viewer.
+
+Opening a dataset only reads its metadata.  Each pyramid level of each channel is a LazyChunkedArray, which napari
+displays as a multiscale layer, and which only reads (and decodes) the chunks of the level napari is showing, and
+only the ones in view.  Decoded chunks are kept in a ChunkCache shared by every dataset, so going back to a well or
+timepoint that was just shown doesn't touch the disk, and AcquisitionBrowser.prefetch warms the cache with the
+neighbouring wells and timepoints in the background.
+"""
+
+import collections
+import concurrent.futures
+import dataclasses
+import itertools
+import os
+import threading
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import squid.logging
+from control._def import *
+from control.utils import lazy_import
+
+zarr = lazy_import("zarr")
+
+
+class ChunkCache:
+    """A thread safe LRU cache of decoded chunks, that evicts the least recently used ones to stay under max_bytes."""
+
+    def __init__(self, max_bytes: int = ACQUISITION_VIEWER_CACHE_MB * 1024**2):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._chunks: "collections.OrderedDict[Hashable, np.ndarray]" = collections.OrderedDict()
+        self._nbytes = 0
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._chunks
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def get_or_load(self, key: Hashable, load: Callable[[], np.ndarray]) -> np.ndarray:
+        with self._lock:
+            chunk = self._chunks.get(key)
+            if chunk is not None:
+                self._chunks.move_to_end(key)
+                self.hits += 1
+                return chunk
+            self.misses += 1
+        # Don't hold the lock while reading, so that other threads can use what's already cached.
+        chunk = load()
+        chunk.flags.writeable = False
+        self.put(key, chunk)
+        return chunk
+
+    def put(self, key: Hashable, chunk: np.ndarray):
+        if chunk.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._chunks.pop(key, None)
+            if old is not None:
+                self._nbytes -= old.nbytes
+            self._chunks[key] = chunk
+            self._nbytes += chunk.nbytes
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._chunks.popitem(last=False)
+                self._nbytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._chunks.clear()
+            self._nbytes = 0
+
+
+class LazyChunkedArray:
+    """
+    A read only, array-like view of a chunked array (ex: a zarr array) that reads it a chunk at a time, through a
+    ChunkCache.  If channel_axis is given, the view is of the single channel at that index, with that axis dropped.
+
+    Like TiledMosaicLevel, this only implements what napari needs from a multiscale level: shape, dtype, ndim and
+    __getitem__ with integers and slices.
+    """
+
+    def __init__(
+        self,
+        array,
+        chunks: Sequence[int],
+        cache: ChunkCache,
+        cache_key: Hashable,
+        channel_axis: Optional[int] = None,
+        channel: int = 0,
+    ):
+        self._array = array
+        self._chunks = tuple(chunks)
+        self._cache = cache
+        self._cache_key = cache_key
+        self._channel_axis = channel_axis
+        self._channel = channel
+        self._axes = [axis for axis in range(len(array.shape)) if axis != channel_axis]
+
+        self.shape = tuple(array.shape[axis] for axis in self._axes)
+        self.dtype = np.dtype(array.dtype)
+        self.ndim = len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape, dtype=np.int64))
+
+    @property
+    def chunks(self):
+        return tuple(self._chunks[axis] for axis in self._axes)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        array = self[...]
+        return array if dtype is None else array.astype(dtype)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            i = key.index(Ellipsis)
+            key = key[:i] + (slice(None),) * (self.ndim - len(key) + 1) + key[i + 1 :]
+        key = key + (slice(None),) * (self.ndim - len(key))
+
+        ranges = [self._normalize(k, n) for k, n in zip(key, self.shape)]
+        out = np.zeros(tuple(stop - start for start, stop, _ in ranges), dtype=self.dtype)
+        if out.size:
+            self._read_into(out, ranges)
+
+        out = out[tuple(slice(None, None, step) for _, _, step in ranges)]
+        # Integer indices drop their axis, just like a numpy array would.
+        return out[tuple(0 if isinstance(k, (int, np.integer)) else slice(None) for k in key)]
+
+    def get_chunk_indices(self) -> List[Tuple[int, ...]]:
+        """The index of every chunk of the view (ex: to prefetch them all)."""
+        return list(itertools.product(*[range(-(-n // c)) for n, c in zip(self.shape, self.chunks)]))
+
+    def load_chunk(self, index: Tuple[int, ...]) -> np.ndarray:
+        """A chunk of the view, with its channel axis (if any) dropped.  Chunks at the edges may be smaller."""
+        full_index = list(index)
+        if self._channel_axis is not None:
+            full_index.insert(self._channel_axis, self._channel // self._chunks[self._channel_axis])
+        chunk = self._cache.get_or_load((self._cache_key,) + tuple(full_index), lambda: self._read_chunk(full_index))
+        if self._channel_axis is not None:
+            chunk = np.take(chunk, self._channel % self._chunks[self._channel_axis], axis=self._channel_axis)
+        return chunk
+
+    def _read_chunk(self, full_index) -> np.ndarray:
+        selection = tuple(
+            slice(i * c, min((i + 1) * c, n)) for i, c, n in zip(full_index, self._chunks, self._array.shape)
+        )
+        return np.ascontiguousarray(self._array[selection])
+
+    @staticmethod
+    def _normalize(key, length) -> Tuple[int, int, int]:
+        if isinstance(key, (int, np.integer)):
+            key = int(key)
+            if key < 0:
+                key += length
+            if not 0 <= key < length:
+                raise IndexError(f"index {key} is out of bounds for axis with size {length}")
+            return key, key + 1, 1
+        start, stop, step = key.indices(length)
+        if step < 1:
+            raise IndexError("LazyChunkedArray only supports positive steps")
+        return start, max(start, stop), step
+
+    def _read_into(self, out: np.ndarray, ranges):
+        chunks = self.chunks
+        chunk_ranges = [range(start // c, (stop - 1) // c + 1) for (start, stop, _), c in zip(ranges, chunks)]
+        for index in itertools.product(*chunk_ranges):
+            chunk = self.load_chunk(index)
+            out_selection = []
+            chunk_selection = []
+            for i, c, (start, stop, _) in zip(index, chunks, ranges):
+                lo = max(start, i * c)
+                hi = min(stop, (i + 1) * c)
+                out_selection.append(slice(lo - start, hi - start))
+                chunk_selection.append(slice(lo - i * c, hi - i * c))
+            out[tuple(out_selection)] = chunk[tuple(chunk_selection)]
+
+
+@dataclasses.dataclass
+class OmeZarrDataset:
+    path: str
+    channel_names: List[str]
+    # The names of the axes of each channel's levels (ex: ["t", "z", "y", "x"])
+    axes: List[str]
+    # The physical size of a pixel of the finest level, along each of axes
+    scale: Tuple[float, ...]
+    # {channel name: [one LazyChunkedArray per pyramid level, finest first]}
+    levels: Dict[str, List[LazyChunkedArray]]
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.levels[self.channel_names[0]][0].dtype
+
+
+def open_ome_zarr(path: str, cache: ChunkCache) -> OmeZarrDataset:
+    """Open the OME-Zarr image at path.  Only the metadata is read, the pixels are read as they're needed."""
+    group = zarr.open_group(path, mode="r")
+    attrs = group.attrs.asdict() if hasattr(group.attrs, "asdict") else dict(group.attrs)
+    # OME-Zarr 0.5 nests its metadata under "ome"
+    attrs = attrs.get("ome", attrs)
+    multiscale = attrs["multiscales"][0]
+
+    axes = [axis["name"] if isinstance(axis, dict) else axis for axis in multiscale.get("axes", "tczyx")]
+    datasets = multiscale["datasets"]
+    arrays = [group[dataset["path"]] for dataset in datasets]
+    if len(axes) != arrays[0].ndim:
+        raise ValueError(f"{path} has axes {axes}, but its arrays have {arrays[0].ndim} dimensions")
+
+    scale = [1.0] * len(axes)
+    for transformation in datasets[0].get("coordinateTransformations", []):
+        if transformation.get("type") == "scale":
+            scale = [float(s) for s in transformation["scale"]]
+
+    channel_axis = axes.index("c") if "c" in axes else None
+    n_channels = 1 if channel_axis is None else arrays[0].shape[channel_axis]
+    labels = [channel.get("label") for channel in attrs.get("omero", {}).get("channels", [])]
+    channel_names = [labels[c] if c < len(labels) and labels[c] else f"Channel {c}" for c in range(n_channels)]
+
+    levels = {
+        name: [
+            LazyChunkedArray(array, array.chunks, cache, (path, level), channel_axis, c)
+            for level, array in enumerate(arrays)
+        ]
+        for c, name in enumerate(channel_names)
+    }
+    if channel_axis is not None:
+        del axes[channel_axis]
+        del scale[channel_axis]
+    return OmeZarrDataset(path, channel_names, axes, tuple(scale), levels)
+
+
+class AcquisitionBrowser:
+    """
+    Opens OME-Zarr datasets for the acquisition viewer, keeping the last max_open_datasets of them open, and all their
+    decoded chunks in one ChunkCache.
+
+    prefetch reads the coarsest level of the given datasets on a background thread, so that the first view of a
+    neighbouring well or timepoint is already in memory when it's selected.  A new prefetch replaces the datasets
+    still waiting from the last one.
+    """
+
+    def __init__(
+        self,
+        cache_bytes: int = ACQUISITION_VIEWER_CACHE_MB * 1024**2,
+        max_open_datasets: int = ACQUISITION_VIEWER_MAX_OPEN_DATASETS,
+        open_dataset: Callable[[str, ChunkCache], OmeZarrDataset] = open_ome_zarr,
+    ):
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self.cache = ChunkCache(cache_bytes)
+        self.max_open_datasets = max_open_datasets
+        self._open_dataset = open_dataset
+
+        self._lock = threading.Lock()
+        self._datasets: "collections.OrderedDict[str, OmeZarrDataset]" = collections.OrderedDict()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._prefetch_generation = 0
+
+    def open(self, path: str) -> OmeZarrDataset:
+        path = os.path.abspath(path)
+        with self._lock:
+            dataset = self._datasets.get(path)
+            if dataset is not None:
+                self._datasets.move_to_end(path)
+                return dataset
+        dataset = self._open_dataset(path, self.cache)
+        with self._lock:
+            self._datasets[path] = dataset
+            while len(self._datasets) > self.max_open_datasets:
+                self._datasets.popitem(last=False)
+        return dataset
+
+    def prefetch(self, paths: Sequence[str]):
+        with self._lock:
+            self._prefetch_generation += 1
+            generation = self._prefetch_generation
+        self._executor.submit(self._prefetch, list(paths), generation)
+
+    def wait_for_prefetch(self):
+        """Block until everything prefetched so far is done (ex: for tests)."""
+        self._executor.submit(lambda: None).result()
+
+    def close(self):
+        with self._lock:
+            self._prefetch_generation += 1
+            self._datasets.clear()
+        self._executor.shutdown(wait=True)
+        self.cache.clear()
+
+    def _prefetch(self, paths: List[str], generation: int):
+        for path in paths:
+            try:
+                dataset = self.open(path)
+                for levels in dataset.levels.values():
+                    coarsest = levels[-1]
+                    for index in coarsest.get_chunk_indices():
+                        if generation != self._prefetch_generation:
+                            return
+                        coarsest.load_chunk(index)
+            except Exception as e:
+                self._log.warning(f"Couldn't prefetch {path}: {e}")
@@ -1,8 +1,16 @@
+import concurrent.futures
+import enum
 import threading
 import queue
+import time
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Optional
+
 import numpy as np
 import pandas as pd
 import control.utils as utils
+import squid.logging
+from squid.ring_buffer import RingBuffer
 
 
 def default_image_preprocessor(image, callable_list):
@@ -21,14 +29,109 @@ def default_image_preprocessor(image, callable_list):
     return output_image
 
 
+class DropPolicy(enum.Enum):
+    # Block the producer until there is room in the processing queue
+    BLOCK = "block"
+    # Discard the task being submitted
+    DROP_NEWEST = "drop newest"
+    # Discard the oldest task waiting in the queue to make room
+    DROP_OLDEST = "drop oldest"
+
+
+class SharedFrame:
+    """
+    An image copied into a shared memory block so that it can be handed to a worker process without pickling the
+    pixel data.  Only the name, shape, and dtype of the block are pickled.
+
+    The process that created the SharedFrame owns the block, and must call release() once the worker is done.
+    """
+
+    def __init__(self, image: np.ndarray):
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, image.nbytes))
+        self.name = self._shm.name
+        self.shape = image.shape
+        self.dtype = image.dtype
+        np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)[...] = image
+
+    def __getstate__(self):
+        return {"name": self.name, "shape": self.shape, "dtype": self.dtype}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._shm = None
+
+    def attach(self):
+        """Returns (shared_memory, image) where image is a view into the shared block."""
+        shm = shared_memory.SharedMemory(name=self.name)
+        return shm, np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+
+    def release(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+def _call_with_shared_frames(function, args, kwargs):
+    """Runs in the worker process: swap SharedFrames for ndarray views, call function, then detach."""
+    attached = []
+
+    def unwrap(value):
+        if isinstance(value, SharedFrame):
+            shm, image = value.attach()
+            attached.append(shm)
+            return image
+        if isinstance(value, list):
+            return [unwrap(v) for v in value]
+        return value
+
+    try:
+        return function(*[unwrap(a) for a in args], **{k: unwrap(v) for (k, v) in kwargs.items()})
+    finally:
+        for shm in attached:
+            shm.close()
+
+
 class ProcessingHandler:
     """
-    :brief: Handler class for parallelizing FOV processing. GENERAL NOTE:
-        REMEMBER TO PASS COPIES OF IMAGES WHEN QUEUEING THEM FOR PROCESSING
+    :brief: Handler class for parallelizing FOV processing.
+
+    Tasks are dicts in the form {'function': callable, 'args': list of positional arguments, 'kwargs': dict of
+    kwargs}.  A pool of num_workers processing threads pulls tasks from a bounded processing queue and calls the
+    function.  The function should return a task in the same form, which is passed to a single upload thread (so
+    uploads happen in order, one at a time).
+
+    Use submit() to queue work.  It copies ndarray arguments (or puts them in shared memory when the task runs in a
+    worker process) so the caller can reuse its buffers right away, and applies the drop_policy when the queue is
+    full so that a slow classifier can't stall acquisition unless asked to.
+
+    If use_processes is True, each processing thread hands its task to a process pool so that CPU bound work
+    (ex: model inference) is not limited by the GIL.  Functions run this way must be picklable (ie defined at
+    module level).
     """
 
-    def __init__(self):
-        self.processing_queue = queue.Queue()  # elements in this queue are
+    def __init__(
+        self,
+        num_workers: int = 1,
+        use_processes: bool = False,
+        max_queue_size: int = 0,
+        drop_policy: DropPolicy = DropPolicy.BLOCK,
+        batch_size: int = 1,
+        batch_timeout_s: float = 0.05,
+    ):
+        """
+        max_queue_size: The maximum number of tasks waiting to be processed.  0 means unbounded.
+        batch_size: The maximum number of items passed to a function submitted with batch=True.
+        batch_timeout_s: How long a worker waits for a batch to fill up before processing a partial batch.
+        """
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self.num_workers = max(1, num_workers)
+        self.use_processes = use_processes
+        self.drop_policy = DropPolicy(drop_policy)
+        self.batch_size = max(1, batch_size)
+        self.batch_timeout_s = batch_timeout_s
+
+        self.processing_queue = queue.Queue(max_queue_size)  # elements in this queue are
         # dicts in the form
         # {'function': callable, 'args':list
         # of positional arguments to pass,
@@ -47,23 +150,203 @@ class ProcessingHandler:
         # 'kwargs': dict of kwargs to pass}
         # a dict in the form {'function':'end'}
         # will cause the uploading to terminate
-        self.processing_thread = None
+        self.processing_threads = []
         self.uploading_thread = None
+        self.executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+        self._metrics_lock = threading.Lock()
+        self._latencies: Dict[str, RingBuffer] = {
+            stage: RingBuffer(1000) for stage in ("queue_wait", "processing", "upload")
+        }
+        self.dropped_count = 0
+        self.processed_count = 0
+        self.error_count = 0
+
+    @property
+    def processing_thread(self):
+        return self.processing_threads[0] if self.processing_threads else None
+
+    def submit(
+        self,
+        function: Callable,
+        args=(),
+        kwargs=None,
+        in_process: Optional[bool] = None,
+        batch: bool = False,
+    ) -> bool:
+        """
+        Queue function(*args, **kwargs) for processing.  Returns False if the task was dropped because the queue was
+        full.
+
+        in_process: Run this task in the process pool.  Defaults to use_processes.  Pass False for functions that
+            need objects that can't be pickled (ex: QObjects).
+        batch: Batch this task with other batch tasks for the same function.  The function is then called once with
+            a list of the args tuples of up to batch_size tasks, and kwargs from the first of them.
+        """
+        kwargs = kwargs or {}
+        in_process = self.use_processes if in_process is None else in_process
+        task = {
+            "function": function,
+            "args": [self._handoff(a, in_process) for a in args],
+            "kwargs": {k: self._handoff(v, in_process) for (k, v) in kwargs.items()},
+            "in_process": in_process,
+            "batch": batch,
+            "enqueue_time": time.perf_counter(),
+        }
+        return self._put(task)
+
+    def _handoff(self, value, in_process):
+        if isinstance(value, np.ndarray):
+            return SharedFrame(value) if in_process else np.copy(value)
+        return value
+
+    def _put(self, task) -> bool:
+        if self.drop_policy == DropPolicy.BLOCK:
+            self.processing_queue.put(task)
+            return True
 
-    def processing_queue_handler(self, queue_timeout=None):
         while True:
-            processing_task = None
             try:
-                processing_task = self.processing_queue.get(timeout=queue_timeout)
+                self.processing_queue.put_nowait(task)
+                return True
+            except queue.Full:
+                if self.drop_policy == DropPolicy.DROP_NEWEST or not self._make_room():
+                    self._drop(task)
+                    return False
+
+    @staticmethod
+    def _is_sentinel(task) -> bool:
+        return task["function"] == "end"
+
+    def _make_room(self) -> bool:
+        """
+        Make room in the full queue by dropping the oldest task waiting.  A shutdown sentinel is never dropped or
+        moved, so if it's the oldest (processing is ending) nothing is dropped and this returns False.
+        """
+        q = self.processing_queue
+        with q.mutex:
+            if not q.queue:
+                # A worker took a task since the queue was full
+                return True
+            if self._is_sentinel(q.queue[0]):
+                return False
+            oldest = q.queue.popleft()
+            q.not_full.notify()
+        q.task_done()
+        self._drop(oldest)
+        return True
+
+    def _drop(self, task):
+        self._release_frames(task)
+        with self._metrics_lock:
+            self.dropped_count += 1
+        self._log.warning(f"Processing queue is full, dropped a task (total dropped={self.dropped_count})")
+
+    @staticmethod
+    def _release_frames(task):
+        for value in list(task.get("args", [])) + list(task.get("kwargs", {}).values()):
+            if isinstance(value, SharedFrame):
+                value.release()
+
+    def _record_latency(self, stage, seconds):
+        with self._metrics_lock:
+            self._latencies[stage].append(seconds)
+
+    def get_metrics(self) -> dict:
+        """Per stage latency stats (in ms) over the most recent tasks, plus task counters."""
+        metrics = {}
+        with self._metrics_lock:
+            for stage, latencies in self._latencies.items():
+                window = latencies.get_window()
+                if len(window) == 0:
+                    metrics[stage] = {"count": 0, "mean_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+                else:
+                    metrics[stage] = {
+                        "count": latencies.total_count,
+                        "mean_ms": float(np.mean(window) * 1000),
+                        "p95_ms": float(np.percentile(window, 95) * 1000),
+                        "max_ms": float(np.max(window) * 1000),
+                    }
+            metrics["processed"] = self.processed_count
+            metrics["dropped"] = self.dropped_count
+            metrics["errors"] = self.error_count
+            metrics["queued"] = self.processing_queue.qsize()
+        return metrics
+
+    def _get_batch(self, first_task, pending):
+        """Collect up to batch_size batch tasks for first_task's function.  A non matching task goes into pending."""
+        tasks = [first_task]
+        deadline = time.perf_counter() + self.batch_timeout_s
+        while len(tasks) < self.batch_size:
+            try:
+                task = self.processing_queue.get(timeout=max(0.0, deadline - time.perf_counter()))
             except queue.Empty:
                 break
-            if processing_task["function"] == "end":
-                self.processing_queue.task_done()
+            if task.get("batch") and task["function"] == first_task["function"]:
+                tasks.append(task)
+            else:
+                pending.append(task)
                 break
+        return tasks
+
+    def _run_task(self, function, args, kwargs, in_process):
+        if in_process:
+            return self.executor.submit(_call_with_shared_frames, function, args, kwargs).result()
+        return function(*args, **kwargs)
+
+    def processing_queue_handler(self, queue_timeout=None):
+        pending = []
+        while True:
+            processing_task = None
+            if pending:
+                processing_task = pending.pop()
             else:
-                upload_task = processing_task["function"](*processing_task["args"], **processing_task["kwargs"])
-                self.upload_queue.put(upload_task)
+                try:
+                    processing_task = self.processing_queue.get(timeout=queue_timeout)
+                except queue.Empty:
+                    break
+            if self._is_sentinel(processing_task):
                 self.processing_queue.task_done()
+                break
+
+            tasks = [processing_task]
+            if processing_task.get("batch") and self.batch_size > 1:
+                tasks = self._get_batch(processing_task, pending)
+
+            start_time = time.perf_counter()
+            for task in tasks:
+                if "enqueue_time" in task:
+                    self._record_latency("queue_wait", start_time - task["enqueue_time"])
+            try:
+                if len(tasks) > 1 or processing_task.get("batch"):
+                    upload_task = self._run_task(
+                        processing_task["function"],
+                        [[t["args"] for t in tasks]],
+                        processing_task["kwargs"],
+                        processing_task.get("in_process", False),
+                    )
+                else:
+                    upload_task = self._run_task(
+                        processing_task["function"],
+                        processing_task["args"],
+                        processing_task["kwargs"],
+                        processing_task.get("in_process", False),
+                    )
+                # Functions that have nothing to upload can return anything else (ex: None).
+                if isinstance(upload_task, dict):
+                    upload_task.setdefault("enqueue_time", time.perf_counter())
+                    self.upload_queue.put(upload_task)
+                with self._metrics_lock:
+                    self.processed_count += len(tasks)
+            except Exception:
+                with self._metrics_lock:
+                    self.error_count += len(tasks)
+                self._log.exception(f"Processing task {processing_task['function']} failed")
+            finally:
+                self._record_latency("processing", time.perf_counter() - start_time)
+                for task in tasks:
+                    self._release_frames(task)
+                    self.processing_queue.task_done()
 
     def upload_queue_handler(self, queue_timeout=None):
         while True:
@@ -75,21 +358,51 @@ class ProcessingHandler:
             if upload_task["function"] == "end":
                 self.upload_queue.task_done()
                 break
-            else:
+            start_time = time.perf_counter()
+            try:
                 upload_task["function"](*upload_task["args"], **upload_task["kwargs"])
+            except Exception:
+                with self._metrics_lock:
+                    self.error_count += 1
+                self._log.exception(f"Upload task {upload_task['function']} failed")
+            finally:
+                self._record_latency("upload", time.perf_counter() - start_time)
                 self.upload_queue.task_done()
 
     def start_processing(self, queue_timeout=None):
-        self.processing_thread = threading.Thread(target=self.processing_queue_handler, args=[queue_timeout])
-        self.processing_thread.start()
+        if self.use_processes and self.executor is None:
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.num_workers)
+        self.processing_threads = [
+            threading.Thread(target=self.processing_queue_handler, args=[queue_timeout], daemon=True)
+            for _ in range(self.num_workers)
+        ]
+        for thread in self.processing_threads:
+            thread.start()
 
     def start_uploading(self, queue_timeout=None):
-        self.uploading_thread = threading.Thread(target=self.upload_queue_handler, args=[queue_timeout])
+        self.uploading_thread = threading.Thread(target=self.upload_queue_handler, args=[queue_timeout], daemon=True)
         self.uploading_thread.start()
 
     def end_uploading(self, *args, **kwargs):
         return {"function": "end"}
 
     def end_processing(self):
-        self.processing_queue.put({"function": self.end_uploading, "args": [], "kwargs": {}})
-        self.processing_queue.put({"function": "end"})
+        """
+        Finish all the queued work, then stop the processing and upload threads.  Blocks until they have exited.
+        """
+        for _ in self.processing_threads:
+            self.processing_queue.put({"function": "end"})
+        for thread in self.processing_threads:
+            thread.join()
+        self.processing_threads = []
+
+        self.upload_queue.put(self.end_uploading())
+        if self.uploading_thread is not None:
+            self.uploading_thread.join()
+            self.uploading_thread = None
+
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+        self._log.info(f"Processing finished: {self.get_metrics()}")
@@ -0,0 +1,538 @@
+"""
+The formats recordings are saved in, and reading them back.
+
+The original format, RecordingFormat.FILES, is an image file per frame, in folders of 1000.  At hundreds of frames per
+second that's hundreds of files created per second, and creating them (the filesystem metadata updates) ends up
+costing more than writing the pixels.  The container formats append every frame of a recording to one container
+instead, along with the frame's id and timestamp:
+
+- BIGTIFF: BigTIFF files of up to RECORDING_BIGTIFF_FILE_MB (frames_00000.tif, frames_00001.tif, ...).  Each file is
+  created with the IFDs of all its pages already written (so the page chain is allocated once instead of per frame)
+  and its pixel data contiguous, and frames are written straight into their place.  The frame ids and timestamps are
+  arrays in private tags of the first page.  The timestamps start out NaN, so after a crash the frames that were never
+  written are known.  Any TIFF reader can open the files.
+- RAW: frames.raw, the frames one after another, frames_index.bin, a FRAME_INDEX_DTYPE record per frame, and
+  frames.json with the frames' dtype and shape.  The cheapest to write, and read back with a memory map.
+- ZARR: frames.zarr, a zarr group with a "frames" array chunked RECORDING_ZARR_FRAMES_PER_CHUNK frames at a time (each
+  chunk is written once, when it's full), and "frame_ids" and "timestamps" arrays.
+
+open_recording reads any of them (FILES too) back lazily: frames are only read when they're indexed.
+"""
+
+import abc
+import glob
+import json
+import os
+from typing import List, Optional, Tuple
+
+import cv2
+import imageio as iio
+import numpy as np
+
+from control._def import *
+from control.utils import lazy_import
+
+tifffile = lazy_import("tifffile")
+zarr = lazy_import("zarr")
+
+
+class RecordingFormat:
+    FILES = "files"
+    BIGTIFF = "bigtiff"
+    RAW = "raw"
+    ZARR = "zarr"
+
+    ALL = (FILES, BIGTIFF, RAW, ZARR)
+
+
+# The private TIFF tags of the frame ids and timestamps
+FRAME_IDS_TAG = 65000
+TIMESTAMPS_TAG = 65001
+
+BIGTIFF_FILE_PATTERN = "frames_{:05d}.tif"
+# The IFDs of a BigTIFF file's pages are built in memory when it's created, so small frames don't make for millions of
+# pages per file
+BIGTIFF_MAX_FRAMES_PER_FILE = 10000
+RAW_FILE_NAME = "frames.raw"
+RAW_INDEX_FILE_NAME = "frames_index.bin"
+RAW_METADATA_FILE_NAME = "frames.json"
+ZARR_FILE_NAME = "frames.zarr"
+
+FRAME_INDEX_DTYPE = np.dtype([("frame_id", "<i8"), ("timestamp", "<f8")])
+
+
+class RecordingWriter(metaclass=abc.ABCMeta):
+    """
+    Writes the frames of a recording to the folder at path.  The shape and dtype of the recording are those of its
+    first frame, and the container formats raise a ValueError for frames that don't match them.
+
+    What's written is flushed to the file after every frame (except ZARR's, which are written a chunk at a time), but a
+    container is only complete (ex: BIGTIFF's unused pages are cut off) once it's closed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self.shape: Optional[Tuple[int, ...]] = None
+        self.dtype: Optional[np.dtype] = None
+        os.makedirs(path, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, image: np.ndarray, frame_ID: int, timestamp: float):
+        if self.shape is None:
+            self.shape = image.shape
+            self.dtype = image.dtype
+            self._start(image)
+        elif image.shape != self.shape or image.dtype != self.dtype:
+            raise ValueError(
+                f"Frame {frame_ID} is {image.shape} {image.dtype}, but the recording in {self.path} is {self.shape} "
+                f"{self.dtype}"
+            )
+        self._write(image, frame_ID, timestamp)
+        self.count += 1
+
+    def close(self):
+        pass
+
+    def _start(self, image: np.ndarray):
+        pass
+
+    @abc.abstractmethod
+    def _write(self, image: np.ndarray, frame_ID: int, timestamp: float):
+        pass
+
+
+class FilesRecordingWriter(RecordingWriter):
+    """An image file per frame, <folder_ID>/<file_ID>_<frame_ID>.<image_format>.  16 bit images are always tiff."""
+
+    def __init__(self, path: str, image_format: str = Acquisition.IMAGE_FORMAT, max_num_image_per_folder: int = 1000):
+        super().__init__(path)
+        self.image_format = image_format
+        self.max_num_image_per_folder = max_num_image_per_folder
+
+    def write(self, image: np.ndarray, frame_ID: int, timestamp: float):
+        # Every frame is its own file, so they don't have to match
+        self._write(image, frame_ID, timestamp)
+        self.count += 1
+
+    def _write(self, image: np.ndarray, frame_ID: int, timestamp: float):
+        folder_ID = int(self.count / self.max_num_image_per_folder)
+        file_ID = int(self.count % self.max_num_image_per_folder)
+        # create a new folder
+        if file_ID == 0:
+            os.makedirs(os.path.join(self.path, str(folder_ID)), exist_ok=True)
+
+        if image.dtype == np.uint16:
+            # need to use tiff when saving 16 bit images
+            saving_path = os.path.join(self.path, str(folder_ID), str(file_ID) + "_" + str(frame_ID) + ".tiff")
+            iio.imwrite(saving_path, image)
+        else:
+            saving_path = os.path.join(
+                self.path, str(folder_ID), str(file_ID) + "_" + str(frame_ID) + "." + self.image_format
+            )
+            if not cv2.imwrite(saving_path, image):
+                raise IOError(f"Couldn't write {saving_path}")
+
+
+class BigTiffRecordingWriter(RecordingWriter):
+    def __init__(
+        self,
+        path: str,
+        max_file_bytes: int = int(RECORDING_BIGTIFF_FILE_MB * 1024**2),
+        max_frames_per_file: int = BIGTIFF_MAX_FRAMES_PER_FILE,
+    ):
+        super().__init__(path)
+        self.max_file_bytes = max_file_bytes
+        self.max_frames_per_file = max_frames_per_file
+        self._file = None
+        self._file_path = None
+        self._file_index = -1
+        # The number of frames in the current file, and the number it has room for
+        self._file_count = 0
+        self._file_capacity = 0
+        self._frame_bytes = 0
+        self._data_offset = 0
+        self._frame_ids_offset = 0
+        self._timestamps_offset = 0
+
+    def _start(self, image: np.ndarray):
+        self._frame_bytes = image.nbytes
+        self._file_capacity = max(1, min(self.max_frames_per_file, self.max_file_bytes // image.nbytes))
+
+    def _write(self, image: np.ndarray, frame_ID: int, timestamp: float):
+        if self._file is None or self._file_count == self._file_capacity:
+            self._close_file()
+            self._open_file()
+        i = self._file_count
+        self._file.seek(self._data_offset + i * self._frame_bytes)
+        self._file.write(np.ascontiguousarray(image).data)
+        self._file.seek(self._frame_ids_offset + 8 * i)
+        self._file.write(np.array([frame_ID], dtype="<i8").tobytes())
+        # The timestamp goes last, since it's what marks the frame as written
+        self._file.seek(self._timestamps_offset + 8 * i)
+        self._file.write(np.array([timestamp], dtype="<f8").tobytes())
+        self._file.flush()
+        self._file_count += 1
+
+    def _open_file(self):
+        self._file_index += 1
+        self._file_path = os.path.join(self.path, BIGTIFF_FILE_PATTERN.format(self._file_index))
+        capacity = self._file_capacity
+        rgb = len(self.shape) == 3 and self.shape[-1] == 3
+        # Writes the IFDs of all the pages, without the pixel data (which is left as a hole in the file)
+        with tifffile.TiffWriter(self._file_path, bigtiff=True, byteorder="<") as tif:
+            tif.write(
+                shape=(capacity,) + self.shape,
+                dtype=self.dtype,
+                photometric="rgb" if rgb else "minisblack",
+                metadata=None,
+                extratags=[
+                    (FRAME_IDS_TAG, "q", capacity, [-1] * capacity, True),
+                    (TIMESTAMPS_TAG, "d", capacity, [np.nan] * capacity, True),
+                ],
+            )
+        with tifffile.TiffFile(self._file_path) as tif:
+            page = tif.pages[0]
+            self._data_offset = page.dataoffsets[0]
+            self._frame_ids_offset = page.tags[FRAME_IDS_TAG].valueoffset
+            self._timestamps_offset = page.tags[TIMESTAMPS_TAG].valueoffset
+        self._file = open(self._file_path, "r+b")
+        self._file_count = 0
+
+    def _close_file(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        if self._file_count < self._file_capacity:
+            _truncate_tiff_pages(self._file_path, self._file_count)
+
+    def close(self):
+        self._close_file()
+
+
+# The size in bytes of each TIFF field type, to tell whether a tag's value is in its IFD entry or elsewhere
+_TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 16: 8, 17: 8, 18: 8}
+
+
+def _truncate_tiff_pages(path: str, count: int):
+    """
+    Cut the little endian BigTIFF at path down to its first count pages (it has more than that).  The file is laid out
+    like TiffWriter writes a contiguous series: the first page's IFD, the pixel data of every page, and then the IFDs
+    (with their values) of the other pages.  The IFDs of pages 1 to count - 1 are moved to right after the pixel data of
+    page count - 1, and everything after them is cut off.
+    """
+    with tifffile.TiffFile(path) as tif:
+        first_ifd_offset = tif.pages[0].offset
+        last_page = tif.pages[count - 1]
+        data_end = last_page.dataoffsets[-1] + last_page.databytecounts[-1]
+        # The IFDs to keep, and where the first one that isn't kept starts
+        ifds_start = tif.pages[1].offset if count > 1 else None
+        ifds_end = tif.pages[count].offset
+    # IFDs start on a word boundary
+    new_ifds_start = -(-data_end // 8) * 8
+
+    with open(path, "r+b") as f:
+        if count > 1:
+            f.seek(ifds_start)
+            ifds = bytearray(f.read(ifds_end - ifds_start))
+            shift = new_ifds_start - ifds_start
+            position = 0
+            for i in range(1, count):
+                tag_count = int.from_bytes(ifds[position : position + 8], "little")
+                for entry in range(position + 8, position + 8 + 20 * tag_count, 20):
+                    field_type = int.from_bytes(ifds[entry + 2 : entry + 4], "little")
+                    value_count = int.from_bytes(ifds[entry + 4 : entry + 12], "little")
+                    value_offset = int.from_bytes(ifds[entry + 12 : entry + 20], "little")
+                    # Values that don't fit in the entry are elsewhere, and move with the IFDs if they're among them
+                    value_bytes = _TIFF_TYPE_SIZES.get(field_type, 1) * value_count
+                    if value_bytes > 8 and ifds_start <= value_offset < ifds_end:
+                        ifds[entry + 12 : entry + 20] = (value_offset + shift).to_bytes(8, "little")
+                next_entry = position + 8 + 20 * tag_count
+                next_offset = int.from_bytes(ifds[next_entry : next_entry + 8], "little")
+                ifds[next_entry : next_entry + 8] = (next_offset + shift if i < count - 1 else 0).to_bytes(8, "little")
+                position = next_offset - ifds_start
+            f.seek(new_ifds_start)
+            f.write(ifds)
+            file_end = new_ifds_start + len(ifds)
+        else:
+            file_end = data_end
+        # Point the first page at the moved IFDs (or make it the last page)
+        f.seek(first_ifd_offset)
+        tag_count = int.from_bytes(f.read(8), "little")
+        f.seek(first_ifd_offset + 8 + 20 * tag_count)
+        f.write((new_ifds_start if count > 1 else 0).to_bytes(8, "little"))
+        f.truncate(file_end)
+
+
+class RawRecordingWriter(RecordingWriter):
+    def _start(self, image: np.ndarray):
+        with open(os.path.join(self.path, RAW_METADATA_FILE_NAME), "w") as f:
+            json.dump({"format": RecordingFormat.RAW, "dtype": image.dtype.str, "shape": list(image.shape)}, f)
+        self._frames = open(os.path.join(self.path, RAW_FILE_NAME), "wb")
+        self._index = open(os.path.join(self.path, RAW_INDEX_FILE_NAME), "wb")
+
+    def _write(self, image: np.ndarray, frame_ID: int, timestamp: float):
+        self._frames.write(np.ascontiguousarray(image).data)
+        self._index.write(np.array([(frame_ID, timestamp)], dtype=FRAME_INDEX_DTYPE).tobytes())
+        # The frame before its index record, since the record is what marks it as written
+        self._frames.flush()
+        self._index.flush()
+
+    def close(self):
+        if self.shape is None:
+            return
+        self._frames.close()
+        self._index.close()
+
+
+class ZarrRecordingWriter(RecordingWriter):
+    def __init__(self, path: str, frames_per_chunk: int = RECORDING_ZARR_FRAMES_PER_CHUNK):
+        super().__init__(path)
+        self.frames_per_chunk = max(1, frames_per_chunk)
+        self._group = None
+        self._chunk: Optional[np.ndarray] = None
+        self._chunk_frame_ids = np.zeros(self.frames_per_chunk, dtype=np.int64)
+        self._chunk_timestamps = np.zeros(self.frames_per_chunk, dtype=np.float64)
+        self._chunk_count = 0
+        # The number of frames in the zarr arrays
+        self._flushed = 0
+
+    def _start(self, image: np.ndarray):
+        self._group = zarr.open_group(os.path.join(self.path, ZARR_FILE_NAME), mode="w")
+        create = getattr(self._group, "create_array", None) or self._group.create_dataset
+        create("frames", shape=(0,) + image.shape, chunks=(self.frames_per_chunk,) + image.shape, dtype=image.dtype)
+        create("frame_ids", shape=(0,), chunks=(4096,), dtype=np.int64)
+        create("timestamps", shape=(0,), chunks=(4096,), dtype=np.float64)
+        self._chunk = np.empty((self.frames_per_chunk,) + image.shape, dtype=image.dtype)
+
+    def _write(self, image: np.ndarray, frame_ID: int, timestamp: float):
+        self._chunk[self._chunk_count] = image
+        self._chunk_frame_ids[self._chunk_count] = frame_ID
+        self._chunk_timestamps[self._chunk_count] = timestamp
+        self._chunk_count += 1
+        if self._chunk_count == self.frames_per_chunk:
+            self._flush()
+
+    def _flush(self):
+        if not self._chunk_count:
+            return
+        n = self._chunk_count
+        start = self._flushed
+        for name, values in (
+            ("frames", self._chunk[:n]),
+            ("frame_ids", self._chunk_frame_ids[:n]),
+            ("timestamps", self._chunk_timestamps[:n]),
+        ):
+            array = self._group[name]
+            array.resize((start + n,) + array.shape[1:])
+            array[start : start + n] = values
+        self._flushed += n
+        self._chunk_count = 0
+
+    def close(self):
+        if self._group is not None:
+            self._flush()
+
+
+def make_recording_writer(
+    recording_format: str, path: str, image_format: str = Acquisition.IMAGE_FORMAT
+) -> RecordingWriter:
+    if recording_format == RecordingFormat.FILES:
+        return FilesRecordingWriter(path, image_format)
+    if recording_format == RecordingFormat.BIGTIFF:
+        return BigTiffRecordingWriter(path)
+    if recording_format == RecordingFormat.RAW:
+        return RawRecordingWriter(path)
+    if recording_format == RecordingFormat.ZARR:
+        return ZarrRecordingWriter(path)
+    raise ValueError(f"Unknown recording format {recording_format!r}, it should be one of {RecordingFormat.ALL}")
+
+
+class Recording:
+    """
+    A recording read back.  len(recording) is the number of frames, recording[i] reads frame i (only frame i), and
+    frame_ids and timestamps have the id and timestamp of every frame (NaN timestamps for FILES recordings, which
+    don't save them).  For the formats that store the frames as one array (RAW and ZARR), frames is that array (a
+    memory map or a zarr array, so it's only read as it's indexed), and None for the others.
+    """
+
+    def __init__(
+        self,
+        recording_format: str,
+        frame_ids: np.ndarray,
+        timestamps: np.ndarray,
+        shape: Tuple[int, ...],
+        dtype: np.dtype,
+        read_frame,
+        close=None,
+        frames=None,
+    ):
+        self.format = recording_format
+        self.frame_ids = frame_ids
+        self.timestamps = timestamps
+        # The shape of a frame
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.frames = frames
+        self._read_frame = read_frame
+        self._close = close
+
+    def __len__(self):
+        return len(self.frame_ids)
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        if not -len(self) <= index < len(self):
+            raise IndexError(f"Frame {index} is out of range for a recording of {len(self)} frames")
+        return self._read_frame(index % len(self))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+
+
+def get_recording_format(path: str) -> str:
+    """Which format the recording in the folder at path was saved in."""
+    if os.path.exists(os.path.join(path, RAW_METADATA_FILE_NAME)):
+        return RecordingFormat.RAW
+    if os.path.exists(os.path.join(path, ZARR_FILE_NAME)):
+        return RecordingFormat.ZARR
+    if os.path.exists(os.path.join(path, BIGTIFF_FILE_PATTERN.format(0))):
+        return RecordingFormat.BIGTIFF
+    return RecordingFormat.FILES
+
+
+def open_recording(path: str) -> Recording:
+    recording_format = get_recording_format(path)
+    if recording_format == RecordingFormat.RAW:
+        return _open_raw(path)
+    if recording_format == RecordingFormat.ZARR:
+        return _open_zarr(path)
+    if recording_format == RecordingFormat.BIGTIFF:
+        return _open_bigtiff(path)
+    return _open_files(path)
+
+
+def _open_raw(path: str) -> Recording:
+    with open(os.path.join(path, RAW_METADATA_FILE_NAME)) as f:
+        metadata = json.load(f)
+    dtype = np.dtype(metadata["dtype"])
+    shape = tuple(metadata["shape"])
+    frame_bytes = int(np.prod(shape)) * dtype.itemsize
+    raw_path = os.path.join(path, RAW_FILE_NAME)
+    index = np.fromfile(os.path.join(path, RAW_INDEX_FILE_NAME), dtype=FRAME_INDEX_DTYPE)
+    # A recording that didn't close cleanly can have a frame without its index record, or the other way around
+    count = min(len(index), os.path.getsize(raw_path) // frame_bytes)
+    if count:
+        frames = np.memmap(raw_path, dtype=dtype, mode="r", shape=(count,) + shape)
+    else:
+        frames = np.zeros((0,) + shape, dtype=dtype)
+    return Recording(
+        RecordingFormat.RAW,
+        index["frame_id"][:count],
+        index["timestamp"][:count],
+        shape,
+        dtype,
+        lambda i: np.array(frames[i]),
+        frames=frames,
+    )
+
+
+def _open_zarr(path: str) -> Recording:
+    group = zarr.open_group(os.path.join(path, ZARR_FILE_NAME), mode="r")
+    frames = group["frames"]
+    count = min(frames.shape[0], group["frame_ids"].shape[0])
+    return Recording(
+        RecordingFormat.ZARR,
+        group["frame_ids"][:count],
+        group["timestamps"][:count],
+        frames.shape[1:],
+        frames.dtype,
+        lambda i: frames[i],
+        frames=frames,
+    )
+
+
+def _open_bigtiff(path: str) -> Recording:
+    # (file path, offset of its pixel data, number of frames written to it)
+    files: List[Tuple[str, int, int]] = []
+    frame_ids = []
+    timestamps = []
+    shape = dtype = None
+    for file_path in sorted(glob.glob(os.path.join(path, "frames_*.tif"))):
+        with tifffile.TiffFile(file_path) as tif:
+            page = tif.pages[0]
+            file_timestamps = np.asarray(page.tags[TIMESTAMPS_TAG].value, dtype=np.float64)
+            # The frames are written in order, so the first one that wasn't written ends the file
+            unwritten = np.flatnonzero(np.isnan(file_timestamps))
+            count = int(unwritten[0]) if len(unwritten) else len(file_timestamps)
+            frame_ids.append(np.asarray(page.tags[FRAME_IDS_TAG].value, dtype=np.int64)[:count])
+            timestamps.append(file_timestamps[:count])
+            files.append((file_path, page.dataoffsets[0], count))
+            shape = page.shape
+            dtype = page.dtype
+
+    starts = np.cumsum([0] + [count for _, _, count in files])
+    maps = {}
+
+    def read_frame(i):
+        file_index = int(np.searchsorted(starts, i, side="right")) - 1
+        if file_index not in maps:
+            file_path, offset, count = files[file_index]
+            maps[file_index] = np.memmap(file_path, dtype=dtype, mode="r", offset=offset, shape=(count,) + shape)
+        return np.array(maps[file_index][i - starts[file_index]])
+
+    return Recording(
+        RecordingFormat.BIGTIFF,
+        np.concatenate(frame_ids) if frame_ids else np.zeros(0, dtype=np.int64),
+        np.concatenate(timestamps) if timestamps else np.zeros(0),
+        shape or (),
+        dtype or np.uint8,
+        read_frame,
+        close=maps.clear,
+    )
+
+
+def _open_files(path: str) -> Recording:
+    files = []
+    for folder in os.listdir(path):
+        if not folder.isdigit():
+            continue
+        for name in os.listdir(os.path.join(path, folder)):
+            stem = os.path.splitext(name)[0]
+            file_ID, _, frame_ID = stem.partition("_")
+            if file_ID.isdigit() and frame_ID.lstrip("-").isdigit():
+                files.append((int(folder), int(file_ID), int(frame_ID), os.path.join(path, folder, name)))
+    files.sort()
+    paths = [file[3] for file in files]
+
+    def read_frame(i):
+        image = cv2.imread(paths[i], cv2.IMREAD_UNCHANGED)
+        if image is None:
+            image = iio.imread(paths[i])
+        return image
+
+    first = read_frame(0) if paths else np.zeros(0, dtype=np.uint8)
+    return Recording(
+        RecordingFormat.FILES,
+        np.array([file[2] for file in files], dtype=np.int64),
+        np.full(len(files), np.nan),
+        first.shape,
+        first.dtype,
+        read_frame,
+    )
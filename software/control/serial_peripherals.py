@@ -5,6 +5,7 @@ from typing import Tuple, Optional
 import struct
 from squid.abc import LightSource
 
+from control.serial_transport import LengthPrefixedFramer, SerialTransport, SimulatedSerial
 import squid.logging
 
 log = squid.logging.get_logger(__name__)
@@ -15,9 +16,15 @@ class SerialDevice:
     General wrapper for serial devices, with
     automating device finding based on VID/PID
     or serial number.
+
+    Commands and responses go through a SerialTransport, so a command returns as soon as the device answers
+    instead of after a fixed delay.  existing_serial can be any port-like object (ex: a SimulatedSerial) to use
+    instead of finding and opening a port.
     """
 
-    def __init__(self, port=None, VID=None, PID=None, SN=None, baudrate=9600, read_timeout=0.1, **kwargs):
+    def __init__(
+        self, port=None, VID=None, PID=None, SN=None, baudrate=9600, read_timeout=0.1, existing_serial=None, **kwargs
+    ):
         # Initialize the serial connection
         self.port = port
         self.VID = VID
@@ -28,7 +35,10 @@ class SerialDevice:
         self.read_timeout = read_timeout
         self.serial_kwargs = kwargs
 
-        self.serial = None
+        self.serial = existing_serial
+        self._transport = None
+        if existing_serial is not None:
+            return
 
         if VID is not None and PID is not None:
             for d in list_ports.comports():
@@ -79,7 +89,13 @@ class SerialDevice:
                         self.port = d.device
                         break
             if self.port is not None:
-                self.serial = serial.Serial(self.port, **kwargs)
+                # The transport's reader thread needs reads to time out, to notice when it's closed.
+                self.serial = serial.Serial(self.port, baudrate=baudrate, timeout=read_timeout, **kwargs)
+
+    def _get_transport(self) -> SerialTransport:
+        if self._transport is None:
+            self._transport = SerialTransport(self.serial, name=f"SerialDevice({self.port or self.SN})")
+        return self._transport
 
     def write_and_check(
         self,
@@ -90,49 +106,60 @@ class SerialDevice:
         attempt_delay=1,
         check_prefix=True,
         print_response=False,
+        settle_time=0,
     ):
-        # Write a command and check the response
-        for attempt in range(max_attempts):
-            self.serial.write(command.encode())
-            time.sleep(read_delay)  # Wait for the command to be sent/executed
+        """
+        Write a command, and wait for the expected response (or one that starts with it if check_prefix).  Other
+        lines the device sends before it are skipped.
 
-            response = self.serial.readline().decode().strip()
-            if print_response:
-                log.info(response)
+        read_delay is how long the device may take to answer, on top of read_timeout.  This returns as soon as the
+        expected response arrives, so it only costs that long if the device doesn't answer.
 
-            # flush the input buffer
-            while self.serial.in_waiting:
-                if print_response:
-                    log.info(self.serial.readline().decode().strip())
-                else:
-                    self.serial.readline().decode().strip()
+        settle_time is how long after the command was written to return at the earliest, for devices that answer
+        a command before they're done carrying it out (ex: moving).
+        """
+        if check_prefix:
+            accept = lambda response: response.startswith(expected_response)
+        else:
+            accept = lambda response: response == expected_response
 
-            # check response
-            if response == expected_response:
-                return response
-            else:
-                log.warning(response)
+        transport = self._get_transport()
+        for attempt in range(max_attempts):
+            written_time = time.monotonic()
+            pending = transport.send(command, accept)
+            response = transport.wait(pending, read_delay + self.read_timeout)
+            if print_response:
+                for message in pending.messages:
+                    log.info(message)
 
-            # check prefix if the full response does not match
-            if check_prefix:
-                if response.startswith(expected_response):
-                    return response
-            else:
+            if response is not None:
+                remaining_settle_time = settle_time - (time.monotonic() - written_time)
+                if remaining_settle_time > 0:
+                    time.sleep(remaining_settle_time)
+                return response
+            log.warning(f"No {expected_response!r} response to {command.strip()!r}, got: {pending.messages}")
+            if not check_prefix:
                 time.sleep(attempt_delay)  # Wait before retrying
 
         raise RuntimeError("Max attempts reached without receiving expected response.")
 
     def write_and_read(self, command, read_delay=0.1, max_attempts=3, attempt_delay=1):
-        self.serial.write(command.encode())
-        time.sleep(read_delay)  # Wait for the command to be sent
-        response = self.serial.readline().decode().strip()
-        return response
+        """Write a command and return the first line of the response, or "" if there is none within read_delay."""
+        response = self._get_transport().request(command, read_delay + self.read_timeout)
+        return "" if response is None else response
 
     def write(self, command):
-        self.serial.write(command.encode())
+        self._get_transport().write(command)
+
+    def get_latency_stats(self):
+        """Command round trip times for this device, see SerialTransport.get_latency_stats."""
+        return self._get_transport().get_latency_stats()
 
     def close(self):
         # Close the serial connection
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
         self.serial.close()
 
 
@@ -207,7 +234,12 @@ class XLight_Simulation:
 
 
 class XLight:
-    """Wrapper for communicating with CrestOptics X-Light devices over serial"""
+    """
+    Wrapper for communicating with CrestOptics X-Light devices over serial
+
+    The X-Light can answer a motion command (wheels, disk, slider, irises, disk motor) before the motion is done, so
+    those commands wait at least as long as the device used to be given to carry them out (their settle_time).
+    """
 
     def __init__(self, SN, sleep_time_for_wheel=0.25, disable_emission_filter_wheel=True):
         """
@@ -288,7 +320,7 @@ class XLight:
 
         if validate:
             current_pos = self.serial_connection.write_and_check(
-                "B" + position_to_write + "\r", "B" + position_to_read, read_delay=0.01
+                "B" + position_to_write + "\r", "B" + position_to_read, read_delay=0.01, settle_time=0.01
             )
             self.emission_wheel_pos = int(current_pos[1])
         else:
@@ -312,7 +344,7 @@ class XLight:
             position_to_write += "m"
 
         current_pos = self.serial_connection.write_and_check(
-            "C" + position_to_write + "\r", "C" + position_to_read, read_delay=0.01
+            "C" + position_to_write + "\r", "C" + position_to_read, read_delay=0.01, settle_time=0.01
         )
         self.dichroic_wheel_pos = int(current_pos[1])
         return self.dichroic_wheel_pos
@@ -335,7 +367,7 @@ class XLight:
         position_to_read = str(position)
 
         current_pos = self.serial_connection.write_and_check(
-            "D" + position_to_write + "\r", "D" + position_to_read, read_delay=5
+            "D" + position_to_write + "\r", "D" + position_to_read, read_delay=5, settle_time=5
         )
         self.spinning_disk_pos = int(current_pos[1])
         return self.spinning_disk_pos
@@ -344,14 +376,14 @@ class XLight:
         # value: 0 - 100
         self.illumination_iris = value
         value = str(int(10 * value))
-        self.serial_connection.write_and_check("J" + value + "\r", "J" + value, read_delay=3)
+        self.serial_connection.write_and_check("J" + value + "\r", "J" + value, read_delay=3, settle_time=3)
         return self.illumination_iris
 
     def set_emission_iris(self, value):
         # value: 0 - 100
         self.emission_iris = value
         value = str(int(10 * value))
-        self.serial_connection.write_and_check("V" + value + "\r", "V" + value, read_delay=3)
+        self.serial_connection.write_and_check("V" + value + "\r", "V" + value, read_delay=3, settle_time=3)
         return self.emission_iris
 
     def set_filter_slider(self, position):
@@ -360,7 +392,9 @@ class XLight:
         self.slider_position = position
         position_to_write = str(position)
         position_to_read = str(position)
-        self.serial_connection.write_and_check("P" + position_to_write + "\r", "V" + position_to_read, read_delay=5)
+        self.serial_connection.write_and_check(
+            "P" + position_to_write + "\r", "V" + position_to_read, read_delay=5, settle_time=5
+        )
         return self.slider_position
 
     def get_disk_position(self):
@@ -376,7 +410,7 @@ class XLight:
             state_to_write = "0"
 
         current_pos = self.serial_connection.write_and_check(
-            "N" + state_to_write + "\r", "N" + state_to_write, read_delay=2.5
+            "N" + state_to_write + "\r", "N" + state_to_write, read_delay=2.5, settle_time=2.5
         )
 
         self.disk_motor_state = bool(int(current_pos[1]))
@@ -495,6 +529,8 @@ class LDI_Simulation(LightSource):
         Provide serial number
         """
         self.log = squid.logging.get_logger(self.__class__.__name__)
+        # A stand in for the device that acknowledges every command
+        self.serial_connection = SerialDevice(existing_serial=SimulatedSerial(lambda command: b"ok\r\n"))
         self.intensity_mode = IntensityControlMode.Software
         self.shutter_mode = ShutterControlMode.Software
 
@@ -657,6 +693,7 @@ class SciMicroscopyLEDArray_Simulation:
         """
         Provide serial number
         """
+        self.serial_connection = SerialDevice(existing_serial=SimulatedSerial(lambda command: b"-==-\r\n"))
         self.serial_connection.open_ser()
         self.check_about()
         self.set_distance(array_distance)
@@ -772,16 +809,8 @@ class CellX_Simulation:
     """Wrapper for communicating with LDI over serial"""
 
     def __init__(self, SN=""):
-        self.serial_connection = SerialDevice(
-            SN=SN,
-            baudrate=115200,
-            bytesize=serial.EIGHTBITS,
-            stopbits=serial.STOPBITS_ONE,
-            parity=serial.PARITY_NONE,
-            xonxoff=False,
-            rtscts=False,
-            dsrdtr=False,
-        )
+        # A stand in for the device that acknowledges every command
+        self.serial_connection = SerialDevice(existing_serial=SimulatedSerial(lambda command: b"OK\r\n"))
         self.serial_connection.open_ser()
         self.power = {}
 
@@ -888,6 +917,7 @@ class FilterController:
         self.current_position = 0
         self.current_index = 1
         self.serial = self._initialize_serial(serial_number, baudrate, bytesize, parity, stopbits)
+        self._transport = SerialTransport(self.serial, name=self.__class__.__name__)
         self._configure_device()
 
     def _initialize_serial(
@@ -917,6 +947,7 @@ class FilterController:
         if hasattr(self, "serial") and self.serial.is_open:
             self._send_command("/stop")
             time.sleep(0.5)
+            self._transport.close()
             self.serial.close()
 
     def _send_command(self, cmd: str) -> Tuple[bool, str]:
@@ -937,8 +968,7 @@ class FilterController:
 
         for attempt in range(self.MAX_RETRIES):
             try:
-                self.serial.write(f"{cmd}\n".encode("utf-8"))
-                response = self.serial.readline().decode("utf-8").strip()
+                response = self._transport.request(f"{cmd}\n", self.COMMAND_TIMEOUT) or ""
                 success, message = self._parse_response(response)
 
                 if success:
@@ -1131,6 +1161,9 @@ class Optospin:
 
         optospin_port = [p.device for p in serial.tools.list_ports.comports() if SN == p.serial_number]
         self.ser = serial.Serial(optospin_port[0], baudrate=baudrate, timeout=timeout)
+        # Responses are a status byte, a length byte, and then length bytes of data.
+        self._transport = SerialTransport(self.ser, framer=LengthPrefixedFramer(), name=self.__class__.__name__)
+        self.timeout = timeout
         self.max_retries = max_retries
         self.retry_delay = retry_delay
         self.current_index = 1
@@ -1142,22 +1175,18 @@ class Optospin:
 
         for attempt in range(self.max_retries):
             try:
-                self.ser.write(full_command)
-                response = self.ser.read(2)
+                response = self._transport.request(full_command, self.timeout)
 
-                if len(response) != 2:
+                if response is None:
                     raise serial.SerialTimeoutException("Timeout: No response from device")
 
-                status, length = struct.unpack(">BB", response)
+                status, length = struct.unpack(">BB", response[:2])
 
                 if status != 0xFF:
                     raise Exception(f"Command failed with status: {status}")
 
                 if length > 0:
-                    additional_data = self.ser.read(length)
-                    if len(additional_data) != length:
-                        raise serial.SerialTimeoutException("Timeout: Incomplete additional data")
-                    return additional_data
+                    return response[2:]
                 return None
 
             except (serial.SerialTimeoutException, Exception) as e:
@@ -1206,6 +1235,7 @@ class Optospin:
         return struct.unpack(">BBBB", result)
 
     def close(self):
+        self._transport.close()
         self.ser.close()
 
 
@@ -0,0 +1,316 @@
+import collections
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import numpy as np
+
+import squid.logging
+from squid.ring_buffer import RingBuffer
+
+
+class LineFramer:
+    """
+    Splits the bytes from a device into lines on \\r or \\n, for the many devices that answer a command with a line
+    of text.  Lines are decoded and stripped, and empty lines (ex: between \\r and \\n) are skipped.
+    """
+
+    def __init__(self, encoding="utf-8"):
+        self.encoding = encoding
+
+    def __call__(self, buffer: bytearray) -> Optional[str]:
+        while True:
+            ends = [i for i in (buffer.find(b"\r"), buffer.find(b"\n")) if i >= 0]
+            if not ends:
+                return None
+            end = min(ends)
+            line = bytes(buffer[:end]).decode(self.encoding, errors="replace").strip()
+            del buffer[: end + 1]
+            if line:
+                return line
+
+
+class LengthPrefixedFramer:
+    """
+    For binary protocols where a response is a header_size byte header whose length_index'th byte is the number of
+    payload bytes that follow it.  Messages are the raw bytes of header + payload.
+    """
+
+    def __init__(self, header_size=2, length_index=1):
+        self.header_size = header_size
+        self.length_index = length_index
+
+    def __call__(self, buffer: bytearray) -> Optional[bytes]:
+        if len(buffer) < self.header_size:
+            return None
+        size = self.header_size + buffer[self.length_index]
+        if len(buffer) < size:
+            return None
+        message = bytes(buffer[:size])
+        del buffer[:size]
+        return message
+
+
+class PendingResponse:
+    """
+    A command that was sent and is waiting for its response.  Every message that arrives while it is the oldest
+    pending command is offered to accept(); the first one accepted is the response, and the others are kept in
+    messages (ex: the extra lines some devices print before their answer).
+    """
+
+    def __init__(self, command: bytes, accept: Optional[Callable[[Any], bool]]):
+        self.command = command
+        self.accept = accept
+        self.messages: List[Any] = []
+        self.response = None
+        self.sent_at: Optional[float] = None
+        self.latency_s: Optional[float] = None
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def _offer(self, message) -> bool:
+        self.messages.append(message)
+        if self.accept is None or self.accept(message):
+            self.response = message
+            self.latency_s = time.perf_counter() - self.sent_at
+            self._done.set()
+            return True
+        return False
+
+
+class SerialTransport:
+    """
+    Command/response over a serial port, without fixed sleeps.
+
+    A reader thread reads everything the device sends as it arrives, splits it into messages with framer, and hands
+    each message to the oldest command still waiting for a response.  So a command returns as soon as the device
+    answers, and waits at most until its deadline if it doesn't.  Messages that arrive when no command is waiting
+    are kept (the last few) in unsolicited.
+
+    A command that times out might still be answered late.  So that the late response isn't taken as the response
+    to the next command, the next command isn't written until as long again as the timeout has passed; anything
+    that arrives in the meantime is unsolicited.
+
+    Up to max_in_flight commands can be waiting for responses at once.  The default of 1 means each command waits
+    for the last one's response (or timeout) before it is written.  Devices that queue commands and answer them in
+    order can use more, to pipeline commands without waiting for each round trip.
+
+    serial_port only needs write, read(size), in_waiting, and a read timeout (so that the reader thread can notice
+    close), so pyserial ports and SimulatedSerial both work.
+    """
+
+    def __init__(self, serial_port, framer=None, max_in_flight=1, name=None, latency_history=1000):
+        self._log = squid.logging.get_logger(name or self.__class__.__name__)
+        self.serial = serial_port
+        self.framer = framer if framer is not None else LineFramer()
+        self.max_in_flight = max_in_flight
+
+        self._buffer = bytearray()
+        self._pending: Deque[PendingResponse] = collections.deque()
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self.unsolicited: Deque[Any] = collections.deque(maxlen=100)
+
+        self._latencies = RingBuffer(latency_history)
+        self._request_count = 0
+        self._timeout_count = 0
+        # After a timeout, commands aren't written before this time (time.monotonic())
+        self._quiet_until = 0.0
+
+        self._closed = False
+        self._reader = threading.Thread(target=self._read_loop, name=f"{self._log.name} reader", daemon=True)
+        self._reader.start()
+
+    def _read_loop(self):
+        while not self._closed:
+            try:
+                data = self.serial.read(max(1, self.serial.in_waiting))
+            except Exception:
+                if not self._closed:
+                    self._log.exception("Serial read failed, stopping reader")
+                return
+            if not data:
+                continue
+            self._buffer.extend(data)
+            while (message := self.framer(self._buffer)) is not None:
+                self._dispatch(message)
+
+    def _dispatch(self, message):
+        with self._condition:
+            if not self._pending:
+                self._log.debug(f"Unsolicited message: {message!r}")
+                self.unsolicited.append(message)
+                return
+            pending = self._pending[0]
+            if pending._offer(message):
+                self._pending.popleft()
+                self._latencies.append(pending.latency_s)
+                self._condition.notify_all()
+
+    def send(
+        self, command, accept: Optional[Callable[[Any], bool]] = None, timeout: Optional[float] = None
+    ) -> PendingResponse:
+        """
+        Write command (str or bytes) and return without waiting for the response.  Blocks (up to timeout) only if
+        max_in_flight commands are already waiting.
+        """
+        if isinstance(command, str):
+            command = command.encode()
+        pending = PendingResponse(command, accept)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while len(self._pending) >= self.max_in_flight or time.monotonic() < self._quiet_until:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"Gave up waiting to send {command!r}, {len(self._pending)} commands pending")
+                if len(self._pending) < self.max_in_flight:
+                    quiet_remaining = self._quiet_until - time.monotonic()
+                    remaining = quiet_remaining if remaining is None else min(remaining, quiet_remaining)
+                self._condition.wait(remaining)
+            # Writing while holding the condition keeps the order of _pending the same as the order on the wire.
+            with self._write_lock:
+                pending.sent_at = time.perf_counter()
+                self._pending.append(pending)
+                self._request_count += 1
+                self.serial.write(command)
+        return pending
+
+    def wait(self, pending: PendingResponse, timeout: Optional[float]):
+        """
+        The response to pending, or None if it doesn't arrive within timeout seconds.  After a timeout, the next
+        command is held back for another timeout seconds, see the class docstring.
+        """
+        if pending._done.wait(timeout):
+            return pending.response
+        with self._condition:
+            # Check again, the response might have arrived after the wait timed out.
+            if pending.done:
+                return pending.response
+            try:
+                self._pending.remove(pending)
+            except ValueError:
+                pass
+            self._timeout_count += 1
+            if timeout is not None:
+                self._quiet_until = max(self._quiet_until, time.monotonic() + timeout)
+            self._condition.notify_all()
+        self._log.debug(f"Timed out waiting for a response to {pending.command!r}, got {pending.messages!r}")
+        return None
+
+    def request(self, command, timeout: float, accept: Optional[Callable[[Any], bool]] = None):
+        """Write command and wait up to timeout seconds for the response.  Returns None on timeout."""
+        return self.wait(self.send(command, accept, timeout), timeout)
+
+    def write(self, command):
+        """Write command without expecting a response."""
+        if isinstance(command, str):
+            command = command.encode()
+        with self._write_lock:
+            self.serial.write(command)
+
+    def get_latency_stats(self) -> Dict[str, float]:
+        """Round trip times (in ms) of the latest responses, and the number of requests and timeouts."""
+        latencies_ms = self._latencies.get_window() * 1000
+        stats = {"requests": self._request_count, "timeouts": self._timeout_count, "responses": len(latencies_ms)}
+        if len(latencies_ms):
+            stats.update(
+                mean_ms=float(np.mean(latencies_ms)),
+                p50_ms=float(np.percentile(latencies_ms, 50)),
+                p95_ms=float(np.percentile(latencies_ms, 95)),
+                max_ms=float(np.max(latencies_ms)),
+            )
+        return stats
+
+    def close(self):
+        self._closed = True
+        self._reader.join(timeout=1)
+        with self._condition:
+            self._pending.clear()
+            self._condition.notify_all()
+
+
+class SimulatedSerial:
+    """
+    A stand in for a serial port, for running device drivers (and SerialTransport) without the device.
+
+    respond is called with each write, and returns the bytes the device would answer with (or None).  The answer
+    becomes readable response_delay_s later, like a device that takes that long to process a command.
+    """
+
+    def __init__(self, respond: Callable[[bytes], Optional[bytes]], response_delay_s=0.0, timeout=0.1):
+        self.respond = respond
+        self.response_delay_s = response_delay_s
+        self.timeout = timeout
+        self.is_open = True
+        self.written: List[bytes] = []
+        # (time the bytes become readable, bytes)
+        self._responses: Deque = collections.deque()
+        self._buffer = bytearray()
+        self._condition = threading.Condition()
+
+    def _collect(self):
+        now = time.monotonic()
+        while self._responses and self._responses[0][0] <= now:
+            self._buffer.extend(self._responses.popleft()[1])
+
+    @property
+    def in_waiting(self) -> int:
+        with self._condition:
+            self._collect()
+            return len(self._buffer)
+
+    def write(self, data: bytes):
+        if not self.is_open:
+            raise IOError("Closed")
+        self.written.append(bytes(data))
+        response = self.respond(bytes(data))
+        if response:
+            with self._condition:
+                # Responses are in order, even if response_delay_s changes between writes
+                ready_at = time.monotonic() + self.response_delay_s
+                if self._responses:
+                    ready_at = max(ready_at, self._responses[-1][0])
+                self._responses.append((ready_at, response))
+                self._condition.notify_all()
+        return len(data)
+
+    def read(self, size=1) -> bytes:
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            while True:
+                if not self.is_open:
+                    raise IOError("Closed")
+                self._collect()
+                if self._buffer:
+                    data = bytes(self._buffer[:size])
+                    del self._buffer[:size]
+                    return data
+                now = time.monotonic()
+                if now >= deadline:
+                    return b""
+                wait = deadline - now
+                if self._responses:
+                    wait = min(wait, max(0.0, self._responses[0][0] - now))
+                self._condition.wait(wait)
+
+    def readline(self) -> bytes:
+        line = bytearray()
+        while not line.endswith(b"\n"):
+            data = self.read(1)
+            if not data:
+                break
+            line.extend(data)
+        return bytes(line)
+
+    def reset_input_buffer(self):
+        with self._condition:
+            self._collect()
+            self._buffer.clear()
+
+    def close(self):
+        with self._condition:
+            self.is_open = False
+            self._condition.notify_all()
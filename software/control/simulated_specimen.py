@@ -0,0 +1,200 @@
+import functools
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+from control._def import *
+
+
+class SyntheticSpecimen:
+    """
+    Something for the simulated camera to look at: a 2d map of intensities in [0, 1] laid out on the stage with
+    pixel_size_um pixels, and repeated in x and y so that every stage position has something in view.
+
+    render() crops the field of view at a stage position out of the map, bins it, and blurs it by the distance from
+    focus_z_mm.  Sensor effects (exposure, gain and noise) are added by expose().
+    """
+
+    def __init__(
+        self,
+        image: np.ndarray,
+        pixel_size_um: float = SIMULATED_SPECIMEN_PIXEL_SIZE_UM,
+        focus_z_mm: float = SIMULATED_SPECIMEN_FOCUS_Z_MM,
+        blur_um_per_um: float = SIMULATED_SPECIMEN_BLUR_UM_PER_UM,
+    ):
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        image = image.astype(np.float32)
+        low, high = float(image.min()), float(image.max())
+        self.image = (image - low) / (high - low) if high > low else np.zeros_like(image)
+        self.pixel_size_um = pixel_size_um
+        self.focus_z_mm = focus_z_mm
+        self.blur_um_per_um = blur_um_per_um
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "SyntheticSpecimen":
+        image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if image is None:
+            raise ValueError(f"Could not read specimen image {path}")
+        return cls(image, **kwargs)
+
+    @classmethod
+    def procedural(cls, size: int = SIMULATED_SPECIMEN_SIZE, seed: int = 0, **kwargs) -> "SyntheticSpecimen":
+        """A field of cells (dim cytoplasm around a bright nucleus) on a faint uneven background."""
+        rng = np.random.default_rng(seed)
+        pixel_size_um = kwargs.get("pixel_size_um", SIMULATED_SPECIMEN_PIXEL_SIZE_UM)
+        cell_radius = 8 / pixel_size_um
+        # About one cell per 4 cell areas
+        cell_count = int(size * size / (4 * np.pi * cell_radius**2))
+
+        canvas = np.zeros((size, size), dtype=np.float32)
+        centers = rng.uniform(0, size, (cell_count, 2))
+        axes = rng.uniform(0.6, 1.4, (cell_count, 2)) * cell_radius
+        angles = rng.uniform(0, 180, cell_count)
+        brightness = rng.uniform(0.2, 0.6, cell_count)
+        # Cells that overlap an edge are also drawn wrapped around to the other side, so that the tile is seamless
+        # when it repeats.
+        margin = 2 * cell_radius
+        for (x, y), (a, b), angle, value in zip(centers, axes, angles, brightness):
+            for cx in (x - size, x, x + size):
+                for cy in (y - size, y, y + size):
+                    if -margin < cx < size + margin and -margin < cy < size + margin:
+                        center = (int(cx), int(cy))
+                        cv2.ellipse(canvas, center, (int(a), int(b)), angle, 0, 360, float(value), -1)
+                        cv2.circle(canvas, center, int(min(a, b) / 2), 1.0, -1)
+
+        background = cv2.resize(rng.uniform(0, 0.1, (8, 8)).astype(np.float32), (size, size), cv2.INTER_CUBIC)
+        canvas += background
+        margin = int(margin)
+        image = cv2.GaussianBlur(np.pad(canvas, margin, mode="wrap"), (0, 0), max(1.0, 0.5 / pixel_size_um))[
+            margin:-margin, margin:-margin
+        ]
+        return cls(image, **kwargs)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.image.shape
+
+    def blur_sigma_px(self, z_mm: float) -> float:
+        """The gaussian sigma, in specimen pixels, of the defocus blur at z_mm."""
+        return abs(z_mm - self.focus_z_mm) * 1000 * self.blur_um_per_um / self.pixel_size_um
+
+    def crop(self, out: np.ndarray, x_mm: float, y_mm: float) -> np.ndarray:
+        """Copy the out.shape region centered on (x_mm, y_mm) into out, wrapping around the edges of the map."""
+        height, width = out.shape
+        map_height, map_width = self.image.shape
+        top = int(round(y_mm * 1000 / self.pixel_size_um)) - height // 2
+        left = int(round(x_mm * 1000 / self.pixel_size_um)) - width // 2
+
+        # Copy the region one wrapped block at a time.
+        row = 0
+        while row < height:
+            source_row = (top + row) % map_height
+            rows = min(height - row, map_height - source_row)
+            column = 0
+            while column < width:
+                source_column = (left + column) % map_width
+                columns = min(width - column, map_width - source_column)
+                out[row : row + rows, column : column + columns] = self.image[
+                    source_row : source_row + rows, source_column : source_column + columns
+                ]
+                column += columns
+            row += rows
+        return out
+
+    def render(
+        self,
+        out: np.ndarray,
+        x_mm: float,
+        y_mm: float,
+        z_mm: float,
+        binning: int = 1,
+        scratch: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Render the field of view at the stage position into out (a float32 array of the binned image shape).
+
+        scratch is a float32 array of the unbinned shape, only needed if binning > 1.
+        """
+        if binning > 1:
+            if scratch is None:
+                scratch = np.empty((out.shape[0] * binning, out.shape[1] * binning), dtype=np.float32)
+            self.crop(scratch, x_mm, y_mm)
+            cv2.resize(scratch, (out.shape[1], out.shape[0]), dst=out, interpolation=cv2.INTER_AREA)
+        else:
+            self.crop(out, x_mm, y_mm)
+
+        # Blurring with a large sigma is slow and looks the same as a flat image, so cap it.
+        sigma = min(self.blur_sigma_px(z_mm) / binning, 50)
+        if sigma >= 0.5:
+            cv2.GaussianBlur(out, (0, 0), sigma, dst=out)
+        return out
+
+
+@functools.lru_cache(maxsize=1)
+def get_default_specimen() -> SyntheticSpecimen:
+    """The specimen from the SIMULATED_SPECIMEN_* settings, made once and shared by all simulated cameras."""
+    if SIMULATED_SPECIMEN_IMAGE:
+        return SyntheticSpecimen.from_file(SIMULATED_SPECIMEN_IMAGE)
+    return SyntheticSpecimen.procedural()
+
+
+class SensorNoise:
+    """
+    Standard normal noise for expose(), precomputed once per image size.  Each frame uses a different random
+    offset into it, so that generating noise costs nothing per frame.
+    """
+
+    _PADDING = 64
+
+    def __init__(self, seed: Optional[int] = None):
+        self._rng = np.random.default_rng(seed)
+        self._noise: Optional[np.ndarray] = None
+
+    def get(self, shape: Tuple[int, int]) -> np.ndarray:
+        height, width = shape
+        if (
+            self._noise is None
+            or self._noise.shape[0] < height + self._PADDING
+            or self._noise.shape[1] < width + self._PADDING
+        ):
+            self._noise = self._rng.standard_normal((height + self._PADDING, width + self._PADDING), np.float32)
+        row, column = self._rng.integers(0, self._PADDING, 2)
+        return self._noise[row : row + height, column : column + width]
+
+
+def expose(
+    specimen_image: np.ndarray,
+    out: np.ndarray,
+    exposure_time_ms: float,
+    analog_gain_db: float,
+    max_value: int,
+    noise: SensorNoise,
+    scratch: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    full_scale_exposure_ms: float = SIMULATED_CAMERA_FULL_SCALE_EXPOSURE_MS,
+    full_well_e: float = SIMULATED_CAMERA_FULL_WELL_E,
+    read_noise_e: float = SIMULATED_CAMERA_READ_NOISE_E,
+) -> np.ndarray:
+    """
+    Turn a rendered specimen image into camera counts in out (an integer array), with shot and read noise.
+
+    A specimen intensity of 1 collects full_well_e electrons in full_scale_exposure_ms.  scratch is a pair of float32
+    arrays with the image shape, to avoid allocating.
+    """
+    if scratch is None:
+        scratch = (np.empty(out.shape, dtype=np.float32), np.empty(out.shape, dtype=np.float32))
+    electrons, sigma = scratch
+
+    np.multiply(specimen_image, full_well_e * exposure_time_ms / full_scale_exposure_ms, out=electrons)
+    # Shot noise (approximated as gaussian) and read noise: sigma = sqrt(electrons + read_noise ** 2)
+    np.add(electrons, read_noise_e**2, out=sigma)
+    np.sqrt(sigma, out=sigma)
+    np.multiply(sigma, noise.get(out.shape), out=sigma)
+    np.add(electrons, sigma, out=electrons)
+
+    counts_per_e = 10 ** (analog_gain_db / 20) * max_value / full_well_e
+    np.multiply(electrons, counts_per_e, out=electrons)
+    np.clip(electrons, 0, max_value, out=electrons)
+    np.copyto(out, electrons, casting="unsafe")
+    return out
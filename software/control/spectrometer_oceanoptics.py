@@ -79,7 +79,12 @@ class Spectrometer(object):
 
 class Spectrometer_Simulation(object):
 
-    def __init__(self, sn=None):
+    def __init__(self, sn=None, N=4096):
+        self.N = N
+        self.wavelength = np.linspace(400, 1100, N)
+        # Spectra are read one integration time apart, like the real spectrometer
+        self.integration_time_s = 0.01
+        self._last_read = 0
         self.new_data_callback_external = None
         self.streaming_started = False
         self.stop_streaming = False
@@ -88,13 +93,20 @@ class Spectrometer_Simulation(object):
         self.thread_streaming = threading.Thread(target=self.stream, daemon=True)
 
     def set_integration_time_us(self, integration_time_us):
-        pass
+        self.integration_time_s = integration_time_us / 1e6
+
+    def set_integration_time_ms(self, integration_time_ms):
+        self.integration_time_s = integration_time_ms / 1e3
 
     def read_spectrum(self, correct_dark_counts=False, correct_nonlinearity=False):
-        N = 4096
-        wavelength = np.linspace(400, 1100, N)
-        intensity = np.random.randint(0, 65536, N)
-        return np.stack((wavelength, intensity))
+        self.is_reading_spectrum = True
+        delay = self._last_read + self.integration_time_s - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        self._last_read = time.perf_counter()
+        intensity = np.random.randint(0, 65536, self.N)
+        self.is_reading_spectrum = False
+        return np.stack((self.wavelength, intensity))
 
     def set_callback(self, function):
         self.new_data_callback_external = function
@@ -122,7 +134,6 @@ class Spectrometer_Simulation(object):
             while self.is_reading_spectrum:
                 time.sleep(0.05)
             if self.new_data_callback_external != None:
-                print("read spectrum...")
                 self.new_data_callback_external(self.read_spectrum())
 
     def close(self):
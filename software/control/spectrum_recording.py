@@ -0,0 +1,141 @@
+"""
+Recording spectra: a RAW recording (see control/recording_formats.py) of the spectra's intensities, one row per
+spectrum with its id and timestamp in the index, and the wavelength axis they share in wavelengths.npy.
+
+Spectra are small (a few thousand values) and come fast, so they're written in batches of SPECTRUM_RECORDING_BATCH_SIZE
+(or whatever came in the last SPECTRUM_RECORDING_FLUSH_INTERVAL_S, so a crash doesn't lose more than that) with one
+write per file for the whole batch.  export_csv turns a recording into a CSV table when one is needed.
+"""
+
+import os
+import time
+from typing import Optional
+
+import numpy as np
+
+from control._def import *
+from control.recording_formats import FRAME_INDEX_DTYPE, RawRecordingWriter, Recording, open_recording
+
+WAVELENGTHS_FILE_NAME = "wavelengths.npy"
+CSV_FILE_NAME = "spectra.csv"
+
+
+class SpectrumRecordingWriter(RawRecordingWriter):
+    """
+    Spectra are written with write_spectrum, as the (2, N) arrays the spectrometers read: the wavelengths, and the
+    intensities at them.  The wavelengths of the first spectrum are the recording's, and the ones after it have to
+    match.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = SPECTRUM_RECORDING_BATCH_SIZE,
+        flush_interval_s: float = SPECTRUM_RECORDING_FLUSH_INTERVAL_S,
+    ):
+        super().__init__(path)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval_s = flush_interval_s
+        self.wavelengths: Optional[np.ndarray] = None
+        self._batch: Optional[np.ndarray] = None
+        self._batch_index = np.zeros(self.batch_size, dtype=FRAME_INDEX_DTYPE)
+        self._batch_count = 0
+        self._last_flush = time.monotonic()
+
+    def write_spectrum(self, data: np.ndarray, spectrum_ID: int, timestamp: float):
+        wavelengths = data[0]
+        if self.wavelengths is None:
+            self.wavelengths = np.array(wavelengths)
+            np.save(os.path.join(self.path, WAVELENGTHS_FILE_NAME), self.wavelengths)
+        elif len(wavelengths) != len(self.wavelengths) or not np.array_equal(wavelengths, self.wavelengths):
+            raise ValueError(f"Spectrum {spectrum_ID} has different wavelengths than the recording in {self.path}")
+        self.write(data[1], spectrum_ID, timestamp)
+
+    def _start(self, image: np.ndarray):
+        super()._start(image)
+        self._batch = np.empty((self.batch_size,) + image.shape, dtype=image.dtype)
+
+    def _write(self, image: np.ndarray, frame_ID: int, timestamp: float):
+        self._batch[self._batch_count] = image
+        self._batch_index[self._batch_count] = (frame_ID, timestamp)
+        self._batch_count += 1
+        if self._batch_count == self.batch_size:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        """
+        Flush the batch if it's been flush_interval_s since the last flush.  _write only checks when a spectrum comes,
+        so whoever writes calls this when they stop coming, to get the last of them written.
+        """
+        if self._batch_count and time.monotonic() - self._last_flush >= self.flush_interval_s:
+            self.flush()
+
+    def flush(self):
+        if self._batch_count:
+            self._frames.write(self._batch[: self._batch_count].data)
+            self._index.write(self._batch_index[: self._batch_count].data)
+            self._batch_count = 0
+        if self.shape is not None:
+            self._frames.flush()
+            self._index.flush()
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self.shape is None:
+            return
+        self.flush()
+        super().close()
+
+
+class SpectrumRecording:
+    """
+    A spectrum recording read back.  intensities is an (n spectra, N) array mapped from the file, so it's only read as
+    it's used, and spectrum i is (wavelengths, intensities[i]).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.wavelengths = np.load(os.path.join(path, WAVELENGTHS_FILE_NAME))
+        self._recording: Recording = open_recording(path)
+        self.spectrum_ids = self._recording.frame_ids
+        self.timestamps = self._recording.timestamps
+        self.intensities = self._recording.frames
+
+    def __len__(self):
+        return len(self._recording)
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        """Spectrum index as a (2, N) array, like the spectrometer read it."""
+        return np.stack((self.wavelengths, self._recording[index]))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._recording.close()
+
+    def export_csv(self, csv_path: Optional[str] = None, batch_size: int = 1000) -> str:
+        """
+        Write the recording as a CSV table: a header row of spectrum_id, timestamp and the wavelengths, then a row per
+        spectrum of its id, timestamp and intensities.  By default it's spectra.csv in the recording's folder.  Returns
+        the path written.
+        """
+        csv_path = csv_path or os.path.join(self.path, CSV_FILE_NAME)
+        with open(csv_path, "w", newline="") as f:
+            f.write(",".join(["spectrum_id", "timestamp"] + [repr(float(w)) for w in self.wavelengths]) + "\n")
+            for start in range(0, len(self), batch_size):
+                end = min(start + batch_size, len(self))
+                rows = np.column_stack(
+                    (self.spectrum_ids[start:end], self.timestamps[start:end], self.intensities[start:end])
+                )
+                np.savetxt(f, rows, delimiter=",", fmt=["%d", "%.6f"] + ["%.10g"] * self.intensities.shape[1])
+        return csv_path
+
+
+def open_spectrum_recording(path: str) -> SpectrumRecording:
+    return SpectrumRecording(path)
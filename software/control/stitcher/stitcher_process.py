@@ -26,6 +26,7 @@ from bioio.writers.ome_zarr_writer_2 import compute_level_shapes, compute_level_
 from bioio_base import types as bioio_types
 from basicpy import BaSiC
 from multiprocessing import Process, Queue, Event, Pool, cpu_count
+import control.acquisition_index as acquisition_index
 from control.stitcher.stitcher_parameters import StitchingParameters
 
 # Cephla-Lab: Squid Microscopy Image Stitcher (soham mukherjee)
@@ -265,7 +266,8 @@ class StitcherProcess(Process):
         self.pixel_binning = self.acquisition_params.get("pixel_binning", 1)
         obj_focal_length_mm = obj_tube_lens_mm / obj_mag
         actual_mag = tube_lens_mm / obj_focal_length_mm
-        self.pixel_size_um = sensor_pixel_size_um / actual_mag
+        # The images are binned by pixel_binning, so each of their pixels covers that many sensor pixels
+        self.pixel_size_um = sensor_pixel_size_um * self.pixel_binning / actual_mag
         print("pixel_size_um:", self.pixel_size_um)
 
     def parse_acquisition_metadata(self):
@@ -282,9 +284,13 @@ class StitcherProcess(Process):
         for timepoint in self.timepoints:
 
             image_folder = os.path.join(self.input_folder, str(timepoint))
+            index_path = os.path.join(self.input_folder, timepoint, acquisition_index.INDEX_FILE_NAME)
             coordinates_path = os.path.join(self.input_folder, timepoint, "coordinates.csv")
             try:
-                coordinates_df = pd.read_csv(coordinates_path)
+                if os.path.exists(index_path):
+                    coordinates_df = acquisition_index.to_coordinates_dataframe(acquisition_index.load(index_path))
+                else:
+                    coordinates_df = pd.read_csv(coordinates_path)
             except FileNotFoundError:
                 print(f"Warning: coordinates.csv not found for timepoint {timepoint}")
                 continue
@@ -626,8 +632,8 @@ class StitcherProcess(Process):
         dx_pixels = dx_mm * 1000 / self.pixel_size_um
         dy_pixels = dy_mm * 1000 / self.pixel_size_um
 
-        max_x_overlap = round(abs(self.input_width - dx_pixels) * 1.05) // 2 * self.pixel_binning
-        max_y_overlap = round(abs(self.input_height - dy_pixels) * 1.05) // 2 * self.pixel_binning
+        max_x_overlap = round(abs(self.input_width - dx_pixels) * 1.05) // 2
+        max_y_overlap = round(abs(self.input_height - dy_pixels) * 1.05) // 2
         ## print("objective calculated - vertical overlap:", max_y_overlap, ", horizontal overlap:", max_x_overlap)
 
         # Find center positions
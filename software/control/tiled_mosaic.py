@@ -0,0 +1,262 @@
+import math
+from typing import Dict, List, Optional, Set, Tuple
+
+import cv2
+import numpy as np
+
+import squid.logging
+
+
+class TiledMosaicLevel:
+    """
+    A read only, array-like view of one pyramid level of one channel of a TiledMosaic.
+
+    napari only needs shape, dtype, ndim and __getitem__ to display a multiscale layer, and it only ever asks for
+    the visible region of the level it picked.  So this never materializes the full mosaic; slicing assembles the
+    requested region from the tiles that exist and leaves everything else as zeros.
+    """
+
+    def __init__(self, mosaic: "TiledMosaic", channel: str, level: int):
+        self._mosaic = mosaic
+        self._channel = channel
+        self._level = level
+        min_row, min_col, max_row, max_col = mosaic.get_tile_bounds(level)
+        self._min_tile_row = min_row
+        self._min_tile_col = min_col
+        tile_size = mosaic.tile_size
+        self.shape = ((max_row - min_row) * tile_size, (max_col - min_col) * tile_size) + mosaic.get_pixel_shape(
+            channel
+        )
+        self.dtype = mosaic.get_dtype(channel)
+        self.ndim = len(self.shape)
+
+    @property
+    def size(self):
+        return math.prod(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        array = self[:, :]
+        return array if dtype is None else array.astype(dtype)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (self.ndim - len(key))
+        (row_key, col_key), rest = key[:2], key[2:]
+
+        row_start, row_stop, row_step = self._normalize(row_key, self.shape[0])
+        col_start, col_stop, col_step = self._normalize(col_key, self.shape[1])
+        region = self._read_region(row_start, row_stop, col_start, col_stop)
+        region = region[::row_step, ::col_step]
+
+        # Integer indices drop their axis, just like a numpy array would.
+        index = (0 if isinstance(row_key, (int, np.integer)) else slice(None),) + (
+            0 if isinstance(col_key, (int, np.integer)) else slice(None),
+        )
+        return region[index + tuple(rest)]
+
+    @staticmethod
+    def _normalize(key, length) -> Tuple[int, int, int]:
+        if isinstance(key, (int, np.integer)):
+            key = int(key)
+            if key < 0:
+                key += length
+            return key, key + 1, 1
+        start, stop, step = key.indices(length)
+        return start, max(start, stop), step
+
+    def _read_region(self, row_start, row_stop, col_start, col_stop) -> np.ndarray:
+        tile_size = self._mosaic.tile_size
+        out = np.zeros((row_stop - row_start, col_stop - col_start) + self.shape[2:], dtype=self.dtype)
+        tiles = self._mosaic.get_tiles(self._channel, self._level)
+        if out.size == 0 or not tiles:
+            return out
+
+        for tile_row in range(row_start // tile_size, (row_stop - 1) // tile_size + 1):
+            for tile_col in range(col_start // tile_size, (col_stop - 1) // tile_size + 1):
+                tile = tiles.get((tile_row + self._min_tile_row, tile_col + self._min_tile_col))
+                if tile is None:
+                    continue
+                tile_top = tile_row * tile_size
+                tile_left = tile_col * tile_size
+                r0 = max(row_start, tile_top)
+                r1 = min(row_stop, tile_top + tile_size)
+                c0 = max(col_start, tile_left)
+                c1 = min(col_stop, tile_left + tile_size)
+                out[r0 - row_start : r1 - row_start, c0 - col_start : c1 - col_start] = tile[
+                    r0 - tile_top : r1 - tile_top, c0 - tile_left : c1 - tile_left
+                ]
+        return out
+
+
+class TiledMosaic:
+    """
+    A sparse, tiled, multiresolution mosaic of the FOVs acquired during a scan.
+
+    Every channel is stored as a dict of fixed size tiles keyed on (level, tile_row, tile_col), where level 0 is the
+    full resolution of the mosaic and each level above it is 2x downsampled from the one below.  Tiles are only
+    allocated where images land, and adding an image only touches the tiles it overlaps (plus their parents in the
+    pyramid), so the cost of adding a FOV does not depend on how big the mosaic already is.
+
+    Pixel (0, 0) of level 0 is at origin_mm, and tile indices can go negative so that the mosaic can grow in any
+    direction without moving existing data.
+    """
+
+    def __init__(self, pixel_size_mm: float, origin_mm: Tuple[float, float], tile_size: int = 512, n_levels: int = 4):
+        """
+        pixel_size_mm: The size of a level 0 pixel.
+        origin_mm: The (y_mm, x_mm) position of level 0 pixel (0, 0).
+        """
+        if tile_size % (2 ** (n_levels - 1)) != 0:
+            raise ValueError(f"tile_size={tile_size} must be divisible by 2**(n_levels-1)={2 ** (n_levels - 1)}")
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self.pixel_size_mm = pixel_size_mm
+        self.origin_mm = origin_mm
+        self.tile_size = tile_size
+        self.n_levels = n_levels
+
+        # {channel: {level: {(tile_row, tile_col): tile}}}
+        self._tiles: Dict[str, Dict[int, Dict[Tuple[int, int], np.ndarray]]] = {}
+        self._dtypes: Dict[str, np.dtype] = {}
+        self._pixel_shapes: Dict[str, Tuple[int, ...]] = {}
+
+        # The bounds are kept aligned to the tiles of the coarsest level, so that every level's shape is exactly
+        # 2x the shape of the level above it.  This is what napari expects from a multiscale pyramid.
+        # [min_row, min_col, max_row, max_col] in coarsest level tiles, max exclusive.
+        self._coarse_tile_bounds: Optional[List[int]] = None
+
+    @property
+    def channels(self):
+        return list(self._tiles.keys())
+
+    def get_dtype(self, channel: str) -> np.dtype:
+        return self._dtypes[channel]
+
+    def get_pixel_shape(self, channel: str) -> Tuple[int, ...]:
+        """The shape of a single pixel, ie () for mono and (3,) for rgb."""
+        return self._pixel_shapes[channel]
+
+    def get_tiles(self, channel: str, level: int) -> Dict[Tuple[int, int], np.ndarray]:
+        return self._tiles.get(channel, {}).get(level, {})
+
+    def get_tile_bounds(self, level: int) -> Tuple[int, int, int, int]:
+        """(min_tile_row, min_tile_col, max_tile_row, max_tile_col) of the given level, max exclusive."""
+        if self._coarse_tile_bounds is None:
+            return 0, 0, 0, 0
+        factor = 2 ** (self.n_levels - 1 - level)
+        return tuple(b * factor for b in self._coarse_tile_bounds)
+
+    def get_top_left_mm(self) -> Tuple[float, float]:
+        """The (y_mm, x_mm) position of pixel (0, 0) of the arrays returned by get_levels."""
+        min_row, min_col, _, _ = self.get_tile_bounds(0)
+        return (
+            self.origin_mm[0] + min_row * self.tile_size * self.pixel_size_mm,
+            self.origin_mm[1] + min_col * self.tile_size * self.pixel_size_mm,
+        )
+
+    def get_levels(self, channel: str) -> List[TiledMosaicLevel]:
+        return [TiledMosaicLevel(self, channel, level) for level in range(self.n_levels)]
+
+    def get_nbytes(self) -> int:
+        return sum(
+            tile.nbytes for levels in self._tiles.values() for tiles in levels.values() for tile in tiles.values()
+        )
+
+    def add_image(self, channel: str, image: np.ndarray, y_mm: float, x_mm: float) -> bool:
+        """
+        Write image into the mosaic with its top left corner at (y_mm, x_mm).  The image must already be at the
+        mosaic's pixel size.
+
+        Returns True if the bounds of the mosaic grew (and so the arrays from get_levels need to be fetched again).
+        """
+        if channel not in self._tiles:
+            self._tiles[channel] = {level: {} for level in range(self.n_levels)}
+            self._dtypes[channel] = image.dtype
+            self._pixel_shapes[channel] = image.shape[2:]
+        elif image.dtype != self._dtypes[channel]:
+            raise ValueError(f"Channel {channel} has dtype {self._dtypes[channel]}, cannot add {image.dtype} image")
+
+        top = int(math.floor((y_mm - self.origin_mm[0]) / self.pixel_size_mm))
+        left = int(math.floor((x_mm - self.origin_mm[1]) / self.pixel_size_mm))
+        bottom = top + image.shape[0]
+        right = left + image.shape[1]
+        if bottom <= top or right <= left:
+            return False
+
+        bounds_changed = self._grow_bounds(top, left, bottom, right)
+
+        # Write into the level 0 tiles this image overlaps.
+        tile_size = self.tile_size
+        level_tiles = self._tiles[channel][0]
+        touched: Set[Tuple[int, int]] = set()
+        for tile_row in range(top // tile_size, (bottom - 1) // tile_size + 1):
+            for tile_col in range(left // tile_size, (right - 1) // tile_size + 1):
+                tile = level_tiles.get((tile_row, tile_col))
+                if tile is None:
+                    tile = np.zeros((tile_size, tile_size) + image.shape[2:], dtype=image.dtype)
+                    level_tiles[(tile_row, tile_col)] = tile
+                tile_top = tile_row * tile_size
+                tile_left = tile_col * tile_size
+                r0 = max(top, tile_top)
+                r1 = min(bottom, tile_top + tile_size)
+                c0 = max(left, tile_left)
+                c1 = min(right, tile_left + tile_size)
+                tile[r0 - tile_top : r1 - tile_top, c0 - tile_left : c1 - tile_left] = image[
+                    r0 - top : r1 - top, c0 - left : c1 - left
+                ]
+                touched.add((tile_row, tile_col))
+
+        self._update_pyramid(channel, touched)
+        return bounds_changed
+
+    def _grow_bounds(self, top, left, bottom, right) -> bool:
+        coarse_tile_size = self.tile_size * 2 ** (self.n_levels - 1)
+        new_bounds = [
+            top // coarse_tile_size,
+            left // coarse_tile_size,
+            (bottom - 1) // coarse_tile_size + 1,
+            (right - 1) // coarse_tile_size + 1,
+        ]
+        if self._coarse_tile_bounds is None:
+            self._coarse_tile_bounds = new_bounds
+            return True
+        old_bounds = self._coarse_tile_bounds
+        self._coarse_tile_bounds = [
+            min(old_bounds[0], new_bounds[0]),
+            min(old_bounds[1], new_bounds[1]),
+            max(old_bounds[2], new_bounds[2]),
+            max(old_bounds[3], new_bounds[3]),
+        ]
+        return self._coarse_tile_bounds != old_bounds
+
+    def _update_pyramid(self, channel: str, touched: Set[Tuple[int, int]]):
+        half = self.tile_size // 2
+        for level in range(1, self.n_levels):
+            child_tiles = self._tiles[channel][level - 1]
+            level_tiles = self._tiles[channel][level]
+            parents = {(tile_row // 2, tile_col // 2) for (tile_row, tile_col) in touched}
+            for tile_row, tile_col in parents:
+                tile = level_tiles.get((tile_row, tile_col))
+                if tile is None:
+                    tile = np.zeros(
+                        (self.tile_size, self.tile_size) + self._pixel_shapes[channel], dtype=self._dtypes[channel]
+                    )
+                    level_tiles[(tile_row, tile_col)] = tile
+                for sub_row in range(2):
+                    for sub_col in range(2):
+                        child_key = (tile_row * 2 + sub_row, tile_col * 2 + sub_col)
+                        if child_key not in touched:
+                            continue
+                        tile[sub_row * half : (sub_row + 1) * half, sub_col * half : (sub_col + 1) * half] = cv2.resize(
+                            child_tiles[child_key], (half, half), interpolation=cv2.INTER_AREA
+                        )
+            touched = parents
+
+    def clear(self):
+        self._tiles.clear()
+        self._dtypes.clear()
+        self._pixel_shapes.clear()
+        self._coarse_tile_bounds = None
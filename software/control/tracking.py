@@ -2,23 +2,6 @@ import control.utils_.image_processing as image_processing
 import numpy as np
 from os.path import realpath, dirname, join
 
-try:
-    import torch
-    from control.DaSiamRPN.code.net import SiamRPNvot
-
-    print(1)
-    from control.DaSiamRPN.code import vot
-
-    print(2)
-    from control.DaSiamRPN.code.utils import get_axis_aligned_bbox, cxy_wh_2_rect
-
-    print(3)
-    from control.DaSiamRPN.code.run_SiamRPN import SiamRPN_init, SiamRPN_track
-
-    print(4)
-except Exception as e:
-    print(e)
-    # print('Warning: DaSiamRPN is not available!')
 from control._def import Tracking
 import cv2
 
@@ -50,20 +33,10 @@ class Tracker_Image(object):
         except:
             print("Warning: OpenCV-Contrib trackers unavailable!")
 
-        # Neural Net based trackers
+        # Neural Net based trackers.  The net is loaded when it's first used (see _load_net), since torch is slow to
+        # import and usually not installed.
         self.NEURALNETTRACKERS = {"daSiamRPN": []}
-        try:
-            # load net
-            self.net = SiamRPNvot()
-            self.net.load_state_dict(
-                torch.load(join(realpath(dirname(__file__)), "DaSiamRPN", "code", "SiamRPNOTB.model"))
-            )
-            self.net.eval().cuda()
-            print("Finished loading net ...")
-        except Exception as e:
-            print(e)
-            print("No neural net model found ...")
-            print("reverting to default OpenCV tracker")
+        self.net = None
 
         # Image Tracker type
         self.tracker_type = Tracking.DEFAULT_TRACKER
@@ -135,11 +108,31 @@ class Tracker_Image(object):
             print("Using {} tracker".format(self.tracker_type))
             pass
 
+    def _load_net(self):
+        if self.net is not None:
+            return True
+        try:
+            import torch
+            from control.DaSiamRPN.code.net import SiamRPNvot
+
+            net = SiamRPNvot()
+            net.load_state_dict(torch.load(join(realpath(dirname(__file__)), "DaSiamRPN", "code", "SiamRPNOTB.model")))
+            self.net = net.eval().cuda()
+            print("Finished loading net ...")
+            return True
+        except Exception as e:
+            print(e)
+            print("No neural net model found ...")
+            return False
+
     def _initialize_tracker(self, image, centroid, bbox):
         bbox = tuple(int(x) for x in bbox)
         # check if the image is color or not
         if len(image.shape) < 3:
             self.is_color = False
+        if self.tracker_type in self.NEURALNETTRACKERS.keys() and not self._load_net():
+            print("reverting to default OpenCV tracker")
+            self.tracker_type = Tracking.DEFAULT_TRACKER
         # Initialize the OpenCV based tracker
         if self.tracker_type in self.OPENCV_OBJECT_TRACKERS.keys():
             print("Initializing openCV tracker")
@@ -156,6 +149,8 @@ class Tracker_Image(object):
             target_pos, target_sz = np.array([centroid[0], centroid[1]]), np.array([bbox[2], bbox[3]])
             if self.is_color == False:
                 image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+            from control.DaSiamRPN.code.run_SiamRPN import SiamRPN_init
+
             self.state = SiamRPN_init(image, target_pos, target_sz, self.net)
             print("daSiamRPN tracker initialized")
         else:
@@ -178,6 +173,9 @@ class Tracker_Image(object):
             self.origin = np.array([0, 0])
             if self.is_color == False:
                 image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+            from control.DaSiamRPN.code.run_SiamRPN import SiamRPN_track
+            from control.DaSiamRPN.code.utils import cxy_wh_2_rect
+
             self.state = SiamRPN_track(self.state, image)
             ok = True
             if ok:
@@ -1,8 +1,11 @@
 import cv2
+import importlib.util
 from numpy import std, square, mean
 import numpy as np
-from scipy.ndimage import label
 import os
+import sys
+
+import control.compositing as compositing
 
 
 def crop_image(image, crop_width, crop_height):
@@ -71,22 +74,12 @@ def rotate_and_flip_image(image, rotate_image_angle, flip_image):
 
 
 def generate_dpc(im_left, im_right):
-    # Normalize the images
-    im_left = im_left.astype(float) / 255
-    im_right = im_right.astype(float) / 255
-    # differential phase contrast calculation
-    im_dpc = 0.5 + np.divide(im_left - im_right, im_left + im_right)
-    # take care of errors
-    im_dpc[im_dpc < 0] = 0
-    im_dpc[im_dpc > 1] = 1
-    im_dpc[np.isnan(im_dpc)] = 0
-
-    im_dpc = (im_dpc * 255).astype(np.uint8)
-
-    return im_dpc
+    return compositing.generate_dpc(im_left, im_right)
 
 
 def colorize_mask(mask):
+    from scipy.ndimage import label
+
     # Label the detected objects
     labeled_mask, ___ = label(mask)
     # Color them
@@ -98,6 +91,8 @@ def colorize_mask(mask):
 
 
 def colorize_mask_get_counts(mask):
+    from scipy.ndimage import label
+
     # Label the detected objects
     labeled_mask, no_cells = label(mask)
     # Color them
@@ -153,3 +148,33 @@ def interpolate_plane(triple1, triple2, triple3, point):
 def create_done_file(path):
     with open(os.path.join(path, ".done"), "w") as file:
         pass  # This creates an empty file
+
+
+class _MissingModule:
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attribute):
+        raise ImportError(f"No module named {self._name!r}")
+
+
+def lazy_import(name):
+    """
+    Import module name when one of its attributes is first used, instead of now.  For big optional dependencies
+    (napari, the stitcher) that would otherwise slow down startup even when they aren't used.  If the module isn't
+    installed, using it raises ImportError.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    try:
+        spec = importlib.util.find_spec(name)
+    except ImportError:
+        spec = None
+    if spec is None:
+        return _MissingModule(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
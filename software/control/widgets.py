@@ -1,10 +1,16 @@
 import os
 import sys
+import threading
 from typing import Optional
 
 import squid.logging
 from control.core.core import TrackingController
 from control.microcontroller import Microcontroller
+from control.display_mailbox import DisplayMailbox
+from control.live_statistics import LiveStatisticsWorker
+from control.ome_zarr_browser import AcquisitionBrowser
+from control.tiled_mosaic import TiledMosaic
+from control.zstack_canvas import ZStackCanvas
 from squid.abc import AbstractStage
 from control._def import *
 
@@ -29,14 +35,14 @@ from datetime import datetime
 import itertools
 import shutil
 from PIL import Image, ImageDraw, ImageFont
+from multiprocessing import Queue, Event
+from queue import Empty
 
-if ENABLE_STITCHER:
-    from control.stitcher.stitcher_process import StitcherProcess
-    from control.stitcher.stitcher_parameters import StitchingParameters
-    import napari
-    from napari.utils.colormaps import Colormap, AVAILABLE_COLORMAPS
-    from multiprocessing import Queue, Event
-    from queue import Empty
+from control.utils import lazy_import
+
+# These take seconds to import, so only import them if they're used.
+napari = lazy_import("napari")
+stitcher_process = lazy_import("control.stitcher.stitcher_process")
 
 
 class WrapperWindow(QMainWindow):
@@ -876,6 +882,7 @@ class LiveControlWidget(QFrame):
 
         self.add_components(show_trigger_options, show_display_options, show_autolevel, autolevel, stretch)
         self.setFrameStyle(QFrame.Panel | QFrame.Raised)
+        self.apply_mode_to_hardware = True  # False while the mode is being changed to match the hardware
         self.update_microscope_mode_by_name(self.currentConfiguration.name)
 
         self.is_switching_mode = False  # flag used to prevent from settings being set by twice - from both mode change slot and value change slot; another way is to use blockSignals(True)
@@ -1081,7 +1088,8 @@ class LiveControlWidget(QFrame):
         )
         self.signal_live_configuration.emit(self.currentConfiguration)
         # update the microscope to the current configuration
-        self.liveController.set_microscope_mode(self.currentConfiguration)
+        if self.apply_mode_to_hardware:
+            self.liveController.set_microscope_mode(self.currentConfiguration)
         # update the exposure time and analog gain settings according to the selected configuration
         self.entry_exposureTime.setValue(self.currentConfiguration.exposure_time)
         self.entry_analogGain.setValue(self.currentConfiguration.analog_gain)
@@ -1114,8 +1122,10 @@ class LiveControlWidget(QFrame):
             )
 
     def set_microscope_mode(self, config):
-        # self.liveController.set_microscope_mode(config)
+        # The sender has already set up the hardware for config, so only update the controls.
+        self.apply_mode_to_hardware = False
         self.dropdown_modeSelection.setCurrentText(config.name)
+        self.apply_mode_to_hardware = True
 
     def set_trigger_mode(self, trigger_mode):
         self.dropdown_triggerManu.setCurrentText(trigger_mode)
@@ -1265,6 +1275,11 @@ class RecordingWidget(QFrame):
         self.btn_record.setChecked(False)
         self.btn_record.setDefault(False)
 
+        # What happened to the frames of the recording: saved, dropped, ...
+        self.label_recordingStats = QLabel()
+        self.timer_recordingStats = QTimer()
+        self.timer_recordingStats.setInterval(500)
+
         grid_line1 = QGridLayout()
         grid_line1.addWidget(QLabel("Saving Path"))
         grid_line1.addWidget(self.lineEdit_savingDir, 0, 1)
@@ -1285,6 +1300,7 @@ class RecordingWidget(QFrame):
         self.grid.addLayout(grid_line2)
         self.grid.addLayout(grid_line3)
         self.grid.addWidget(self.btn_record)
+        self.grid.addWidget(self.label_recordingStats)
         self.setLayout(self.grid)
 
         # add and display a timer - to be implemented
@@ -1296,6 +1312,8 @@ class RecordingWidget(QFrame):
         self.entry_saveFPS.valueChanged.connect(self.streamHandler.set_save_fps)
         self.entry_timeLimit.valueChanged.connect(self.imageSaver.set_recording_time_limit)
         self.imageSaver.stop_recording.connect(self.stop_recording)
+        self.imageSaver.recording_error.connect(self.show_recording_error)
+        self.timer_recordingStats.timeout.connect(self.update_recording_stats)
 
     def set_saving_dir(self):
         dialog = QFileDialog()
@@ -1316,8 +1334,11 @@ class RecordingWidget(QFrame):
             self.btn_setSavingDir.setEnabled(False)
             self.imageSaver.start_new_experiment(self.lineEdit_experimentID.text())
             self.streamHandler.start_recording()
+            self.update_recording_stats()
+            self.timer_recordingStats.start()
         else:
             self.streamHandler.stop_recording()
+            self.imageSaver.finish_recording()
             self.lineEdit_experimentID.setEnabled(True)
             self.btn_setSavingDir.setEnabled(True)
 
@@ -1326,8 +1347,19 @@ class RecordingWidget(QFrame):
         self.lineEdit_experimentID.setEnabled(True)
         self.btn_record.setChecked(False)
         self.streamHandler.stop_recording()
+        self.imageSaver.finish_recording()
         self.btn_setSavingDir.setEnabled(True)
 
+    def update_recording_stats(self):
+        stats = self.imageSaver.get_stats()
+        self.label_recordingStats.setText(stats.describe().capitalize())
+        # Keep updating until everything has been saved
+        if not self.btn_record.isChecked() and stats.buffered_items == 0:
+            self.timer_recordingStats.stop()
+
+    def show_recording_error(self, message):
+        QMessageBox.critical(self, "Recording error", message)
+
 
 class NavigationWidget(QFrame):
     def __init__(
@@ -1858,6 +1890,79 @@ class StatsDisplayWidget(QFrame):
             row += 1
 
 
+class AcquisitionTelemetryWidget(QFrame):
+    """
+    Shows how fast acquisitions are imaging FOVs, and where each FOV's time goes (from squid.logging's spans), so that
+    it's clear which step is worth speeding up.
+    """
+
+    def __init__(self, window_s=ACQUISITION_TELEMETRY_WINDOW_S, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.window_s = window_s
+        self.initUI()
+        self.setFrameStyle(QFrame.Panel | QFrame.Raised)
+
+        self.update_timer = QTimer()
+        self.update_timer.setInterval(1000)
+        self.update_timer.timeout.connect(self.update_summary)
+        self.checkbox_enable.setChecked(squid.logging.is_tracing_enabled())
+
+    def initUI(self):
+        self.checkbox_enable = QCheckBox("Record Timing")
+        self.checkbox_enable.toggled.connect(self.set_enabled)
+        self.btn_clear = QPushButton("Clear")
+        self.btn_clear.clicked.connect(self.clear)
+        self.label_rate = QLabel("- FOV/s")
+
+        self.table_widget = QTableWidget()
+        self.table_widget.setColumnCount(3)
+        self.table_widget.setHorizontalHeaderLabels(["Step", "ms / FOV", "%"])
+        self.table_widget.verticalHeader().hide()
+        self.table_widget.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table_widget.setEditTriggers(QAbstractItemView.NoEditTriggers)
+
+        controls = QHBoxLayout()
+        controls.addWidget(self.checkbox_enable)
+        controls.addWidget(self.btn_clear)
+        controls.addStretch()
+        controls.addWidget(self.label_rate)
+
+        self.layout = QVBoxLayout()
+        self.layout.addLayout(controls)
+        self.layout.addWidget(self.table_widget)
+        self.setLayout(self.layout)
+
+    def set_enabled(self, enabled):
+        if enabled:
+            squid.logging.enable_tracing()
+            self.update_timer.start()
+        else:
+            self.update_timer.stop()
+            squid.logging.disable_tracing()
+        self.update_summary()
+
+    def clear(self):
+        squid.logging.clear_spans()
+        self.update_summary()
+
+    def update_summary(self):
+        since_ns = time.perf_counter_ns() - int(self.window_s * 1e9)
+        summary = squid.logging.summarize_spans(squid.logging.get_spans(since_ns))
+        if summary["count"] == 0:
+            self.label_rate.setText("- FOV/s")
+            self.table_widget.setRowCount(0)
+            return
+
+        self.label_rate.setText(f"{summary['rate_per_s']:.2f} FOV/s")
+        breakdown = summary["breakdown_s"]
+        self.table_widget.setRowCount(len(breakdown))
+        for row, (name, seconds) in enumerate(breakdown.items()):
+            percent = 100 * seconds / summary["mean_s"] if summary["mean_s"] > 0 else 0
+            self.table_widget.setItem(row, 0, QTableWidgetItem(name))
+            self.table_widget.setItem(row, 1, QTableWidgetItem(f"{seconds * 1000:.1f}"))
+            self.table_widget.setItem(row, 2, QTableWidgetItem(f"{percent:.0f}"))
+
+
 class FlexibleMultiPointWidget(QFrame):
 
     signal_acquisition_started = Signal(bool)  # true = started, false = finished
@@ -2717,8 +2822,9 @@ class FlexibleMultiPointWidget(QFrame):
 
             # Remove scanCoordinates dictionaries and remove region overlay
             self.scanCoordinates.region_centers.pop(region_id, None)
-            for coord in self.scanCoordinates.region_fov_coordinates.pop(region_id, []):
-                self.navigationViewer.deregister_fov_to_image(coord[0], coord[1])
+            self.navigationViewer.deregister_fovs_to_image(
+                self.scanCoordinates.region_fov_coordinates.pop(region_id, [])
+            )
 
             # Reindex remaining regions and update UI
             for i in range(index, len(self.location_ids)):
@@ -2744,8 +2850,7 @@ class FlexibleMultiPointWidget(QFrame):
 
             print(f"Remaining location IDs: {self.location_ids}")
             for region_id, fov_coords in self.scanCoordinates.region_fov_coordinates.items():
-                for coord in fov_coords:
-                    self.navigationViewer.register_fov_to_image(coord[0], coord[1])
+                self.navigationViewer.register_fovs_to_image(fov_coords)
 
             # Re-enable signals
             self.table_location_list.blockSignals(False)
@@ -2830,8 +2935,7 @@ class FlexibleMultiPointWidget(QFrame):
 
         # Clear all FOVs for this region
         if region_id in self.scanCoordinates.region_fov_coordinates.keys():
-            for coord in self.scanCoordinates.region_fov_coordinates[region_id]:
-                self.navigationViewer.deregister_fov_to_image(coord[0], coord[1])
+            self.navigationViewer.deregister_fovs_to_image(self.scanCoordinates.region_fov_coordinates[region_id])
 
         # Handle the changed value
         val_edit = self.table_location_list.item(row, column).text()
@@ -3531,7 +3635,7 @@ class WellplateMultiPointWidget(QFrame):
     def get_effective_well_size(self):
         well_size = self.scanCoordinates.well_size_mm
         if self.combobox_shape.currentText() == "Circle":
-            fov_size_mm = (self.objectiveStore.get_pixel_size() / 1000) * Acquisition.CROP_WIDTH
+            fov_size_mm = self.objectiveStore.get_fov_size_mm()
             return well_size + fov_size_mm * (1 + math.sqrt(2))
         return well_size
 
@@ -4247,7 +4351,7 @@ class StitcherWidget(QFrame):
         self.stop_event = Event()
         self.acquisition_path = params.input_folder
         try:
-            self.stitcher_process = StitcherProcess(
+            self.stitcher_process = stitcher_process.StitcherProcess(
                 params=params,
                 progress_queue=self.progress_queue,
                 status_queue=self.status_queue,
@@ -4323,7 +4427,7 @@ class StitcherWidget(QFrame):
             ((channel_info["hex"] >> 8) & 0xFF) / 255,
             (channel_info["hex"] & 0xFF) / 255,
         )
-        return Colormap(colors=[c0, c1], controls=[0, 1], name=channel_info["name"])
+        return napari.utils.colormaps.Colormap(colors=[c0, c1], controls=[0, 1], name=channel_info["name"])
 
     def updateContrastLimits(self, channel, min_val, max_val):
         self.contrastManager.update_limits(channel, min_val, max_val)
@@ -4347,8 +4451,8 @@ class StitcherWidget(QFrame):
                     self.extractWavelength(layer_name), {"hex": 0xFFFFFF, "name": "gray"}
                 )
 
-                if channel_info["name"] in AVAILABLE_COLORMAPS:
-                    layer.colormap = AVAILABLE_COLORMAPS[channel_info["name"]]
+                if channel_info["name"] in napari.utils.colormaps.AVAILABLE_COLORMAPS:
+                    layer.colormap = napari.utils.colormaps.AVAILABLE_COLORMAPS[channel_info["name"]]
                 else:
                     layer.colormap = self.generateColormap(channel_info)
 
@@ -4420,6 +4524,7 @@ class NapariLiveWidget(QWidget):
         self.configurationManager = configurationManager
         self.wellSelectionWidget = wellSelectionWidget
         self.live_configuration = self.liveController.currentConfiguration
+        self.apply_mode_to_hardware = True  # False while the mode is being changed to match the hardware
         self.image_width = 0
         self.image_height = 0
         self.dtype = np.uint8
@@ -4433,12 +4538,29 @@ class NapariLiveWidget(QWidget):
         self.fps_trigger = 10
         self.fps_display = 10
         self.contrastManager = contrastManager
+        self.autolevel = autolevel
+        # pg.ColorMaps for the histogram, by napari colormap name
+        self.histogram_colormaps = {}
+        self.last_colormap = None
+
+        # The histogram (and autolevel) is computed off the GUI thread, from a subsample of the latest frame.
+        self.liveStatisticsWorker = LiveStatisticsWorker()
+        self.liveStatisticsWorker.statistics_ready.connect(self.updateHistogramFromStatistics)
+        # Frames are posted from the camera's thread, and only the latest one is drawn on each refresh.
+        self.displayMailbox = DisplayMailbox(self.updateLiveLayer, parent=self)
+        self.last_presented_count = 0
 
         self.initNapariViewer()
         self.addNapariGrayclipColormap()
         self.initControlWidgets(show_trigger_options, show_display_options, show_autolevel, autolevel)
         self.update_microscope_mode_by_name(self.live_configuration.name)
 
+    def closeEvent(self, event):
+        self.displayMailbox.close()
+        # Stops and joins the statistics thread, so nothing is computed for (or emitted to) a closed widget.
+        self.liveStatisticsWorker.close()
+        super().closeEvent(event)
+
     def initNapariViewer(self):
         self.viewer = napari.Viewer(show=False)
         self.viewerWidget = self.viewer.window._qt_window
@@ -4458,23 +4580,36 @@ class NapariLiveWidget(QWidget):
             self.viewer.window._qt_viewer.layerButtons.hide()
 
     def updateHistogram(self, layer):
+        """Match the histogram's levels and colormap to the layer's.  The bins come from updateHistogramFromStatistics."""
         if self.histogram_widget is not None and layer.data is not None:
-            self.pg_image_item.setImage(layer.data, autoLevels=False)
             self.histogram_widget.setLevels(*layer.contrast_limits)
-            self.histogram_widget.setHistogramRange(layer.data.min(), layer.data.max())
 
             # Set the histogram widget's region to match the layer's contrast limits
             self.histogram_widget.region.setRegion(layer.contrast_limits)
 
             # Update colormap only if it has changed
-            if hasattr(self, "last_colormap") and self.last_colormap != layer.colormap.name:
+            if self.last_colormap != layer.colormap.name:
                 self.histogram_widget.gradient.setColorMap(self.createColorMap(layer.colormap))
             self.last_colormap = layer.colormap.name
 
+    def updateHistogramFromStatistics(self, statistics):
+        if self.histogram_widget is None or "Live View" not in self.viewer.layers:
+            return
+        self.histogram_widget.plot.setData(statistics.bin_edges, statistics.counts)
+        self.histogram_widget.setHistogramRange(statistics.min, statistics.max)
+        if self.autolevel and statistics.high > statistics.low:
+            self.updateContrastLimits(self.live_configuration.name, statistics.low, statistics.high)
+            self.updateHistogram(self.viewer.layers["Live View"])
+
+    def set_autolevel(self, enabled):
+        self.autolevel = enabled
+
     def createColorMap(self, colormap):
-        colors = colormap.colors
-        positions = np.linspace(0, 1, len(colors))
-        return pg.ColorMap(positions, colors)
+        if colormap.name not in self.histogram_colormaps:
+            colors = colormap.colors
+            positions = np.linspace(0, 1, len(colors))
+            self.histogram_colormaps[colormap.name] = pg.ColorMap(positions, colors)
+        return self.histogram_colormaps[colormap.name]
 
     def initControlWidgets(self, show_trigger_options, show_display_options, show_autolevel, autolevel):
         # Initialize histogram widget
@@ -4592,11 +4727,21 @@ class NapariLiveWidget(QWidget):
         self.label_resolutionScaling = QLabel(str(self.slider_resolutionScaling.value()) + "%")
         self.slider_resolutionScaling.valueChanged.connect(lambda v: self.label_resolutionScaling.setText(str(v) + "%"))
 
+        # Display statistics
+        self.label_displayStatistics = QLabel()
+        self.label_displayStatistics.setToolTip(
+            "Frames drawn per second, frames dropped because a newer one arrived first, and the mean (95th "
+            "percentile) time from exposure to display"
+        )
+        self.display_statistics_timer = QTimer(self)
+        self.display_statistics_timer.timeout.connect(self.update_display_statistics)
+
         # Autolevel
         self.btn_autolevel = QPushButton("Autolevel")
         self.btn_autolevel.setCheckable(True)
         self.btn_autolevel.setChecked(autolevel)
         self.btn_autolevel.clicked.connect(self.signal_autoLevelSetting.emit)
+        self.btn_autolevel.clicked.connect(self.set_autolevel)
 
         def make_row(label_widget, entry_widget, value_label=None):
             row = QHBoxLayout()
@@ -4635,6 +4780,9 @@ class NapariLiveWidget(QWidget):
             control_layout.addLayout(row4)
             row5 = make_row(QLabel("Display Resolution"), self.slider_resolutionScaling, self.label_resolutionScaling)
             control_layout.addLayout(row5)
+            row6 = make_row(QLabel("Display"), self.label_displayStatistics)
+            control_layout.addLayout(row6)
+            self.display_statistics_timer.start(1000)
             control_layout.addSpacerItem(QSpacerItem(20, 20, QSizePolicy.Minimum, QSizePolicy.Expanding))
 
         if show_autolevel:
@@ -4742,7 +4890,10 @@ class NapariLiveWidget(QWidget):
         )
 
     def set_microscope_mode(self, config):
+        # The sender has already set up the hardware for config, so only update the controls.
+        self.apply_mode_to_hardware = False
         self.dropdown_modeSelection.setCurrentText(config.name)
+        self.apply_mode_to_hardware = True
 
     def update_microscope_mode_by_name(self, current_microscope_mode_name):
         self.live_configuration = next(
@@ -4754,10 +4905,19 @@ class NapariLiveWidget(QWidget):
             None,
         )
         if self.live_configuration:
-            self.liveController.set_microscope_mode(self.live_configuration)
+            controls = (self.entry_exposureTime, self.entry_analogGain, self.slider_illuminationIntensity)
+            if self.apply_mode_to_hardware:
+                self.liveController.set_microscope_mode(self.live_configuration)
+            else:
+                # Don't let the controls send their new values to the hardware
+                for control in controls:
+                    control.blockSignals(True)
             self.entry_exposureTime.setValue(self.live_configuration.exposure_time)
             self.entry_analogGain.setValue(self.live_configuration.analog_gain)
             self.slider_illuminationIntensity.setValue(int(self.live_configuration.illumination_intensity))
+            for control in controls:
+                control.blockSignals(False)
+            self.label_illuminationIntensity.setText(str(self.slider_illuminationIntensity.value()) + "%")
 
     def update_config_exposure_time(self, new_value):
         self.live_configuration.exposure_time = new_value
@@ -4834,6 +4994,22 @@ class NapariLiveWidget(QWidget):
             self.viewer.camera.zoom = self.previous_scale
             self.viewer.camera.center = self.previous_center
 
+    def postLiveFrame(self, image, from_autofocus=False, timestamp=None):
+        """
+        Leave image to be drawn on the next refresh, replacing any frame that's still waiting.  Can be called from any
+        thread.  timestamp is when the frame was captured (for the latency statistics), or now if None.
+        """
+        self.displayMailbox.post(image, from_autofocus, timestamp=timestamp)
+
+    def update_display_statistics(self):
+        statistics = self.displayMailbox.get_statistics()
+        fps = (statistics.presented - self.last_presented_count) * 1000 / self.display_statistics_timer.interval()
+        self.last_presented_count = statistics.presented
+        text = f"{fps:.0f} fps, {statistics.dropped} dropped"
+        if not np.isnan(statistics.latency_mean_s):
+            text += f", {statistics.latency_mean_s * 1000:.0f} ({statistics.latency_p95_s * 1000:.0f}) ms"
+        self.label_displayStatistics.setText(text)
+
     def updateLiveLayer(self, image, from_autofocus=False):
         """Updates the canvas with the new image data."""
         if self.dtype != np.dtype(image.dtype):
@@ -4859,8 +5035,12 @@ class NapariLiveWidget(QWidget):
 
         layer = self.viewer.layers["Live View"]
         layer.data = image
-        layer.contrast_limits = self.contrastManager.get_limits(self.live_configuration.name)
-        self.updateHistogram(layer)
+        # Setting the limits makes napari (and the histogram) redraw, so only do it when they change.
+        contrast_limits = self.contrastManager.get_limits(self.live_configuration.name)
+        if tuple(layer.contrast_limits) != tuple(contrast_limits):
+            layer.contrast_limits = contrast_limits
+            self.updateHistogram(layer)
+        self.liveStatisticsWorker.submit(image)
 
         if from_autofocus:
             # save viewer scale
@@ -4941,6 +5121,13 @@ class NapariMultiChannelWidget(QWidget):
         self.viewer_scale_initialized = False
         self.update_layer_count = 0
         self.grid_enabled = grid_enabled
+        # The z stack of every channel, allocated at the start of each acquisition within a fixed memory budget
+        self.canvas = ZStackCanvas()
+        # Only the latest image of each channel and z level is drawn on each refresh.
+        self.displayMailbox = DisplayMailbox(self.updateLayers, parent=self)
+        # The initLayers arguments posted by postLayersInit, for before the next image is drawn
+        self._pending_layers_init = None
+        self._pending_layers_init_lock = threading.Lock()
 
         # Initialize a napari Viewer without showing its standalone window.
         self.initNapariViewer()
@@ -4997,16 +5184,21 @@ class NapariMultiChannelWidget(QWidget):
             ((channel_info["hex"] >> 8) & 0xFF) / 255,  # Normalize the Green component
             (channel_info["hex"] & 0xFF) / 255,
         )  # Normalize the Blue component
-        return Colormap(colors=[c0, c1], controls=[0, 1], name=channel_info["name"])
+        return napari.utils.colormaps.Colormap(colors=[c0, c1], controls=[0, 1], name=channel_info["name"])
 
-    def initLayers(self, image_height, image_width, image_dtype):
-        """Initializes the full canvas for each channel based on the acquisition parameters."""
-        if self.acquisition_initialized:
-            for layer in list(self.viewer.layers):
-                if layer.name not in self.channels:
-                    self.viewer.layers.remove(layer)
-        else:
-            self.viewer.layers.clear()
+    def postLayersInit(self, image_height, image_width, image_dtype, pixel_shape=()):
+        """
+        Like initLayers, but can be called from any thread (like postLayers): the images still waiting (from the last
+        acquisition) are dropped, and the layers are initialized right before the next image is drawn.
+        """
+        with self._pending_layers_init_lock:
+            self.displayMailbox.discard_waiting()
+            self._pending_layers_init = (image_height, image_width, image_dtype, pixel_shape)
+
+    def initLayers(self, image_height, image_width, image_dtype, pixel_shape=()):
+        """Allocates the canvas for every channel of the acquisition (from initChannels and initLayersShape)."""
+        self.viewer.layers.clear()
+        if not self.acquisition_initialized:
             self.acquisition_initialized = True
             if self.dtype != np.dtype(image_dtype) and not USE_NAPARI_FOR_LIVE_VIEW:
                 self.contrastManager.scale_contrast_limits(image_dtype)
@@ -5014,68 +5206,75 @@ class NapariMultiChannelWidget(QWidget):
         self.image_width = image_width
         self.image_height = image_height
         self.dtype = np.dtype(image_dtype)
+        self.canvas.allocate(sorted(self.channels), self.Nz, image_height, image_width, self.dtype, tuple(pixel_shape))
         self.layers_initialized = True
         self.update_layer_count = 0
 
-    def updateLayers(self, image, x, y, k, channel_name):
-        """Updates the appropriate slice of the canvas with the new image data."""
-        rgb = len(image.shape) == 3
-
-        # Check if the layer exists and has a different dtype
-        if self.dtype != np.dtype(image.dtype):  # or self.viewer.layers[channel_name].data.dtype != image.dtype:
-            # Remove the existing layer
-            self.layers_initialized = False
-            self.acquisition_initialized = False
+    def postLayers(self, image, x, y, k, channel_name):
+        """Leave image to be drawn on the next refresh, replacing the one waiting for its channel and z level."""
+        self.displayMailbox.post(image, x, y, k, channel_name, key=(k, channel_name))
 
-        if not self.layers_initialized:
-            self.initLayers(image.shape[0], image.shape[1], image.dtype)
+    def updateLayers(self, image, x, y, k, channel_name):
+        """Writes the image into slice k of its channel's canvas, and redraws that layer if the slice is showing."""
+        with self._pending_layers_init_lock:
+            pending_layers_init, self._pending_layers_init = self._pending_layers_init, None
+        if pending_layers_init is not None:
+            self.initLayers(*pending_layers_init)
+        if not self.layers_initialized or image.shape[:2] != (self.image_height, self.image_width):
+            self.initLayers(image.shape[0], image.shape[1], image.dtype, image.shape[2:])
+
+        if not self.canvas.fits(channel_name, image):
+            # A channel that wasn't in the plan, or whose images aren't like the first image of the acquisition
+            self.canvas.allocate_channel(channel_name, image.dtype, image.shape[2:])
+            if channel_name in self.viewer.layers:
+                self.viewer.layers.remove(channel_name)
 
         if channel_name not in self.viewer.layers:
             self.channels.add(channel_name)
+            rgb = len(image.shape) == 3
             if rgb:
                 color = None  # RGB images do not need a colormap
-                canvas = np.zeros((self.Nz, self.image_height, self.image_width, 3), dtype=self.dtype)
             else:
                 channel_info = CHANNEL_COLORS_MAP.get(
                     self.extractWavelength(channel_name), {"hex": 0xFFFFFF, "name": "gray"}
                 )
-                if channel_info["name"] in AVAILABLE_COLORMAPS:
-                    color = AVAILABLE_COLORMAPS[channel_info["name"]]
+                if channel_info["name"] in napari.utils.colormaps.AVAILABLE_COLORMAPS:
+                    color = napari.utils.colormaps.AVAILABLE_COLORMAPS[channel_info["name"]]
                 else:
                     color = self.generateColormap(channel_info)
-                canvas = np.zeros((self.Nz, self.image_height, self.image_width), dtype=self.dtype)
 
-            limits = self.getContrastLimits(self.dtype)
+            levels = self.canvas.get_levels(channel_name)
+            pixel_size_um = self.pixel_size_um * self.canvas.downsample_factor
             layer = self.viewer.add_image(
-                canvas,
+                levels if len(levels) > 1 else levels[0],
+                multiscale=len(levels) > 1,
                 name=channel_name,
                 visible=True,
                 rgb=rgb,
                 colormap=color,
-                contrast_limits=limits,
+                contrast_limits=self.contrastManager.get_limits(channel_name),
                 blending="additive",
-                scale=(self.dz_um, self.pixel_size_um, self.pixel_size_um),
+                scale=(self.dz_um, pixel_size_um, pixel_size_um),
             )
-
-            # print(f"multi channel - dz_um:{self.dz_um}, pixel_y_um:{self.pixel_size_um}, pixel_x_um:{self.pixel_size_um}")
-            layer.contrast_limits = self.contrastManager.get_limits(channel_name)
             layer.events.contrast_limits.connect(self.signalContrastLimits)
 
             if not self.viewer_scale_initialized:
                 self.resetView()
                 self.viewer_scale_initialized = True
-            else:
-                layer.refresh()
 
         layer = self.viewer.layers[channel_name]
-        layer.data[k] = image
-        layer.contrast_limits = self.contrastManager.get_limits(channel_name)
+        self.canvas.write(channel_name, k, image)
+        contrast_limits = self.contrastManager.get_limits(channel_name)
+        if tuple(layer.contrast_limits) != tuple(contrast_limits):
+            layer.contrast_limits = contrast_limits
+
+        # Only the slice being shown needs redrawing, and moving to a new slice redraws every layer anyway.
+        showing_k = self.Nz == 1 or self.viewer.dims.current_step[0] == k
+        if showing_k:
+            layer.refresh()
         self.update_layer_count += 1
-        if self.update_layer_count % len(self.channels) == 0:
-            if self.Nz > 1:
-                self.viewer.dims.set_point(0, k * self.dz_um)
-            for layer in self.viewer.layers:
-                layer.refresh()
+        if self.update_layer_count % len(self.channels) == 0 and not showing_k:
+            self.viewer.dims.set_point(0, k * self.dz_um)
 
     def updateRTPLayers(self, image, channel_name):
         """Updates the appropriate slice of the canvas with the new image data."""
@@ -5098,8 +5297,8 @@ class NapariMultiChannelWidget(QWidget):
                 channel_info = CHANNEL_COLORS_MAP.get(
                     self.extractWavelength(channel_name), {"hex": 0xFFFFFF, "name": "gray"}
                 )
-                if channel_info["name"] in AVAILABLE_COLORMAPS:
-                    color = AVAILABLE_COLORMAPS[channel_info["name"]]
+                if channel_info["name"] in napari.utils.colormaps.AVAILABLE_COLORMAPS:
+                    color = napari.utils.colormaps.AVAILABLE_COLORMAPS[channel_info["name"]]
                 else:
                     color = self.generateColormap(channel_info)
                 canvas = np.zeros((self.image_height, self.image_width), dtype=self.dtype)
@@ -5170,10 +5369,22 @@ class NapariMosaicDisplayWidget(QWidget):
         self.dz_um = None
         self.Nz = None
         self.channels = set()
-        self.viewer_extents = []  # [min_y, max_y, min_x, max_x]
+        self.mosaic = None  # TiledMosaic holding the image data of all the layers
         self.top_left_coordinate = None  # [y, x] in mm
         self.mosaic_dtype = None
 
+        # Layers are refreshed from a timer instead of after every FOV, so that a fast scan doesn't spend all its
+        # time redrawing the viewer.
+        self.dirty_layers = set()
+        self.view_needs_reset = False
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(MOSAIC_DISPLAY_REFRESH_INTERVAL_MS)
+        self.refresh_timer.timeout.connect(self.refreshDirtyLayers)
+        # Images are added in batches on each refresh.  Every FOV is its own tile, so none are dropped unless a
+        # position is imaged again before it's drawn.
+        self.displayMailbox = DisplayMailbox(self.updateMosaic, parent=self)
+
     def customizeViewer(self):
         # hide status bar
         if hasattr(self.viewer.window, "_status_bar"):
@@ -5289,7 +5500,11 @@ class NapariMosaicDisplayWidget(QWidget):
             ((channel_info["hex"] >> 8) & 0xFF) / 255,
             (channel_info["hex"] & 0xFF) / 255,
         )
-        return Colormap(colors=[c0, c1], controls=[0, 1], name=channel_info["name"])
+        return napari.utils.colormaps.Colormap(colors=[c0, c1], controls=[0, 1], name=channel_info["name"])
+
+    def postMosaic(self, image, x_mm, y_mm, k, channel_name):
+        """Leave image to be added to the mosaic on the next refresh."""
+        self.displayMailbox.post(image, x_mm, y_mm, k, channel_name, key=(x_mm, y_mm, k, channel_name))
 
     def updateMosaic(self, image, x_mm, y_mm, k, channel_name):
         # calculate pixel size
@@ -5309,17 +5524,14 @@ class NapariMosaicDisplayWidget(QWidget):
         x_mm -= (image.shape[1] * image_pixel_size_mm) / 2
         y_mm -= (image.shape[0] * image_pixel_size_mm) / 2
 
-        if not self.viewer.layers:
-            # initialize first layer
+        if self.mosaic is None:
+            # initialize mosaic
             self.layers_initialized = True
             self.signal_layers_initialized.emit(self.layers_initialized)
             self.viewer_pixel_size_mm = image_pixel_size_mm
-            self.viewer_extents = [
-                y_mm,
-                y_mm + image.shape[0] * image_pixel_size_mm,
-                x_mm,
-                x_mm + image.shape[1] * image_pixel_size_mm,
-            ]
+            self.mosaic = TiledMosaic(
+                image_pixel_size_mm, (y_mm, x_mm), tile_size=MOSAIC_TILE_SIZE, n_levels=MOSAIC_PYRAMID_LEVELS
+            )
             self.top_left_coordinate = [y_mm, x_mm]
             self.mosaic_dtype = image_dtype
         else:
@@ -5333,21 +5545,33 @@ class NapariMosaicDisplayWidget(QWidget):
                     interpolation=cv2.INTER_LINEAR,
                 )
 
+        # write the image into the tiles it overlaps
+        prev_top_left = self.top_left_coordinate.copy() if self.top_left_coordinate else None
+        bounds_changed = self.mosaic.add_image(channel_name, image, y_mm, x_mm)
+        self.top_left_coordinate = list(self.mosaic.get_top_left_mm())
+
+        # get contrast limits
+        min_val, max_val = self.contrastManager.get_limits(channel_name)
+        scaled_min = self.convertValue(min_val, self.contrastManager.acquisition_dtype, self.mosaic_dtype)
+        scaled_max = self.convertValue(max_val, self.contrastManager.acquisition_dtype, self.mosaic_dtype)
+
         if channel_name not in self.viewer.layers:
             # create new layer for channel
             channel_info = CHANNEL_COLORS_MAP.get(
                 self.extractWavelength(channel_name), {"hex": 0xFFFFFF, "name": "gray"}
             )
-            if channel_info["name"] in AVAILABLE_COLORMAPS:
-                color = AVAILABLE_COLORMAPS[channel_info["name"]]
+            if channel_info["name"] in napari.utils.colormaps.AVAILABLE_COLORMAPS:
+                color = napari.utils.colormaps.AVAILABLE_COLORMAPS[channel_info["name"]]
             else:
                 color = self.generateColormap(channel_info)
 
             layer = self.viewer.add_image(
-                np.zeros_like(image),
+                self.mosaic.get_levels(channel_name),
                 name=channel_name,
+                multiscale=True,
                 rgb=len(image.shape) == 3,
                 colormap=color,
+                contrast_limits=(scaled_min, scaled_max),
                 visible=True,
                 blending="additive",
                 scale=(self.viewer_pixel_size_mm * 1000, self.viewer_pixel_size_mm * 1000),
@@ -5355,79 +5579,38 @@ class NapariMosaicDisplayWidget(QWidget):
             layer.mouse_double_click_callbacks.append(self.onDoubleClick)
             layer.events.contrast_limits.connect(self.signalContrastLimits)
 
-        # get layer for channel
-        layer = self.viewer.layers[channel_name]
-
-        # update extents
-        self.viewer_extents[0] = min(self.viewer_extents[0], y_mm)
-        self.viewer_extents[1] = max(self.viewer_extents[1], y_mm + image.shape[0] * self.viewer_pixel_size_mm)
-        self.viewer_extents[2] = min(self.viewer_extents[2], x_mm)
-        self.viewer_extents[3] = max(self.viewer_extents[3], x_mm + image.shape[1] * self.viewer_pixel_size_mm)
-
-        # store previous top-left coordinate
-        prev_top_left = self.top_left_coordinate.copy() if self.top_left_coordinate else None
-        self.top_left_coordinate = [self.viewer_extents[0], self.viewer_extents[2]]
-
-        # update layer
-        self.updateLayer(layer, image, x_mm, y_mm, k, prev_top_left)
+        if bounds_changed:
+            self.updateLayerBounds(prev_top_left)
 
         # update contrast limits
-        min_val, max_val = self.contrastManager.get_limits(channel_name)
-        scaled_min = self.convertValue(min_val, self.contrastManager.acquisition_dtype, self.mosaic_dtype)
-        scaled_max = self.convertValue(max_val, self.contrastManager.acquisition_dtype, self.mosaic_dtype)
-        layer.contrast_limits = (scaled_min, scaled_max)
-        layer.refresh()
-
-    def updateLayer(self, layer, image, x_mm, y_mm, k, prev_top_left):
-        # calculate new mosaic size and position
-        mosaic_height = int(math.ceil((self.viewer_extents[1] - self.viewer_extents[0]) / self.viewer_pixel_size_mm))
-        mosaic_width = int(math.ceil((self.viewer_extents[3] - self.viewer_extents[2]) / self.viewer_pixel_size_mm))
-
-        is_rgb = len(image.shape) == 3 and image.shape[2] == 3
-        if layer.data.shape[:2] != (mosaic_height, mosaic_width):
-            # calculate offsets for existing data
-            y_offset = int(math.floor((prev_top_left[0] - self.top_left_coordinate[0]) / self.viewer_pixel_size_mm))
-            x_offset = int(math.floor((prev_top_left[1] - self.top_left_coordinate[1]) / self.viewer_pixel_size_mm))
-
-            for mosaic in self.viewer.layers:
-                if mosaic.name != "Manual ROI":
-                    if len(mosaic.data.shape) == 3 and mosaic.data.shape[2] == 3:
-                        new_data = np.zeros((mosaic_height, mosaic_width, 3), dtype=mosaic.data.dtype)
-                    else:
-                        new_data = np.zeros((mosaic_height, mosaic_width), dtype=mosaic.data.dtype)
-
-                    # ensure offsets don't exceed bounds
-                    y_end = min(y_offset + mosaic.data.shape[0], new_data.shape[0])
-                    x_end = min(x_offset + mosaic.data.shape[1], new_data.shape[1])
-
-                    # shift existing data
-                    if len(mosaic.data.shape) == 3 and mosaic.data.shape[2] == 3:
-                        new_data[y_offset:y_end, x_offset:x_end, :] = mosaic.data[
-                            : y_end - y_offset, : x_end - x_offset, :
-                        ]
-                    else:
-                        new_data[y_offset:y_end, x_offset:x_end] = mosaic.data[: y_end - y_offset, : x_end - x_offset]
-                    mosaic.data = new_data
+        layer = self.viewer.layers[channel_name]
+        if tuple(layer.contrast_limits) != (scaled_min, scaled_max):
+            layer.contrast_limits = (scaled_min, scaled_max)
 
-            if "Manual ROI" in self.viewer.layers:
-                self.update_shape_layer_position(prev_top_left, self.top_left_coordinate)
+        self.dirty_layers.add(channel_name)
+        if not self.refresh_timer.isActive():
+            self.refresh_timer.start()
 
-            self.resetView()
+    def updateLayerBounds(self, prev_top_left):
+        # The mosaic grew, so every layer needs new level arrays with the new shape and origin.  No image data
+        # is copied here, the levels are just views onto the tiles.
+        for layer in self.viewer.layers:
+            if layer.name in self.mosaic.channels:
+                layer.data = self.mosaic.get_levels(layer.name)
 
-        # insert new image
-        y_pos = int(math.floor((y_mm - self.top_left_coordinate[0]) / self.viewer_pixel_size_mm))
-        x_pos = int(math.floor((x_mm - self.top_left_coordinate[1]) / self.viewer_pixel_size_mm))
+        if "Manual ROI" in self.viewer.layers and prev_top_left is not None:
+            self.update_shape_layer_position(prev_top_left, self.top_left_coordinate)
 
-        # ensure indices are within bounds
-        y_end = min(y_pos + image.shape[0], layer.data.shape[0])
-        x_end = min(x_pos + image.shape[1], layer.data.shape[1])
+        self.view_needs_reset = True
 
-        # insert image data
-        if is_rgb:
-            layer.data[y_pos:y_end, x_pos:x_end, :] = image[: y_end - y_pos, : x_end - x_pos, :]
-        else:
-            layer.data[y_pos:y_end, x_pos:x_end] = image[: y_end - y_pos, : x_end - x_pos]
-        layer.refresh()
+    def refreshDirtyLayers(self):
+        if self.view_needs_reset:
+            self.view_needs_reset = False
+            self.viewer.reset_view()
+        for channel_name in self.dirty_layers:
+            if channel_name in self.viewer.layers:
+                self.viewer.layers[channel_name].refresh()
+        self.dirty_layers.clear()
 
     def convertImageDtype(self, image, target_dtype):
         # convert image to target dtype
@@ -5447,9 +5630,9 @@ class NapariMosaicDisplayWidget(QWidget):
         else:
             output_min, output_max = 0.0, 1.0
 
-        # normalize and scale image
-        image_normalized = (image.astype(np.float64) - input_min) / (input_max - input_min)
-        image_scaled = image_normalized * (output_max - output_min) + output_min
+        # normalize and scale image.  float32 is plenty for display, and half the memory traffic of float64.
+        scale = np.float32((output_max - output_min) / (input_max - input_min))
+        image_scaled = (image.astype(np.float32) - np.float32(input_min)) * scale + np.float32(output_min)
 
         return image_scaled.astype(target_dtype)
 
@@ -5499,9 +5682,13 @@ class NapariMosaicDisplayWidget(QWidget):
             self.signal_shape_drawn.emit([])
 
     def clearAllLayers(self):
+        self.displayMailbox.discard_waiting()
         self.clear_shape()
+        self.refresh_timer.stop()
+        self.dirty_layers.clear()
+        self.view_needs_reset = False
         self.viewer.layers.clear()
-        self.viewer_extents = None
+        self.mosaic = None
         self.top_left_coordinate = None
         self.dtype = None
         self.channels = set()
@@ -5519,9 +5706,12 @@ class NapariMosaicDisplayWidget(QWidget):
 class NapariAcquisitionViewerWidget(QWidget):
     def __init__(self, manager_widget=None, parent=None):
         super().__init__(parent)
+        self._log = squid.logging.get_logger(self.__class__.__name__)
         self.viewer = None
         self.current_path = None
         self.acquisition_manager = manager_widget if manager_widget else None
+        # Datasets are read lazily through one chunk cache, and their neighbours are prefetched.
+        self.browser = AcquisitionBrowser()
         self.setup_ui()
 
     def setup_ui(self):
@@ -5547,51 +5737,88 @@ class NapariAcquisitionViewerWidget(QWidget):
         self.setLayout(self.layout)
 
     def show_acquisition(self, path):
-        """Display an OME-ZARR acquisition."""
+        """Display an OME-ZARR acquisition, reusing the layers of the one already showing."""
         if path == self.current_path:
             return
 
+        try:
+            dataset = self.browser.open(path)
+        except Exception as e:
+            self._log.error(f"Couldn't open acquisition {path}: {e}")
+            return
+
+        if self.viewer is None:
+            self.init_viewer()
         self.current_path = path
-        self.close_viewer()
+        self.show_dataset(dataset)
 
-        try:
-            # Initialize viewer
-            self.viewer = napari.Viewer()
+        if self.acquisition_manager:
+            self.browser.prefetch(self.acquisition_manager.get_neighbour_zarr_paths())
 
-            # Show necessary controls
-            self.viewer.window.qt_viewer.dockLayerControls.setVisible(True)
-            self.viewer.window.qt_viewer.dockLayerList.setVisible(True)
+    def init_viewer(self):
+        """Create the viewer, once, the first time an acquisition is shown."""
+        self.viewer = napari.Viewer()
 
-            # Configure window parenting
-            qt_window = self.viewer.window._qt_window
-            qt_window.setParent(self)
+        # Show necessary controls
+        self.viewer.window.qt_viewer.dockLayerControls.setVisible(True)
+        self.viewer.window.qt_viewer.dockLayerList.setVisible(True)
 
-            # Add to viewer layout instead of main layout
-            self.viewer_layout.addWidget(qt_window)
+        # Configure window parenting
+        qt_window = self.viewer.window._qt_window
+        qt_window.setParent(self)
 
-            # Hide unused UI elements
-            if hasattr(self.viewer.window, "_status_bar"):
-                self.viewer.window._status_bar.hide()
-            if hasattr(self.viewer.window._qt_viewer, "layerButtons"):
-                self.viewer.window._qt_viewer.layerButtons.hide()
+        # Add to viewer layout instead of main layout
+        self.viewer_layout.addWidget(qt_window)
 
-            # Load the data
-            self.viewer.open(path, plugin="napari-ome-zarr", chunks=(1, 1, 1, 2048, 2048))
+        # Hide unused UI elements
+        if hasattr(self.viewer.window, "_status_bar"):
+            self.viewer.window._status_bar.hide()
+        if hasattr(self.viewer.window._qt_viewer, "layerButtons"):
+            self.viewer.window._qt_viewer.layerButtons.hide()
 
-            # Configure each layer
-            for layer in self.viewer.layers:
-                self.configure_layer(layer)
+    def show_dataset(self, dataset):
+        """
+        Show each channel of dataset as a multiscale layer.  A layer that already shows that channel (with the same
+        dimensions and dtype) gets the new data, and keeps its contrast limits and the view.
+        """
+        for layer in list(self.viewer.layers):
+            if layer.name not in dataset.channel_names:
+                self.viewer.layers.remove(layer)
+
+        for name in dataset.channel_names:
+            levels = dataset.levels[name]
+            data = levels if len(levels) > 1 else levels[0]
+            layer = self.viewer.layers[name] if name in self.viewer.layers else None
+            if (
+                layer is not None
+                and layer.multiscale == (len(levels) > 1)
+                and layer.ndim == levels[0].ndim
+                and layer.dtype == levels[0].dtype
+            ):
+                layer.data = data
+                layer.scale = dataset.scale
+                continue
 
-        except Exception as e:
-            print(f"Error showing acquisition: {e}")
-            self.close_viewer()
-            self.current_path = None
+            if layer is not None:
+                self.viewer.layers.remove(layer)
+            layer = self.viewer.add_image(
+                data,
+                multiscale=len(levels) > 1,
+                name=name,
+                scale=dataset.scale,
+                blending="additive",
+                # Without limits napari would read the whole coarsest level to compute them
+                contrast_limits=self.get_default_contrast_limits(levels[0].dtype),
+            )
+            self.configure_layer(layer)
+        self.viewer.dims.axis_labels = dataset.axes
 
     def close_viewer(self):
         """Clean up viewer resources."""
         if self.viewer:
             self.viewer.close()
             self.viewer = None
+            self.current_path = None
 
             # Clear only the viewer layout
             while self.viewer_layout.count():
@@ -5599,6 +5826,12 @@ class NapariAcquisitionViewerWidget(QWidget):
                 if item.widget():
                     item.widget().deleteLater()
 
+    def get_default_contrast_limits(self, dtype):
+        if np.issubdtype(dtype, np.integer):
+            info = np.iinfo(dtype)
+            return (info.min, info.max)
+        return (0.0, 1.0)
+
     def configure_layer(self, layer):
         """Configure display settings for a layer."""
         # Get channel info
@@ -5606,18 +5839,14 @@ class NapariAcquisitionViewerWidget(QWidget):
         channel_info = CHANNEL_COLORS_MAP.get(wavelength, {"hex": 0xFFFFFF, "name": "gray"})
 
         # Set colormap
-        if channel_info["name"] in AVAILABLE_COLORMAPS:
-            layer.colormap = AVAILABLE_COLORMAPS[channel_info["name"]]
+        if channel_info["name"] in napari.utils.colormaps.AVAILABLE_COLORMAPS:
+            layer.colormap = napari.utils.colormaps.AVAILABLE_COLORMAPS[channel_info["name"]]
         else:
             layer.colormap = self.generate_colormap(channel_info)
 
         # Set data-type appropriate contrast limits
         if layer.dtype is not None:
-            if np.issubdtype(layer.dtype, np.integer):
-                info = np.iinfo(layer.dtype)
-                layer.contrast_limits = (info.min, info.max)
-            elif np.issubdtype(layer.dtype, np.floating):
-                layer.contrast_limits = (0.0, 1.0)
+            layer.contrast_limits = self.get_default_contrast_limits(layer.dtype)
 
     def extract_wavelength(self, name):
         """Extract channel wavelength from layer name."""
@@ -5648,11 +5877,12 @@ class NapariAcquisitionViewerWidget(QWidget):
         )
 
         # Black to color gradient
-        return Colormap(colors=[(0, 0, 0), c1], controls=[0, 1], name=channel_info["name"])
+        return napari.utils.colormaps.Colormap(colors=[(0, 0, 0), c1], controls=[0, 1], name=channel_info["name"])
 
     def closeEvent(self, event):
         """Handle widget close."""
         self.close_viewer()
+        self.browser.close()
         super().closeEvent(event)
 
     def activate(self):
@@ -5856,6 +6086,27 @@ class AcquisitionManagerWidget(QWidget):
             print(f"Warning: Expected zarr file not found at {full_path}")
             return None
 
+    def get_neighbour_zarr_paths(self):
+        """
+        The zarr paths of the timepoints before and after the current one (in the current region), and of the
+        regions before and after the current one (at the current timepoint), that exist.  Nearest first.
+        """
+        if not self.current_stitched_path or not self.timepoints or not self.regions:
+            return []
+        t = self.timepoint_combo.currentIndex()
+        r = self.region_combo.currentIndex()
+        candidates = []
+        for offset in (1, -1):
+            if 0 <= t + offset < len(self.timepoints):
+                candidates.append((self.timepoints[t + offset], self.regions[r]))
+            if 0 <= r + offset < len(self.regions):
+                candidates.append((self.timepoints[t], self.regions[r + offset]))
+        paths = [
+            os.path.join(self.current_stitched_path, f"{timepoint}_stitched", f"{region}_stitched.ome.zarr")
+            for timepoint, region in candidates
+        ]
+        return [path for path in paths if os.path.exists(path)]
+
     def selection_changed_old(self):
         """Handle changes in timepoint/region selection."""
         if zarr_path := self.get_current_zarr_path():
@@ -5865,22 +6116,8 @@ class AcquisitionManagerWidget(QWidget):
         """Handle changes in timepoint/region selection."""
         zarr_path = self.get_current_zarr_path()
         if zarr_path:
-            print(f"Attempting to open zarr file: {zarr_path}")
-            if os.path.exists(zarr_path):
-                print(f"File exists at path: {zarr_path}")
-                # Check if it's a valid zarr
-                try:
-                    import zarr
-                    store = zarr.open(zarr_path)
-                    if store is not None:
-                        print(f"Valid zarr store found with groups: {list(store.group_keys())}")
-                        self.signal_view_acquisition.emit(zarr_path)
-                    else:
-                        print(f"Warning: Not a valid zarr store at {zarr_path}")
-                except Exception as e:
-                    print(f"Error validating zarr store: {str(e)}")
-            else:
-                print(f"Warning: File does not exist at {zarr_path}")
+            # The viewer opens (and validates) it, reading only what it shows.
+            self.signal_view_acquisition.emit(zarr_path)
 
     def on_acquisition_changed(self, index):
         """Handle acquisition selection changes."""
@@ -6591,6 +6828,7 @@ class MultiCameraRecordingWidget(QFrame):
         else:
             for channel in self.channels:
                 self.streamHandler[channel].stop_recording()
+                self.imageSaver[channel].finish_recording()
             self.lineEdit_experimentID.setEnabled(True)
             self.btn_setSavingDir.setEnabled(True)
 
@@ -6600,6 +6838,7 @@ class MultiCameraRecordingWidget(QFrame):
         self.btn_record.setChecked(False)
         for channel in self.channels:
             self.streamHandler[channel].stop_recording()
+            self.imageSaver[channel].finish_recording()
         self.btn_setSavingDir.setEnabled(True)
 
 
@@ -6627,9 +6866,9 @@ class WaveformDisplay(QFrame):
 
     def plot(self, time, data):
         if self.include_x:
-            self.plotWidget["X"].plot(time, data[0, :], "X", color=(255, 255, 255), clear=True)
+            self.plotWidget["X"].plot(time, data[0, :], "X", color=(255, 255, 255))
         if self.include_y:
-            self.plotWidget["Y"].plot(time, data[1, :], "Y", color=(255, 255, 255), clear=True)
+            self.plotWidget["Y"].plot(time, data[1, :], "Y", color=(255, 255, 255))
 
     def update_N(self, N):
         self.N = N
@@ -6645,9 +6884,22 @@ class PlotWidget(pg.GraphicsLayoutWidget):
         if add_legend:
             self.plotWidget.addLegend()
         self.N = N
+        self.curves = {}
 
     def plot(self, x, y, label, color, clear=False):
-        self.plotWidget.plot(x[-self.N :], y[-self.N :], pen=pg.mkPen(color=color, width=4), name=label, clear=clear)
+        # Reuse the curve for this label instead of creating a new one every update.  pyqtgraph will only draw
+        # the points in view, downsampled to the screen resolution.  The series are plotted whole: the sender picks
+        # the time window (ex: DisplacementMeasurementController decimates the last N readings).
+        curve = self.curves.get(label)
+        if curve is None or clear:
+            if clear:
+                self.plotWidget.clear()
+                self.curves = {}
+            curve = self.plotWidget.plot(pen=pg.mkPen(color=color, width=4), name=label)
+            curve.setDownsampling(auto=True, method="peak")
+            curve.setClipToView(True)
+            self.curves[label] = curve
+        curve.setData(x, y)
 
     def update_N(self, N):
         self.N = N
@@ -101,6 +101,16 @@ class RecordingWidget(QFrame):
         self.btn_record.setChecked(False)
         self.btn_record.setDefault(False)
 
+        # Spectra are recorded to a binary file, which this exports to CSV
+        self.btn_exportCSV = QPushButton("Export CSV")
+        self.btn_exportCSV.setDefault(False)
+        self.btn_exportCSV.setEnabled(False)
+
+        # What happened to the spectra of the recording: saved, dropped, ...
+        self.label_recordingStats = QLabel()
+        self.timer_recordingStats = QTimer()
+        self.timer_recordingStats.setInterval(500)
+
         grid_line1 = QGridLayout()
         grid_line1.addWidget(QLabel("Saving Path"))
         grid_line1.addWidget(self.lineEdit_savingDir, 0, 1)
@@ -116,11 +126,13 @@ class RecordingWidget(QFrame):
         grid_line3.addWidget(QLabel("Time Limit (s)"), 0, 2)
         grid_line3.addWidget(self.entry_timeLimit, 0, 3)
         grid_line3.addWidget(self.btn_record, 0, 4)
+        grid_line3.addWidget(self.btn_exportCSV, 0, 5)
 
         self.grid = QGridLayout()
         self.grid.addLayout(grid_line1, 0, 0)
         self.grid.addLayout(grid_line2, 1, 0)
         self.grid.addLayout(grid_line3, 2, 0)
+        self.grid.addWidget(self.label_recordingStats, 3, 0)
         self.grid.setRowStretch(self.grid.rowCount(), 1)
         self.setLayout(self.grid)
 
@@ -130,9 +142,14 @@ class RecordingWidget(QFrame):
         # connections
         self.btn_setSavingDir.clicked.connect(self.set_saving_dir)
         self.btn_record.clicked.connect(self.toggle_recording)
+        self.btn_exportCSV.clicked.connect(self.export_csv)
         self.entry_saveFPS.valueChanged.connect(self.streamHandler.set_save_fps)
         self.entry_timeLimit.valueChanged.connect(self.imageSaver.set_recording_time_limit)
         self.imageSaver.stop_recording.connect(self.stop_recording)
+        self.imageSaver.recording_error.connect(self.show_recording_error)
+        self.imageSaver.csv_exported.connect(self.show_exported_csv)
+        self.imageSaver.csv_export_failed.connect(self.show_csv_export_error)
+        self.timer_recordingStats.timeout.connect(self.update_recording_stats)
 
     def set_saving_dir(self):
         dialog = QFileDialog()
@@ -153,17 +170,47 @@ class RecordingWidget(QFrame):
             self.btn_setSavingDir.setEnabled(False)
             self.imageSaver.start_new_experiment(self.lineEdit_experimentID.text())
             self.streamHandler.start_recording()
+            self.btn_exportCSV.setEnabled(False)
+            self.update_recording_stats()
+            self.timer_recordingStats.start()
         else:
             self.streamHandler.stop_recording()
+            self.imageSaver.finish_recording()
             self.lineEdit_experimentID.setEnabled(True)
             self.btn_setSavingDir.setEnabled(True)
+            self.btn_exportCSV.setEnabled(True)
 
     # stop_recording can be called by imageSaver
     def stop_recording(self):
         self.lineEdit_experimentID.setEnabled(True)
         self.btn_record.setChecked(False)
         self.streamHandler.stop_recording()
+        self.imageSaver.finish_recording()
         self.btn_setSavingDir.setEnabled(True)
+        self.btn_exportCSV.setEnabled(True)
+
+    def update_recording_stats(self):
+        stats = self.imageSaver.get_stats()
+        self.label_recordingStats.setText(stats.describe().capitalize())
+        # Keep updating until everything has been saved
+        if not self.btn_record.isChecked() and stats.buffered_items == 0:
+            self.timer_recordingStats.stop()
+
+    def export_csv(self):
+        # The export runs on the saving thread, and re-enables the button when it's done
+        self.btn_exportCSV.setEnabled(False)
+        self.imageSaver.export_csv()
+
+    def show_exported_csv(self, csv_path):
+        self.btn_exportCSV.setEnabled(not self.btn_record.isChecked())
+        QMessageBox.information(self, "Export CSV", f"Exported the recording to {csv_path}")
+
+    def show_csv_export_error(self, message):
+        self.btn_exportCSV.setEnabled(not self.btn_record.isChecked())
+        QMessageBox.critical(self, "Export CSV", f"Couldn't export the recording to CSV: {message}")
+
+    def show_recording_error(self, message):
+        QMessageBox.critical(self, "Recording error", message)
 
 
 class SpectrumDisplay(QFrame):
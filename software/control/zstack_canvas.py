@@ -0,0 +1,137 @@
+from typing import Dict, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+import squid.logging
+from control._def import *
+
+
+class ZStackCanvas:
+    """
+    The channel by z level canvas the multichannel view displays, with a fixed memory budget.
+
+    Each channel is stored as a short pyramid of (Nz, height, width[, 3]) arrays, each 2x downsampled from the one
+    before it, for napari to display as a multiscale layer.  The finest level stored (base_level) is picked when the
+    canvas is allocated so that all the planned channels fit in memory_budget_bytes: a small acquisition is kept at
+    full resolution, and a deep stack of a big sensor with lots of channels is kept at 2x, 4x, ... downsampled.
+
+    Everything is allocated once, in allocate, and writing a slice only touches that slice of each level.
+    """
+
+    def __init__(
+        self,
+        memory_budget_bytes: int = MULTICHANNEL_CANVAS_MEMORY_BUDGET_MB * 1024**2,
+        n_levels: int = MULTICHANNEL_CANVAS_DISPLAY_LEVELS,
+        min_level_size: int = MULTICHANNEL_CANVAS_MIN_LEVEL_SIZE,
+    ):
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self.memory_budget_bytes = memory_budget_bytes
+        self.n_levels = n_levels
+        self.min_level_size = min_level_size
+
+        self.Nz = 0
+        self.height = 0
+        self.width = 0
+        self.base_level = 0
+        self._level_shapes: List[Tuple[int, int]] = []
+        # {channel: [level arrays, finest first]}
+        self._levels: Dict[str, List[np.ndarray]] = {}
+
+    @property
+    def channels(self):
+        return list(self._levels.keys())
+
+    @property
+    def downsample_factor(self) -> int:
+        """How many full resolution pixels (along each axis) a pixel of the finest stored level covers."""
+        return 2**self.base_level
+
+    def allocate(
+        self,
+        channels: Sequence[str],
+        Nz: int,
+        height: int,
+        width: int,
+        dtype,
+        pixel_shape: Tuple[int, ...] = (),
+    ):
+        """Throw away everything, and allocate every channel for an acquisition of Nz (height, width) images."""
+        self.clear()
+        self.Nz = max(1, int(Nz))
+        self.height = height
+        self.width = width
+
+        bytes_per_pixel = np.dtype(dtype).itemsize * int(np.prod(pixel_shape, dtype=int))
+        n_channels = max(1, len(channels))
+        self.base_level = 0
+        while True:
+            self._level_shapes = self._get_level_shapes(self.base_level)
+            nbytes = n_channels * self.Nz * bytes_per_pixel * sum(h * w for h, w in self._level_shapes)
+            if nbytes <= self.memory_budget_bytes or self._level_shapes[0] == (1, 1):
+                break
+            self.base_level += 1
+        if self.base_level:
+            self._log.info(
+                f"{n_channels} channels of {self.Nz}x{height}x{width} don't fit in "
+                f"{self.memory_budget_bytes / 1024**2:.0f} MB, displaying them {self.downsample_factor}x downsampled"
+            )
+
+        for channel in channels:
+            self.allocate_channel(channel, dtype, pixel_shape)
+
+    def allocate_channel(self, channel: str, dtype, pixel_shape: Tuple[int, ...] = ()):
+        """(Re)allocate a single channel, ex: one that wasn't planned, or whose images turned out to be rgb."""
+        self._levels[channel] = [
+            np.zeros((self.Nz, h, w) + tuple(pixel_shape), dtype=dtype) for h, w in self._level_shapes
+        ]
+        if self.get_nbytes() > self.memory_budget_bytes:
+            self._log.warning(
+                f"Adding channel {channel} puts the canvas at {self.get_nbytes() / 1024**2:.0f} MB, over its "
+                f"{self.memory_budget_bytes / 1024**2:.0f} MB budget"
+            )
+
+    def fits(self, channel: str, image: np.ndarray) -> bool:
+        """True if image can be written to channel as is (the channel exists, with the same dtype and pixel shape)."""
+        levels = self._levels.get(channel)
+        return levels is not None and levels[0].dtype == image.dtype and levels[0].shape[3:] == image.shape[2:]
+
+    def write(self, channel: str, k: int, image: np.ndarray):
+        """Write a full resolution image into slice k of every level of channel."""
+        levels = self._levels[channel]
+        if image.shape[:2] != (self.height, self.width):
+            raise ValueError(f"Expected a {self.height}x{self.width} image, got {image.shape[0]}x{image.shape[1]}")
+        source = image
+        for level in levels:
+            if level.shape[1:3] != source.shape[:2]:
+                source = self._downsample(source, level.shape[1:3])
+            level[k] = source
+
+    def get_levels(self, channel: str) -> List[np.ndarray]:
+        return self._levels[channel]
+
+    def get_nbytes(self) -> int:
+        return sum(level.nbytes for levels in self._levels.values() for level in levels)
+
+    def clear(self):
+        self._levels.clear()
+
+    def _get_level_shapes(self, base_level: int) -> List[Tuple[int, int]]:
+        shapes = []
+        for level in range(base_level, base_level + self.n_levels):
+            shape = (max(1, self.height >> level), max(1, self.width >> level))
+            # Always keep the finest level, but don't bother with levels napari would never pick.
+            if shapes and min(shape) < self.min_level_size:
+                break
+            shapes.append(shape)
+        return shapes
+
+    @staticmethod
+    def _downsample(image: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+        try:
+            return cv2.resize(image, (shape[1], shape[0]), interpolation=cv2.INTER_AREA)
+        except cv2.error:
+            # cv2 doesn't resize every dtype, so fall back on striding.
+            step_y = max(1, image.shape[0] // shape[0])
+            step_x = max(1, image.shape[1] // shape[1])
+            return image[::step_y, ::step_x][: shape[0], : shape[1]]
@@ -131,6 +131,7 @@ import pydantic
 import squid.logging
 from squid.config import AxisConfig, StageConfig
 from squid.exceptions import SquidTimeout
+from squid.frame_queue import CameraFrame, FrameQueue
 
 
 class Pos(pydantic.BaseModel):
@@ -183,6 +184,13 @@ class AbstractStage(metaclass=abc.ABCMeta):
     def get_pos(self) -> Pos:
         pass
 
+    def get_pos_at(self, timestamp: float) -> Pos:
+        """
+        The position at timestamp (from time.time()), ex: to tag a frame with where the stage was during its
+        exposure.  Stages that don't keep a position history return the current position.
+        """
+        return self.get_pos()
+
     @abc.abstractmethod
     def get_state(self) -> StageStage:
         pass
@@ -225,3 +233,231 @@ class AbstractStage(metaclass=abc.ABCMeta):
         self._log.error(error_message)
 
         raise SquidTimeout(error_message)
+
+
+class SpeedLimitedStage(metaclass=abc.ABCMeta):
+    """
+    For stages that can change how fast x and y move (ex: to sweep x at a constant speed).  Stages that can mix this
+    in next to AbstractStage, and callers check for it with isinstance.
+    """
+
+    @abc.abstractmethod
+    def set_x_max_speed(self, mm_per_s: Optional[float]):
+        """Limit how fast x moves.  None restores the configured MAX_SPEED."""
+        pass
+
+    @abc.abstractmethod
+    def set_y_max_speed(self, mm_per_s: Optional[float]):
+        """Limit how fast y moves.  None restores the configured MAX_SPEED."""
+        pass
+
+
+class AbstractCamera(metaclass=abc.ABCMeta):
+    """
+    The interface (and shared frame plumbing) for cameras.
+
+    Drivers implement the hardware specific methods below, and call _deliver_frame from their SDK's frame callback.
+    That takes care of frame ids, dropping frames while the last one is still locked, and handing the frame to
+    either the external callback (if enabled) or the frame queue that read_frame waits on.
+
+    Frames are kept as the camera packed them (see CameraFrame).  current_frame and read_frame return data scaled
+    to the full range of the dtype for backwards compatibility, but only do that work when they're used.  Consumers
+    that can handle packed data should use current_camera_frame and read_camera_frame instead.
+    """
+
+    # Hardware ROI offsets and sizes (see set_ROI) must be multiples of this
+    ROI_ALIGNMENT = 1
+
+    # The number of significant bits per pixel for each pixel format
+    PIXEL_FORMAT_BIT_DEPTHS = {
+        "MONO8": 8,
+        "MONO10": 10,
+        "MONO12": 12,
+        "MONO14": 14,
+        "MONO16": 16,
+        "BAYER_RG8": 8,
+        "BAYER_RG12": 12,
+        "RGB24": 8,
+        "RGB48": 16,
+    }
+
+    def __init__(self, rotate_image_angle=None, flip_image=None, frame_queue_capacity: int = 4):
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self.rotate_image_angle = rotate_image_angle
+        self.flip_image = flip_image
+
+        self.exposure_time = 1  # unit: ms
+        self.analog_gain = 0
+        self.pixel_format = None
+        self.trigger_mode = None
+        self.is_color = False
+
+        self.frame_ID = -1
+        self.frame_ID_software = -1
+        self.frame_ID_offset_hardware_trigger = 0
+        self.timestamp = 0
+
+        self.image_locked = False
+        self.current_camera_frame: Optional[CameraFrame] = None
+
+        self.callback_is_enabled = False
+        self.is_streaming = False
+        # this determines whether a new frame received will be handled in the streamHandler
+        self.is_live = False
+        self.new_image_callback_external = None
+
+        # Frames delivered while the callback is disabled, for read_frame.
+        self.frame_queue = FrameQueue(frame_queue_capacity)
+        # read_frame returns the first frame with at least this frame_ID_software
+        self._read_from_frame_id = 0
+        self._trigger_pending = False
+
+    @abc.abstractmethod
+    def open(self, index=0):
+        pass
+
+    @abc.abstractmethod
+    def close(self):
+        pass
+
+    @abc.abstractmethod
+    def set_exposure_time(self, exposure_time):
+        pass
+
+    @abc.abstractmethod
+    def set_analog_gain(self, analog_gain):
+        pass
+
+    @abc.abstractmethod
+    def start_streaming(self):
+        pass
+
+    @abc.abstractmethod
+    def stop_streaming(self):
+        pass
+
+    @abc.abstractmethod
+    def set_pixel_format(self, pixel_format):
+        pass
+
+    @abc.abstractmethod
+    def set_continuous_acquisition(self):
+        pass
+
+    @abc.abstractmethod
+    def set_software_triggered_acquisition(self):
+        pass
+
+    @abc.abstractmethod
+    def set_hardware_triggered_acquisition(self):
+        pass
+
+    @abc.abstractmethod
+    def send_trigger(self):
+        """Drivers should call _mark_trigger() right before sending the trigger to the camera."""
+        pass
+
+    @abc.abstractmethod
+    def set_ROI(self, offset_x=None, offset_y=None, width=None, height=None):
+        pass
+
+    def get_is_color(self):
+        return self.is_color
+
+    def get_bit_depth(self) -> Optional[int]:
+        return self.PIXEL_FORMAT_BIT_DEPTHS.get(self.pixel_format)
+
+    def set_callback(self, function):
+        self.new_image_callback_external = function
+
+    def enable_callback(self):
+        self.callback_is_enabled = True
+
+    def disable_callback(self):
+        self.callback_is_enabled = False
+
+    @property
+    def current_frame(self):
+        if self.current_camera_frame is None:
+            return None
+        return self.current_camera_frame.get_normalized()
+
+    @current_frame.setter
+    def current_frame(self, frame):
+        self.current_camera_frame = (
+            None if frame is None else CameraFrame(frame, self.frame_ID_software, self.timestamp)
+        )
+
+    @property
+    def image_is_ready(self):
+        return self.frame_queue.latest_frame_id >= self._read_from_frame_id
+
+    @image_is_ready.setter
+    def image_is_ready(self, is_ready):
+        # Setting this to False means the next read_frame(reset_image_ready_flag=False) waits for a frame that
+        # arrives after now.
+        if not is_ready:
+            self._read_from_frame_id = self.frame_queue.latest_frame_id + 1
+
+    def _mark_trigger(self):
+        """Any frame from before this trigger is stale."""
+        self.image_is_ready = False
+        self._trigger_pending = True
+
+    def _deliver_frame(
+        self, image, bit_depth: Optional[int] = None, frame_id: Optional[int] = None, hardware_triggered=False
+    ) -> bool:
+        """
+        Hand a new frame from the camera to its consumer.  Returns False if the frame was dropped.
+
+        frame_id: The camera's own frame counter, if it has one.  Otherwise frame_ID counts delivered frames.
+        """
+        if self.image_locked:
+            self._log.warning("last image is still being processed, a frame is dropped")
+            self.frame_queue.record_dropped()
+            return False
+
+        self.frame_ID_software += 1
+        self.frame_ID = self.frame_ID + 1 if frame_id is None else frame_id
+        # frame ID for hardware triggered acquisition
+        if hardware_triggered:
+            if self.frame_ID_offset_hardware_trigger is None:
+                self.frame_ID_offset_hardware_trigger = self.frame_ID
+            self.frame_ID = self.frame_ID - self.frame_ID_offset_hardware_trigger
+        self.timestamp = time.time()
+        self.current_camera_frame = CameraFrame(image, self.frame_ID_software, self.timestamp, bit_depth)
+
+        if self.callback_is_enabled and self.new_image_callback_external is not None:
+            self.frame_queue.put(self.current_camera_frame, count_overflow=False)
+            self.new_image_callback_external(self)
+        else:
+            self.frame_queue.put(self.current_camera_frame)
+        return True
+
+    def get_read_timeout_s(self) -> float:
+        return (self.exposure_time / 1000) * 1.02 + 4
+
+    def read_camera_frame(self, reset_image_ready_flag=True, timeout_s=None) -> Optional[CameraFrame]:
+        """
+        Wait for the frame from the last trigger, and return it as the camera packed it.  Returns None on timeout.
+
+        reset_image_ready_flag: If no trigger was sent with send_trigger (ex: for a hardware trigger), wait for a
+            frame that arrives after this call.  Set it to False to wait for the first frame after the last
+            `image_is_ready = False` instead.
+        """
+        if reset_image_ready_flag and not self._trigger_pending:
+            self.image_is_ready = False
+        self._trigger_pending = False
+        frame = self.frame_queue.wait_for_frame(
+            self._read_from_frame_id, self.get_read_timeout_s() if timeout_s is None else timeout_s
+        )
+        if frame is None:
+            self._log.error("read frame timed out")
+            return None
+        self._read_from_frame_id = frame.frame_id + 1
+        return frame
+
+    def read_frame(self, reset_image_ready_flag=True):
+        """Like read_camera_frame, but returns the image scaled to the full range of its dtype."""
+        frame = self.read_camera_frame(reset_image_ready_flag)
+        return None if frame is None else frame.normalize_in_place()
@@ -0,0 +1,266 @@
+"""
+Concurrent, deadline aware bring-up of a set of devices that depend on each other.
+
+Each device is a node with an initialize function, the names of the nodes it depends on, and a timeout.  A node is
+started (on its own thread) as soon as everything it depends on has initialized, and is passed their results, so
+independent devices (ex: the cameras, and the microcontroller and stage homing) come up at the same time.  Steps that
+can't run concurrently, ex: because they all go through the microcontroller's single command channel, should depend
+on each other.
+
+run() records when each node started and how long it took, for a startup timing report.
+"""
+
+import dataclasses
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import squid.logging
+from squid.exceptions import SquidError, SquidTimeout
+
+DEFAULT_DEVICE_TIMEOUT_S = 60.0
+
+
+class DeviceInitializationError(SquidError):
+    def __init__(self, device_name: str, message: str):
+        super().__init__(message)
+        self.device_name = device_name
+
+
+class DeviceInitializationTimeout(DeviceInitializationError, SquidTimeout):
+    pass
+
+
+class DeviceStatus:
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    TIMED_OUT = "timed out"
+    # Not started, because something it depends on (or something else) failed
+    SKIPPED = "skipped"
+
+
+@dataclasses.dataclass
+class DeviceTiming:
+    name: str
+    depends_on: Tuple[str, ...]
+    status: str = DeviceStatus.PENDING
+    # Seconds since the start of run()
+    start_s: Optional[float] = None
+    duration_s: Optional[float] = None
+    error: Optional[BaseException] = None
+
+    @property
+    def end_s(self) -> Optional[float]:
+        if self.start_s is None or self.duration_s is None:
+            return None
+        return self.start_s + self.duration_s
+
+
+@dataclasses.dataclass
+class _Node:
+    name: str
+    initialize: Callable[..., Any]
+    depends_on: Tuple[str, ...]
+    timeout_s: float
+
+
+class DeviceGraph:
+    """
+    A set of devices to initialize, and the dependencies between them.  Add the nodes with add, then call run, which
+    returns {name: what that node's initialize returned}.
+
+    If a node raises, or takes longer than its timeout, no more nodes are started, the ones already running are waited
+    for (up to their own timeouts), and run raises a DeviceInitializationError (a DeviceInitializationTimeout for
+    timeouts) naming the first node that failed.  A thread stuck in a node that timed out can't be stopped, so it's a
+    daemon thread and its result, whenever it finishes, is ignored.
+    """
+
+    def __init__(self, default_timeout_s: float = DEFAULT_DEVICE_TIMEOUT_S):
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self.default_timeout_s = default_timeout_s
+        self._nodes: Dict[str, _Node] = {}
+        self._timings: Dict[str, DeviceTiming] = {}
+        self._wall_time_s: Optional[float] = None
+        # The results of the nodes that initialized in the last run, also available if it failed (ex: to reset a
+        # device that did come up).
+        self.results: Dict[str, Any] = {}
+
+    def __contains__(self, name: str):
+        return name in self._nodes
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._nodes.keys())
+
+    def add(
+        self,
+        name: str,
+        initialize: Callable[..., Any],
+        depends_on: Sequence[str] = (),
+        timeout_s: Optional[float] = None,
+    ):
+        """
+        Add a node called name.  initialize is called with the results of depends_on, in that order, and what it
+        returns is the node's result.  The nodes it depends on can be added later, but must be added before run.
+        """
+        if name in self._nodes:
+            raise ValueError(f"There is already a device called {name}")
+        self._nodes[name] = _Node(
+            name, initialize, tuple(depends_on), self.default_timeout_s if timeout_s is None else timeout_s
+        )
+
+    def get_dependencies(self, name: str) -> Tuple[str, ...]:
+        return self._nodes[name].depends_on
+
+    def run(self) -> Dict[str, Any]:
+        self._check()
+        self.results = {}
+        self._timings = {name: DeviceTiming(name, node.depends_on) for name, node in self._nodes.items()}
+        finished: "queue.Queue[Tuple[str, bool, Any, float]]" = queue.Queue()
+        # {name: deadline} of the nodes that are running
+        running: Dict[str, float] = {}
+        failure: Optional[DeviceInitializationError] = None
+        t0 = time.perf_counter()
+
+        def start_ready_nodes():
+            for name, node in self._nodes.items():
+                timing = self._timings[name]
+                if timing.status != DeviceStatus.PENDING:
+                    continue
+                if not all(self._timings[d].status == DeviceStatus.DONE for d in node.depends_on):
+                    continue
+                args = [self.results[d] for d in node.depends_on]
+                timing.status = DeviceStatus.RUNNING
+                start = time.perf_counter()
+                timing.start_s = start - t0
+                running[name] = start + node.timeout_s
+                threading.Thread(
+                    target=self._initialize, args=(node, args, finished), name=f"initialize {name}", daemon=True
+                ).start()
+
+        start_ready_nodes()
+        while running:
+            try:
+                name, succeeded, value, end = finished.get(
+                    timeout=max(0.0, min(running.values()) - time.perf_counter())
+                )
+            except queue.Empty:
+                now = time.perf_counter()
+                for name, deadline in list(running.items()):
+                    if deadline > now:
+                        continue
+                    del running[name]
+                    timing = self._timings[name]
+                    timing.status = DeviceStatus.TIMED_OUT
+                    timing.duration_s = now - t0 - timing.start_s
+                    timing.error = DeviceInitializationTimeout(
+                        name, f"Initializing {name} timed out after {self._nodes[name].timeout_s} [s]"
+                    )
+                    failure = failure or timing.error
+                continue
+
+            if name not in running:
+                # It already timed out
+                continue
+            del running[name]
+            timing = self._timings[name]
+            timing.duration_s = end - t0 - timing.start_s
+            if succeeded:
+                timing.status = DeviceStatus.DONE
+                self.results[name] = value
+                if failure is None:
+                    start_ready_nodes()
+            else:
+                timing.status = DeviceStatus.FAILED
+                timing.error = value
+                if failure is None:
+                    failure = DeviceInitializationError(name, f"Initializing {name} failed: {value!r}")
+                    failure.__cause__ = value
+
+        self._wall_time_s = time.perf_counter() - t0
+        for timing in self._timings.values():
+            if timing.status == DeviceStatus.PENDING:
+                timing.status = DeviceStatus.SKIPPED
+
+        if failure is not None:
+            self._log.error(self.format_report())
+            raise failure
+        self._log.info(self.format_report())
+        return dict(self.results)
+
+    def get_timings(self) -> List[DeviceTiming]:
+        """The timing of every node in the last run, in the order they started (skipped nodes last)."""
+        return sorted(
+            self._timings.values(), key=lambda timing: float("inf") if timing.start_s is None else timing.start_s
+        )
+
+    def get_critical_path(self) -> List[str]:
+        """
+        The chain of nodes that set how long the last run took: the last node to finish, the dependency of it that
+        finished last, and so on.
+        """
+        finished = [timing for timing in self._timings.values() if timing.end_s is not None]
+        if not finished:
+            return []
+        path = [max(finished, key=lambda timing: timing.end_s)]
+        while True:
+            dependencies = [self._timings[d] for d in path[-1].depends_on if self._timings[d].end_s is not None]
+            if not dependencies:
+                break
+            path.append(max(dependencies, key=lambda timing: timing.end_s))
+        return [timing.name for timing in reversed(path)]
+
+    def format_report(self) -> str:
+        timings = self.get_timings()
+        serial_time_s = sum(timing.duration_s or 0.0 for timing in timings)
+        width = max([len("device")] + [len(timing.name) for timing in timings])
+        lines = [
+            f"Device initialization took {self._wall_time_s or 0.0:.2f} [s] "
+            f"({serial_time_s:.2f} [s] if done one after another)",
+            f"  {'device':<{width}}  {'start [s]':>9}  {'took [s]':>9}  status",
+        ]
+        for timing in timings:
+            start = "" if timing.start_s is None else f"{timing.start_s:.2f}"
+            duration = "" if timing.duration_s is None else f"{timing.duration_s:.2f}"
+            status = timing.status if timing.error is None else f"{timing.status}: {timing.error}"
+            lines.append(f"  {timing.name:<{width}}  {start:>9}  {duration:>9}  {status}")
+        lines.append(f"Critical path: {' -> '.join(self.get_critical_path())}")
+        return "\n".join(lines)
+
+    def _check(self):
+        for node in self._nodes.values():
+            for dependency in node.depends_on:
+                if dependency not in self._nodes:
+                    raise ValueError(f"{node.name} depends on {dependency}, which isn't in the graph")
+
+        # Depth first search for cycles
+        visited = set()
+        in_progress = []
+
+        def visit(name):
+            if name in in_progress:
+                cycle = in_progress[in_progress.index(name) :] + [name]
+                raise ValueError(f"Device dependencies have a cycle: {' -> '.join(cycle)}")
+            if name in visited:
+                return
+            in_progress.append(name)
+            for dependency in self._nodes[name].depends_on:
+                visit(dependency)
+            in_progress.pop()
+            visited.add(name)
+
+        for name in self._nodes:
+            visit(name)
+
+    @staticmethod
+    def _initialize(node: _Node, args: List[Any], finished: queue.Queue):
+        try:
+            with squid.logging.span(f"initialize {node.name}"):
+                value = node.initialize(*args)
+        except Exception as e:
+            finished.put((node.name, False, e, time.perf_counter()))
+        else:
+            finished.put((node.name, True, value, time.perf_counter()))
@@ -0,0 +1,135 @@
+import collections
+import dataclasses
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+
+@dataclasses.dataclass
+class CameraFrame:
+    """
+    A frame as delivered by the camera.  frame holds the pixels as the camera packed them, ex: MONO12 data is 12 bit
+    values in a uint16 array with bit_depth=12.  Consumers that understand that (ex: anything that scales by the
+    actual range of the data) can use frame directly.  Everything else should use get_normalized or
+    normalize_in_place, which scale the data up to the full range of the dtype.
+    """
+
+    frame: np.ndarray
+    # Increments by 1 for every frame the camera delivers, regardless of trigger mode.
+    frame_id: int
+    timestamp: float
+    # The number of significant bits per pixel.  None means the data uses the full range of its dtype.
+    bit_depth: Optional[int] = None
+    _normalized: Optional[np.ndarray] = dataclasses.field(default=None, repr=False, compare=False)
+
+    @property
+    def normalization_shift(self) -> int:
+        """How many bits frame needs to be shifted left to use the full range of its dtype."""
+        if self.bit_depth is None or not np.issubdtype(self.frame.dtype, np.integer):
+            return 0
+        return max(0, self.frame.dtype.itemsize * 8 - self.bit_depth)
+
+    def get_normalized(self) -> np.ndarray:
+        """frame scaled to the full range of its dtype.  Computed on first use, and frame is left as is."""
+        shift = self.normalization_shift
+        if shift == 0:
+            return self.frame
+        if self._normalized is None:
+            self._normalized = np.left_shift(self.frame, shift)
+        return self._normalized
+
+    def normalize_in_place(self) -> np.ndarray:
+        """
+        Like get_normalized, but shifts frame itself (when it is writable) instead of allocating a new array.
+        Afterwards frame is full range, and bit_depth is None.
+        """
+        shift = self.normalization_shift
+        if shift == 0:
+            return self.frame
+        if self._normalized is not None or not self.frame.flags.writeable:
+            self.frame = self.get_normalized()
+        else:
+            np.left_shift(self.frame, shift, out=self.frame)
+        self._normalized = None
+        self.bit_depth = None
+        return self.frame
+
+
+class FrameQueue:
+    """
+    A small bounded queue of the frames a camera has delivered, for readers that wait on a specific frame (ex: the
+    frame for the trigger they just sent) rather than getting every frame through a callback.
+
+    The camera's frame callback calls put(), which wakes any waiting reader immediately (no polling).  If the queue is
+    full, the oldest frame is discarded and counted in dropped_count.  Drivers should also call record_dropped() for
+    frames they discard themselves (ex: because the last frame is still being processed), so that dropped_count is
+    the total number of frames that never reached anyone.
+    """
+
+    def __init__(self, capacity: int = 4):
+        self._frames = collections.deque(maxlen=capacity)
+        self._condition = threading.Condition()
+        self._latest_frame_id = -1
+        self._dropped_count = 0
+        self._delivered_count = 0
+
+    @property
+    def latest_frame_id(self) -> int:
+        """The id of the newest frame put in the queue, or -1 if there hasn't been one."""
+        return self._latest_frame_id
+
+    @property
+    def dropped_count(self) -> int:
+        return self._dropped_count
+
+    @property
+    def delivered_count(self) -> int:
+        return self._delivered_count
+
+    def __len__(self):
+        return len(self._frames)
+
+    def put(self, frame: CameraFrame, count_overflow: bool = True):
+        """
+        count_overflow: Count the frame this pushes out of the queue as dropped.  Pass False if the frame was also
+            handed to a callback, so pushing it out of the queue doesn't mean nobody got it.
+        """
+        with self._condition:
+            if count_overflow and len(self._frames) == self._frames.maxlen:
+                self._dropped_count += 1
+            self._frames.append(frame)
+            self._latest_frame_id = frame.frame_id
+            self._condition.notify_all()
+
+    def record_dropped(self, count: int = 1):
+        with self._condition:
+            self._dropped_count += count
+
+    def get(self, timeout: Optional[float] = None) -> Optional[CameraFrame]:
+        """Take the oldest frame in the queue, waiting up to timeout seconds for one.  Returns None on timeout."""
+        return self.wait_for_frame(-1, timeout)
+
+    def wait_for_frame(self, frame_id: int, timeout: Optional[float] = None) -> Optional[CameraFrame]:
+        """
+        Take the first frame with an id of at least frame_id, waiting up to timeout seconds for it to arrive.  Older
+        frames in the queue are discarded (they're for triggers nobody is waiting on anymore).  Returns None on
+        timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                while self._frames:
+                    frame = self._frames.popleft()
+                    if frame.frame_id >= frame_id:
+                        self._delivered_count += 1
+                        return frame
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def clear(self):
+        with self._condition:
+            self._frames.clear()
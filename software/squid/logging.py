@@ -1,12 +1,18 @@
+import functools
+import json
 import logging as py_logging
 import logging.handlers
 import os.path
 import threading
-from typing import Optional, Type
+import time
+from typing import Dict, List, Optional, Type
 from types import TracebackType
 import sys
+import numpy as np
 import platformdirs
 
+from squid.ring_buffer import RingBuffer
+
 _squid_root_logger_name = "squid"
 _baseline_log_format = "%(asctime)s.%(msecs)03d - %(name)s - %(levelname)s - %(message)s (%(filename)s:%(lineno)d)"
 _baseline_log_dateformat = "%Y-%m-%d %H:%M:%S"
@@ -191,3 +197,209 @@ def add_file_logging(log_filename, replace_existing=False):
         new_handler.doRollover()
 
     return True
+
+
+# Span tracing, to see where the time goes in something like an acquisition: wrap each step in
+# "with squid.logging.span(name):", and the start and duration of each one is recorded (in perf_counter_ns) in a ring
+# buffer.  It's off until enable_tracing is called, and span() then returns a shared do-nothing context manager, so
+# instrumented code only pays for a function call.
+SPAN_DTYPE = np.dtype(
+    [
+        # An index into get_span_names()
+        ("name", "<u4"),
+        ("start_ns", "<i8"),
+        ("duration_ns", "<i8"),
+        ("thread_id", "<u8"),
+        # How many spans this one is nested in, on its thread
+        ("depth", "<u4"),
+    ]
+)
+DEFAULT_SPAN_CAPACITY = 100000
+
+_span_lock = threading.Lock()
+_span_buffer: Optional[RingBuffer] = None
+_span_names: List[str] = []
+_span_name_ids: Dict[str, int] = {}
+_span_thread_state = threading.local()
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("_name_id", "_start_ns", "_depth")
+
+    def __init__(self, name_id: int):
+        self._name_id = name_id
+
+    def __enter__(self):
+        self._depth = getattr(_span_thread_state, "depth", 0)
+        _span_thread_state.depth = self._depth + 1
+        self._start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration_ns = time.perf_counter_ns() - self._start_ns
+        _span_thread_state.depth = self._depth
+        with _span_lock:
+            # Tracing might have been turned off while this span was open.
+            if _span_buffer is not None:
+                _span_buffer.append((self._name_id, self._start_ns, duration_ns, threading.get_ident(), self._depth))
+        return False
+
+
+def _get_span_name_id(name: str) -> int:
+    name_id = _span_name_ids.get(name)
+    if name_id is None:
+        with _span_lock:
+            name_id = _span_name_ids.setdefault(name, len(_span_names))
+            if name_id == len(_span_names):
+                _span_names.append(name)
+    return name_id
+
+
+def span(name: str):
+    """
+    A context manager that records how long its body took as a span called name, if tracing is enabled.  Spans can be
+    nested.
+    """
+    if _span_buffer is None:
+        return _NULL_SPAN
+    return _Span(_get_span_name_id(name))
+
+
+def traced(name: Optional[str] = None):
+    """A decorator that wraps every call of the function in a span, called name or the function's qualified name."""
+
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def enable_tracing(capacity: int = DEFAULT_SPAN_CAPACITY):
+    """Start recording spans, keeping the latest capacity of them.  Spans recorded so far are kept if still enabled."""
+    global _span_buffer
+    with _span_lock:
+        if _span_buffer is None:
+            _span_buffer = RingBuffer(capacity, dtype=SPAN_DTYPE)
+        elif _span_buffer.capacity != capacity:
+            _span_buffer.resize(capacity)
+
+
+def disable_tracing():
+    """Stop recording spans, and drop the ones recorded so far."""
+    global _span_buffer
+    with _span_lock:
+        _span_buffer = None
+
+
+def is_tracing_enabled() -> bool:
+    return _span_buffer is not None
+
+
+def clear_spans():
+    with _span_lock:
+        if _span_buffer is not None:
+            _span_buffer.clear()
+
+
+def get_span_names() -> List[str]:
+    with _span_lock:
+        return list(_span_names)
+
+
+def get_spans(since_ns: Optional[int] = None) -> np.ndarray:
+    """
+    A copy of the recorded spans (SPAN_DTYPE, in the order they ended), optionally only the ones that started at or
+    after since_ns.
+    """
+    with _span_lock:
+        if _span_buffer is None:
+            return np.zeros(0, dtype=SPAN_DTYPE)
+        spans = _span_buffer.get_window().copy()
+    if since_ns is not None:
+        spans = spans[spans["start_ns"] >= since_ns]
+    return spans
+
+
+def summarize_spans(spans: np.ndarray, unit: str = "fov") -> Dict:
+    """
+    How fast units (spans called unit, ex: one per FOV) were done, and where their time went.  Returns a dict with:
+      count: the number of units
+      rate_per_s: units per second of wall time, from the start of the first to the end of the last
+      mean_s: the mean duration of a unit
+      breakdown_s: {name: mean seconds per unit} of the spans directly inside the units, plus "other" for the time
+        in a unit that isn't in any of them.  These are the steps on the critical path of each unit.
+    """
+    names = get_span_names()
+    summary = {"count": 0, "rate_per_s": 0.0, "mean_s": 0.0, "breakdown_s": {}}
+    if unit not in names or not len(spans):
+        return summary
+    units = spans[spans["name"] == names.index(unit)]
+    if not len(units):
+        return summary
+    units = units[np.argsort(units["start_ns"])]
+    unit_ends = units["start_ns"] + units["duration_ns"]
+    summary["count"] = len(units)
+    summary["mean_s"] = float(units["duration_ns"].mean()) / 1e9
+    wall_ns = int(unit_ends.max() - units["start_ns"].min())
+    if wall_ns > 0:
+        summary["rate_per_s"] = len(units) * 1e9 / wall_ns
+
+    # Each unit's direct children are on its thread, one level deeper, and within it.
+    parent = np.searchsorted(units["start_ns"], spans["start_ns"], side="right") - 1
+    has_parent = parent >= 0
+    parent = np.maximum(parent, 0)
+    is_child = (
+        has_parent
+        & (spans["thread_id"] == units["thread_id"][parent])
+        & (spans["depth"] == units["depth"][parent] + 1)
+        & (spans["start_ns"] + spans["duration_ns"] <= unit_ends[parent])
+    )
+    children = spans[is_child]
+    breakdown = {}
+    for name_id in np.unique(children["name"]):
+        breakdown[names[name_id]] = float(children["duration_ns"][children["name"] == name_id].sum()) / 1e9 / len(units)
+    breakdown["other"] = max(0.0, summary["mean_s"] - sum(breakdown.values()))
+    summary["breakdown_s"] = dict(sorted(breakdown.items(), key=lambda item: -item[1]))
+    return summary
+
+
+def export_chrome_trace(path: str, since_ns: Optional[int] = None):
+    """
+    Write the recorded spans as a Chrome trace (JSON), which chrome://tracing or https://ui.perfetto.dev can show.
+    """
+    names = get_span_names()
+    pid = os.getpid()
+    events = [
+        {
+            "name": names[s["name"]],
+            "ph": "X",
+            "ts": s["start_ns"] / 1000,
+            "dur": s["duration_ns"] / 1000,
+            "pid": pid,
+            "tid": int(s["thread_id"]),
+        }
+        for s in get_spans(since_ns)
+    ]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    log.info(f"Wrote {len(events)} spans to '{path}'")
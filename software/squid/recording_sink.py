@@ -0,0 +1,416 @@
+"""
+A bounded buffer between something that produces data to record (ex: a camera at a high frame rate) and a thread that
+writes it out, which can be slower, or stall for a moment (ex: while the disk flushes).
+
+The buffer is bounded by the bytes it holds, not by the number of items, so that it holds as many frames as fit in the
+memory it's given whatever their size.  What happens when it's full is an explicit OverflowPolicy, and every item that
+goes in is accounted for in the stats: written, dropped (and whether it was the oldest or the newest), spilled to a
+scratch file, or failed to write.  The keys of the lost items (ex: frame ids) are kept, so a recording can say exactly
+which frames are missing.
+
+Errors writing an item don't stop the sink (the next item may well be fine), but they aren't swallowed either: the
+first one is logged with its traceback, passed to on_error, and kept in the stats along with how many items failed.
+"""
+
+import collections
+import dataclasses
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Deque, List, Optional, Tuple
+
+import numpy as np
+
+import squid.logging
+from squid.exceptions import SquidError
+
+
+class OverflowPolicy:
+    # The producer waits for room in the buffer.  Nothing is lost, but the producer is slowed down to the writer.
+    BLOCK = "block"
+    # The oldest buffered items are discarded to make room
+    DROP_OLDEST = "drop_oldest"
+    # The new item is discarded
+    DROP_NEWEST = "drop_newest"
+    # The new item's arrays go to a scratch file (ideally on a fast local disk), and are read back when it's written.
+    # Items are dropped (newest) only once the scratch file is full too.
+    SPILL = "spill"
+
+    ALL = (BLOCK, DROP_OLDEST, DROP_NEWEST, SPILL)
+
+
+class RecordingSinkError(SquidError):
+    pass
+
+
+@dataclasses.dataclass
+class RecordingSinkStats:
+    accepted: int = 0
+    written: int = 0
+    failed: int = 0
+    dropped_oldest: int = 0
+    dropped_newest: int = 0
+    # Items that went through the scratch file (they're also counted as written or failed once written)
+    spilled: int = 0
+    # Total time producers spent waiting for room in the buffer
+    blocked_s: float = 0.0
+    buffered_items: int = 0
+    buffered_bytes: int = 0
+    peak_buffered_bytes: int = 0
+    spill_bytes: int = 0
+    # The keys of the items that were dropped or failed, in the order that happened
+    lost_keys: List[Any] = dataclasses.field(default_factory=list)
+    first_error: Optional[BaseException] = None
+
+    @property
+    def dropped(self) -> int:
+        return self.dropped_oldest + self.dropped_newest
+
+    @property
+    def lost(self) -> int:
+        return self.dropped + self.failed
+
+    def describe(self) -> str:
+        text = (
+            f"written {self.written}, dropped {self.dropped}, failed {self.failed}, spilled {self.spilled}, "
+            f"buffered {self.buffered_items} ({self.buffered_bytes / 1024 ** 2:.1f} MB)"
+        )
+        if self.blocked_s > 0:
+            text += f", blocked {self.blocked_s:.2f} s"
+        return text
+
+
+@dataclasses.dataclass
+class _SpilledArray:
+    offset: int
+    shape: Tuple[int, ...]
+    dtype: np.dtype
+
+    @property
+    def nbytes(self) -> int:
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+
+@dataclasses.dataclass
+class _Entry:
+    item: Tuple[Any, ...]
+    key: Any
+    # The bytes this entry holds in memory (0 for spilled entries)
+    nbytes: int
+    # The stats the entry is counted in (the sink's stats when it was put, which reset_stats may have replaced since)
+    stats: RecordingSinkStats
+    spilled: bool = False
+    # For the entries of call_when_written, which have no item
+    callback: Optional[Callable[[RecordingSinkStats], None]] = None
+
+
+def get_item_nbytes(item: Tuple[Any, ...]) -> int:
+    """The memory the arrays in item hold.  Everything else in an item is assumed to be small."""
+    return sum(value.nbytes for value in item if isinstance(value, np.ndarray))
+
+
+class RecordingSink:
+    """
+    put(*item) buffers item, and a worker thread calls write(*item) for each one, in order.
+
+    max_bytes: How much the buffered items can hold in memory.  An item bigger than that is still accepted when
+        nothing else is buffered or being written, so a small buffer doesn't make big items impossible to record.
+    policy: What put does when the buffer is full, one of OverflowPolicy.ALL.
+    spill_dir, max_spill_bytes: Where the scratch file for OverflowPolicy.SPILL goes (the system temp dir if None), and
+        how big it can get.  It's deleted by close.
+    key: Picks what identifies an item in lost_keys out of it (ex: its frame id).  By default items are identified by
+        the order they were put in, counting from 0 (since the sink was made, or its stats were last reset).
+    on_error: Called, on the worker thread, with the first exception write raises.
+    on_idle, idle_interval_s: on_idle is called, on the worker thread, each time it has waited idle_interval_s for an
+        item without one coming (ex: to flush what the writer has batched up, which no item is coming to trigger).
+    """
+
+    def __init__(
+        self,
+        write: Callable[..., None],
+        max_bytes: int,
+        policy: str = OverflowPolicy.DROP_NEWEST,
+        spill_dir: Optional[str] = None,
+        max_spill_bytes: int = 4 * 1024**3,
+        key: Optional[Callable[[Tuple[Any, ...]], Any]] = None,
+        on_error: Optional[Callable[[BaseException], None]] = None,
+        name: str = "RecordingSink",
+        on_idle: Optional[Callable[[], None]] = None,
+        idle_interval_s: float = 1.0,
+    ):
+        if policy not in OverflowPolicy.ALL:
+            raise ValueError(f"Unknown overflow policy {policy!r}, it should be one of {OverflowPolicy.ALL}")
+        self._log = squid.logging.get_logger(name)
+        self._write = write
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        self._key = key
+        self._on_error = on_error
+        self._on_idle = on_idle
+        # How long the worker waits for an item before calling on_idle (forever if there's nothing to call)
+        self._idle_timeout = idle_interval_s if on_idle is not None else None
+
+        self._entries: Deque[_Entry] = collections.deque()
+        self._condition = threading.Condition()
+        self._stats = RecordingSinkStats()
+        # The number of entries the worker has taken but not finished writing
+        self._writing = 0
+        self._closed = False
+
+        self._spill_path: Optional[str] = None
+        self._spill_writer = None
+        self._spill_reader = None
+        # The number of buffered entries that are in the scratch file.  When it gets to 0, the file is emptied.
+        self._spilled_entries = 0
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, *item) -> bool:
+        """
+        Buffer item to be written, following the overflow policy if the buffer is full.  Returns whether item was
+        buffered (False if it was dropped).
+        """
+        nbytes = get_item_nbytes(item)
+        with self._condition:
+            if self._closed:
+                raise RecordingSinkError("Can't put items in a closed recording sink")
+            stats = self._stats
+            key = stats.accepted if self._key is None else self._key(item)
+            stats.accepted += 1
+            if not self._fits(nbytes):
+                if self.policy == OverflowPolicy.BLOCK:
+                    t0 = time.perf_counter()
+                    while not self._fits(nbytes) and not self._closed:
+                        self._condition.wait()
+                    stats.blocked_s += time.perf_counter() - t0
+                    if self._closed:
+                        raise RecordingSinkError("The recording sink was closed while waiting for room in it")
+                elif self.policy == OverflowPolicy.DROP_OLDEST:
+                    while not self._fits(nbytes) and (oldest := self._pop_oldest_item()) is not None:
+                        self._drop(oldest, oldest=True)
+                elif self.policy == OverflowPolicy.SPILL and self._spill(item, key, nbytes):
+                    return True
+                else:
+                    self._lose(stats, key, oldest=False)
+                    return False
+            elif self._spilled_entries:
+                # Once items are spilling, the rest follow them through the scratch file, to keep them in order
+                if self._spill(item, key, nbytes):
+                    return True
+                self._lose(stats, key, oldest=False)
+                return False
+
+            self._append(_Entry(item, key, nbytes, stats))
+            return True
+
+    def call_when_written(self, callback: Callable[[RecordingSinkStats], None]):
+        """
+        Call callback, on the worker thread, once everything put so far has been written.  It's passed a copy of the
+        stats of those items, even if reset_stats has been called since.  Doesn't wait, so the thread that puts items
+        (ex: the GUI's) can use it to finish off a recording (ex: close its file) without waiting for the writes.
+        """
+        with self._condition:
+            if self._closed:
+                raise RecordingSinkError("Can't call back from a closed recording sink")
+            self._entries.append(_Entry((), None, 0, self._stats, callback=callback))
+            self._condition.notify_all()
+
+    def get_stats(self) -> RecordingSinkStats:
+        """A copy of the stats, as of now."""
+        with self._condition:
+            return dataclasses.replace(self._stats, lost_keys=list(self._stats.lost_keys))
+
+    def reset_stats(self):
+        """Start counting from 0 (ex: for a new recording).  What's still buffered stays counted as buffered."""
+        with self._condition:
+            self._stats = RecordingSinkStats(
+                buffered_items=self._stats.buffered_items,
+                buffered_bytes=self._stats.buffered_bytes,
+                peak_buffered_bytes=self._stats.buffered_bytes,
+                spill_bytes=self._stats.spill_bytes,
+            )
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything buffered has been written.  Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._entries or self._writing:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout: Optional[float] = None):
+        """Write everything that's buffered, then stop the worker and delete the scratch file."""
+        self.join(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        self._close_spill_file()
+
+    def _fits(self, nbytes: int) -> bool:
+        buffered_bytes = self._stats.buffered_bytes
+        return buffered_bytes + nbytes <= self.max_bytes or (buffered_bytes == 0 and not self._writing)
+
+    def _pop_oldest_item(self) -> Optional[_Entry]:
+        """Take the oldest buffered item out of the buffer, leaving the call_when_written entries in place."""
+        for index, entry in enumerate(self._entries):
+            if entry.callback is None:
+                del self._entries[index]
+                return entry
+        return None
+
+    def _append(self, entry: _Entry):
+        stats = self._stats
+        self._entries.append(entry)
+        stats.buffered_items += 1
+        stats.buffered_bytes += entry.nbytes
+        stats.peak_buffered_bytes = max(stats.peak_buffered_bytes, stats.buffered_bytes)
+        self._condition.notify_all()
+
+    def _take(self) -> _Entry:
+        stats = self._stats
+        entry = self._entries.popleft()
+        if entry.callback is None:
+            stats.buffered_items -= 1
+            stats.buffered_bytes -= entry.nbytes
+        return entry
+
+    def _drop(self, entry: _Entry, oldest: bool):
+        stats = self._stats
+        stats.buffered_items -= 1
+        stats.buffered_bytes -= entry.nbytes
+        if entry.spilled:
+            self._spilled_entries -= 1
+        self._lose(entry.stats, entry.key, oldest)
+
+    @staticmethod
+    def _lose(stats: RecordingSinkStats, key, oldest: bool):
+        if oldest:
+            stats.dropped_oldest += 1
+        else:
+            stats.dropped_newest += 1
+        stats.lost_keys.append(key)
+
+    def _spill(self, item: Tuple[Any, ...], key, nbytes: int) -> bool:
+        """Put item in the scratch file, if there's room.  Called with the condition held."""
+        if self._stats.spill_bytes + nbytes > self.max_spill_bytes:
+            return False
+        if self._spill_writer is None:
+            fd, self._spill_path = tempfile.mkstemp(prefix="squid_recording_", suffix=".spill", dir=self._spill_dir)
+            self._spill_writer = os.fdopen(fd, "wb")
+            self._spill_reader = open(self._spill_path, "rb")
+
+        spilled_item = []
+        for value in item:
+            if isinstance(value, np.ndarray):
+                offset = self._spill_writer.tell()
+                self._spill_writer.write(np.ascontiguousarray(value).data)
+                value = _SpilledArray(offset, value.shape, value.dtype)
+            spilled_item.append(value)
+        self._spill_writer.flush()
+
+        self._stats.spill_bytes += nbytes
+        self._stats.spilled += 1
+        self._spilled_entries += 1
+        self._append(_Entry(tuple(spilled_item), key, 0, self._stats, spilled=True))
+        return True
+
+    def _unspill(self, entry: _Entry) -> Tuple[Any, ...]:
+        """Read entry's arrays back from the scratch file.  Called with the condition held."""
+        item = []
+        for value in entry.item:
+            if isinstance(value, _SpilledArray):
+                self._spill_reader.seek(value.offset)
+                array = np.empty(value.shape, dtype=value.dtype)
+                self._spill_reader.readinto(array.data)
+                value = array
+            item.append(value)
+        self._spilled_entries -= 1
+        if self._spilled_entries == 0:
+            # Everything in the file has been read back, so start it over
+            self._spill_writer.seek(0)
+            self._spill_writer.truncate()
+            self._stats.spill_bytes = 0
+        return tuple(item)
+
+    def _close_spill_file(self):
+        if self._spill_writer is None:
+            return
+        self._spill_writer.close()
+        self._spill_reader.close()
+        try:
+            os.remove(self._spill_path)
+        except OSError:
+            self._log.warning(f"Couldn't remove the recording scratch file {self._spill_path}")
+        self._spill_writer = None
+        self._spill_reader = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                timed_out = False
+                while not self._entries and not self._closed and not timed_out:
+                    timed_out = not self._condition.wait(self._idle_timeout)
+                if not self._entries:
+                    if self._closed:
+                        return
+                    entry = None
+                else:
+                    entry = self._take()
+                    item = self._unspill(entry) if entry.spilled else entry.item
+                    self._writing += 1
+                    # There's room in the buffer now
+                    self._condition.notify_all()
+                    if entry.callback is not None:
+                        # Everything before it is written, so nothing of what it's called back about is buffered
+                        callback_stats = dataclasses.replace(
+                            entry.stats, lost_keys=list(entry.stats.lost_keys), buffered_items=0, buffered_bytes=0
+                        )
+
+            if entry is None:
+                try:
+                    self._on_idle()
+                except Exception:
+                    self._log.exception("Recording sink idle callback failed")
+                continue
+
+            if entry.callback is not None:
+                try:
+                    entry.callback(callback_stats)
+                except Exception:
+                    self._log.exception("Recording sink callback failed")
+                with self._condition:
+                    self._writing -= 1
+                    self._condition.notify_all()
+                continue
+
+            error = None
+            try:
+                self._write(*item)
+            except Exception as e:
+                error = e
+
+            with self._condition:
+                self._writing -= 1
+                stats = entry.stats
+                if error is None:
+                    stats.written += 1
+                else:
+                    stats.failed += 1
+                    stats.lost_keys.append(entry.key)
+                    first_error = stats.first_error is None
+                    if first_error:
+                        stats.first_error = error
+                self._condition.notify_all()
+
+            if error is not None and first_error:
+                self._log.exception(f"Writing {entry.key} failed, later failures are only counted", exc_info=error)
+                if self._on_error is not None:
+                    self._on_error(error)
@@ -0,0 +1,98 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    A fixed capacity ring buffer for streaming numeric data (ex: a time series of focus measurements).
+
+    Each appended item is a row of shape item_shape, so RingBuffer(1000, (3,)) holds the latest 1000 rows of
+    3 values.  Appending never allocates, and once the buffer is full the oldest rows are overwritten.
+
+    Every row is written to two places in a backing array that is twice the capacity, which means the latest n rows
+    are always contiguous in memory.  That lets get_window and get_decimated return views (no copies) that are
+    ordered from oldest to newest.  A view is only guaranteed to be unchanged until the next append, so copy it if
+    you need to keep it around or hand it to another thread.
+    """
+
+    def __init__(self, capacity: int, item_shape: Tuple[int, ...] = (), dtype=np.float64):
+        if capacity < 1:
+            raise ValueError(f"RingBuffer capacity must be at least 1, got {capacity}")
+        self._capacity = capacity
+        self._item_shape = tuple(item_shape)
+        self._data = np.zeros((2 * capacity,) + self._item_shape, dtype=dtype)
+        self._head = 0  # Index (in [0, capacity)) the next item will be written to
+        self._count = 0
+        self._total_count = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def dtype(self):
+        return self._data.dtype
+
+    @property
+    def total_count(self) -> int:
+        """The number of items appended since creation (or the last clear), including ones that were overwritten."""
+        return self._total_count
+
+    def __len__(self):
+        return self._count
+
+    def append(self, item):
+        self._data[self._head] = item
+        self._data[self._head + self._capacity] = item
+        self._head = (self._head + 1) % self._capacity
+        self._count = min(self._count + 1, self._capacity)
+        self._total_count += 1
+
+    def extend(self, items):
+        items = np.asarray(items, dtype=self._data.dtype)
+        if len(items) > self._capacity:
+            self._total_count += len(items) - self._capacity
+            items = items[-self._capacity :]
+        for item in items:
+            self.append(item)
+
+    def get_window(self, n: Optional[int] = None) -> np.ndarray:
+        """A read only view of the latest n items (or all of them if n is None), oldest first."""
+        n = self._count if n is None else max(0, min(n, self._count))
+        # The latest item is at head - 1, and its mirror is at head - 1 + capacity.  Reading the mirrored half
+        # means [end - n, end) never wraps.
+        end = self._head + self._capacity
+        view = self._data[end - n : end]
+        view.flags.writeable = False
+        return view
+
+    def get_decimated(self, n: Optional[int] = None, max_points: int = 1000) -> np.ndarray:
+        """
+        Like get_window, but strided so that at most max_points items are returned.  The newest item is always
+        included so that the end of a plot doesn't lag behind.
+        """
+        window = self.get_window(n)
+        step = max(1, -(-len(window) // max_points))
+        if step == 1:
+            return window
+        # Anchor the stride on the newest item.
+        return window[(len(window) - 1) % step :: step]
+
+    def get_latest(self):
+        if self._count == 0:
+            raise IndexError("get_latest from empty RingBuffer")
+        return self._data[self._head + self._capacity - 1]
+
+    def resize(self, capacity: int):
+        """Change the capacity, keeping as many of the latest items as fit."""
+        latest = self.get_window(capacity).copy()
+        total_count = self._total_count
+        self.__init__(capacity, self._item_shape, self._data.dtype)
+        self.extend(latest)
+        self._total_count = total_count
+
+    def clear(self):
+        self._head = 0
+        self._count = 0
+        self._total_count = 0
@@ -1,13 +1,15 @@
 import math
 from typing import Optional
 
+import numpy as np
+
 import control.microcontroller
 import control._def as _def
-from squid.abc import AbstractStage, Pos, StageStage
+from squid.abc import AbstractStage, Pos, SpeedLimitedStage, StageStage
 from squid.config import StageConfig, AxisConfig
 
 
-class CephlaStage(AbstractStage):
+class CephlaStage(AbstractStage, SpeedLimitedStage):
     @staticmethod
     def _calc_move_timeout(distance, max_speed):
         # We arbitrarily guess that if a move takes 3x the naive "infinite acceleration" time, then it
@@ -19,6 +21,7 @@ class CephlaStage(AbstractStage):
     def __init__(self, microcontroller: control.microcontroller.Microcontroller, stage_config: StageConfig):
         super().__init__(stage_config)
         self._microcontroller = microcontroller
+        self._usteps_to_real_units: Optional[np.ndarray] = None
 
         # TODO(imo): configure theta here?  Do we ever have theta?
         self._configure_axis(_def.AXIS.X, stage_config.X_AXIS)
@@ -90,13 +93,53 @@ class CephlaStage(AbstractStage):
             )
 
     def get_pos(self) -> Pos:
-        pos_usteps = self._microcontroller.get_pos()
-        x_mm = self._config.X_AXIS.convert_to_real_units(pos_usteps[0])
-        y_mm = self._config.Y_AXIS.convert_to_real_units(pos_usteps[1])
-        z_mm = self._config.Z_AXIS.convert_to_real_units(pos_usteps[2])
-        theta_rad = self._config.THETA_AXIS.convert_to_real_units(pos_usteps[3])
+        return self._usteps_to_pos(self._microcontroller.get_pos())
+
+    def _usteps_to_pos(self, pos_usteps) -> Pos:
+        return Pos(
+            x_mm=self._config.X_AXIS.convert_to_real_units(pos_usteps[0]),
+            y_mm=self._config.Y_AXIS.convert_to_real_units(pos_usteps[1]),
+            z_mm=self._config.Z_AXIS.convert_to_real_units(pos_usteps[2]),
+            theta_rad=self._config.THETA_AXIS.convert_to_real_units(pos_usteps[3]),
+        )
+
+    def get_pos_at(self, timestamp: float) -> Pos:
+        return self._usteps_to_pos(self._microcontroller.get_pos_at(timestamp))
+
+    def get_pos_array(self, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        The current position as [x_mm, y_mm, z_mm, theta_rad], written into out if given.  This skips building a
+        Pos, for callers that read the position at a high rate.
+        """
+        if out is None:
+            out = np.empty(4)
+        out[:] = self._microcontroller.get_pos()
+        out *= self._get_usteps_to_real_units()
+        return out
+
+    def _get_usteps_to_real_units(self) -> np.ndarray:
+        # All the conversions are linear, so they're just a scale factor per axis.
+        if self._usteps_to_real_units is None:
+            self._usteps_to_real_units = np.array(
+                [
+                    axis.convert_to_real_units(1)
+                    for axis in (self._config.X_AXIS, self._config.Y_AXIS, self._config.Z_AXIS, self._config.THETA_AXIS)
+                ]
+            )
+        return self._usteps_to_real_units
 
-        return Pos(x_mm=x_mm, y_mm=y_mm, z_mm=z_mm, theta_rad=theta_rad)
+    def set_x_max_speed(self, mm_per_s: Optional[float]):
+        self._set_max_speed(_def.AXIS.X, self._config.X_AXIS, mm_per_s)
+
+    def set_y_max_speed(self, mm_per_s: Optional[float]):
+        self._set_max_speed(_def.AXIS.Y, self._config.Y_AXIS, mm_per_s)
+
+    def _set_max_speed(self, microcontroller_axis_number: int, axis_config: AxisConfig, mm_per_s: Optional[float]):
+        speed = axis_config.MAX_SPEED if mm_per_s is None else min(mm_per_s, axis_config.MAX_SPEED)
+        self._microcontroller.set_max_velocity_acceleration(
+            microcontroller_axis_number, speed, axis_config.MAX_ACCELERATION
+        )
+        self._microcontroller.wait_till_operation_is_completed()
 
     def get_state(self) -> StageStage:
         return StageStage(busy=self._microcontroller.is_busy())
@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import control.acquisition_index as acquisition_index
+
+
+def append_frames(index, n):
+    for i in range(n):
+        index.append(
+            "A1", i // 2, 0, ["BF", "Fluorescence 488 nm Ex"][i % 2], 1 + i, 2, 3000, timestamp=100 + i, frame_id=i
+        )
+
+
+def test_write_and_load(tmp_path):
+    path = os.path.join(tmp_path, acquisition_index.INDEX_FILE_NAME)
+    # Small enough that it has to grow
+    index = acquisition_index.AcquisitionIndexWriter(path, capacity=3)
+    append_frames(index, 10)
+    assert len(index) == 10
+
+    # Readable while it's still being written
+    records = acquisition_index.load(path)
+    assert len(records) == 10
+    assert records[9]["region"] == b"A1" and records[9]["fov"] == 4
+    assert records[9]["channel"] == b"Fluorescence 488 nm Ex"
+    assert records[9]["x_mm"] == 10 and records[9]["timestamp"] == 109 and records[9]["frame_id"] == 9
+    assert np.isnan(records[9]["z_piezo_um"])
+
+    index.close()
+    assert os.path.getsize(path) == acquisition_index.HEADER_SIZE + 10 * acquisition_index.RECORD_DTYPE.itemsize
+    assert len(acquisition_index.load(path)) == 10
+    with pytest.raises(ValueError):
+        index.append("A1", 0, 0, "BF", 0, 0, 0)
+
+
+def test_file_is_not_mapped_while_it_grows(tmp_path):
+    path = os.path.join(tmp_path, acquisition_index.INDEX_FILE_NAME)
+    index = acquisition_index.AcquisitionIndexWriter(path, capacity=2)
+    truncated = []
+
+    class File:
+        # Windows can't resize a mapped file, so check nothing of it is mapped when it's resized
+        def __init__(self, file):
+            self._file = file
+
+        def truncate(self, size):
+            truncated.append((size, index._header is None and index._records is None))
+            return self._file.truncate(size)
+
+        def __getattr__(self, name):
+            return getattr(self._file, name)
+
+    index._file = File(index._file)
+    append_frames(index, 5)
+    index.close()
+
+    record_size = acquisition_index.RECORD_DTYPE.itemsize
+    sizes = [acquisition_index.HEADER_SIZE + n * record_size for n in (4, 8, 5)]
+    assert truncated == [(size, True) for size in sizes]
+    records = acquisition_index.load(path)
+    assert len(records) == 5 and list(records["frame_id"]) == list(range(5))
+
+
+def test_empty_and_invalid(tmp_path):
+    path = os.path.join(tmp_path, acquisition_index.INDEX_FILE_NAME)
+    with acquisition_index.AcquisitionIndexWriter(path):
+        pass
+    assert len(acquisition_index.load(path)) == 0
+
+    not_an_index = os.path.join(tmp_path, "coordinates.csv")
+    with open(not_an_index, "w") as f:
+        f.write("region,fov\n")
+    with pytest.raises(ValueError):
+        acquisition_index.load(not_an_index)
+
+
+def test_coordinates_csv(tmp_path):
+    path = os.path.join(tmp_path, acquisition_index.INDEX_FILE_NAME)
+    with acquisition_index.AcquisitionIndexWriter(path) as index:
+        append_frames(index, 6)
+    csv_path = os.path.join(tmp_path, "coordinates.csv")
+    acquisition_index.write_coordinates_csv(path, csv_path)
+
+    coordinates = pd.read_csv(csv_path)
+    assert list(coordinates.columns) == ["region", "fov", "z_level", "x (mm)", "y (mm)", "z (um)", "time"]
+    # One row per FOV, at its first channel's position
+    assert list(coordinates["fov"]) == [0, 1, 2]
+    assert list(coordinates["x (mm)"]) == [1, 3, 5]
+    assert list(coordinates["z (um)"]) == [3000] * 3
@@ -0,0 +1,161 @@
+import itertools
+import types
+
+import numpy as np
+import pytest
+
+import control._def
+import control.camera
+import control.simulated_specimen
+from control.camera_geometry import (
+    CameraGeometryCapabilities,
+    OutputGeometry,
+    SoftwareGeometry,
+    configure_camera_geometry,
+    get_camera_capabilities,
+    negotiate_geometry,
+)
+
+
+def _reference_bin(image, binning):
+    height, width = image.shape[0] // binning, image.shape[1] // binning
+    out = np.empty((height, width) + image.shape[2:], dtype=np.float64)
+    for y in range(height):
+        for x in range(width):
+            out[y, x] = image[y * binning : (y + 1) * binning, x * binning : (x + 1) * binning].mean(axis=(0, 1))
+    return out
+
+
+@pytest.mark.parametrize("binning", [1, 2, 3, 4, 5, 6, 8])
+@pytest.mark.parametrize("use_hardware", [True, False])
+def test_negotiation_picks_the_cheapest_path(binning, use_hardware):
+    capabilities = CameraGeometryCapabilities(4000, 3000, hardware_binnings=(1, 2, 4), roi_alignment=8)
+    requested = OutputGeometry(1001, 5000, binning)
+    plan = negotiate_geometry(capabilities, requested, use_hardware)
+
+    # The field of view is clipped to the sensor, and binned
+    assert (plan.output_width, plan.output_height) == (1001 // binning, 3000 // binning)
+    assert plan.binning == binning
+    if use_hardware:
+        # As much binning as possible in the camera, and a ROI just big enough
+        assert plan.hardware_binning == {1: 1, 2: 2, 3: 1, 4: 4, 5: 1, 6: 2, 8: 4}[binning]
+        offset_x, offset_y, width, height = plan.hardware_roi
+        sensor_width, sensor_height = 4000 // plan.hardware_binning, 3000 // plan.hardware_binning
+        assert offset_x % 8 == 0 and offset_y % 8 == 0
+        assert width % 8 == 0 or offset_x + width == sensor_width
+        assert height % 8 == 0 or offset_y + height == sensor_height
+        assert plan.crop_width <= width < plan.crop_width + 16 and offset_x + width <= sensor_width
+        assert (plan.frame_width, plan.frame_height) == (width, height)
+        # The field of view is centred on the sensor, and inside the ROI
+        assert offset_x + plan.crop_x == (sensor_width - plan.crop_width) // 2
+        assert offset_y + plan.crop_y == (sensor_height - plan.crop_height) // 2
+        assert plan.crop_x + plan.crop_width <= width and plan.crop_y + plan.crop_height <= height
+    else:
+        assert plan.hardware_binning == 1 and plan.hardware_roi is None
+        assert (plan.frame_width, plan.frame_height) == (4000, 3000)
+    assert plan.needs_software == (plan.software_binning > 1 or plan.crop_width != plan.frame_width)
+    assert str(plan.output_width) in plan.describe()
+
+
+@pytest.mark.parametrize(
+    "dtype,shape", [(np.uint8, (37, 50)), (np.uint16, (64, 64)), (np.uint8, (30, 41, 3)), (np.float32, (24, 30))]
+)
+@pytest.mark.parametrize("software_binning", [1, 2, 3])
+def test_software_geometry_is_a_centred_crop_and_mean(dtype, shape, software_binning):
+    rng = np.random.default_rng(0)
+    frame = (rng.random(shape) * (255 if dtype == np.uint8 else 4095)).astype(dtype)
+    crop_width, crop_height = 18, 12
+    plan = negotiate_geometry(
+        CameraGeometryCapabilities(shape[1], shape[0], supports_roi=False),
+        OutputGeometry(crop_width, crop_height, software_binning),
+    )
+    geometry = SoftwareGeometry(plan)
+
+    for _ in range(2):
+        out = geometry.apply(frame)
+        assert out.shape[:2] == (plan.output_height, plan.output_width) and out.dtype == dtype
+        top = int(shape[0] / 2 - plan.crop_height / 2)
+        left = int(shape[1] / 2 - plan.crop_width / 2)
+        expected = _reference_bin(frame[top : top + plan.crop_height, left : left + plan.crop_width], software_binning)
+        if np.issubdtype(dtype, np.integer):
+            np.testing.assert_array_equal(out, np.floor(expected + 0.5).astype(dtype))
+        else:
+            np.testing.assert_allclose(out, expected, rtol=1e-5)
+
+
+def test_capabilities_of_cameras_that_bin_by_resolution():
+    toupcam = types.SimpleNamespace(
+        res_list=[(4000, 3000), (2000, 1500), (1000, 750), (1800, 1000)], set_ROI=None, WidthMax=2000, HeightMax=1500
+    )
+    capabilities = get_camera_capabilities(toupcam)
+    assert (capabilities.sensor_width, capabilities.sensor_height) == (4000, 3000)
+    assert capabilities.hardware_binnings == (1, 2, 4)
+    assert capabilities.binning_resolutions[4] == (1000, 750)
+
+    calls = []
+    tucsen = types.SimpleNamespace(
+        binning_options={(6240, 4168): 0, (3120, 2084): 1, (388, 260): 7},
+        set_resolution=lambda *args: calls.append(("set_resolution",) + args),
+        set_ROI=lambda *args: calls.append(("set_ROI",) + args),
+    )
+    plan = configure_camera_geometry(tucsen, OutputGeometry(3000, 3000, 32))
+    assert plan.hardware_binning == 16 and plan.software_binning == 2
+    assert calls[0] == ("set_resolution", 388, 260)
+    assert calls[1][0] == "set_ROI"
+
+
+def test_roi_alignment_comes_from_the_driver():
+    assert get_camera_capabilities(control.camera.Camera_Simulation()).roi_alignment == 1
+    toupcam = types.SimpleNamespace(res_list=[(4000, 3000)], set_ROI=None, ROI_ALIGNMENT=2)
+    assert get_camera_capabilities(toupcam).roi_alignment == 2
+
+
+@pytest.mark.parametrize("binning", [1, 2])
+def test_default_config_leaves_the_camera_as_it_is(binning):
+    camera = control.camera.Camera_Simulation()
+    camera.set_binning(binning)
+    camera.set_ROI(0, 0, 1200, 800)
+    before = (camera.Width, camera.Height, camera.OffsetX, camera.OffsetY, camera.binning)
+
+    plan = configure_camera_geometry(
+        camera,
+        OutputGeometry(
+            control._def.Acquisition.CROP_WIDTH, control._def.Acquisition.CROP_HEIGHT, control._def.CAMERA_BINNING
+        ),
+        use_hardware=control._def.CAMERA_USE_HARDWARE_ROI_AND_BINNING,
+    )
+
+    assert (camera.Width, camera.Height, camera.OffsetX, camera.OffsetY, camera.binning) == before
+    assert plan.hardware_roi is None and plan.binning == binning and plan.software_binning == 1
+    assert (plan.frame_width, plan.frame_height) == (1200, 800)
+    # Like cropping to CROP_WIDTH x CROP_HEIGHT, which is bigger than the frames
+    assert (plan.output_width, plan.output_height) == (1200, 800) and not plan.needs_software
+
+
+def test_simulated_camera_every_combination():
+    specimen = control.simulated_specimen.SyntheticSpecimen.procedural(size=512, focus_z_mm=1.0)
+    for binning, use_hardware, fov in itertools.product(
+        [1, 2, 3, 4, 6, 8], [True, False], [(1000, 600), (4000, 3000), (333, 5000)]
+    ):
+        camera = control.camera.Camera_Simulation(specimen=specimen)
+        camera.set_pixel_format("MONO12")
+        plan = configure_camera_geometry(camera, OutputGeometry(*fov, binning), use_hardware)
+        camera.send_trigger()
+        frame = camera.read_frame()
+        assert frame.shape == (plan.frame_height, plan.frame_width), (binning, use_hardware, fov)
+        out = SoftwareGeometry(plan).apply(frame)
+        assert out.shape == (plan.output_height, plan.output_width), (binning, use_hardware, fov)
+        assert out.dtype == np.uint16
+
+
+def test_hardware_and_software_paths_image_the_same_field_of_view():
+    specimen = control.simulated_specimen.SyntheticSpecimen.procedural(size=512, focus_z_mm=1.0)
+    images = []
+    for use_hardware in [True, False]:
+        camera = control.camera.Camera_Simulation(specimen=specimen)
+        camera.set_exposure_time(50)
+        plan = configure_camera_geometry(camera, OutputGeometry(512, 384, 4), use_hardware)
+        camera.send_trigger()
+        images.append(SoftwareGeometry(plan).apply(camera.read_frame()).astype(np.float32))
+    assert images[0].shape == images[1].shape == (96, 128)
+    assert np.corrcoef(images[0].ravel(), images[1].ravel())[0, 1] > 0.8
@@ -0,0 +1,114 @@
+import time
+
+import numpy as np
+
+import control.camera
+import control.simulated_specimen
+import squid.abc
+
+
+def test_simulated_camera_triggered_read():
+    camera = control.camera.Camera_Simulation()
+    camera.open()
+    camera.start_streaming()
+
+    for _ in range(3):
+        t0 = time.perf_counter()
+        camera.send_trigger()
+        frame = camera.read_frame()
+        assert frame is not None
+        assert time.perf_counter() - t0 < 1
+
+    assert camera.frame_queue.delivered_count == 3
+    assert camera.frame_queue.dropped_count == 0
+
+
+def test_simulated_camera_callback_delivery():
+    camera = control.camera.Camera_Simulation()
+    camera.open()
+    received = []
+    camera.set_callback(lambda cam: received.append(cam.current_frame))
+    camera.enable_callback()
+    camera.start_streaming()
+
+    for _ in range(10):
+        camera.send_trigger()
+    assert len(received) == 10
+    # Frames that went to the callback are also queued for read_frame, but aren't dropped when they age out
+    assert camera.read_frame() is not None
+    assert camera.frame_queue.dropped_count == 0
+
+
+def _make_camera(**kwargs):
+    specimen = control.simulated_specimen.SyntheticSpecimen.procedural(size=512, focus_z_mm=1.0)
+    camera = control.camera.Camera_Simulation(specimen=specimen, **kwargs)
+    camera.open()
+    camera.set_ROI(width=256, height=256)
+    camera.start_streaming()
+    return camera
+
+
+def _snap(camera):
+    camera.send_trigger()
+    return camera.read_frame().astype(np.float32)
+
+
+def test_simulated_camera_images_the_stage_position():
+    pos = squid.abc.Pos(x_mm=0, y_mm=0, z_mm=1.0, theta_rad=0)
+    camera = _make_camera(position_source=lambda: pos)
+    camera.set_exposure_time(40)
+
+    in_focus = _snap(camera)
+    # The same place looks the same, apart from noise
+    assert np.corrcoef(in_focus.ravel(), _snap(camera).ravel())[0, 1] > 0.9
+
+    pos = squid.abc.Pos(x_mm=0.05, y_mm=0, z_mm=1.0, theta_rad=0)
+    assert np.corrcoef(in_focus.ravel(), _snap(camera).ravel())[0, 1] < 0.5
+
+    # Defocus blurs out the contrast
+    pos = squid.abc.Pos(x_mm=0, y_mm=0, z_mm=1.02, theta_rad=0)
+    assert _snap(camera).std() < in_focus.std() / 2
+
+
+def test_simulated_camera_honours_settings():
+    camera = _make_camera()
+    camera.set_exposure_time(5)
+    dim = _snap(camera).mean()
+    camera.set_exposure_time(20)
+    assert _snap(camera).mean() > 3 * dim
+
+    camera.set_pixel_format("MONO12")
+    camera.set_binning(2)
+    camera.set_ROI(width=128, height=64)
+    camera.send_trigger()
+    frame = camera.read_camera_frame()
+    assert frame.frame.shape == (64, 128)
+    assert frame.frame.dtype == np.uint16
+    assert frame.bit_depth == 12
+
+
+def test_simulated_camera_frame_pool():
+    camera = _make_camera()
+    camera.prepare_frame_pool(3)
+    frames = []
+    for _ in range(6):
+        camera.send_trigger()
+        frames.append(camera.read_frame())
+    assert frames[0] is frames[3]
+    assert not frames[0].flags.writeable
+
+
+def test_simulated_camera_timing():
+    camera = _make_camera(simulate_timing=True)
+    camera.set_exposure_time(20)
+    period = camera.get_frame_period_s()
+    assert period > 0.02
+
+    t0 = time.perf_counter()
+    for _ in range(3):
+        camera.send_trigger()
+    # Triggers are queued behind each other, like on a real sensor
+    for _ in range(3):
+        assert camera.read_frame(reset_image_ready_flag=False) is not None
+    assert time.perf_counter() - t0 >= 3 * period * 0.95
+    camera.close()
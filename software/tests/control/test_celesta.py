@@ -0,0 +1,184 @@
+import time
+
+import pytest
+
+import control.celesta
+import control.device_initialization
+import squid.abc
+from control.celesta import CELESTA, CelestaError, CelestaSimulationServer
+from control.microscope import IlluminationController, ShutterControlMode
+
+
+@pytest.fixture
+def server():
+    server = CelestaSimulationServer()
+    yield server
+    server.close()
+
+
+def connect(server, **kwds):
+    return CELESTA(ip=server.ip, port=server.port, **kwds)
+
+
+def set_commands(server):
+    return [command for command in server.commands if command.startswith("SET")]
+
+
+def test_light_source_interface(server):
+    celesta = connect(server)
+
+    assert isinstance(celesta, squid.abc.LightSource)
+    assert celesta.get_status()
+    assert celesta.n_lasers == server.n_lasers
+    assert celesta.get_intensity_range() == [0, server.max_intensity]
+
+    celesta.set_intensity(2, 321.7)
+    assert server.intensities[2] == 321
+    assert celesta.get_intensity(2) == 321
+    celesta.set_intensity(2, 5000)
+    assert celesta.get_intensity(2) == server.max_intensity
+
+    celesta.set_shutter_state(5, on=True)
+    assert server.shutter_states[5] and celesta.get_shutter_state(5)
+    celesta.set_shutter_state(5, on=False)
+    assert not celesta.get_shutter_state(5)
+
+    celesta.set_shutter_control_mode(ShutterControlMode.TTL)
+    assert celesta.get_shutter_control_mode() == ShutterControlMode.TTL
+
+    celesta.shut_down()
+    assert server.intensities == [0] * server.n_lasers
+    assert server.shutter_states == [False] * server.n_lasers
+
+
+def test_commands_share_one_connection(server):
+    celesta = connect(server)
+    for i in range(20):
+        celesta.set_intensity(0, i)
+    celesta.shut_down()
+
+    assert server.connections == 1
+
+
+def test_reconnects_after_the_connection_is_closed(server):
+    celesta = connect(server)
+    celesta.session._connection.sock.close()
+
+    celesta.set_intensity(1, 100)
+    assert server.intensities[1] == 100
+
+
+def test_redundant_commands_are_skipped(server):
+    celesta = connect(server)
+    server.commands.clear()
+
+    celesta.set_intensity(3, 200)
+    celesta.set_intensity(3, 200.4)
+    celesta.set_shutter_state(3, True)
+    celesta.set_shutter_state(3, True)
+    assert set_commands(server) == ["SET CHINT 3 200", "SET CH 3 1"]
+
+    # Changed on the light engine itself
+    server.intensities[3] = 0
+    celesta.invalidate_cache()
+    celesta.set_intensity(3, 200)
+    assert server.intensities[3] == 200
+
+
+def test_refused_command_is_sent_again(server):
+    celesta = connect(server)
+    server.max_intensity = 100
+    server.commands.clear()
+
+    assert not celesta.set_intensity(0, 500)
+    assert not celesta.set_intensity(0, 500)
+    assert set_commands(server) == ["SET CHINT 0 500"] * 2
+
+
+def test_batched_updates(server):
+    celesta = connect(server)
+    server.commands.clear()
+
+    celesta.set_intensities({0: 100, 2: 200, 5: 300})
+    celesta.set_shutter_states({0: True, 5: True})
+    assert set_commands(server) == ["SET MULCHINT 100 0 200 0 0 300 0", "SET MULCH 1 0 0 0 0 1 0"]
+    assert server.intensities == [100, 0, 200, 0, 0, 300, 0]
+
+    # Only what changed is sent, so a single change is a single laser command
+    server.commands.clear()
+    celesta.set_intensities({0: 100, 2: 250, 5: 300})
+    assert set_commands(server) == ["SET CHINT 2 250"]
+
+
+def test_non_blocking_commands_keep_their_order(server):
+    celesta = connect(server, blocking=False)
+    server.commands.clear()
+
+    t0 = time.perf_counter()
+    for i in range(1, 51):
+        celesta.set_intensity(4, i)
+    celesta.set_shutter_state(4, True)
+    queued_s = time.perf_counter() - t0
+    celesta.wait()
+
+    assert set_commands(server) == [f"SET CHINT 4 {i}" for i in range(1, 51)] + ["SET CH 4 1"]
+    assert server.intensities[4] == 50 and server.shutter_states[4]
+    assert queued_s < 0.5
+    celesta.shut_down()
+
+
+def test_queuing_doesnt_wait_for_a_command_in_flight(server):
+    celesta = connect(server, blocking=False)
+    server.response_delay_s = 0.5
+
+    celesta.set_intensity(1, 100)
+    t0 = time.perf_counter()
+    celesta.set_intensity(2, 200)
+    queued_s = time.perf_counter() - t0
+    celesta.wait()
+
+    assert queued_s < 0.25
+    assert server.intensities[1] == 100 and server.intensities[2] == 200
+    server.response_delay_s = 0
+    celesta.shut_down()
+
+
+def test_blocking_mode_is_configurable(monkeypatch):
+    monkeypatch.setattr(control.device_initialization, "CELESTA_BLOCKING", False)
+    celesta = control.device_initialization._initialize_celesta(is_simulation=True)
+
+    assert not celesta.blocking
+    celesta.set_intensity(0, 100)
+    celesta.wait()
+    assert celesta.server.intensities[0] == 100
+    celesta.shut_down()
+
+
+def test_responses_are_parsed_as_json():
+    assert control.celesta.parse_response(b'{"message": "A IP 1.2.3.4"}') == {"message": "A IP 1.2.3.4"}
+    with pytest.raises(CelestaError):
+        control.celesta.parse_response(b"__import__('os').getcwd()")
+    with pytest.raises(CelestaError):
+        control.celesta.parse_response(b"[1, 2]")
+
+
+def test_unreachable_light_engine_is_not_live(server):
+    port = server.port
+    server.close()
+
+    celesta = CELESTA(ip="127.0.0.1", port=port, timeout_s=0.5)
+    assert not celesta.get_status()
+
+
+def test_simulated_celesta_initializes(monkeypatch):
+    monkeypatch.setattr(control.device_initialization, "USE_CELESTA_ETHENET_CONTROL", True)
+    graph = control.device_initialization.build_device_graph(is_simulation=True)
+    devices = graph.run()
+
+    illumination_controller = devices["illuminationController"]
+    assert isinstance(illumination_controller, IlluminationController)
+    assert isinstance(illumination_controller.light_source, control.celesta.CELESTA_Simulation)
+    illumination_controller.set_intensity(488, 50)
+    assert illumination_controller.light_source.server.intensities[2] == 500
+    illumination_controller.close()
+    devices["microcontroller"].close()
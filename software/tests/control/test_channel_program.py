@@ -0,0 +1,87 @@
+import control.camera
+import control.core.core as core
+from control.channel_program import compile_channel_program, parse_wavelength
+from control.microcontroller import Microcontroller, SimSerial
+
+
+def _make_configuration(mode_id, name, exposure_time=10.0, illumination_source=12, intensity=50.0):
+    return core.Configuration(
+        mode_id=mode_id,
+        name=name,
+        exposure_time=exposure_time,
+        analog_gain=0,
+        illumination_source=illumination_source,
+        illumination_intensity=intensity,
+        emission_filter_position=1,
+    )
+
+
+def test_compile_channel_program():
+    assert parse_wavelength("Fluorescence 488 nm Ex") == 488
+    assert parse_wavelength("BF LED matrix full_R") is None
+
+    program = compile_channel_program(_make_configuration("1", "Fluorescence 561 nm Ex"))
+    assert program.wavelength == 561
+    assert program.is_fluorescence
+    assert not program.uses_led_matrix
+
+    program = compile_channel_program(_make_configuration("2", "BF LED matrix full_G", illumination_source=0))
+    assert program.uses_led_matrix
+    assert program.led_matrix_color == (0, 1, 0)
+    assert program.led_array_pattern == "bf"
+
+    program = compile_channel_program(_make_configuration("3", "BF LED matrix left half", illumination_source=1))
+    assert program.led_array_pattern == "dpc.l"
+
+
+def test_live_controller_only_sends_changes():
+    camera = control.camera.Camera_Simulation()
+    camera.open()
+    microcontroller = Microcontroller(existing_serial=SimSerial())
+    live_controller = core.LiveController(camera, microcontroller, None, None)
+
+    calls = []
+    for name in ("set_exposure_time", "set_analog_gain"):
+        method = getattr(camera, name)
+        setattr(camera, name, lambda value, method=method, name=name: (calls.append(name), method(value)))
+    set_illumination = microcontroller.set_illumination
+    microcontroller.set_illumination = lambda *args: (calls.append("set_illumination"), set_illumination(*args))
+
+    fluorescence_488 = _make_configuration("1", "Fluorescence 488 nm Ex")
+    fluorescence_561 = _make_configuration("2", "Fluorescence 561 nm Ex", illumination_source=14)
+    live_controller.compile_channel_programs([fluorescence_488, fluorescence_561])
+
+    live_controller.set_microscope_mode(fluorescence_488)
+    assert sorted(calls) == ["set_analog_gain", "set_exposure_time", "set_illumination"]
+
+    # Only the illumination differs between these two.  The camera settings are always sent.
+    calls.clear()
+    live_controller.set_microscope_mode(fluorescence_561)
+    assert sorted(calls) == ["set_analog_gain", "set_exposure_time", "set_illumination"]
+
+    calls.clear()
+    live_controller.set_microscope_mode(fluorescence_561)
+    assert sorted(calls) == ["set_analog_gain", "set_exposure_time"]
+
+    calls.clear()
+    live_controller.invalidate_hardware_state()
+    live_controller.set_microscope_mode(fluorescence_561)
+    assert sorted(calls) == ["set_analog_gain", "set_exposure_time", "set_illumination"]
+    live_controller.close()
+
+
+def test_exposure_changed_from_the_camera_is_not_kept():
+    camera = control.camera.Camera_Simulation()
+    camera.open()
+    microcontroller = Microcontroller(existing_serial=SimSerial())
+    live_controller = core.LiveController(camera, microcontroller, None, None)
+
+    mode_a = _make_configuration("1", "Fluorescence 488 nm Ex", exposure_time=10.0)
+    mode_b = _make_configuration("2", "Fluorescence 561 nm Ex", exposure_time=10.0, illumination_source=14)
+    live_controller.set_microscope_mode(mode_a)
+    # ex: from the camera settings widget
+    camera.set_exposure_time(20.0)
+    live_controller.set_microscope_mode(mode_b)
+
+    assert camera.exposure_time == 10.0
+    live_controller.close()
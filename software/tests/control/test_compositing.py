@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+import control.compositing as compositing
+
+
+def _legacy_dpc(im_left, im_right):
+    im_left = im_left.astype(float) / 255
+    im_right = im_right.astype(float) / 255
+    with np.errstate(invalid="ignore"):
+        im_dpc = 0.5 + np.divide(im_left - im_right, im_left + im_right)
+    im_dpc[im_dpc < 0] = 0
+    im_dpc[im_dpc > 1] = 1
+    im_dpc[np.isnan(im_dpc)] = 0
+    return (im_dpc * 255).astype(np.uint8)
+
+
+def test_generate_dpc_matches_legacy():
+    rng = np.random.default_rng(0)
+    im_left = rng.integers(0, 256, (64, 80), dtype=np.uint8)
+    im_right = rng.integers(0, 256, (64, 80), dtype=np.uint8)
+    im_left[:4, :4] = 0
+    im_right[:4, :4] = 0
+
+    dpc = compositing.generate_dpc(im_left, im_right)
+    assert dpc.dtype == np.uint8
+    assert np.abs(dpc.astype(int) - _legacy_dpc(im_left, im_right)).max() <= 1
+    assert np.all(dpc[:4, :4] == 0)
+
+
+def test_pseudo_color_matches_legacy():
+    image = np.random.default_rng(1).integers(0, 2**16, (32, 32), dtype=np.uint16)
+    hex_color = 0x20FF80
+    ratios = np.array([(hex_color >> 16) & 0xFF, (hex_color >> 8) & 0xFF, hex_color & 0xFF]) / 255
+    legacy = (np.stack([image] * 3, axis=-1) * ratios).astype(image.dtype)
+
+    colored = compositing.pseudo_color(image, hex_color)
+    assert colored.dtype == np.uint16
+    assert colored.shape == (32, 32, 3)
+    assert np.abs(colored.astype(int) - legacy).max() <= 1
+
+
+def test_saturating_add():
+    for dtype in (np.uint8, np.uint16, np.int32):
+        max_value = np.iinfo(dtype).max
+        accumulator = np.array([[1, max_value - 1]], dtype=dtype)
+        compositing.saturating_add(accumulator, np.array([[2, 5]], dtype=dtype))
+        assert accumulator.tolist() == [[3, max_value]]
+
+
+def test_compositor_reuses_buffers():
+    compositor = compositing.Compositor()
+    image = np.full((16, 16), 200, dtype=np.uint8)
+
+    first = compositor.pseudo_color(image, 0xFFFFFF)
+    assert compositor.pseudo_color(image, 0xFF0000) is first
+
+    merged = compositor.add_to_merged(first)
+    assert compositor.add_to_merged(first) is merged
+    assert compositor.merged_count == 2
+    assert np.all(merged[..., 0] == 255)
+    compositor.reset_merged()
+    assert np.all(compositor.add_to_merged(np.zeros_like(first)) == 0)
+
+    rgb = compositor.merge_rgb(image, image // 2, image // 4)
+    assert rgb[0, 0].tolist() == [200, 100, 50]
+    assert compositor.dpc(image, image)[0, 0] == 127
+
+
+def test_compositor_refuses_to_merge_mismatched_images():
+    compositor = compositing.Compositor()
+    image = np.full((16, 16), 100, dtype=np.uint8)
+
+    merged = compositor.add_to_merged(image)
+    with pytest.raises(ValueError):
+        compositor.add_to_merged(np.zeros((8, 8), dtype=np.uint8))
+    with pytest.raises(ValueError):
+        compositor.add_to_merged(image.astype(np.uint16))
+    # The merge so far is kept
+    assert compositor.merged_count == 1
+    assert compositor.add_to_merged(image) is merged
+    assert np.all(merged == 200)
+
+    # A new merge can have another shape
+    compositor.reset_merged()
+    assert compositor.add_to_merged(np.ones((8, 8, 3), dtype=np.uint16)).shape == (8, 8, 3)
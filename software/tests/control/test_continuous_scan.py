@@ -0,0 +1,124 @@
+import pytest
+
+import control.camera
+import squid.abc
+import squid.config
+import squid.stage.cephla
+import squid.stage.prior
+from squid.abc import Pos
+from control.continuous_scan import RowSweep, plan_illumination_on_time_us, plan_sweep_speed
+from control.microcontroller import Microcontroller, SimSerial
+from control.simulated_specimen import SyntheticSpecimen
+
+
+def test_plan_sweep_speed():
+    # 0.5 px of 0.5 um during a 100 us pulse is 2.5 mm/s
+    assert plan_sweep_speed(0.5, 100, fov_pitch_mm=1, frame_period_s=0.01, max_speed_mm=10) == pytest.approx(2.5)
+    # Limited by the frame rate
+    assert plan_sweep_speed(0.5, 100, fov_pitch_mm=0.02, frame_period_s=0.01, max_speed_mm=10) == pytest.approx(2)
+    # And by the stage
+    assert plan_sweep_speed(5, 10, fov_pitch_mm=1, frame_period_s=0.01, max_speed_mm=10) == 10
+
+
+def test_plan_illumination_on_time_us():
+    # A 20 fps camera 1 mm apart allows 20 mm/s, capped at 10 by the stage.  0.5 px of 0.5 um at 10 mm/s is 25 us,
+    # which is below the minimum.
+    assert plan_illumination_on_time_us(30, 0.5, fov_pitch_mm=1, frame_period_s=0.05, max_speed_mm=10) == 100
+    # 0.2 mm apart allows 4 mm/s, and 0.5 px of 1 um at 4 mm/s is 125 us
+    assert plan_illumination_on_time_us(30, 1, fov_pitch_mm=0.2, frame_period_s=0.05) == pytest.approx(125)
+    # Short exposures are used as is
+    assert plan_illumination_on_time_us(0.05, 1, fov_pitch_mm=0.2, frame_period_s=0.05) == pytest.approx(50)
+
+
+@pytest.fixture
+def stage():
+    microcontroller = Microcontroller(existing_serial=SimSerial(simulate_motion=True))
+    stage = squid.stage.cephla.CephlaStage(microcontroller, squid.config.get_stage_config())
+    yield stage
+    microcontroller.close()
+
+
+@pytest.mark.parametrize("x_mm", [[1.0, 1.2, 1.4, 1.6], [1.6, 1.4, 1.2, 1.0]])
+def test_row_sweep_triggers_at_each_fov(stage, x_mm):
+    camera = control.camera.Camera_Simulation(
+        specimen=SyntheticSpecimen.procedural(size=256), position_source=stage.get_pos
+    )
+    camera.set_ROI(width=64, height=64)
+    camera.start_streaming()
+    frames = []
+
+    def on_trigger(index, trigger_time):
+        frames.append((index, camera.read_camera_frame(timeout_s=1)))
+
+    sweep = RowSweep(stage, camera.send_trigger, speed_mm_s=5, on_trigger=on_trigger)
+    triggers = sweep.run(x_mm, y_mm=0.5)
+
+    assert [trigger.index for trigger in triggers] == [0, 1, 2, 3]
+    assert [index for index, _ in frames] == [0, 1, 2, 3]
+    assert all(frame is not None for _, frame in frames)
+    for trigger, x in zip(triggers, x_mm):
+        # Tagged with where the stage actually was, which is close to (but not exactly at) the FOV
+        assert trigger.pos.x_mm == pytest.approx(x, abs=sweep.max_trigger_error_mm)
+        assert trigger.pos.y_mm == pytest.approx(0.5, abs=0.001)
+
+    # The sweep keeps going past the last FOV, so that it's still at speed there
+    direction = 1 if x_mm[-1] > x_mm[0] else -1
+    assert stage.get_pos().x_mm == pytest.approx(x_mm[-1] + direction * sweep.get_run_up_mm(), abs=0.01)
+
+
+class SteppingStage:
+    """A stage whose x moves step_mm towards its target every time its position is read, so sweeps are repeatable."""
+
+    def __init__(self, step_mm=0.01):
+        self.step_mm = step_mm
+        self.x_mm = 0.0
+        self.target_x_mm = 0.0
+
+    def get_config(self):
+        return squid.config.get_stage_config()
+
+    def move_y_to(self, abs_mm, blocking=True):
+        pass
+
+    def move_x_to(self, abs_mm, blocking=True):
+        self.target_x_mm = abs_mm
+        if blocking:
+            self.x_mm = abs_mm
+
+    def set_x_max_speed(self, mm_per_s):
+        pass
+
+    def get_pos(self):
+        step_mm = min(self.step_mm, abs(self.target_x_mm - self.x_mm))
+        self.x_mm += step_mm if self.target_x_mm > self.x_mm else -step_mm
+        return Pos(x_mm=self.x_mm, y_mm=0, z_mm=0, theta_rad=None)
+
+    def get_pos_at(self, timestamp):
+        return self.get_pos()
+
+
+def test_row_sweep_skips_missed_fovs():
+    stage = SteppingStage()
+
+    def on_trigger(index, trigger_time):
+        if index == 0:
+            # Takes long enough that the stage is 100 um past the next FOV
+            stage.x_mm = 1.2
+
+    sweep = RowSweep(
+        stage, lambda: None, speed_mm_s=5, on_trigger=on_trigger, poll_interval_s=0, max_trigger_error_mm=0.05
+    )
+    triggers = sweep.run([1.0, 1.1, 1.4], y_mm=0)
+    assert triggers[0] is not None and triggers[1] is None and triggers[2] is not None
+
+
+def test_stage_speed_capability(stage):
+    # Continuous scanning needs set_x_max_speed, which only some stages have
+    assert isinstance(stage, squid.abc.SpeedLimitedStage)
+    assert not issubclass(squid.stage.prior.PriorStage, squid.abc.SpeedLimitedStage)
+
+
+def test_row_sweep_abort(stage):
+    sweep = RowSweep(stage, lambda: None, speed_mm_s=5)
+    triggers = sweep.run([1.0, 1.2], y_mm=0, abort=lambda: True)
+    assert triggers == [None, None]
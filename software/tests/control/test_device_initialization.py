@@ -0,0 +1,40 @@
+import control.device_initialization
+import control.microcontroller
+import squid.abc
+from control._def import *
+from squid.device_graph import DeviceStatus
+
+
+def test_simulated_devices_initialize():
+    graph = control.device_initialization.build_device_graph(is_simulation=True)
+    devices = graph.run()
+
+    assert isinstance(devices["microcontroller"], control.microcontroller.Microcontroller)
+    assert isinstance(devices["stage"], squid.abc.AbstractStage)
+    assert devices["stage_homing"] == (HOMING_ENABLED_X and HOMING_ENABLED_Y)
+    assert devices["camera"] is not None
+    assert all(timing.status == DeviceStatus.DONE for timing in graph.get_timings())
+
+
+def test_microcontroller_steps_are_serialized():
+    graph = control.device_initialization.build_device_graph(is_simulation=True)
+
+    def depends_on(name, dependency):
+        dependencies = graph.get_dependencies(name)
+        return dependency in dependencies or any(depends_on(d, dependency) for d in dependencies)
+
+    users = ["stage_homing", "dac"] + (["squid_filter_wheel"] if USE_SQUID_FILTERWHEEL else [])
+    # Each of them waits for the one before it, so they never send commands at the same time.
+    for before, after in zip(users, users[1:]):
+        assert depends_on(after, before)
+    # The camera doesn't wait for the microcontroller
+    assert not graph.get_dependencies("camera")
+
+
+def test_cameras_are_opened_one_at_a_time(monkeypatch):
+    monkeypatch.setattr(control.device_initialization, "SUPPORT_LASER_AUTOFOCUS", True)
+    graph = control.device_initialization.build_device_graph(is_simulation=True)
+
+    assert "camera" in graph.get_dependencies("camera_focus")
+    devices = graph.run()
+    assert devices["camera_focus"] is not None and devices["camera_focus"] is not devices["camera"]
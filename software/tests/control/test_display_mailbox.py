@@ -0,0 +1,141 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+from qtpy.QtWidgets import QApplication
+
+from control.display_mailbox import DisplayMailbox
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def test_latest_frame_wins(app):
+    presented = []
+    mailbox = DisplayMailbox(lambda image, tag: presented.append(tag))
+    try:
+        mailbox.present_waiting()
+        assert presented == []
+
+        for tag in range(5):
+            mailbox.post(np.zeros((2, 2)), tag)
+        mailbox.present_waiting()
+        assert presented == [4]
+
+        statistics = mailbox.get_statistics()
+        assert (statistics.posted, statistics.presented, statistics.dropped) == (5, 1, 4)
+    finally:
+        mailbox.close()
+
+
+def test_keys_get_their_own_slots(app):
+    presented = []
+    mailbox = DisplayMailbox(lambda channel, value: presented.append((channel, value)))
+    try:
+        mailbox.post("a", 1, key="a")
+        mailbox.post("b", 1, key="b")
+        mailbox.post("a", 2, key="a")
+        mailbox.present_waiting()
+        # In the order the keys were first posted, with the latest value for each
+        assert presented == [("a", 2), ("b", 1)]
+        assert mailbox.get_statistics().dropped == 1
+
+        mailbox.post("c", 1, key="c")
+        mailbox.discard_waiting()
+        mailbox.present_waiting()
+        assert len(presented) == 2
+        assert mailbox.get_statistics().dropped == 2
+    finally:
+        mailbox.close()
+
+
+def test_latency_and_errors(app):
+    def present(fail):
+        if fail:
+            raise ValueError("can't draw")
+
+    mailbox = DisplayMailbox(present)
+    try:
+        assert np.isnan(mailbox.get_statistics().latency_mean_s)
+        mailbox.post(True)
+        mailbox.present_waiting()
+        # A frame that couldn't be drawn isn't counted as presented
+        assert mailbox.get_statistics().presented == 0
+
+        mailbox.post(False, timestamp=time.time() - 0.5)
+        mailbox.present_waiting()
+        statistics = mailbox.get_statistics()
+        assert statistics.presented == 1
+        assert 0.5 <= statistics.latency_mean_s == statistics.latency_max_s < 1
+
+        mailbox.reset_statistics()
+        statistics = mailbox.get_statistics()
+        assert (statistics.posted, statistics.presented, statistics.dropped) == (0, 0, 0)
+        assert np.isnan(statistics.latency_max_s)
+    finally:
+        mailbox.close()
+
+
+def test_timer_presents_frames_posted_from_another_thread(app):
+    presented = []
+    mailbox = DisplayMailbox(presented.append, refresh_rate_hz=100)
+    try:
+        producer = threading.Thread(target=lambda: [mailbox.post(i) for i in range(1000)])
+        producer.start()
+        producer.join()
+
+        deadline = time.time() + 5
+        while not presented and time.time() < deadline:
+            app.processEvents()
+            time.sleep(0.005)
+        assert presented == [999]
+        statistics = mailbox.get_statistics()
+        assert statistics.posted == statistics.presented + statistics.dropped == 1000
+    finally:
+        mailbox.close()
+
+
+def test_multichannel_layers_posted_from_another_thread(app, monkeypatch):
+    from control.core.core import ContrastManager, ObjectiveStore
+    from control.widgets import NapariMultiChannelWidget
+
+    widget = NapariMultiChannelWidget(ObjectiveStore(), ContrastManager())
+    events = []
+    init_layers = widget.initLayers
+    monkeypatch.setattr(widget, "initLayers", lambda *args: (events.append(("init",) + args[:2]), init_layers(*args)))
+
+    def present(image, *args):
+        try:
+            widget.updateLayers(image, *args)
+        except AttributeError:
+            # There's no OpenGL to draw the layer with here, but it was set up for the image by then.
+            pass
+        events.append(("image", int(image[0, 0])))
+
+    widget.displayMailbox.present = present
+    try:
+        widget.initChannels(["BF LED matrix full"])
+        # Left over from the last acquisition
+        widget.postLayers(np.zeros((8, 8), dtype=np.uint8), 0, 0, 0, "BF LED matrix full")
+
+        def acquire():
+            widget.postLayersInit(16, 24, np.uint16, ())
+            for i in range(1, 4):
+                widget.postLayers(np.full((16, 24), i, dtype=np.uint16), 0, 0, 0, "BF LED matrix full")
+
+        producer = threading.Thread(target=acquire)
+        producer.start()
+        producer.join()
+        widget.displayMailbox.present_waiting()
+
+        # The layers are set up for the new acquisition before its latest image is drawn, and nothing else is drawn
+        assert events == [("init", 16, 24), ("image", 3)]
+        assert (widget.image_height, widget.image_width, widget.dtype) == (16, 24, np.uint16)
+        statistics = widget.displayMailbox.get_statistics()
+        assert (statistics.posted, statistics.dropped) == (4, 3)
+    finally:
+        widget.displayMailbox.close()
+        widget.deleteLater()
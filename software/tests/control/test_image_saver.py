@@ -0,0 +1,194 @@
+import os
+import threading
+import time
+
+import pytest
+import tifffile
+from qtpy.QtWidgets import QApplication
+
+import control.camera
+import control.core.core as core
+from control.recording_formats import RecordingFormat, open_recording
+from squid.recording_sink import OverflowPolicy
+
+
+def _saved_frame_ids(path):
+    # Files are <folder>/<file_ID>_<frame_ID>.<format>
+    return sorted(
+        int(os.path.splitext(name)[0].split("_")[1]) for _, _, names in os.walk(path) for name in names if "_" in name
+    )
+
+
+def _record(saver, frame_count, tmp_path):
+    saver.set_base_path(str(tmp_path))
+    saver.start_new_experiment("recording", add_timestamp=False)
+
+    camera = control.camera.Camera_Simulation()
+    camera.open()
+    camera.set_ROI(width=256, height=256)
+    camera.set_callback(lambda cam: saver.enqueue(cam.current_frame, cam.frame_ID, cam.timestamp))
+    camera.enable_callback()
+    camera.start_streaming()
+    frame_ids = []
+    t0 = time.perf_counter()
+    for _ in range(frame_count):
+        camera.send_trigger()
+        frame_ids.append(camera.frame_ID)
+    produce_s = time.perf_counter() - t0
+    saver.close()
+    camera.close()
+    return frame_ids, produce_s
+
+
+def test_recording_with_block_policy_saves_every_frame(monkeypatch, tmp_path):
+    monkeypatch.setattr(core, "RECORDING_OVERFLOW_POLICY", OverflowPolicy.BLOCK)
+    monkeypatch.setattr(core, "RECORDING_BUFFER_MB", 1)
+    saver = core.ImageSaver(image_format="bmp")
+
+    frame_ids, _ = _record(saver, 200, tmp_path)
+
+    stats = saver.get_stats()
+    assert stats.written == 200 and stats.lost == 0
+    assert stats.peak_buffered_bytes <= 1024**2
+    assert _saved_frame_ids(tmp_path / "recording") == sorted(frame_ids)
+
+
+def test_recording_faster_than_the_disk_accounts_for_every_frame(monkeypatch, tmp_path):
+    monkeypatch.setattr(core, "RECORDING_OVERFLOW_POLICY", OverflowPolicy.DROP_NEWEST)
+    # Room for 8 frames of 256x256
+    monkeypatch.setattr(core, "RECORDING_BUFFER_MB", 0.5)
+    saver = core.ImageSaver(image_format="bmp")
+    save_image = saver.save_image
+
+    def slow_save_image(*args):
+        time.sleep(0.005)
+        save_image(*args)
+
+    saver.sink._write = slow_save_image
+    frame_ids, produce_s = _record(saver, 200, tmp_path)
+
+    stats = saver.get_stats()
+    assert stats.dropped > 0 and stats.failed == 0
+    assert stats.written + stats.dropped == 200
+    # Exactly the frames that weren't saved are the lost ones
+    saved = _saved_frame_ids(tmp_path / "recording")
+    assert len(saved) == stats.written
+    assert sorted(saved + stats.lost_keys) == sorted(frame_ids)
+    # Dropping kept the producer from waiting on the disk
+    assert produce_s < 200 * 0.005
+
+
+@pytest.mark.parametrize("recording_format", [RecordingFormat.BIGTIFF, RecordingFormat.RAW])
+def test_recording_to_a_container_keeps_frame_ids_and_timestamps(recording_format, monkeypatch, tmp_path):
+    monkeypatch.setattr(core, "RECORDING_OVERFLOW_POLICY", OverflowPolicy.BLOCK)
+    saver = core.ImageSaver(recording_format=recording_format)
+    timestamps = []
+    saver_enqueue = saver.enqueue
+
+    def enqueue(image, frame_ID, timestamp):
+        timestamps.append(timestamp)
+        saver_enqueue(image, frame_ID, timestamp)
+
+    saver.enqueue = enqueue
+    frame_ids, _ = _record(saver, 50, tmp_path)
+
+    with open_recording(str(tmp_path / "recording")) as recording:
+        assert recording.format == recording_format and len(recording) == 50
+        assert list(recording.frame_ids) == frame_ids and list(recording.timestamps) == timestamps
+        assert recording[49].shape == (256, 256)
+
+
+def test_a_new_recording_does_not_wait_for_the_last_ones_frames(tmp_path):
+    saver = core.ImageSaver(image_format="bmp")
+    gate = threading.Event()
+    save_image = saver.save_image
+
+    def gated_save_image(*args):
+        gate.wait()
+        save_image(*args)
+
+    saver.sink._write = gated_save_image
+    saver.set_base_path(str(tmp_path))
+    camera = control.camera.Camera_Simulation()
+    camera.open()
+    camera.set_ROI(width=64, height=64)
+    camera.start_streaming()
+    frame_id = 0
+    for experiment_ID, frame_count in (("first", 3), ("second", 2)):
+        t0 = time.perf_counter()
+        saver.start_new_experiment(experiment_ID, add_timestamp=False)
+        assert time.perf_counter() - t0 < 0.5
+        for _ in range(frame_count):
+            camera.send_trigger()
+            saver.enqueue(camera.read_frame(), frame_id, time.time())
+            frame_id += 1
+    gate.set()
+    saver.close()
+    camera.close()
+
+    # Each recording's frames still went to its own folder
+    assert _saved_frame_ids(tmp_path / "first") == [0, 1, 2]
+    assert _saved_frame_ids(tmp_path / "second") == [3, 4]
+    assert saver.get_stats().written == 2
+
+
+@pytest.mark.parametrize("recording_format", [RecordingFormat.BIGTIFF, RecordingFormat.RAW, RecordingFormat.ZARR])
+def test_stopping_a_recording_completes_it(recording_format, tmp_path):
+    if recording_format == RecordingFormat.ZARR:
+        pytest.importorskip("zarr")
+    saver = core.ImageSaver(recording_format=recording_format)
+    saver.set_base_path(str(tmp_path))
+    saver.start_new_experiment("recording", add_timestamp=False)
+    camera = control.camera.Camera_Simulation()
+    camera.open()
+    camera.set_ROI(width=64, height=64)
+    camera.start_streaming()
+    for frame_id in range(5):
+        camera.send_trigger()
+        saver.enqueue(camera.read_frame(), frame_id, time.time())
+    saver.finish_recording()
+    # A frame that was on its way when the recording stopped doesn't start it over
+    saver.enqueue(camera.read_frame(), 5, time.time())
+    assert saver.sink.join(timeout=5)
+
+    with open_recording(str(tmp_path / "recording")) as recording:
+        assert list(recording.frame_ids) == [0, 1, 2, 3, 4]
+    if recording_format == RecordingFormat.BIGTIFF:
+        # The unused pages were cut off, for other TIFF readers
+        with tifffile.TiffFile(str(tmp_path / "recording" / "frames_00000.tif")) as tif:
+            assert len(tif.pages) == 5
+    saver.close()
+    camera.close()
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def test_recording_errors_stop_the_recording(app, tmp_path):
+    saver = core.ImageSaver(image_format="bmp")
+    errors = []
+    stops = []
+    saver.recording_error.connect(errors.append)
+    saver.stop_recording.connect(lambda: stops.append(True))
+    saver.set_base_path(str(tmp_path))
+    saver.start_new_experiment("recording", add_timestamp=False)
+    # A file where the first frame's folder should go
+    (tmp_path / "recording" / "0").write_text("")
+
+    camera = control.camera.Camera_Simulation()
+    camera.open()
+    camera.set_ROI(width=64, height=64)
+    camera.start_streaming()
+    for frame_id in range(3):
+        camera.send_trigger()
+        saver.enqueue(camera.read_frame(), frame_id, time.time())
+    saver.close()
+    camera.close()
+    # The signals come from the saving thread
+    app.processEvents()
+
+    stats = saver.get_stats()
+    assert stats.failed >= 1 and stats.written + stats.failed == 3
+    assert len(errors) == 1 and "recording" in errors[0] and stops
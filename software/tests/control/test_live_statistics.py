@@ -0,0 +1,86 @@
+import time
+
+import numpy as np
+import pytest
+from qtpy.QtCore import Qt
+from qtpy.QtWidgets import QApplication
+
+from control.live_statistics import LiveStatisticsWorker, compute_live_statistics, subsample
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def test_subsample():
+    image = np.zeros((3000, 4000), dtype=np.uint16)
+    sample = subsample(image, max_samples=65536)
+    assert sample.size <= 65536
+    assert sample.size > 65536 / 4
+    # Small images aren't subsampled
+    assert subsample(image[:100, :100], max_samples=65536).shape == (100, 100)
+
+
+def test_compute_live_statistics():
+    rng = np.random.default_rng(0)
+    image = rng.integers(1000, 3000, size=(2000, 3000), dtype=np.uint16)
+    image[0, 0] = 60000
+
+    statistics = compute_live_statistics(image, max_samples=65536, bins=100, low_percentile=1, high_percentile=99)
+    assert len(statistics.bin_edges) == len(statistics.counts) == 100
+    assert statistics.counts.sum() == subsample(image, 65536).size
+    # The percentiles ignore the outlier, and are close to the full image's
+    assert statistics.low == pytest.approx(np.percentile(image, 1), rel=0.01)
+    assert statistics.high == pytest.approx(np.percentile(image, 99), rel=0.01)
+
+    flat = compute_live_statistics(np.full((10, 10), 7, dtype=np.uint8))
+    assert flat.min == flat.max == 7 and flat.counts.sum() == 100
+
+
+def test_worker_only_computes_the_latest_frame():
+    results = []
+    worker = LiveStatisticsWorker(rate_hz=10)
+    # Without a Qt event loop to deliver them, the results have to come straight from the worker's thread.
+    worker.statistics_ready.connect(results.append, Qt.DirectConnection)
+    try:
+        for value in range(1, 21):
+            worker.submit(np.full((64, 64), value, dtype=np.uint8))
+            time.sleep(0.005)
+        deadline = time.time() + 2
+        while (not results or results[-1].max != 20) and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        worker.close()
+
+    # Rate limited to 10 Hz over about 0.1 s, so only a few of the 20 frames, ending with the latest
+    assert 1 <= len(results) <= 4
+    assert results[-1].max == 20
+
+
+def test_closing_the_live_widget_stops_its_statistics_thread(app):
+    import control.microscope
+    import squid.config
+    import squid.stage.cephla
+    from control.core.core import ContrastManager
+    from control.microcontroller import Microcontroller, SimSerial
+    from control.widgets import NapariLiveWidget
+
+    microcontroller = Microcontroller(existing_serial=SimSerial())
+    stage = squid.stage.cephla.CephlaStage(microcontroller, squid.config.get_stage_config())
+    scope = control.microscope.Microscope(stage=stage, is_simulation=True)
+    scope.liveController.set_microscope_mode(scope.configurationManager.configurations[0])
+
+    widget = NapariLiveWidget(
+        scope.streamHandler, scope.liveController, stage, scope.configurationManager, ContrastManager()
+    )
+    thread = widget.liveStatisticsWorker._thread
+    try:
+        assert thread.is_alive()
+        widget.close()
+        assert not thread.is_alive()
+        # Closing again (e.g. from the main window after the tab was closed) is harmless
+        widget.close()
+    finally:
+        widget.liveStatisticsWorker.close()
+        widget.deleteLater()
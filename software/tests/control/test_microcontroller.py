@@ -1,3 +1,6 @@
+import time
+
+import numpy as np
 import pytest
 import control._def
 import control.microcontroller
@@ -144,3 +147,43 @@ def test_microcontroller_absolute_and_relative_match():
     micro.move_z_usteps(-abs_position)
     wait()
     assert_pos_almost_equal((0, 0, 0, 0), micro.get_pos())
+
+
+def test_microcontroller_position_history():
+    micro = control.microcontroller.Microcontroller(existing_serial=control.microcontroller.SimSerial())
+    micro.move_x_to_usteps(1000)
+    micro.wait_till_operation_is_completed()
+    micro.move_x_to_usteps(3000)
+    micro.wait_till_operation_is_completed()
+
+    history = micro.get_position_history()
+    assert history.shape[1] == 5
+    assert (np.diff(history[:, 0]) >= 0).all()
+    assert history[-1, 1] == 3000
+
+    # Interpolates between received positions, and holds the first/last one outside of them
+    t_1000 = history[history[:, 1] == 1000][-1, 0]
+    t_3000 = history[history[:, 1] == 3000][0, 0]
+    assert micro.get_pos_at((t_1000 + t_3000) / 2)[0] == pytest.approx(2000, abs=1)
+    assert micro.get_pos_at(history[-1, 0] + 100)[0] == 3000
+    assert micro.get_pos_at(0)[0] == history[0, 1]
+
+
+def test_simulated_motion_takes_time():
+    serial = control.microcontroller.SimSerial(simulate_motion=True)
+    micro = control.microcontroller.Microcontroller(existing_serial=serial)
+    usteps_per_mm = serial._usteps_per_mm[control._def.AXIS.X]
+
+    micro.set_max_velocity_acceleration(control._def.AXIS.X, 10, 500)
+    micro.wait_till_operation_is_completed()
+    start = time.time()
+    micro.move_x_to_usteps(int(usteps_per_mm))
+    # Status packets report the position along the way
+    time.sleep(0.05)
+    assert micro.is_busy()
+    assert 0 < micro.get_pos()[0] < usteps_per_mm
+
+    micro.wait_till_operation_is_completed()
+    # 1 mm at 10 mm/s
+    assert time.time() - start == pytest.approx(0.1, abs=0.05)
+    assert micro.get_pos()[0] == int(usteps_per_mm)
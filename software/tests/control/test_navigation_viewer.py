@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+import pytest
+from qtpy.QtWidgets import QApplication
+
+from control.core.core import NavigationViewer, ObjectiveStore
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def viewer(app, monkeypatch):
+    # The background images are found relative to the software directory
+    monkeypatch.chdir(os.path.join(os.path.dirname(__file__), "..", ".."))
+    viewer = NavigationViewer(ObjectiveStore(), sample="glass slide")
+    viewer.flush_overlay_updates()
+    yield viewer
+    viewer.deleteLater()
+
+
+def count_uploads(monkeypatch, item):
+    uploads = []
+    original = item.setImage
+    monkeypatch.setattr(item, "setImage", lambda *args, **kwargs: (uploads.append(1), original(*args, **kwargs)))
+    return uploads
+
+
+def test_a_burst_of_edits_is_one_upload(viewer, monkeypatch):
+    uploads = count_uploads(monkeypatch, viewer.scan_overlay_item)
+    coordinates = [(x, y) for x in np.linspace(20, 40, 10) for y in np.linspace(20, 40, 10)]
+
+    viewer.register_fovs_to_image(coordinates)
+    for x_mm, y_mm in coordinates[:5]:
+        viewer.deregister_fov_to_image(x_mm, y_mm)
+    assert uploads == []
+    assert viewer._update_timer.isActive()
+
+    viewer.flush_overlay_updates()
+    assert uploads == [1]
+    assert viewer.scan_overlay.any()
+
+    viewer.deregister_fovs_to_image(coordinates)
+    viewer.flush_overlay_updates()
+    assert not viewer.scan_overlay.any()
+
+
+def test_edits_outside_of_the_image_are_not_uploaded(viewer, monkeypatch):
+    uploads = count_uploads(monkeypatch, viewer.scan_overlay_item)
+
+    viewer.register_fovs_to_image([])
+    viewer.register_fov_to_image(-1000, -1000)
+    assert not viewer._update_timer.isActive()
+    viewer.flush_overlay_updates()
+    assert uploads == []
+
+
+def test_current_fov_only_redraws_when_it_moves(viewer, monkeypatch):
+    uploads = count_uploads(monkeypatch, viewer.fov_overlay_item)
+
+    viewer.draw_current_fov(30, 30)
+    viewer.flush_overlay_updates()
+    first_box = viewer.fov_overlay.copy()
+    assert first_box.any() and uploads == [1]
+
+    viewer.draw_current_fov(30, 30)
+    assert not viewer._update_timer.isActive()
+
+    viewer.draw_current_fov(60, 60)
+    viewer.flush_overlay_updates()
+    assert uploads == [1, 1]
+    # The first box was erased, not left behind
+    assert not viewer.fov_overlay[first_box[..., 3] > 0].any()
+    assert viewer.fov_overlay.any()
@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+
+from control.ome_zarr_browser import (
+    AcquisitionBrowser,
+    ChunkCache,
+    LazyChunkedArray,
+    OmeZarrDataset,
+    open_ome_zarr,
+)
+
+
+class CountingArray:
+    """A numpy array that records the selections it's read with, like a zarr array would be read."""
+
+    def __init__(self, array):
+        self.array = array
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.reads = []
+
+    def __getitem__(self, selection):
+        self.reads.append(selection)
+        return self.array[selection]
+
+
+def test_chunk_cache_evicts_least_recently_used():
+    cache = ChunkCache(max_bytes=300)
+    for key in "abc":
+        cache.get_or_load(key, lambda: np.zeros(100, dtype=np.uint8))
+    assert len(cache) == 3 and cache.nbytes == 300 and cache.misses == 3
+
+    # Using "a" makes "b" the least recently used
+    cache.get_or_load("a", lambda: pytest.fail("a should be cached"))
+    cache.get_or_load("d", lambda: np.zeros(100, dtype=np.uint8))
+    assert "b" not in cache and "a" in cache and "d" in cache
+    assert cache.nbytes == 300 and cache.hits == 1
+
+    # Chunks bigger than the whole budget aren't kept
+    cache.get_or_load("e", lambda: np.zeros(1000, dtype=np.uint8))
+    assert "e" not in cache and len(cache) == 3
+
+
+def test_lazy_chunked_array_reads_only_what_is_asked_for():
+    data = np.arange(2 * 3 * 40 * 50, dtype=np.uint16).reshape(2, 3, 40, 50)
+    array = CountingArray(data)
+    cache = ChunkCache()
+    # The view of channel 1 (axis 1), chunked by 1 channel and 16x16 pixels
+    view = LazyChunkedArray(array, (1, 1, 16, 16), cache, "level0", channel_axis=1, channel=1)
+    assert view.shape == (2, 40, 50) and view.dtype == np.uint16 and view.ndim == 3
+    assert array.reads == []
+
+    np.testing.assert_array_equal(view[1, 10:20, 20:28], data[1, 1, 10:20, 20:28])
+    # Two chunks along y, one along x
+    assert len(array.reads) == 2
+
+    np.testing.assert_array_equal(view[1, 10:20, 20:28], data[1, 1, 10:20, 20:28])
+    assert len(array.reads) == 2
+
+    np.testing.assert_array_equal(view[:, ::3, -7:], data[:, 1, ::3, -7:])
+    np.testing.assert_array_equal(view[0, 39, 49], data[0, 1, 39, 49])
+    np.testing.assert_array_equal(np.asarray(view), data[:, 1])
+    assert len(view.get_chunk_indices()) == 2 * 3 * 4
+
+
+def test_browser_reuses_datasets_and_prefetches_the_coarsest_level(tmp_path):
+    arrays = {}
+
+    def open_dataset(path, cache):
+        levels = []
+        for level, size in enumerate((64, 32)):
+            array = CountingArray(np.full((1, size, size), level, dtype=np.uint8))
+            arrays[(path, level)] = array
+            levels.append(LazyChunkedArray(array, (1, 16, 16), cache, (path, level)))
+        return OmeZarrDataset(path, ["BF"], ["z", "y", "x"], (1.0, 0.5, 0.5), {"BF": levels})
+
+    browser = AcquisitionBrowser(cache_bytes=1024**2, max_open_datasets=2, open_dataset=open_dataset)
+    try:
+        a = browser.open(str(tmp_path / "a"))
+        assert browser.open(str(tmp_path / "a")) is a
+
+        browser.prefetch([str(tmp_path / "b")])
+        browser.wait_for_prefetch()
+        b = str(tmp_path / "b")
+        # Every chunk of the coarsest level, and nothing of the finest
+        assert len(arrays[(b, 1)].reads) == 4 and arrays[(b, 0)].reads == []
+        browser.open(b).levels["BF"][1][0]
+        assert len(arrays[(b, 1)].reads) == 4
+
+        # Only the last 2 datasets stay open
+        browser.open(str(tmp_path / "c"))
+        assert browser.open(str(tmp_path / "a")) is not a
+    finally:
+        browser.close()
+
+
+def test_open_ome_zarr(tmp_path):
+    zarr = pytest.importorskip("zarr")
+
+    path = str(tmp_path / "B2_stitched.ome.zarr")
+    root = zarr.open_group(path, mode="w")
+    full = np.random.default_rng(0).integers(0, 4096, size=(1, 2, 3, 64, 48), dtype=np.uint16)
+    levels = [full, full[..., ::2, ::2]]
+    datasets = []
+    for level, data in enumerate(levels):
+        array = root.create_dataset(str(level), shape=data.shape, chunks=(1, 1, 1, 32, 32), dtype=data.dtype)
+        array[...] = data
+        datasets.append(
+            {
+                "path": str(level),
+                "coordinateTransformations": [{"type": "scale", "scale": [1, 1, 2.0, 0.5 * 2**level, 0.5 * 2**level]}],
+            }
+        )
+    root.attrs["multiscales"] = [
+        {
+            "version": "0.4",
+            "axes": [{"name": name} for name in "tczyx"],
+            "datasets": datasets,
+        }
+    ]
+    root.attrs["omero"] = {"channels": [{"label": "Fluorescence 488 nm Ex"}, {"label": "Fluorescence 561 nm Ex"}]}
+
+    cache = ChunkCache()
+    dataset = open_ome_zarr(path, cache)
+    assert dataset.channel_names == ["Fluorescence 488 nm Ex", "Fluorescence 561 nm Ex"]
+    assert dataset.axes == ["t", "z", "y", "x"]
+    assert dataset.scale == (1.0, 2.0, 0.5, 0.5)
+    assert len(cache) == 0
+
+    red = dataset.levels["Fluorescence 561 nm Ex"]
+    assert [level.shape for level in red] == [(1, 3, 64, 48), (1, 3, 32, 24)]
+    np.testing.assert_array_equal(red[1][0, 2], levels[1][0, 1, 2])
+    np.testing.assert_array_equal(red[0][0, 1, 10:50, 5:40], full[0, 1, 1, 10:50, 5:40])
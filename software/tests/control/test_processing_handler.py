@@ -0,0 +1,131 @@
+import threading
+import time
+
+import numpy as np
+
+from control.processing_handler import DropPolicy, ProcessingHandler
+
+
+def _sum_image(image):
+    return float(np.sum(image))
+
+
+def _upload(results, value):
+    results.append(value)
+
+
+def _process(results, image):
+    return {"function": _upload, "args": [results, _sum_image(image)], "kwargs": {}}
+
+
+def test_processing_handler_copies_frames():
+    results = []
+    handler = ProcessingHandler(num_workers=2)
+    handler.start_processing()
+    handler.start_uploading()
+
+    image = np.ones((8, 8), dtype=np.uint16)
+    for _ in range(10):
+        assert handler.submit(_process, args=(results, image))
+    # The caller is free to reuse its buffer right away.
+    image[:] = 0
+    handler.end_processing()
+
+    assert results == [64.0] * 10
+    metrics = handler.get_metrics()
+    assert metrics["processed"] == 10
+    assert metrics["dropped"] == 0
+    assert metrics["processing"]["count"] == 10
+    assert metrics["upload"]["count"] == 10
+
+
+def test_processing_handler_drop_oldest_never_blocks():
+    gate = threading.Event()
+    processed = []
+
+    def slow(i):
+        gate.wait()
+        processed.append(i)
+
+    handler = ProcessingHandler(num_workers=1, max_queue_size=2, drop_policy=DropPolicy.DROP_OLDEST)
+    handler.start_processing()
+    handler.start_uploading()
+
+    start = time.perf_counter()
+    for i in range(10):
+        assert handler.submit(slow, args=(i,))
+    assert time.perf_counter() - start < 1.0
+    gate.set()
+    handler.end_processing()
+
+    # The newest tasks survive, and the ones that didn't fit were counted.
+    assert processed[-2:] == [8, 9]
+    assert handler.get_metrics()["dropped"] == 10 - len(processed)
+
+
+def test_processing_handler_drop_newest():
+    gate = threading.Event()
+    started = threading.Event()
+
+    def first():
+        started.set()
+        gate.wait()
+
+    handler = ProcessingHandler(num_workers=1, max_queue_size=1, drop_policy="drop newest")
+    handler.start_processing()
+    handler.start_uploading()
+
+    handler.submit(first)
+    assert started.wait(5)  # The worker took the first task, so the queue is empty
+    assert handler.submit(lambda: None)
+    assert not handler.submit(lambda: None)
+    gate.set()
+    handler.end_processing()
+    assert handler.get_metrics()["dropped"] == 1
+
+
+def test_processing_handler_drop_oldest_keeps_the_end_of_processing():
+    handler = ProcessingHandler(num_workers=1, max_queue_size=1, drop_policy=DropPolicy.DROP_OLDEST)
+    handler.processing_queue.put({"function": "end"})
+
+    # Processing is ending, so the task that doesn't fit is dropped, not the sentinel.
+    assert not handler.submit(lambda: None)
+    assert handler.get_metrics()["dropped"] == 1
+    assert list(handler.processing_queue.queue) == [{"function": "end"}]
+
+    handler.start_processing()
+    handler.start_uploading()
+    handler.end_processing()
+    assert handler.get_metrics()["processed"] == 0
+
+
+def test_processing_handler_batches():
+    batches = []
+
+    def process_batch(batch):
+        batches.append([args[0] for args in batch])
+
+    handler = ProcessingHandler(num_workers=1, batch_size=4, batch_timeout_s=0.5)
+    for i in range(8):
+        handler.submit(process_batch, args=(i,), batch=True)
+    handler.start_processing()
+    handler.start_uploading()
+    handler.end_processing()
+
+    assert batches == [[0, 1, 2, 3], [4, 5, 6, 7]]
+
+
+def test_processing_handler_process_pool_shared_memory():
+    results = []
+    handler = ProcessingHandler(num_workers=2, use_processes=True)
+    handler.start_processing()
+    handler.start_uploading()
+
+    for i in range(4):
+        handler.submit(_sum_image, args=(np.full((16, 16), i, dtype=np.uint8),))
+    handler.submit(_process, args=(results, np.ones((4, 4))), in_process=False)
+    handler.end_processing()
+
+    assert results == [16.0]
+    assert handler.get_metrics()["processed"] == 5
+    assert handler.get_metrics()["errors"] == 0
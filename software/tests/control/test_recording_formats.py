@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+import pytest
+import tifffile
+
+from control.recording_formats import (
+    BigTiffRecordingWriter,
+    RecordingFormat,
+    get_recording_format,
+    make_recording_writer,
+    open_recording,
+)
+
+
+def _frames(shape, dtype, count=7):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, np.iinfo(dtype).max, size=shape, dtype=dtype) for _ in range(count)]
+
+
+@pytest.mark.parametrize("recording_format", RecordingFormat.ALL)
+@pytest.mark.parametrize("shape, dtype", [((30, 40), np.uint8), ((30, 40), np.uint16), ((30, 40, 3), np.uint8)])
+def test_recordings_read_back_what_was_written(recording_format, shape, dtype, tmp_path):
+    if recording_format == RecordingFormat.ZARR:
+        pytest.importorskip("zarr")
+    if recording_format == RecordingFormat.FILES and len(shape) == 3:
+        pytest.skip("Color frames are saved as BGR files")
+    frames = _frames(shape, dtype)
+    frame_ids = [10 + 2 * i for i in range(len(frames))]
+    with make_recording_writer(recording_format, str(tmp_path), image_format="png") as writer:
+        for i, frame in enumerate(frames):
+            writer.write(frame, frame_ids[i], 1000.0 + i)
+
+    assert get_recording_format(str(tmp_path)) == recording_format
+    with open_recording(str(tmp_path)) as recording:
+        assert len(recording) == len(frames) and recording.shape == shape and recording.dtype == dtype
+        np.testing.assert_array_equal(recording.frame_ids, frame_ids)
+        if recording_format != RecordingFormat.FILES:
+            np.testing.assert_array_equal(recording.timestamps, 1000.0 + np.arange(len(frames)))
+        for i in (3, 0, -1):
+            np.testing.assert_array_equal(recording[i], frames[i])
+        with pytest.raises(IndexError):
+            recording[len(frames)]
+
+
+def test_bigtiff_recordings_are_split_into_files_any_reader_can_open(tmp_path):
+    frames = _frames((16, 16), np.uint16, count=7)
+    # Room for 3 frames per file
+    with BigTiffRecordingWriter(str(tmp_path), max_file_bytes=3 * frames[0].nbytes + 100) as writer:
+        for i, frame in enumerate(frames):
+            writer.write(frame, i, float(i))
+
+    assert sorted(os.listdir(tmp_path)) == ["frames_00000.tif", "frames_00001.tif", "frames_00002.tif"]
+    # The last file has room for 3 frames, but only has 1
+    data = tifffile.imread(str(tmp_path / "frames_00002.tif"))
+    np.testing.assert_array_equal(data, frames[6])
+    np.testing.assert_array_equal(tifffile.imread(str(tmp_path / "frames_00001.tif")), np.stack(frames[3:6]))
+    with open_recording(str(tmp_path)) as recording:
+        np.testing.assert_array_equal(np.stack(list(recording)), np.stack(frames))
+
+
+@pytest.mark.parametrize("count", [1, 2, 4])
+def test_bigtiff_file_is_cut_down_to_the_frames_written(count, tmp_path):
+    frames = _frames((30, 40, 3), np.uint8, count=count)
+    frame_bytes = frames[0].nbytes
+    with BigTiffRecordingWriter(str(tmp_path), max_file_bytes=10 * frame_bytes) as writer:
+        for i, frame in enumerate(frames):
+            writer.write(frame, i, float(i))
+
+    path = str(tmp_path / "frames_00000.tif")
+    # The room for the other 10 - count frames is gone, and only the frames' pages are left
+    assert os.path.getsize(path) < (count + 1) * frame_bytes
+    with tifffile.TiffFile(path) as tif:
+        assert len(tif.pages) == count
+        np.testing.assert_array_equal(tif.asarray().reshape((count,) + frames[0].shape), np.stack(frames))
+    with open_recording(str(tmp_path)) as recording:
+        np.testing.assert_array_equal(recording.frame_ids, np.arange(count))
+        np.testing.assert_array_equal(np.stack(list(recording)), np.stack(frames))
+
+
+@pytest.mark.parametrize("recording_format", [RecordingFormat.BIGTIFF, RecordingFormat.RAW])
+def test_recording_that_wasnt_closed_has_the_frames_written(recording_format, tmp_path):
+    frames = _frames((16, 16), np.uint8, count=3)
+    writer = make_recording_writer(recording_format, str(tmp_path))
+    for i, frame in enumerate(frames):
+        writer.write(frame, i, float(i))
+
+    with open_recording(str(tmp_path)) as recording:
+        assert len(recording) == 3
+        np.testing.assert_array_equal(recording[2], frames[2])
+    writer.close()
+
+
+@pytest.mark.parametrize("recording_format", [RecordingFormat.BIGTIFF, RecordingFormat.RAW])
+def test_container_recordings_reject_frames_that_do_not_match(recording_format, tmp_path):
+    with make_recording_writer(recording_format, str(tmp_path)) as writer:
+        writer.write(np.zeros((4, 4), dtype=np.uint8), 0, 0.0)
+        with pytest.raises(ValueError):
+            writer.write(np.zeros((4, 5), dtype=np.uint8), 1, 1.0)
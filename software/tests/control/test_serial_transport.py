@@ -0,0 +1,132 @@
+import struct
+import time
+import types
+
+import pytest
+
+import control.serial_peripherals
+from control.serial_transport import LengthPrefixedFramer, LineFramer, SerialTransport, SimulatedSerial
+
+
+def echo_ok(command):
+    return b"ok\r\n"
+
+
+def test_line_framer():
+    framer = LineFramer()
+    buffer = bytearray(b"first\r\n\r\nsecond\rpart")
+    assert framer(buffer) == "first"
+    assert framer(buffer) == "second"
+    assert framer(buffer) is None
+    assert buffer == b"part"
+
+
+def test_length_prefixed_framer():
+    framer = LengthPrefixedFramer()
+    buffer = bytearray(b"\xff\x02ab\xff")
+    assert framer(buffer) == b"\xff\x02ab"
+    assert framer(buffer) is None
+    buffer.extend(b"\x00")
+    assert framer(buffer) == b"\xff\x00"
+
+
+def test_request_returns_as_soon_as_the_device_answers():
+    transport = SerialTransport(SimulatedSerial(echo_ok, response_delay_s=0.005))
+    t0 = time.perf_counter()
+    for _ in range(10):
+        assert transport.request("set:470=10.00\r", timeout=1) == "ok"
+    # 10 fixed 100 ms read delays would take a second
+    assert time.perf_counter() - t0 < 0.5
+
+    stats = transport.get_latency_stats()
+    assert stats["requests"] == 10 and stats["responses"] == 10 and stats["timeouts"] == 0
+    assert 5 <= stats["p50_ms"] < 50
+    transport.close()
+
+
+def test_request_skips_lines_until_accepted():
+    transport = SerialTransport(SimulatedSerial(lambda command: b"banner\r\nCurrent NA is 0.5\r\n-==-\r\n"))
+    pending = transport.send("na.5\r", accept=lambda line: line.startswith("Current NA"))
+    assert transport.wait(pending, 1) == "Current NA is 0.5"
+    assert pending.messages == ["banner", "Current NA is 0.5"]
+    transport.close()
+
+
+def test_request_timeout():
+    transport = SerialTransport(SimulatedSerial(lambda command: None))
+    t0 = time.perf_counter()
+    assert transport.request("rB\r", timeout=0.05) is None
+    assert time.perf_counter() - t0 < 0.5
+    assert transport.get_latency_stats()["timeouts"] == 1
+    # A timed out request doesn't block the next one
+    transport.serial.respond = echo_ok
+    assert transport.request("rB\r", timeout=1) == "ok"
+    transport.close()
+
+
+def test_late_response_is_not_taken_as_the_next_response():
+    port = SimulatedSerial(lambda command: command.strip() + b"\r", response_delay_s=0.1)
+    transport = SerialTransport(port)
+    assert transport.request("first\r", timeout=0.05) is None
+    port.response_delay_s = 0
+    assert transport.request("second\r", timeout=1) == "second"
+    assert list(transport.unsolicited) == ["first"]
+    transport.close()
+
+
+def test_pipelined_requests_are_matched_in_order():
+    port = SimulatedSerial(lambda command: command.strip().upper() + b"\r", response_delay_s=0.05)
+    transport = SerialTransport(port, max_in_flight=4)
+    t0 = time.perf_counter()
+    pending = [transport.send(f"c{i}\r") for i in range(4)]
+    assert [transport.wait(p, 1) for p in pending] == ["C0", "C1", "C2", "C3"]
+    # All 4 were in flight at once, so this took about 1 round trip, not 4
+    assert time.perf_counter() - t0 < 0.15
+    transport.close()
+
+
+def test_serial_device_write_and_check():
+    device = control.serial_peripherals.SerialDevice(existing_serial=SimulatedSerial(echo_ok))
+    t0 = time.perf_counter()
+    assert device.write_and_check("run!\r", "ok") == "ok"
+    assert time.perf_counter() - t0 < 0.05
+    assert device.write_and_read("shutter?\r") == "ok"
+
+    with pytest.raises(RuntimeError):
+        device.write_and_check("run!\r", "error", read_delay=0, max_attempts=2)
+    device.close()
+    assert device._transport is None
+
+
+def test_serial_device_settle_time():
+    device = control.serial_peripherals.SerialDevice(existing_serial=SimulatedSerial(echo_ok))
+    t0 = time.perf_counter()
+    assert device.write_and_check("D1\r", "ok", read_delay=1, settle_time=0.2) == "ok"
+    assert 0.2 <= time.perf_counter() - t0 < 0.5
+    device.close()
+
+
+def test_opened_port_has_a_read_timeout(monkeypatch):
+    opened = {}
+    monkeypatch.setattr(
+        control.serial_peripherals.list_ports,
+        "comports",
+        lambda: [types.SimpleNamespace(device="/dev/ttyXLIGHT", vid=None, pid=None, serial_number="SN1")],
+    )
+    monkeypatch.setattr(
+        control.serial_peripherals.serial, "Serial", lambda port, **kwargs: opened.update(kwargs, port=port)
+    )
+    device = control.serial_peripherals.SerialDevice(baudrate=115200, read_timeout=0.3)
+    device.open_ser(SN="SN1")
+    assert opened == {"port": "/dev/ttyXLIGHT", "baudrate": 115200, "timeout": 0.3}
+
+
+def test_optospin_style_binary_responses():
+    def respond(command):
+        # Get version answers with 2 bytes of data, everything else with none
+        return b"\xff\x02\x01\x07" if struct.unpack(">H", command[:2])[0] == 0x0040 else b"\xff\x00"
+
+    transport = SerialTransport(SimulatedSerial(respond), framer=LengthPrefixedFramer())
+    assert transport.request(struct.pack(">H", 0x0060), timeout=1) == b"\xff\x00"
+    assert transport.request(struct.pack(">H", 0x0040), timeout=1) == b"\xff\x02\x01\x07"
+    transport.close()
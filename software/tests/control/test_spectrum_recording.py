@@ -0,0 +1,130 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+from qtpy.QtWidgets import QApplication
+
+import control.core.core
+import control.core_usbspectrometer as core_usbspectrometer
+from control.spectrometer_oceanoptics import Spectrometer_Simulation
+from control.spectrum_recording import SpectrumRecordingWriter, open_spectrum_recording
+from squid.recording_sink import OverflowPolicy
+
+
+def _spectra(count, N=64):
+    spectrometer = Spectrometer_Simulation(N=N)
+    spectrometer.set_integration_time_ms(0)
+    return [spectrometer.read_spectrum() for _ in range(count)]
+
+
+def test_spectra_are_written_in_batches_and_read_back(tmp_path):
+    spectra = _spectra(10)
+    writer = SpectrumRecordingWriter(str(tmp_path), batch_size=4, flush_interval_s=60)
+    for i, spectrum in enumerate(spectra):
+        writer.write_spectrum(spectrum, i, 100.0 + i)
+
+    # Only the full batches are in the file so far
+    with open_spectrum_recording(str(tmp_path)) as recording:
+        assert len(recording) == 8
+    writer.close()
+
+    with open_spectrum_recording(str(tmp_path)) as recording:
+        assert len(recording) == 10
+        np.testing.assert_array_equal(recording.wavelengths, spectra[0][0])
+        np.testing.assert_array_equal(recording.spectrum_ids, np.arange(10))
+        np.testing.assert_array_equal(recording.timestamps, 100.0 + np.arange(10))
+        np.testing.assert_array_equal(recording.intensities, np.stack([spectrum[1] for spectrum in spectra]))
+        np.testing.assert_array_equal(recording[7], spectra[7])
+
+
+def test_spectra_must_share_the_wavelengths(tmp_path):
+    with SpectrumRecordingWriter(str(tmp_path)) as writer:
+        writer.write_spectrum(_spectra(1, N=64)[0], 0, 0.0)
+        with pytest.raises(ValueError):
+            writer.write_spectrum(_spectra(1, N=32)[0], 1, 1.0)
+
+
+def test_export_csv(tmp_path):
+    spectra = _spectra(5)
+    with SpectrumRecordingWriter(str(tmp_path)) as writer:
+        for i, spectrum in enumerate(spectra):
+            writer.write_spectrum(spectrum, i, 100.0 + i)
+
+    with open_spectrum_recording(str(tmp_path)) as recording:
+        csv_path = recording.export_csv(batch_size=2)
+    table = pd.read_csv(csv_path)
+    assert list(table.columns[:2]) == ["spectrum_id", "timestamp"]
+    np.testing.assert_allclose(table.columns[2:].astype(float), spectra[0][0])
+    np.testing.assert_array_equal(table["spectrum_id"], np.arange(5))
+    np.testing.assert_array_equal(table.iloc[:, 2:].to_numpy(), np.stack([spectrum[1] for spectrum in spectra]))
+
+
+def test_spectrum_saver_keeps_up_with_the_spectrometer(monkeypatch, tmp_path):
+    monkeypatch.setattr(control.core.core, "RECORDING_OVERFLOW_POLICY", OverflowPolicy.DROP_NEWEST)
+    saver = core_usbspectrometer.SpectrumSaver()
+    saver.set_base_path(str(tmp_path))
+    saver.start_new_experiment("spectra", add_timestamp=False)
+
+    spectrometer = Spectrometer_Simulation()
+    spectrometer.set_integration_time_ms(1)
+    spectrometer.set_callback(saver.enqueue)
+    spectrometer.start_streaming()
+    time.sleep(0.5)
+    spectrometer.close()
+    saver.close()
+
+    stats = saver.get_stats()
+    # The spectrometer ran at close to its full rate, and every spectrum was saved
+    assert stats.accepted > 200
+    assert stats.lost == 0 and stats.written == stats.accepted
+    with open_spectrum_recording(str(tmp_path / "spectra")) as recording:
+        assert len(recording) == stats.accepted and recording.intensities.shape[1] == 4096
+        assert np.all(np.diff(recording.timestamps) > 0)
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def test_stopping_a_spectrum_recording_writes_it_out_and_exports_it(app, tmp_path):
+    saver = core_usbspectrometer.SpectrumSaver()
+    exported = []
+    saver.csv_exported.connect(exported.append)
+    saver.set_base_path(str(tmp_path))
+    saver.start_new_experiment("spectra", add_timestamp=False)
+    for spectrum in _spectra(3):
+        saver.enqueue(spectrum)
+    saver.finish_recording()
+    saver.export_csv()
+    assert saver.sink.join(timeout=5)
+
+    # Without waiting for the flush interval, or closing the saver
+    with open_spectrum_recording(str(tmp_path / "spectra")) as recording:
+        assert len(recording) == 3
+    # The signal comes from the saving thread
+    app.processEvents()
+    assert exported == [str(tmp_path / "spectra" / "spectra.csv")]
+    assert len(pd.read_csv(exported[0])) == 3
+    saver.close()
+
+
+def test_spectra_are_written_out_when_the_spectrometer_pauses(monkeypatch, tmp_path):
+    monkeypatch.setattr(core_usbspectrometer, "SPECTRUM_RECORDING_FLUSH_INTERVAL_S", 0.1)
+    saver = core_usbspectrometer.SpectrumSaver()
+    saver.set_base_path(str(tmp_path))
+    saver.start_new_experiment("spectra", add_timestamp=False)
+    try:
+        for spectrum in _spectra(3):
+            saver.enqueue(spectrum)
+        assert saver.sink.join(timeout=5)
+
+        # No more spectra come to trigger the flush, and the recording isn't finished, but they're written out
+        deadline = time.time() + 5
+        while saver.writer._batch_count and time.time() < deadline:
+            time.sleep(0.01)
+        with open_spectrum_recording(str(tmp_path / "spectra")) as recording:
+            assert len(recording) == 3
+    finally:
+        saver.close()
@@ -0,0 +1,27 @@
+import subprocess
+import sys
+
+import pytest
+
+import control.utils
+
+# These each take from hundreds of ms to seconds to import, and aren't needed until a feature that uses them is.
+SLOW_MODULES = ("torch", "napari.utils", "scipy.signal", "scipy.interpolate", "scipy.ndimage", "control.tracking")
+
+
+def test_gui_import_skips_slow_modules():
+    code = (
+        "import os, sys; os.environ['QT_API'] = 'pyqt5'; import control.gui_hcs; "
+        f"print([m for m in {SLOW_MODULES!r} if m in sys.modules])"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip().splitlines()[-1] == "[]"
+
+
+def test_lazy_import():
+    json = control.utils.lazy_import("json")
+    assert json.dumps([1]) == "[1]"
+
+    missing = control.utils.lazy_import("not_a_real_module")
+    with pytest.raises(ImportError):
+        missing.anything
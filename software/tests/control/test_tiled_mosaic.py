@@ -0,0 +1,74 @@
+import numpy as np
+
+from control.tiled_mosaic import TiledMosaic
+
+
+def test_tiled_mosaic_round_trip():
+    mosaic = TiledMosaic(pixel_size_mm=0.001, origin_mm=(0.0, 0.0), tile_size=64, n_levels=3)
+    image = np.arange(100 * 150, dtype=np.uint16).reshape(100, 150)
+
+    assert mosaic.add_image("ch", image, 0.0, 0.0)
+    level_0 = mosaic.get_levels("ch")[0]
+    assert level_0.dtype == np.uint16
+    assert np.array_equal(level_0[0:100, 0:150], image)
+
+    # A second image that lands inside the existing bounds only touches its own tiles
+    assert not mosaic.add_image("ch", image[:10, :10], 0.050, 0.050)
+    assert np.array_equal(mosaic.get_levels("ch")[0][50:60, 50:60], image[:10, :10])
+
+
+def test_tiled_mosaic_grows_in_negative_direction():
+    mosaic = TiledMosaic(pixel_size_mm=0.001, origin_mm=(1.0, 1.0), tile_size=64, n_levels=3)
+    image = np.full((32, 32), 7, dtype=np.uint8)
+    mosaic.add_image("ch", image, 1.0, 1.0)
+    top_left_before = mosaic.get_top_left_mm()
+
+    # Far enough up and left to need a new coarse tile
+    assert mosaic.add_image("ch", image, 0.5, 0.5)
+    top_left_after = mosaic.get_top_left_mm()
+    assert top_left_after[0] < top_left_before[0]
+    assert top_left_after[1] < top_left_before[1]
+
+    level_0 = mosaic.get_levels("ch")[0]
+    for y_mm, x_mm in ((1.0, 1.0), (0.5, 0.5)):
+        row = round((y_mm - top_left_after[0]) / 0.001)
+        col = round((x_mm - top_left_after[1]) / 0.001)
+        assert np.all(level_0[row : row + 32, col : col + 32] == 7)
+
+
+def test_tiled_mosaic_pyramid():
+    n_levels = 3
+    mosaic = TiledMosaic(pixel_size_mm=0.001, origin_mm=(0.0, 0.0), tile_size=64, n_levels=n_levels)
+    mosaic.add_image("ch", np.full((256, 256), 100, dtype=np.uint16), 0.0, 0.0)
+    levels = mosaic.get_levels("ch")
+
+    assert len(levels) == n_levels
+    for level in range(1, n_levels):
+        assert levels[level].shape[0] * 2 == levels[level - 1].shape[0]
+        assert levels[level].shape[1] * 2 == levels[level - 1].shape[1]
+    assert np.all(levels[2][0:64, 0:64] == 100)
+
+
+def test_tiled_mosaic_memory_is_sparse():
+    # Use a pixel size that is exact in binary so the FOVs below land exactly on tile boundaries
+    mosaic = TiledMosaic(pixel_size_mm=0.25, origin_mm=(0.0, 0.0), tile_size=64, n_levels=2)
+    image = np.ones((64, 64), dtype=np.uint8)
+    mosaic.add_image("ch", image, 0.0, 0.0)
+    nbytes_one = mosaic.get_nbytes()
+
+    # A FOV a long way away must not allocate the space between the two.
+    mosaic.add_image("ch", image, 1024.0, 1024.0)
+    assert mosaic.get_nbytes() == 2 * nbytes_one
+    assert mosaic.get_levels("ch")[0].shape[0] > 4096
+
+
+def test_tiled_mosaic_rgb():
+    mosaic = TiledMosaic(pixel_size_mm=0.001, origin_mm=(0.0, 0.0), tile_size=64, n_levels=2)
+    image = np.zeros((70, 70, 3), dtype=np.uint8)
+    image[..., 1] = 200
+    mosaic.add_image("rgb", image, 0.0, 0.0)
+
+    level_0 = mosaic.get_levels("rgb")[0]
+    assert level_0.shape[2:] == (3,)
+    assert np.all(level_0[0:70, 0:70, 1] == 200)
+    assert np.all(np.asarray(level_0[5, 0:70])[:, 1] == 200)
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from qtpy.QtWidgets import QApplication
+
+import control.widgets
+from control.core_displacement_measurement import DisplacementMeasurementController
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def test_plots_the_whole_decimated_window(app):
+    controller = DisplacementMeasurementController(N=10000, max_points_to_plot=2000)
+    display = control.widgets.WaveformDisplay(N=1000, include_x=True, include_y=False)
+    controller.signal_plots.connect(display.plot)
+    for i in range(5000):
+        controller.measurements.append((i, i, 0))
+
+    image = np.zeros((8, 8), dtype=np.uint8)
+    image[2, 3] = 255
+    controller.update_measurement(image)
+
+    x = display.plotWidget["X"].curves["X"].xData
+    expected = controller.measurements.get_decimated(controller.N, controller.max_points_to_plot)[:, 0]
+    assert len(x) == len(expected) > display.N
+    # From the oldest reading to the newest, not just the last N of the decimated points
+    np.testing.assert_array_equal(x, expected)
+    assert x[0] < 3
+    display.deleteLater()
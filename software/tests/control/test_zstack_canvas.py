@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from control.zstack_canvas import ZStackCanvas
+
+
+def test_full_resolution_when_it_fits():
+    canvas = ZStackCanvas(memory_budget_bytes=100 * 1024**2, n_levels=3, min_level_size=64)
+    canvas.allocate(["a", "b"], Nz=4, height=1000, width=1200, dtype=np.uint16)
+
+    assert canvas.base_level == 0 and canvas.downsample_factor == 1
+    assert [level.shape for level in canvas.get_levels("a")] == [(4, 1000, 1200), (4, 500, 600), (4, 250, 300)]
+    assert canvas.get_nbytes() <= canvas.memory_budget_bytes
+
+    image = np.full((1000, 1200), 7, dtype=np.uint16)
+    image[:500] = 3
+    canvas.write("a", 2, image)
+    levels = canvas.get_levels("a")
+    np.testing.assert_array_equal(levels[0][2], image)
+    assert levels[1][2, 0, 0] == 3 and levels[2][2, -1, -1] == 7
+    # Nothing else was touched
+    assert not levels[0][[0, 1, 3]].any() and not canvas.get_levels("b")[0].any()
+
+
+def test_downsampled_to_fit_the_budget():
+    # 5 channels of 20x2000x2000 uint16 is 800 MB at full resolution
+    budget = 64 * 1024**2
+    canvas = ZStackCanvas(memory_budget_bytes=budget, n_levels=3, min_level_size=200)
+    canvas.allocate([str(c) for c in range(5)], Nz=20, height=2000, width=2000, dtype=np.uint16)
+
+    assert canvas.base_level == 2 and canvas.downsample_factor == 4
+    assert [level.shape for level in canvas.get_levels("0")] == [(20, 500, 500), (20, 250, 250)]
+    assert canvas.get_nbytes() <= budget
+
+    canvas.write("4", 19, np.full((2000, 2000), 100, dtype=np.uint16))
+    assert (canvas.get_levels("4")[0][19] == 100).all()
+    with pytest.raises(ValueError):
+        canvas.write("4", 0, np.zeros((1000, 1000), dtype=np.uint16))
+
+
+def test_channels_that_dont_fit_the_plan():
+    canvas = ZStackCanvas(memory_budget_bytes=100 * 1024**2, n_levels=2, min_level_size=16)
+    canvas.allocate(["a"], Nz=2, height=64, width=64, dtype=np.uint8)
+
+    mono = np.zeros((64, 64), dtype=np.uint8)
+    rgb = np.zeros((64, 64, 3), dtype=np.uint8)
+    assert canvas.fits("a", mono)
+    assert not canvas.fits("a", rgb) and not canvas.fits("a", mono.astype(np.uint16)) and not canvas.fits("b", mono)
+
+    canvas.allocate_channel("b", rgb.dtype, rgb.shape[2:])
+    canvas.write("b", 1, rgb + 9)
+    assert canvas.get_levels("b")[1].shape == (2, 32, 32, 3)
+    assert (canvas.get_levels("b")[1][1] == 9).all()
+    assert set(canvas.channels) == {"a", "b"}
+
+    canvas.clear()
+    assert canvas.channels == [] and canvas.get_nbytes() == 0
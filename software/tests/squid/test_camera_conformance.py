@@ -0,0 +1,129 @@
+import types
+
+import numpy as np
+import pytest
+
+import control.camera
+import squid.abc
+
+# Every camera that implements AbstractCamera and can run without hardware should be listed here.
+CAMERA_FACTORIES = [control.camera.Camera_Simulation]
+
+
+@pytest.fixture(params=CAMERA_FACTORIES, ids=lambda factory: factory.__name__)
+def camera(request):
+    camera = request.param()
+    camera.open()
+    camera.set_software_triggered_acquisition()
+    camera.start_streaming()
+    yield camera
+    camera.stop_streaming()
+    camera.close()
+
+
+def test_implements_abstract_camera(camera):
+    assert isinstance(camera, squid.abc.AbstractCamera)
+    assert camera.is_streaming
+
+
+def test_trigger_and_read(camera):
+    camera.set_pixel_format("MONO8")
+    camera.send_trigger()
+    frame = camera.read_frame()
+    assert frame is not None
+    assert frame.dtype == np.uint8
+    assert frame.ndim == 2
+
+
+def test_read_camera_frame_ids_increment(camera):
+    ids = []
+    for _ in range(3):
+        camera.send_trigger()
+        ids.append(camera.read_camera_frame().frame_id)
+    assert ids == [ids[0], ids[0] + 1, ids[0] + 2]
+
+
+def test_read_times_out_without_trigger(camera):
+    assert camera.read_camera_frame(timeout_s=0.01) is None
+
+
+def test_mono12_is_delivered_packed(camera):
+    camera.set_pixel_format("MONO12")
+    camera.send_trigger()
+    frame = camera.read_camera_frame()
+    assert frame.bit_depth == 12
+    assert frame.frame.dtype == np.uint16
+    assert frame.frame.max() < 2**12
+
+    normalized = frame.get_normalized()
+    assert np.array_equal(normalized, frame.frame << 4)
+    # get_normalized leaves the packed data alone, and caches its result
+    assert frame.frame.max() < 2**12
+    assert frame.get_normalized() is normalized
+
+
+def test_read_frame_normalizes_in_place(camera):
+    camera.set_pixel_format("MONO12")
+    camera.send_trigger()
+    packed = camera.current_camera_frame.frame
+    expected = packed << 4
+
+    frame = camera.read_frame()
+    # Shifted in place, so no new image was allocated
+    assert frame is packed
+    assert np.array_equal(frame, expected)
+
+
+def test_current_frame_is_normalized(camera):
+    camera.set_pixel_format("MONO12")
+    camera.send_trigger()
+    assert camera.current_camera_frame.bit_depth == 12
+    assert camera.current_frame.max() >= 2**12
+
+
+def test_callback_delivery(camera):
+    received = []
+    camera.set_callback(lambda cam: received.append(cam.current_camera_frame.frame_id))
+    camera.enable_callback()
+    for _ in range(3):
+        camera.send_trigger()
+    camera.disable_callback()
+    assert received == sorted(received) and len(set(received)) == 3
+
+
+def test_locked_image_is_dropped(camera):
+    camera.image_locked = True
+    camera.send_trigger()
+    assert camera.frame_queue.dropped_count == 1
+    assert camera.read_camera_frame(timeout_s=0.01) is None
+
+    camera.image_locked = False
+    camera.send_trigger()
+    assert camera.read_camera_frame() is not None
+
+
+def test_toupcam_frames_outlive_the_pull_buffer():
+    import control.camera_toupcam
+
+    pulled = iter([1, 2])
+
+    def pull_image(buf, bits, info):
+        np.frombuffer(buf, dtype=np.uint16)[:] = next(pulled)
+
+    # Without the SDK, so only the frame path is set up
+    camera = object.__new__(control.camera_toupcam.Camera)
+    squid.abc.AbstractCamera.__init__(camera)
+    camera.log = camera._log
+    camera.camera = types.SimpleNamespace(PullImageV2=pull_image)
+    camera.data_format = "RAW"
+    camera.pixel_size_byte = 2
+    camera.Width, camera.Height = 4, 3
+    camera.buf = bytearray(camera.Width * camera.Height * camera.pixel_size_byte)
+
+    camera._on_frame_callback()
+    first = camera.read_camera_frame(reset_image_ready_flag=False)
+    camera._on_frame_callback()
+
+    assert first.frame.shape == (3, 4)
+    assert np.all(first.frame == 1)
+    assert np.all(camera.current_camera_frame.frame == 2)
@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pytest
+
+from squid.device_graph import DeviceGraph, DeviceInitializationError, DeviceInitializationTimeout, DeviceStatus
+
+
+def test_dependencies_are_passed_in_and_independent_devices_run_concurrently():
+    both_started = threading.Barrier(2, timeout=5)
+
+    def connect(name):
+        both_started.wait()
+        return name
+
+    graph = DeviceGraph()
+    # Added before what it depends on
+    graph.add("homing", lambda stage: f"homed {stage}", depends_on=["stage"])
+    graph.add("stage", lambda mcu: f"stage on {mcu}", depends_on=["microcontroller"])
+    graph.add("microcontroller", lambda: connect("mcu"))
+    graph.add("camera", lambda: connect("camera"))
+
+    results = graph.run()
+    assert results == {
+        "microcontroller": "mcu",
+        "camera": "camera",
+        "stage": "stage on mcu",
+        "homing": "homed stage on mcu",
+    }
+
+    timings = {timing.name: timing for timing in graph.get_timings()}
+    assert all(timing.status == DeviceStatus.DONE for timing in timings.values())
+    assert timings["stage"].start_s >= timings["microcontroller"].end_s
+    assert timings["homing"].start_s >= timings["stage"].end_s
+    assert graph.get_critical_path()[-2:] == ["stage", "homing"]
+    assert "homing" in graph.format_report()
+
+
+def test_a_failure_skips_what_hasnt_started():
+    graph = DeviceGraph()
+    graph.add("microcontroller", lambda: 1 / 0)
+    graph.add("stage", lambda mcu: "stage", depends_on=["microcontroller"])
+    graph.add("camera", lambda: "camera")
+
+    with pytest.raises(DeviceInitializationError) as e:
+        graph.run()
+    assert e.value.device_name == "microcontroller"
+    assert isinstance(e.value.__cause__, ZeroDivisionError)
+
+    statuses = {timing.name: timing.status for timing in graph.get_timings()}
+    assert statuses == {
+        "microcontroller": DeviceStatus.FAILED,
+        "stage": DeviceStatus.SKIPPED,
+        "camera": DeviceStatus.DONE,
+    }
+    assert graph.results == {"camera": "camera"}
+
+
+def test_timeouts_dont_wait_for_the_stuck_device():
+    release = threading.Event()
+    graph = DeviceGraph(default_timeout_s=5)
+    graph.add("stuck", release.wait, timeout_s=0.1)
+    graph.add("after", lambda _: None, depends_on=["stuck"])
+
+    start = time.perf_counter()
+    try:
+        with pytest.raises(DeviceInitializationTimeout) as e:
+            graph.run()
+    finally:
+        release.set()
+    assert time.perf_counter() - start < 2
+    assert e.value.device_name == "stuck" and isinstance(e.value, TimeoutError)
+    statuses = {timing.name: timing.status for timing in graph.get_timings()}
+    assert statuses == {"stuck": DeviceStatus.TIMED_OUT, "after": DeviceStatus.SKIPPED}
+
+
+def test_invalid_graphs():
+    graph = DeviceGraph()
+    graph.add("a", lambda: None)
+    with pytest.raises(ValueError):
+        graph.add("a", lambda: None)
+
+    graph.add("b", lambda _: None, depends_on=["missing"])
+    with pytest.raises(ValueError, match="missing"):
+        graph.run()
+
+    cycle = DeviceGraph()
+    cycle.add("a", lambda _: None, depends_on=["b"])
+    cycle.add("b", lambda _: None, depends_on=["a"])
+    with pytest.raises(ValueError, match="cycle"):
+        cycle.run()
@@ -0,0 +1,58 @@
+import statistics
+import threading
+import time
+
+import numpy as np
+
+from squid.frame_queue import CameraFrame, FrameQueue
+
+
+def _frame(frame_id):
+    return CameraFrame(np.zeros((2, 2), dtype=np.uint8), frame_id, time.time())
+
+
+def test_frame_queue_drops_oldest():
+    frame_queue = FrameQueue(capacity=2)
+    for frame_id in range(5):
+        frame_queue.put(_frame(frame_id))
+    frame_queue.record_dropped()
+
+    assert frame_queue.dropped_count == 4
+    assert frame_queue.latest_frame_id == 4
+    assert frame_queue.get(timeout=0).frame_id == 3
+    assert frame_queue.delivered_count == 1
+
+
+def test_frame_queue_wait_for_frame_skips_stale_frames():
+    frame_queue = FrameQueue()
+    frame_queue.put(_frame(0))
+    frame_queue.put(_frame(1))
+
+    assert frame_queue.wait_for_frame(2, timeout=0.01) is None
+    # The stale frames were discarded while waiting
+    assert len(frame_queue) == 0
+
+    threading.Timer(0.01, frame_queue.put, args=[_frame(2)]).start()
+    assert frame_queue.wait_for_frame(2, timeout=1).frame_id == 2
+
+
+def test_frame_queue_wakes_reader_immediately():
+    # Polling every 5 ms would add 2.5 ms of latency on average; a condition variable should add far less.
+    frame_queue = FrameQueue()
+    latencies = []
+    for frame_id in range(20):
+        put_time = []
+
+        def deliver(frame_id=frame_id):
+            time.sleep(0.002)
+            put_time.append(time.perf_counter())
+            frame_queue.put(_frame(frame_id))
+
+        producer = threading.Thread(target=deliver)
+        producer.start()
+        frame = frame_queue.wait_for_frame(frame_id, timeout=1)
+        latencies.append(time.perf_counter() - put_time[0])
+        producer.join()
+        assert frame.frame_id == frame_id
+
+    assert statistics.median(latencies) < 0.001
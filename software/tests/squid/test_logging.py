@@ -1,5 +1,9 @@
+import json
 import logging
 import tempfile
+import time
+
+import pytest
 
 import squid.logging
 
@@ -51,3 +55,47 @@ def test_file_loggers():
     log.debug(a_debug_message)
     assert line_count() > debug_ling_count
     assert contains(a_debug_message)
+
+
+def test_spans_are_free_when_disabled():
+    squid.logging.disable_tracing()
+    with squid.logging.span("fov"):
+        pass
+    assert len(squid.logging.get_spans()) == 0
+
+
+def test_span_summary_and_chrome_trace():
+    squid.logging.enable_tracing(capacity=100)
+    try:
+        start_ns = time.perf_counter_ns()
+        for _ in range(3):
+            with squid.logging.span("fov"):
+                with squid.logging.span("move"):
+                    time.sleep(0.01)
+                    with squid.logging.span("nested in move"):
+                        pass
+                traced_save()
+
+        spans = squid.logging.get_spans(since_ns=start_ns)
+        assert len(spans) == 12
+        summary = squid.logging.summarize_spans(spans)
+        assert summary["count"] == 3
+        assert 0 < summary["rate_per_s"] < 1 / 0.015
+        # Only the steps directly inside each FOV, slowest first
+        assert list(summary["breakdown_s"])[:2] == ["move", "save"]
+        assert summary["breakdown_s"]["move"] == pytest.approx(0.01, abs=0.005)
+        assert "nested in move" not in summary["breakdown_s"]
+
+        trace_path = tempfile.mktemp(suffix=".json")
+        squid.logging.export_chrome_trace(trace_path, since_ns=start_ns)
+        with open(trace_path) as f:
+            events = json.load(f)["traceEvents"]
+        assert [e["name"] for e in events[:4]] == ["nested in move", "move", "save", "fov"]
+        assert all(e["ph"] == "X" for e in events)
+    finally:
+        squid.logging.disable_tracing()
+
+
+@squid.logging.traced("save")
+def traced_save():
+    time.sleep(0.005)
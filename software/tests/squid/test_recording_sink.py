@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from squid.recording_sink import OverflowPolicy, RecordingSink, RecordingSinkError
+
+
+class GatedWriter:
+    """Writes items to a list, but only while the gate is open."""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.written = []
+
+    def __call__(self, image, frame_id):
+        self.gate.wait()
+        self.written.append((frame_id, image.copy()))
+
+
+def _image(frame_id, size=100):
+    return np.full(size, frame_id, dtype=np.uint8)
+
+
+def _fill(sink, writer, count):
+    # The first item is taken by the worker (and waits at the gate), the rest are buffered
+    results = [sink.put(_image(0), 0)]
+    while len(writer.written) == 0 and sink.get_stats().buffered_items:
+        time.sleep(0.001)
+    results += [sink.put(_image(frame_id), frame_id) for frame_id in range(1, count)]
+    return results
+
+
+@pytest.mark.parametrize(
+    "policy, kept",
+    [
+        (OverflowPolicy.DROP_NEWEST, [0, 1, 2, 3]),
+        (OverflowPolicy.DROP_OLDEST, [0, 4, 5, 6]),
+        (OverflowPolicy.SPILL, [0, 1, 2, 3, 4, 5, 6]),
+    ],
+)
+def test_overflow_policies(policy, kept, tmp_path):
+    writer = GatedWriter()
+    sink = RecordingSink(writer, max_bytes=300, policy=policy, spill_dir=str(tmp_path))
+    try:
+        results = _fill(sink, writer, 7)
+        stats = sink.get_stats()
+        assert stats.accepted == 7 and stats.buffered_bytes <= 300 and stats.peak_buffered_bytes == 300
+        lost = sorted(set(range(7)) - set(kept))
+        assert stats.lost_keys == lost
+        # put says whether the item it was given was buffered, so the ones dropped later to make room count
+        assert results == [frame_id in kept or policy == OverflowPolicy.DROP_OLDEST for frame_id in range(7)]
+        if policy == OverflowPolicy.SPILL:
+            assert stats.spilled == 3 and stats.spill_bytes == 300
+        writer.gate.set()
+        assert sink.join(timeout=5)
+    finally:
+        writer.gate.set()
+        sink.close()
+
+    # What was kept is written in order, and intact
+    assert [frame_id for frame_id, _ in writer.written] == kept
+    for frame_id, image in writer.written:
+        np.testing.assert_array_equal(image, _image(frame_id))
+    stats = sink.get_stats()
+    assert stats.written == len(kept) and stats.dropped == 7 - len(kept) and stats.buffered_items == 0
+    # The scratch file is deleted
+    assert os.listdir(tmp_path) == []
+
+
+def test_spill_keeps_order_and_drops_when_the_scratch_file_is_full(tmp_path):
+    writer = GatedWriter()
+    sink = RecordingSink(
+        writer, max_bytes=200, policy=OverflowPolicy.SPILL, spill_dir=str(tmp_path), max_spill_bytes=300
+    )
+    try:
+        _fill(sink, writer, 8)
+        # 2 in memory, 3 spilled, and the rest didn't fit anywhere
+        assert sink.get_stats().lost_keys == [6, 7]
+        writer.gate.set()
+        assert sink.join(timeout=5)
+        # Once there's room in memory again, new items stay in memory
+        assert sink.get_stats().spill_bytes == 0
+        sink.put(_image(8), 8)
+        assert sink.join(timeout=5)
+        assert sink.get_stats().spilled == 3
+    finally:
+        writer.gate.set()
+        sink.close()
+    assert [frame_id for frame_id, _ in writer.written] == [0, 1, 2, 3, 4, 5, 8]
+
+
+def test_block_waits_for_room():
+    writer = GatedWriter()
+    sink = RecordingSink(writer, max_bytes=200, policy=OverflowPolicy.BLOCK)
+    try:
+        _fill(sink, writer, 3)
+        producer = threading.Thread(target=sink.put, args=(_image(3), 3))
+        producer.start()
+        producer.join(0.05)
+        # Blocked until the writer makes room
+        assert producer.is_alive()
+        writer.gate.set()
+        producer.join(5)
+        assert not producer.is_alive()
+        assert sink.join(timeout=5)
+    finally:
+        writer.gate.set()
+        sink.close()
+    stats = sink.get_stats()
+    assert stats.written == 4 and stats.lost == 0 and stats.blocked_s > 0.04
+
+
+def test_call_when_written_runs_after_the_items_before_it():
+    writer = GatedWriter()
+    sink = RecordingSink(writer, max_bytes=300, policy=OverflowPolicy.DROP_OLDEST)
+    finished = []
+    try:
+        _fill(sink, writer, 3)
+        sink.call_when_written(lambda stats: finished.append((len(writer.written), stats)))
+        # The next recording's items are counted separately, and push the last one's out, but not the callback
+        sink.reset_stats()
+        for frame_id in range(3, 6):
+            sink.put(_image(frame_id), frame_id)
+        assert finished == []
+        writer.gate.set()
+        assert sink.join(timeout=5)
+    finally:
+        writer.gate.set()
+        sink.close()
+
+    assert [frame_id for frame_id, _ in writer.written] == [0, 3, 4, 5]
+    [(written_before, stats)] = finished
+    assert written_before == 1
+    assert stats.accepted == 3 and stats.written == 1 and stats.lost_keys == [1, 2] and stats.buffered_items == 0
+    stats = sink.get_stats()
+    assert stats.accepted == 3 and stats.written == 3 and stats.lost == 0
+
+
+def test_on_idle_is_called_while_no_items_come():
+    written = []
+    idle = threading.Event()
+
+    def on_idle():
+        # Only once the item before the pause is written
+        if written:
+            idle.set()
+
+    sink = RecordingSink(lambda image, frame_id: written.append(frame_id), 1000, on_idle=on_idle, idle_interval_s=0.05)
+    try:
+        sink.put(_image(0), 0)
+        assert idle.wait(timeout=5)
+        assert written == [0]
+    finally:
+        sink.close()
+
+
+def test_write_errors_are_counted_and_reported():
+    errors = []
+
+    def write(image, frame_id):
+        if frame_id % 2:
+            raise IOError(f"disk full writing {frame_id}")
+
+    sink = RecordingSink(write, max_bytes=10000, on_error=errors.append)
+    for frame_id in range(6):
+        sink.put(_image(frame_id), frame_id)
+    sink.close()
+
+    stats = sink.get_stats()
+    assert stats.written == 3 and stats.failed == 3 and stats.lost_keys == [1, 3, 5]
+    # Only the first error is reported
+    assert [str(e) for e in errors] == ["disk full writing 1"] and stats.first_error is errors[0]
+    with pytest.raises(RecordingSinkError):
+        sink.put(_image(6), 6)
+
+
+def test_items_bigger_than_the_buffer_are_still_written():
+    writer = GatedWriter()
+    writer.gate.set()
+    sink = RecordingSink(writer, max_bytes=10, policy=OverflowPolicy.DROP_NEWEST)
+    assert sink.put(_image(0), 0)
+    sink.close()
+    assert [frame_id for frame_id, _ in writer.written] == [0]
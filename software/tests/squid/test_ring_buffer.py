@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from squid.ring_buffer import RingBuffer
+
+
+def test_ring_buffer_append_and_window():
+    buffer = RingBuffer(4)
+    assert len(buffer) == 0
+    assert len(buffer.get_window()) == 0
+
+    for i in range(3):
+        buffer.append(i)
+    assert list(buffer.get_window()) == [0, 1, 2]
+    assert list(buffer.get_window(2)) == [1, 2]
+
+    # Wrap around a few times, the window should always be the latest items in order.
+    for i in range(3, 11):
+        buffer.append(i)
+        assert list(buffer.get_window()) == list(range(i - 3, i + 1))
+        assert buffer.get_latest() == i
+    assert len(buffer) == 4
+    assert buffer.total_count == 11
+
+
+def test_ring_buffer_window_is_a_read_only_view():
+    buffer = RingBuffer(8)
+    buffer.extend(np.arange(20))
+    window = buffer.get_window()
+    assert np.shares_memory(window, buffer._data)
+    with pytest.raises(ValueError):
+        window[0] = 1
+
+
+def test_ring_buffer_rows():
+    buffer = RingBuffer(5, (3,))
+    for i in range(7):
+        buffer.append((i, 10 * i, 100 * i))
+    window = buffer.get_window()
+    assert window.shape == (5, 3)
+    assert list(window[:, 0]) == [2, 3, 4, 5, 6]
+    assert list(window[:, 2]) == [200, 300, 400, 500, 600]
+
+
+def test_ring_buffer_decimated():
+    buffer = RingBuffer(1000)
+    buffer.extend(np.arange(2500))
+
+    decimated = buffer.get_decimated(max_points=100)
+    assert len(decimated) <= 100
+    assert decimated[-1] == 2499
+    assert np.all(np.diff(decimated) == 10)
+
+    assert list(buffer.get_decimated(5, max_points=100)) == [2495, 2496, 2497, 2498, 2499]
+
+
+def test_ring_buffer_resize():
+    buffer = RingBuffer(4)
+    buffer.extend(range(10))
+
+    buffer.resize(2)
+    assert list(buffer.get_window()) == [8, 9]
+
+    buffer.resize(6)
+    buffer.extend([10, 11])
+    assert list(buffer.get_window()) == [8, 9, 10, 11]
+    assert buffer.total_count == 12
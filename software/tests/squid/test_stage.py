@@ -1,5 +1,8 @@
-import pytest
 import tempfile
+import time
+
+import numpy as np
+import pytest
 
 import squid.stage.cephla
 import squid.stage.prior
@@ -23,6 +26,19 @@ def test_simulated_cephla_stage_ops():
     assert stage.get_pos() == squid.abc.Pos(x_mm=0.0, y_mm=0.0, z_mm=0.0, theta_rad=0.0)
 
 
+def test_cephla_stage_position_reads():
+    microcontroller = Microcontroller(existing_serial=SimSerial())
+    stage = squid.stage.cephla.CephlaStage(microcontroller, squid.config.get_stage_config())
+    stage.move_x_to(1.5)
+    stage.move_y_to(2.5)
+
+    pos = stage.get_pos()
+    out = np.zeros(4)
+    assert stage.get_pos_array(out) is out
+    assert out == pytest.approx([pos.x_mm, pos.y_mm, pos.z_mm, pos.theta_rad])
+    assert stage.get_pos_at(time.time() + 1) == pos
+
+
 def test_position_caching():
     (unused_temp_fd, temp_cache_path) = tempfile.mkstemp(".cache", "squid_testing_")
 
@@ -0,0 +1,102 @@
+"""
+Micro-benchmark of control.compositing against the implementations it replaced.
+
+Usage (from the software directory):
+    python tools/benchmark_compositing.py [--height 3000] [--width 3000] [--repeats 10]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import control.compositing as compositing
+
+
+def legacy_generate_dpc(im_left, im_right):
+    im_left = im_left.astype(float) / 255
+    im_right = im_right.astype(float) / 255
+    with np.errstate(invalid="ignore", divide="ignore"):
+        im_dpc = 0.5 + np.divide(im_left - im_right, im_left + im_right)
+    im_dpc[im_dpc < 0] = 0
+    im_dpc[im_dpc > 1] = 1
+    im_dpc[np.isnan(im_dpc)] = 0
+    return (im_dpc * 255).astype(np.uint8)
+
+
+def legacy_grayscale_to_rgb(image, hex_color):
+    rgb_ratios = np.array([(hex_color >> 16) & 0xFF, (hex_color >> 8) & 0xFF, hex_color & 0xFF]) / 255
+    rgb = np.stack([image] * 3, axis=-1) * rgb_ratios
+    return rgb.astype(image.dtype)
+
+
+def legacy_merge(images):
+    merged = images[0]
+    for image in images[1:]:
+        merged += image
+    return merged
+
+
+def legacy_construct_rgb(red, green, blue):
+    rgb_image = np.zeros((*red.shape, 3), dtype=red.dtype)
+    rgb_image[:, :, 0] = red
+    rgb_image[:, :, 1] = green
+    rgb_image[:, :, 2] = blue
+    return rgb_image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--width", type=int, default=3000)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    shape = (args.height, args.width)
+    left = rng.integers(0, 256, shape, dtype=np.uint8)
+    right = rng.integers(0, 256, shape, dtype=np.uint8)
+    mono = rng.integers(0, 2**16, shape, dtype=np.uint16)
+    colors = [0x20ADF8, 0x1FFF00, 0xFFCF00, 0xFF0000]
+    compositor = compositing.Compositor()
+
+    def new_merge():
+        compositor.reset_merged()
+        for color in colors:
+            compositor.add_to_merged(compositor.pseudo_color(mono, color))
+
+    cases = [
+        ("dpc", lambda: legacy_generate_dpc(left, right), lambda: compositor.dpc(left, right)),
+        (
+            "pseudo color",
+            lambda: legacy_grayscale_to_rgb(mono, colors[0]),
+            lambda: compositor.pseudo_color(mono, colors[0]),
+        ),
+        (
+            "pseudo color + merge x4",
+            lambda: legacy_merge([legacy_grayscale_to_rgb(mono, c) for c in colors]),
+            new_merge,
+        ),
+        (
+            "rgb reconstruction",
+            lambda: legacy_construct_rgb(mono, mono, mono),
+            lambda: compositor.merge_rgb(mono, mono, mono),
+        ),
+    ]
+
+    print(f"{args.height}x{args.width}, best of {args.repeats} [ms]")
+    print(f"{'':<26}{'legacy':>10}{'new':>10}{'speedup':>10}")
+    for name, legacy, new in cases:
+        # Warm up (and allocate the compositor's buffers) before timing.
+        legacy()
+        new()
+        legacy_ms = 1000 * min(timeit.repeat(legacy, number=1, repeat=args.repeats))
+        new_ms = 1000 * min(timeit.repeat(new, number=1, repeat=args.repeats))
+        print(f"{name:<26}{legacy_ms:>10.1f}{new_ms:>10.1f}{legacy_ms / new_ms:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+GUI thread time per live frame spent on the napari live view's histogram, before (the whole frame into a pyqtgraph
+ImageItem, plus a min/max over every pixel) and after (control.live_statistics, from a subsample off the GUI thread).
+
+Usage (from the software directory):
+    python tools/benchmark_live_histogram.py [--height 3000] [--width 4000] [--frames 50] [--fps 20]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import pyqtgraph as pg
+from qtpy.QtWidgets import QApplication
+
+from control.live_statistics import LiveStatisticsWorker
+
+
+def make_histogram_widget():
+    image_item = pg.ImageItem()
+    histogram_widget = pg.HistogramLUTWidget(image=image_item)
+    return image_item, histogram_widget
+
+
+def legacy_update(image_item, histogram_widget, image, contrast_limits):
+    image_item.setImage(image, autoLevels=False)
+    histogram_widget.setLevels(*contrast_limits)
+    histogram_widget.setHistogramRange(image.min(), image.max())
+    histogram_widget.region.setRegion(contrast_limits)
+
+
+def run(app, frames, fps, update):
+    """The mean GUI thread time per frame of update(image) plus handling the events it causes, in ms."""
+    gui_s = 0
+    for image in frames:
+        t0 = time.perf_counter()
+        update(image)
+        app.processEvents()
+        gui_s += time.perf_counter() - t0
+        # The rest of the frame period, the GUI thread would be idle (or drawing).
+        time.sleep(max(0.0, 1 / fps - (time.perf_counter() - t0)))
+    return gui_s / len(frames) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--width", type=int, default=4000)
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--fps", type=float, default=20)
+    args = parser.parse_args()
+
+    app = QApplication([])
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 4096, size=(args.height, args.width), dtype=np.uint16) for _ in range(4)]
+    frames = [frames[i % len(frames)] for i in range(args.frames)]
+    contrast_limits = (100, 4000)
+    print(f"{args.width}x{args.height} uint16 frames at {args.fps} fps")
+
+    image_item, histogram_widget = make_histogram_widget()
+    legacy_ms = run(
+        app, frames, args.fps, lambda image: legacy_update(image_item, histogram_widget, image, contrast_limits)
+    )
+    print(f"  before: {legacy_ms:7.2f} ms of GUI thread per frame")
+
+    image_item, histogram_widget = make_histogram_widget()
+    worker = LiveStatisticsWorker()
+    updates = []
+
+    def on_statistics(statistics):
+        histogram_widget.plot.setData(statistics.bin_edges, statistics.counts)
+        histogram_widget.setHistogramRange(statistics.min, statistics.max)
+        updates.append(statistics)
+
+    worker.statistics_ready.connect(on_statistics)
+    new_ms = run(app, frames, args.fps, worker.submit)
+    worker.close()
+    print(f"  after:  {new_ms:7.2f} ms of GUI thread per frame ({len(updates)} histogram updates)")
+
+
+if __name__ == "__main__":
+    main()
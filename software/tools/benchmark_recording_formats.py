@@ -0,0 +1,86 @@
+"""
+Throughput benchmark of the recording formats (see control/recording_formats.py): how many frames per second each one
+saves, and how much CPU time that takes per frame, for frames from the simulated camera.  Also times reading the
+recording back.
+
+Usage (from the software directory):
+    python tools/benchmark_recording_formats.py [--width 1024] [--height 1024] [--frames 500] [--dir /fast/disk]
+"""
+
+import argparse
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import control.camera
+from control.recording_formats import RecordingFormat, make_recording_writer, open_recording
+
+
+def get_frames(args):
+    camera = control.camera.Camera_Simulation()
+    camera.open()
+    camera.set_pixel_format(args.pixel_format)
+    camera.set_ROI(width=args.width, height=args.height)
+    camera.start_streaming()
+    # A pool of frames, so the benchmark measures saving them and not rendering them
+    frames = []
+    for _ in range(8):
+        camera.send_trigger()
+        frames.append(camera.read_frame())
+    camera.close()
+    return frames
+
+
+def benchmark(recording_format, frames, args):
+    path = tempfile.mkdtemp(prefix=f"recording_{recording_format}_", dir=args.dir)
+    try:
+        t0 = time.perf_counter()
+        cpu0 = time.process_time()
+        with make_recording_writer(recording_format, path, image_format=args.image_format) as writer:
+            for i in range(args.frames):
+                writer.write(frames[i % len(frames)], i, time.time())
+        write_s = time.perf_counter() - t0
+        cpu_s = time.process_time() - cpu0
+
+        t0 = time.perf_counter()
+        with open_recording(path) as recording:
+            for frame in recording:
+                pass
+        read_s = time.perf_counter() - t0
+        files = sum(len(names) for _, _, names in os.walk(path))
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+    return args.frames / write_s, 1000 * cpu_s / args.frames, args.frames / read_s, files
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=1024)
+    parser.add_argument("--height", type=int, default=1024)
+    parser.add_argument("--pixel-format", default="MONO8")
+    parser.add_argument("--image-format", default="bmp", help="The image format of the files format")
+    parser.add_argument("--frames", type=int, default=500)
+    parser.add_argument("--dir", default=None, help="Where to save the recordings (the temp dir by default)")
+    parser.add_argument("--formats", nargs="+", default=list(RecordingFormat.ALL), choices=RecordingFormat.ALL)
+    args = parser.parse_args()
+
+    frames = get_frames(args)
+    mb = frames[0].nbytes / 1024**2
+    print(f"{args.frames} frames of {args.width}x{args.height} {args.pixel_format} ({mb:.1f} MB)")
+    print(f"{'format':<10} {'write fps':>10} {'MB/s':>8} {'CPU ms/frame':>13} {'read fps':>10} {'files':>7}")
+    for recording_format in args.formats:
+        if recording_format == RecordingFormat.ZARR and importlib.util.find_spec("zarr") is None:
+            print(f"{recording_format:<10} skipped, zarr isn't installed")
+            continue
+        write_fps, cpu_ms, read_fps, files = benchmark(recording_format, frames, args)
+        print(
+            f"{recording_format:<10} {write_fps:10.1f} {write_fps * mb:8.1f} {cpu_ms:13.2f} {read_fps:10.1f} {files:7d}"
+        )
+
+
+if __name__ == "__main__":
+    main()
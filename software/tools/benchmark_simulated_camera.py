@@ -0,0 +1,84 @@
+"""
+Throughput benchmark of the simulated camera, and of a triggered acquisition loop on top of it.  Needs no hardware,
+so it can run in CI to catch regressions in the acquisition path.
+
+Usage (from the software directory):
+    python tools/benchmark_simulated_camera.py [--width 3000] [--height 3000] [--frames 50] [--fovs 25]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import control.camera
+import squid.abc
+
+
+def make_camera(args, **kwargs):
+    camera = control.camera.Camera_Simulation(**kwargs)
+    camera.open()
+    camera.set_pixel_format(args.pixel_format)
+    camera.set_ROI(width=args.width, height=args.height)
+    camera.set_exposure_time(args.exposure_ms)
+    camera.start_streaming()
+    return camera
+
+
+def triggered_fps(camera, frames):
+    # The first frame renders the specimen and builds the noise, so don't count it.
+    camera.send_trigger()
+    camera.read_frame()
+    t0 = time.perf_counter()
+    for _ in range(frames):
+        camera.send_trigger()
+        camera.read_frame()
+    return frames / (time.perf_counter() - t0)
+
+
+def scan_fovs_per_s(args):
+    """Move the (simulated) stage across a grid, and trigger and read one frame at every FOV."""
+    pos = squid.abc.Pos(x_mm=0, y_mm=0, z_mm=control.camera.SIMULATED_SPECIMEN_FOCUS_Z_MM, theta_rad=0)
+    camera = make_camera(args, position_source=lambda: pos)
+    fov_mm = args.width * control.camera.SIMULATED_SPECIMEN_PIXEL_SIZE_UM / 1000
+    side = int(args.fovs**0.5)
+    t0 = time.perf_counter()
+    for i in range(side):
+        for j in range(side):
+            pos = squid.abc.Pos(x_mm=j * fov_mm, y_mm=i * fov_mm, z_mm=pos.z_mm, theta_rad=0)
+            camera.send_trigger()
+            camera.read_frame()
+    camera.close()
+    return side * side / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=3000)
+    parser.add_argument("--height", type=int, default=3000)
+    parser.add_argument("--pixel-format", default="MONO8")
+    parser.add_argument("--exposure-ms", type=float, default=10)
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--fovs", type=int, default=25)
+    args = parser.parse_args()
+
+    print(f"{args.width}x{args.height} {args.pixel_format}, {args.exposure_ms} ms exposure")
+
+    camera = make_camera(args)
+    print(f"rendered frames, fixed position:  {triggered_fps(camera, args.frames):8.1f} fps")
+    camera.prepare_frame_pool(8)
+    print(f"frame pool:                       {triggered_fps(camera, args.frames):8.1f} fps")
+    camera.close()
+
+    camera = make_camera(args, simulate_timing=True)
+    camera.prepare_frame_pool(8)
+    fps = triggered_fps(camera, args.frames)
+    print(f"frame pool with timing:           {fps:8.1f} fps (sensor limit {1 / camera.get_frame_period_s():.1f})")
+    camera.close()
+
+    print(f"scan, rendered at every FOV:      {scan_fovs_per_s(args):8.1f} FOVs/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Startup benchmark: how long it takes to import the GUI (and optionally to build it with simulated hardware), in a
+fresh interpreter each time, plus a summary of the slowest imports from python -X importtime.
+
+Exits with status 1 if the median startup is over --budget-s, so that it can run in CI to catch an expensive import
+sneaking back in at module level.
+
+Usage (from the software directory):
+    python tools/benchmark_startup.py [--runs 5] [--budget-s 3] [--top 20] [--build-gui] [--gui-budget-s 15]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SOFTWARE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+IMPORT_GUI = "import os; os.environ['QT_API'] = 'pyqt5'; import control.gui_hcs"
+
+BUILD_GUI = """
+import os, time
+os.environ['QT_API'] = 'pyqt5'
+t0 = time.perf_counter()
+from qtpy.QtWidgets import QApplication
+import control.gui_hcs
+app = QApplication([])
+win = control.gui_hcs.HighContentScreeningGui(is_simulation=True)
+print(f"startup_s={time.perf_counter() - t0}", flush=True)
+# Don't wait for the simulated hardware's threads to wind down, that isn't startup.
+os._exit(0)
+"""
+
+
+def run_python(args, env=None, timeout=300):
+    return subprocess.run(
+        [sys.executable, *args], cwd=SOFTWARE_DIR, env=env, capture_output=True, text=True, check=True, timeout=timeout
+    )
+
+
+def time_import(runs):
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        run_python(["-c", IMPORT_GUI])
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def time_build_gui(runs):
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get("QT_QPA_PLATFORM", "offscreen"))
+    times = []
+    for _ in range(runs):
+        output = run_python(["-c", BUILD_GUI], env=env).stdout
+        times.append(float(output.rsplit("startup_s=", 1)[1].split()[0]))
+    return times
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us)] from python -X importtime's output."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:") :].split("|")
+        imports.append((module.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def print_importtime_summary(top):
+    imports = parse_importtime(run_python(["-X", "importtime", "-c", IMPORT_GUI]).stderr)
+    print(f"\nSlowest imports, including what they import (of {len(imports)} modules):")
+    for module, _, cumulative_us in sorted(imports, key=lambda i: -i[2])[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {module}")
+    print("\nSlowest imports by themselves:")
+    for module, self_us, _ in sorted(imports, key=lambda i: -i[1])[:top]:
+        print(f"  {self_us / 1000:8.1f} ms  {module}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-s", type=float, default=3.0, help="Fail if the median import is slower than this")
+    parser.add_argument(
+        "--gui-budget-s",
+        type=float,
+        default=15.0,
+        help="With --build-gui, fail if the median build is slower than this",
+    )
+    parser.add_argument("--top", type=int, default=20, help="How many of the slowest imports to list")
+    parser.add_argument("--build-gui", action="store_true", help="Also time building the GUI in simulation")
+    args = parser.parse_args()
+
+    # The first run also compiles .pyc files, which is a one time cost, so don't count it.
+    run_python(["-c", IMPORT_GUI])
+    times = time_import(args.runs)
+    results = [("import control.gui_hcs", statistics.median(times), args.budget_s)]
+    print(f"import control.gui_hcs: median {results[-1][1]:.2f} s, min {min(times):.2f} s over {args.runs} runs")
+    if args.build_gui:
+        times = time_build_gui(args.runs)
+        results.append(("import and build the GUI", statistics.median(times), args.gui_budget_s))
+        print(f"import and build the GUI: median {results[-1][1]:.2f} s, min {min(times):.2f} s over {args.runs} runs")
+
+    if args.top:
+        print_importtime_summary(args.top)
+
+    print()
+    over_budget = False
+    for name, startup_s, budget_s in results:
+        if startup_s > budget_s:
+            over_budget = True
+            print(f"FAIL: {name} took {startup_s:.2f} s, over the {budget_s:.2f} s budget")
+        else:
+            print(f"OK: {name} took {startup_s:.2f} s, within the {budget_s:.2f} s budget")
+    if over_budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
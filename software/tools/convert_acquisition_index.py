@@ -0,0 +1,53 @@
+"""
+Convert an acquisition's acquisition_index.bin files to csv (every frame, or coordinates.csv style) or parquet.
+
+Usage (from the software directory):
+    python tools/convert_acquisition_index.py <acquisition folder or index file> [--format frames|coordinates|parquet]
+
+Writes each converted file next to its index.
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import control.acquisition_index as acquisition_index
+
+
+def convert(index_path, output_format):
+    folder = os.path.dirname(index_path)
+    if output_format == "coordinates":
+        output_path = os.path.join(folder, "coordinates.csv")
+        acquisition_index.write_coordinates_csv(index_path, output_path)
+    elif output_format == "parquet":
+        output_path = os.path.join(folder, "acquisition_index.parquet")
+        acquisition_index.write_parquet(index_path, output_path)
+    else:
+        output_path = os.path.join(folder, "acquisition_index.csv")
+        acquisition_index.to_dataframe(acquisition_index.load(index_path)).to_csv(output_path, index=False)
+    print(f"{index_path} -> {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", help="An acquisition (or time point) folder, or an index file")
+    parser.add_argument("--format", choices=["frames", "coordinates", "parquet"], default="frames")
+    args = parser.parse_args()
+
+    if os.path.isdir(args.path):
+        index_paths = sorted(
+            glob.glob(os.path.join(args.path, "**", acquisition_index.INDEX_FILE_NAME), recursive=True)
+        )
+    else:
+        index_paths = [args.path]
+    if not index_paths:
+        print(f"No {acquisition_index.INDEX_FILE_NAME} in {args.path}")
+        sys.exit(1)
+    for index_path in index_paths:
+        convert(index_path, args.format)
+
+
+if __name__ == "__main__":
+    main()